@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import subprocess
+import sys
+
+import sleekxmpp
+from sleekxmpp.test.benchmark import SleekBenchmark
+
+
+# Cold starts run in a fresh interpreter so that module imports are
+# included in the timings.
+COLD_START = """
+import sleekxmpp
+xmpp = sleekxmpp.ClientXMPP('tester@localhost/bench', 'test')
+xmpp.lazy_plugins = %r
+xmpp.register_plugins()
+"""
+
+
+class PluginBenchmark(SleekBenchmark):
+
+    """Creating clients and registering all plugins, eager and lazy."""
+
+    number = 20
+
+    def register(self, lazy):
+        """Measure registering plugins on clients in this process."""
+        def run():
+            for i in range(self.number):
+                xmpp = sleekxmpp.ClientXMPP('tester@localhost/bench', 'test')
+                xmpp.lazy_plugins = lazy
+                xmpp.register_plugins()
+        self.measure('register_%s' % ('lazy' if lazy else 'eager'),
+                     run, self.number)
+
+    def cold_start(self, lazy):
+        """Measure an interpreter starting a client from scratch."""
+        def run():
+            subprocess.check_call([sys.executable, '-c', COLD_START % lazy])
+        self.measure('cold_start_%s' % ('lazy' if lazy else 'eager'),
+                     run, 1)
+
+    def bench_register_eager(self):
+        """Load and initialize every plugin when registering it."""
+        self.register(False)
+
+    def bench_register_lazy(self):
+        """Load plugins on first use instead of when registering."""
+        self.register(True)
+
+    def bench_cold_start_eager(self):
+        """Start a client with eager plugins in a new interpreter."""
+        self.cold_start(False)
+
+    def bench_cold_start_lazy(self):
+        """Start a client with lazy plugins in a new interpreter."""
+        self.cold_start(True)
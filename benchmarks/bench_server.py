@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import threading
+
+import sleekxmpp
+from sleekxmpp.test import TestServer
+from sleekxmpp.test.benchmark import SleekBenchmark
+from sleekxmpp.xmlstream import StreamHub
+
+
+class ServerBenchmark(SleekBenchmark):
+
+    """
+    Many real clients exchanging stanzas over loopback TCP through
+    the in-process test server.
+    """
+
+    clients = 100
+    messages = 20
+
+    def setUp(self):
+        self.server = TestServer('localhost')
+        self.server.start()
+        self.sessions = []
+        self.hub = None
+        self.prefix = ''
+
+    def tearDown(self):
+        for xmpp in self.sessions:
+            xmpp.disconnect(wait=False)
+        for xmpp in self.sessions:
+            xmpp.stop.set()
+        if self.hub is not None:
+            self.hub.stop()
+        self.server.stop()
+
+    def connect_all(self):
+        started = [0]
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def session_start(event):
+            with lock:
+                started[0] += 1
+                if started[0] == self.clients:
+                    done.set()
+
+        for i in range(self.clients):
+            xmpp = sleekxmpp.ClientXMPP('user%s@localhost/soak' % i, 'x')
+            xmpp.auto_reconnect = False
+            xmpp.add_event_handler('session_start', session_start)
+            if self.hub is not None:
+                self.hub.add(xmpp)
+            self.server.connect(xmpp)
+            xmpp.process(block=False)
+            self.sessions.append(xmpp)
+        self.wait(done, 60)
+
+    def bench_connect(self):
+        """Connect and start sessions for many clients."""
+        self.measure('%sconnect_%s' % (self.prefix, self.clients),
+                     self.connect_all, self.clients, rounds=1)
+
+    def bench_message_ring(self):
+        """Pass messages between many connected clients."""
+        self.connect_all()
+        total = self.clients * self.messages
+        received = [0]
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def on_message(msg):
+            with lock:
+                received[0] += 1
+                if received[0] == total:
+                    done.set()
+
+        for xmpp in self.sessions:
+            xmpp.add_event_handler('message', on_message)
+
+        def run():
+            for n in range(self.messages):
+                for i, xmpp in enumerate(self.sessions):
+                    peer = self.sessions[(i + 1) % self.clients]
+                    xmpp.send_message(mto=peer.boundjid, mbody=str(n))
+            self.wait(done, 60)
+
+        self.measure('%smessage_ring_%s' % (self.prefix, self.clients),
+                     run, total, rounds=1)
+
+    def bench_hub_connect(self):
+        """Connect and start sessions for many clients in a StreamHub."""
+        self.hub = StreamHub()
+        self.prefix = 'hub_'
+        self.bench_connect()
+
+    def bench_hub_message_ring(self):
+        """Pass messages between many clients in a StreamHub."""
+        self.hub = StreamHub()
+        self.prefix = 'hub_'
+        self.bench_message_ring()
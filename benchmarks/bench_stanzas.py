@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+from sleekxmpp.test.benchmark import SleekBenchmark
+from sleekxmpp.stanza import Message
+from sleekxmpp.xmlstream import ET, tostring
+
+
+MESSAGE = """
+<message xmlns="jabber:client" from="juliet@capulet.lit/balcony"
+         to="romeo@montague.lit/garden" type="chat" id="m1">
+  <subject>Balcony</subject>
+  <thread>e0ffe42b28561960c6b12b944a092794b9683a38</thread>
+  <body>Wherefore art thou, Romeo?</body>
+</message>
+"""
+
+
+class StanzaBenchmark(SleekBenchmark):
+
+    """Parsing, building and serializing of stanza objects."""
+
+    number = 5000
+
+    def bench_parse(self):
+        """Parse raw XML into Message stanza objects."""
+        def parse():
+            for i in range(self.number):
+                msg = Message(xml=ET.fromstring(MESSAGE))
+                msg['body']
+        self.measure('parse', parse, self.number)
+
+    def bench_build(self):
+        """Build Message stanza objects through the interfaces."""
+        def build():
+            for i in range(self.number):
+                msg = Message()
+                msg['to'] = 'romeo@montague.lit/garden'
+                msg['from'] = 'juliet@capulet.lit/balcony'
+                msg['type'] = 'chat'
+                msg['subject'] = 'Balcony'
+                msg['body'] = 'Wherefore art thou, Romeo?'
+        self.measure('build', build, self.number)
+
+    def bench_serialize(self):
+        """Serialize a Message stanza object to a string."""
+        msg = Message(xml=ET.fromstring(MESSAGE))
+
+        def serialize():
+            for i in range(self.number):
+                tostring(msg.xml, top_level=True)
+        self.measure('serialize', serialize, self.number)
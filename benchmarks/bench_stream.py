@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import threading
+
+from sleekxmpp.test.benchmark import SleekBenchmark
+from sleekxmpp.xmlstream.handler import Callback
+from sleekxmpp.xmlstream.matcher import StanzaPath
+
+
+MESSAGE = ('<message from="juliet@capulet.lit/balcony" '
+           'to="tester@localhost" type="chat">'
+           '<body>Wherefore art thou, Romeo? %s</body>'
+           '</message>')
+
+PLUGIN_MESSAGE = (
+    '<message from="juliet@capulet.lit/balcony" '
+    'to="tester@localhost" type="chat" id="m%s">'
+    '<body>Wherefore art thou, Romeo?</body>'
+    '<active xmlns="http://jabber.org/protocol/chatstates" />'
+    '<request xmlns="urn:xmpp:receipts" />'
+    '<nick xmlns="http://jabber.org/protocol/nick">Juliet</nick>'
+    '<delay xmlns="urn:xmpp:delay" from="capulet.lit" '
+    'stamp="2002-09-10T23:08:25Z" />'
+    '<html xmlns="http://jabber.org/protocol/xhtml-im">'
+    '<body xmlns="http://www.w3.org/1999/xhtml">'
+    '<p>Wherefore art thou, <em>Romeo</em>?</p></body></html>'
+    '</message>')
+
+PRESENCE = '<presence from="user%s@localhost/res" %s/>'
+
+
+class StreamBenchmark(SleekBenchmark):
+
+    """Stanza processing through a stream using the in-memory socket."""
+
+    number = 2000
+    batch = 100
+
+    def feed(self, template, count, *args):
+        """Queue ``count`` stanzas for receiving, in batches."""
+        socket = self.xmpp.socket
+        for start in range(0, count, self.batch):
+            end = min(start + self.batch, count)
+            socket.recv_data(''.join(template % ((i,) + args)
+                                     for i in range(start, end)))
+
+    def receive(self, event, template, count, *args):
+        """Return a function that feeds stanzas and waits for events."""
+        def setup():
+            return self.counter(event, count)
+
+        def run(done):
+            self.feed(template, count, *args)
+            self.wait(done)
+        return setup, run
+
+    def bench_receive(self):
+        """Parse and dispatch incoming messages."""
+        self.stream_start(plugins=[])
+        setup, run = self.receive('message', MESSAGE, self.number)
+        self.measure('receive', run, self.number, setup=setup)
+
+    def bench_handlers(self):
+        """Dispatch incoming messages past many registered handlers."""
+        self.stream_start(plugins=[])
+        setup, run = self.receive('message', MESSAGE, self.number)
+        registered = 0
+        for count in (10, 100):
+            while registered < count:
+                self.xmpp.register_handler(
+                        Callback('Bench %s' % registered,
+                                 StanzaPath('message/subject'),
+                                 lambda msg: None))
+                registered += 1
+            self.measure('handlers_%s' % count, run, self.number,
+                         setup=setup)
+
+    def bench_iq_roundtrip(self):
+        """Send Iq requests and wait for each result in turn."""
+        self.stream_start(plugins=[])
+        number = self.number // 4
+        socket = self.xmpp.socket
+
+        def roundtrips():
+            for i in range(number):
+                done = threading.Event()
+                iq = self.xmpp.Iq()
+                iq['type'] = 'get'
+                iq['to'] = 'localhost'
+                iq.send(block=False, callback=lambda resp: done.set())
+                socket.next_sent(timeout=5)
+                socket.recv_data('<iq type="result" id="%s" '
+                                 'from="localhost" />' % iq['id'])
+                self.wait(done, timeout=5)
+        self.measure('iq_roundtrip', roundtrips, number)
+
+    def bench_roster_presence(self):
+        """Process presence updates for contacts in the roster."""
+        self.stream_start(plugins=[])
+        roster = self.xmpp.client_roster
+        for i in range(self.number):
+            roster.add('user%s@localhost' % i, afrom=True, ato=True)
+
+        def setup():
+            return self.counter('presence_unavailable', self.number)
+
+        def run(done):
+            self.feed(PRESENCE, self.number, '')
+            self.feed(PRESENCE, self.number, 'type="unavailable" ')
+            self.wait(done)
+        self.measure('roster_presence', run, self.number * 2, setup=setup)
+
+    def bench_plugin_messages(self):
+        """Process messages with payloads handled by several plugins."""
+        self.stream_start(plugins=['xep_0030', 'xep_0071', 'xep_0085',
+                                   'xep_0172', 'xep_0184', 'xep_0203'])
+        setup, run = self.receive('message', PLUGIN_MESSAGE, self.number)
+        self.measure('plugin_messages', run, self.number, setup=setup)
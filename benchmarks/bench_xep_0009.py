@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2011 Nathanael C. Fritz, Dann Martens (TOMOTON).
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+from sleekxmpp.test.benchmark import SleekBenchmark
+from sleekxmpp.plugins.xep_0009.binding import py2xml, xml2py
+
+
+PAYLOADS = {
+    'ints': [list(range(10000))],
+    'strings': [['item %d' % i for i in range(10000)]],
+    'structs': [[{'id': i,
+                  'name': 'entry %d' % i,
+                  'tags': ['a', 'b', 'c'],
+                  'meta': {'score': i / 3.0, 'active': bool(i % 2)}}
+                 for i in range(2000)]],
+}
+
+
+class RPCCodecBenchmark(SleekBenchmark):
+
+    """Encoding and decoding XML-RPC parameters for XEP-0009."""
+
+    def bench_encode(self):
+        """Convert Python values to XML-RPC parameters."""
+        for name in sorted(PAYLOADS):
+            payload = PAYLOADS[name]
+            self.measure('encode_%s' % name,
+                         lambda: py2xml(*payload), 1)
+
+    def bench_decode(self):
+        """Convert XML-RPC parameters back to Python values."""
+        for name in sorted(PAYLOADS):
+            xml = py2xml(*PAYLOADS[name])
+            self.measure('decode_%s' % name,
+                         lambda: xml2py(xml), 1)
@@ -15,7 +15,7 @@ except ImportError:
     from distutils.core import setup, Command
 # from ez_setup import use_setuptools
 
-from testall import TestCommand
+from testall import TestCommand, BenchmarkCommand
 from sleekxmpp.version import __version__
 # if 'cygwin' in sys.platform.lower():
 #     min_version = '0.6c6'
@@ -155,5 +155,6 @@ setup(
     packages     = packages,
     requires     = [ 'dnspython', 'pyasn1', 'pyasn1_modules' ],
     classifiers  = CLASSIFIERS,
-    cmdclass     = {'test': TestCommand}
+    cmdclass     = {'test': TestCommand,
+                    'benchmark': BenchmarkCommand}
 )
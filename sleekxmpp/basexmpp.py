@@ -94,6 +94,17 @@ class BaseXMPP(XMLStream):
         #: :meth:`register_plugins` is called.
         self.plugin_whitelist = []
 
+        #: If ``True``, :meth:`register_plugins` only records the
+        #: plugins to load, and each plugin is imported and enabled
+        #: the first time it is accessed, or when a stanza using one
+        #: of the namespaces listed for it in
+        #: :data:`sleekxmpp.plugins.PLUGIN_NAMESPACES` is received.
+        #:
+        #: This reduces startup time for short lived clients, but a
+        #: plugin does not advertise its disco features or react to
+        #: stream events until it has been enabled.
+        self.lazy_plugins = False
+
         #: The main roster object. This roster supports multiple
         #: owner JIDs, as in the case for components. For clients
         #: which only have a single JID, see :attr:`client_roster`.
@@ -278,13 +289,18 @@ class BaseXMPP(XMLStream):
 
         for plugin in plugin_list:
             if plugin in plugins.__all__:
-                self.register_plugin(plugin)
+                if self.lazy_plugins:
+                    self.plugin.defer(plugin,
+                            self.plugin_config.get(plugin, {}),
+                            plugins.PLUGIN_NAMESPACES.get(plugin, None))
+                else:
+                    self.register_plugin(plugin)
             else:
                 raise NameError("Plugin %s not in plugins.__all__." % plugin)
 
     def __getitem__(self, key):
         """Return a plugin given its name, if it has been registered."""
-        if key in self.plugin:
+        if key in self.plugin or self.plugin.deferred(key):
             return self.plugin[key]
         else:
             log.warning("Plugin '%s' is not loaded.", key)
@@ -294,6 +310,21 @@ class BaseXMPP(XMLStream):
         """Return a plugin given its name, if it has been registered."""
         return self.plugin.get(key, default)
 
+    def incoming_filter(self, xml):
+        """Enable any deferred plugins that handle the namespace of
+        an incoming stanza or of one of its payloads.
+
+        See :attr:`lazy_plugins`.
+
+        :param xml: The XML stanza to pre-process.
+        """
+        if self.plugin._deferred_namespaces:
+            for elem in [xml] + list(xml):
+                if elem.tag.startswith('{'):
+                    namespace = elem.tag[1:elem.tag.find('}')]
+                    self.plugin.enable_namespace(namespace)
+        return xml
+
     def Message(self, *args, **kwargs):
         """Create a Message stanza associated with this stream."""
         msg = Message(self, *args, **kwargs)
@@ -128,7 +128,7 @@ class ComponentXMPP(BaseXMPP):
         """
         if xml.tag.startswith('{jabber:client}'):
             xml.tag = xml.tag.replace('jabber:client', self.default_ns)
-        return xml
+        return BaseXMPP.incoming_filter(self, xml)
 
     def start_stream_handler(self, xml):
         """
@@ -86,3 +86,54 @@ __all__ = [
     'xep_0325',  # IoT Systems Control
     'xep_0332',  # HTTP Over XMPP Transport
 ]
+
+
+#: Namespaces of the stanza payloads handled by built-in plugins. When
+#: plugins are loaded lazily (see :attr:`BaseXMPP.lazy_plugins`), a
+#: plugin is enabled as soon as a stanza using one of its namespaces is
+#: received. Plugins without an entry are only enabled once accessed.
+PLUGIN_NAMESPACES = {
+    'xep_0004': ('jabber:x:data',),
+    'xep_0009': ('jabber:iq:rpc',),
+    'xep_0012': ('jabber:iq:last',),
+    'xep_0013': ('http://jabber.org/protocol/offline',),
+    'xep_0016': ('jabber:iq:privacy',),
+    'xep_0020': ('http://jabber.org/protocol/feature-neg',),
+    'xep_0030': ('http://jabber.org/protocol/disco#info',
+                 'http://jabber.org/protocol/disco#items'),
+    'xep_0033': ('http://jabber.org/protocol/address',),
+    'xep_0045': ('http://jabber.org/protocol/muc#user',),
+    'xep_0047': ('http://jabber.org/protocol/ibb',),
+    'xep_0050': ('http://jabber.org/protocol/commands',),
+    'xep_0054': ('vcard-temp',),
+    'xep_0060': ('http://jabber.org/protocol/pubsub',
+                 'http://jabber.org/protocol/pubsub#event',
+                 'http://jabber.org/protocol/pubsub#owner'),
+    'xep_0065': ('http://jabber.org/protocol/bytestreams',),
+    'xep_0066': ('jabber:iq:oob', 'jabber:x:oob'),
+    'xep_0071': ('http://jabber.org/protocol/xhtml-im',),
+    'xep_0079': ('http://jabber.org/protocol/amp',),
+    'xep_0085': ('http://jabber.org/protocol/chatstates',),
+    'xep_0092': ('jabber:iq:version',),
+    'xep_0115': ('http://jabber.org/protocol/caps',),
+    'xep_0131': ('http://jabber.org/protocol/shim',),
+    'xep_0152': ('urn:xmpp:reach:0',),
+    'xep_0184': ('urn:xmpp:receipts',),
+    'xep_0186': ('urn:xmpp:invisible:0', 'urn:xmpp:visible:0'),
+    'xep_0191': ('urn:xmpp:blocking',),
+    'xep_0199': ('urn:xmpp:ping',),
+    'xep_0202': ('urn:xmpp:time',),
+    'xep_0203': ('urn:xmpp:delay',),
+    'xep_0224': ('urn:xmpp:attention:0',),
+    'xep_0231': ('urn:xmpp:bob',),
+    'xep_0249': ('jabber:x:conference',),
+    'xep_0258': ('urn:xmpp:sec-label:0', 'urn:xmpp:sec-label:catalog:2'),
+    'xep_0279': ('urn:xmpp:sic:0',),
+    'xep_0280': ('urn:xmpp:carbons:2',),
+    'xep_0297': ('urn:xmpp:forward:0',),
+    'xep_0308': ('urn:xmpp:message-correct:0',),
+    'xep_0313': ('urn:xmpp:mam:tmp',),
+    'xep_0323': ('urn:xmpp:iot:sensordata',),
+    'xep_0325': ('urn:xmpp:iot:control',),
+    'xep_0332': ('urn:xmpp:http',),
+}
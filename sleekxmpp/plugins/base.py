@@ -120,6 +120,14 @@ class PluginManager(object):
 
         self._plugin_lock = threading.RLock()
 
+        #: Plugins that will be enabled on first use, mapped to
+        #: their configuration. See :meth:`defer`.
+        self._deferred = {}
+
+        #: Map namespaces handled by deferred plugins to the names
+        #: of those plugins.
+        self._deferred_namespaces = {}
+
         #: Globally set default plugin configuration. This will
         #: be used for plugins that are auto-enabled through
         #: dependency loading.
@@ -139,6 +147,64 @@ class PluginManager(object):
         if enable:
             self.enable(plugin.name)
 
+    def defer(self, name, config=None, namespaces=None):
+        """Register a plugin to be enabled the first time it is used.
+
+        The plugin is not imported until it is accessed through the
+        manager, or until :meth:`enable_namespace` is called with one
+        of the given namespaces, typically when a stanza using that
+        namespace is received.
+
+        :param string name: The short name of the plugin.
+        :param dict config: Optional settings dictionary for
+                            configuring plugin behaviour.
+        :param namespaces: An iterable of the namespaces handled by
+                           the plugin.
+        """
+        with self._plugin_lock:
+            if name in self._enabled:
+                return
+            self._deferred[name] = config
+            for namespace in namespaces or ():
+                self._deferred_namespaces[namespace] = name
+
+    def deferred(self, name):
+        """Check if a plugin is waiting to be enabled on first use.
+
+        :param string name: The name of the plugin to check.
+        :return: boolean
+        """
+        return name in self._deferred
+
+    def enable_namespace(self, namespace):
+        """Enable the deferred plugin handling a namespace, if any.
+
+        :param string namespace: The namespace of a received element.
+        :return: ``True`` if a plugin was enabled.
+        """
+        name = self._deferred_namespaces.get(namespace, None)
+        if name is None:
+            return False
+        self._enable_deferred(name)
+        return True
+
+    def _enable_deferred(self, name):
+        """Enable a deferred plugin, along with its dependencies.
+
+        Since the stream may already be running, the plugins are
+        fully initialized, including :meth:`BasePlugin.post_init`.
+        """
+        enabled = set()
+        with self._plugin_lock:
+            if name not in self._deferred:
+                return
+            self.enable(name, enabled=enabled)
+            for plugin_name in enabled:
+                plugin = self._plugins[plugin_name]
+                if not hasattr(plugin, 'post_inited'):
+                    plugin.post_init()
+                    plugin.post_inited = True
+
     def enable(self, name, config=None, enabled=None):
         """Enable a plugin, including any dependencies.
 
@@ -151,6 +217,15 @@ class PluginManager(object):
             enabled = set()
 
         with self._plugin_lock:
+            if name in self._deferred:
+                deferred_config = self._deferred.pop(name)
+                if config is None:
+                    config = deferred_config
+                for namespace, plugin in list(
+                        self._deferred_namespaces.items()):
+                    if plugin == name:
+                        del self._deferred_namespaces[namespace]
+
             if name not in self._enabled:
                 enabled.add(name)
                 self._enabled.add(name)
@@ -245,9 +320,19 @@ class PluginManager(object):
         """
         plugin = self._plugins.get(name, None)
         if plugin is None:
+            if name in self._deferred:
+                self._enable_deferred(name)
+                return self._plugins[name]
             raise PluginNotFound(name)
         return plugin
 
+    def get(self, name, default=None):
+        """Return a plugin, or ``default`` if it has not been enabled."""
+        try:
+            return self[name]
+        except PluginNotFound:
+            return default
+
     def __iter__(self):
         """Return an iterator over the set of enabled plugins."""
         return self._plugins.__iter__()
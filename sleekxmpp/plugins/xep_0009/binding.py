@@ -39,99 +39,95 @@ def xml2fault(params):
 def py2xml(*args):
     params = ET.Element("{%s}params" % _namespace)
     for x in args:
-        param = ET.Element("{%s}param" % _namespace)
-        param.append(_py2xml(x))
-        params.append(param) #<params><param>...
+        param = ET.SubElement(params, "{%s}param" % _namespace)
+        param.append(_py2xml(x))  #<params><param>...
     return params
 
 def _py2xml(*args):
     for x in args:
-        val = ET.Element("{%s}value" % _namespace)
-        if x is None:
-            nil = ET.Element("{%s}nil" % _namespace)
-            val.append(nil)
-        elif type(x) is int:
-            i4 = ET.Element("{%s}i4" % _namespace)
-            i4.text = str(x)
-            val.append(i4)
-        elif type(x) is bool:
-            boolean = ET.Element("{%s}boolean" % _namespace)
-            boolean.text = str(int(x))
-            val.append(boolean)
-        elif type(x) in (str, unicode):
-            string = ET.Element("{%s}string" % _namespace)
-            string.text = x
-            val.append(string)
-        elif type(x) is float:
-            double = ET.Element("{%s}double" % _namespace)
-            double.text = str(x)
-            val.append(double)
-        elif type(x) is rpcbase64:
-            b64 = ET.Element("{%s}base64" % _namespace)
-            b64.text = x.encoded()
-            val.append(b64)
-        elif type(x) is rpctime:
-            iso = ET.Element("{%s}dateTime.iso8601" % _namespace)
-            iso.text = str(x)
-            val.append(iso)
-        elif type(x) in (list, tuple):
-            array = ET.Element("{%s}array" % _namespace)
-            data = ET.Element("{%s}data" % _namespace)
-            for y in x:
-                data.append(_py2xml(y))
-            array.append(data)
-            val.append(array)
-        elif type(x) is dict:
-            struct = ET.Element("{%s}struct" % _namespace)
-            for y in x.keys():
-                member = ET.Element("{%s}member" % _namespace)
-                name = ET.Element("{%s}name" % _namespace)
-                name.text = y
-                member.append(name)
-                member.append(_py2xml(x[y]))
-                struct.append(member)
-            val.append(struct)
+        val = ET.Element(_VALUE)
+        encoder = _encoders.get(type(x), None)
+        if encoder is not None:
+            encoder(val, x)
         return val
 
+def _encode_nil(val, x):
+    ET.SubElement(val, "{%s}nil" % _namespace)
+
+def _encode_int(val, x):
+    ET.SubElement(val, "{%s}i4" % _namespace).text = str(x)
+
+def _encode_bool(val, x):
+    ET.SubElement(val, "{%s}boolean" % _namespace).text = str(int(x))
+
+def _encode_string(val, x):
+    ET.SubElement(val, "{%s}string" % _namespace).text = x
+
+def _encode_double(val, x):
+    ET.SubElement(val, "{%s}double" % _namespace).text = str(x)
+
+def _encode_base64(val, x):
+    ET.SubElement(val, "{%s}base64" % _namespace).text = x.encoded()
+
+def _encode_time(val, x):
+    ET.SubElement(val, "{%s}dateTime.iso8601" % _namespace).text = str(x)
+
+def _encode_array(val, x):
+    array = ET.SubElement(val, _ARRAY)
+    data = ET.SubElement(array, _DATA)
+    for y in x:
+        data.append(_py2xml(y))
+
+def _encode_struct(val, x):
+    struct = ET.SubElement(val, _STRUCT)
+    for y in x.keys():
+        member = ET.SubElement(struct, _MEMBER)
+        ET.SubElement(member, _NAME).text = y
+        member.append(_py2xml(x[y]))
+
 def xml2py(params):
-    namespace = 'jabber:iq:rpc'
     vals = []
-    for param in params.findall('{%s}param' % namespace):
-        vals.append(_xml2py(param.find('{%s}value' % namespace)))
+    for param in params.findall('{%s}param' % _namespace):
+        vals.append(_xml2py(param.find(_VALUE)))
     return vals
 
 def _xml2py(value):
-    namespace = 'jabber:iq:rpc'
-    if value.find('{%s}nil' % namespace) is not None:
-        return None
-    if value.find('{%s}i4' % namespace) is not None:
-        return int(value.find('{%s}i4' % namespace).text)
-    if value.find('{%s}int' % namespace) is not None:
-        return int(value.find('{%s}int' % namespace).text)
-    if value.find('{%s}boolean' % namespace) is not None:
-        return bool(int(value.find('{%s}boolean' % namespace).text))
-    if value.find('{%s}string' % namespace) is not None:
-        return value.find('{%s}string' % namespace).text
-    if value.find('{%s}double' % namespace) is not None:
-        return float(value.find('{%s}double' % namespace).text)
-    if value.find('{%s}base64' % namespace) is not None:
-        return rpcbase64(value.find('{%s}base64' % namespace).text.encode())
-    if value.find('{%s}Base64' % namespace) is not None:
-        # Older versions of XEP-0009 used Base64
-        return rpcbase64(value.find('{%s}Base64' % namespace).text.encode())
-    if value.find('{%s}dateTime.iso8601' % namespace) is not None:
-        return rpctime(value.find('{%s}dateTime.iso8601' % namespace).text)
-    if value.find('{%s}struct' % namespace) is not None:
-        struct = {}
-        for member in value.find('{%s}struct' % namespace).findall('{%s}member' % namespace):
-            struct[member.find('{%s}name' % namespace).text] = _xml2py(member.find('{%s}value' % namespace))
-        return struct
-    if value.find('{%s}array' % namespace) is not None:
-        array = []
-        for val in value.find('{%s}array' % namespace).find('{%s}data' % namespace).findall('{%s}value' % namespace):
-            array.append(_xml2py(val))
-        return array
-    raise ValueError()
+    # Nested arrays and structs are decoded using an explicit stack
+    # instead of recursion, with each container filled in as its
+    # values are reached.
+    result = []
+    stack = [(result, iter(((None, value),)))]
+    while stack:
+        container, values = stack[-1]
+        try:
+            key, value = next(values)
+        except StopIteration:
+            stack.pop()
+            continue
+
+        for child in value:
+            tag = child.tag
+            if tag in _decoders:
+                item = _decoders[tag](child)
+                break
+            elif tag == _ARRAY:
+                item = []
+                data = child.find(_DATA)
+                stack.append((item, ((None, v) for v in data.findall(_VALUE))))
+                break
+            elif tag == _STRUCT:
+                item = {}
+                stack.append((item, ((m.find(_NAME).text, m.find(_VALUE))
+                                     for m in child.findall(_MEMBER))))
+                break
+        else:
+            raise ValueError()
+
+        if isinstance(container, list):
+            container.append(item)
+        else:
+            container[key] = item
+    return result[0]
 
 
 
@@ -171,3 +167,42 @@ class rpctime(object):
 
     def __str__(self):
         return self.iso8601()
+
+
+_VALUE = '{%s}value' % _namespace
+_ARRAY = '{%s}array' % _namespace
+_DATA = '{%s}data' % _namespace
+_STRUCT = '{%s}struct' % _namespace
+_MEMBER = '{%s}member' % _namespace
+_NAME = '{%s}name' % _namespace
+
+# Encoding functions for each supported Python type. Types not
+# listed here are encoded as an empty <value />.
+_encoders = {
+    type(None): _encode_nil,
+    int: _encode_int,
+    bool: _encode_bool,
+    str: _encode_string,
+    unicode: _encode_string,
+    float: _encode_double,
+    rpcbase64: _encode_base64,
+    rpctime: _encode_time,
+    list: _encode_array,
+    tuple: _encode_array,
+    dict: _encode_struct,
+}
+
+# Decoding functions for each scalar XML-RPC type, keyed by the
+# tag of the element in a <value />.
+_decoders = {
+    '{%s}nil' % _namespace: lambda e: None,
+    '{%s}i4' % _namespace: lambda e: int(e.text),
+    '{%s}int' % _namespace: lambda e: int(e.text),
+    '{%s}boolean' % _namespace: lambda e: bool(int(e.text)),
+    '{%s}string' % _namespace: lambda e: e.text,
+    '{%s}double' % _namespace: lambda e: float(e.text),
+    '{%s}base64' % _namespace: lambda e: rpcbase64(e.text.encode()),
+    # Older versions of XEP-0009 used Base64
+    '{%s}Base64' % _namespace: lambda e: rpcbase64(e.text.encode()),
+    '{%s}dateTime.iso8601' % _namespace: lambda e: rpctime(e.text),
+}
@@ -6,6 +6,8 @@
     See the file LICENSE for copying permission.
 """
 
+import threading
+
 from sleekxmpp.thirdparty import GPG
 
 from sleekxmpp.stanza import Presence, Message
@@ -14,28 +16,35 @@ from sleekxmpp.xmlstream import ElementBase, register_stanza_plugin
 from sleekxmpp.xmlstream.handler import Callback
 from sleekxmpp.xmlstream.matcher import StanzaPath
 from sleekxmpp.plugins.xep_0027 import stanza, Signed, Encrypted
+from sleekxmpp.plugins.xep_0027.worker import GPGWorker, extract_data
 
 
-def _extract_data(data, kind):
-    stripped = []
-    begin_headers = False
-    begin_data = False
-    for line in data.split('\n'):
-        if not begin_headers and 'BEGIN PGP %s' % kind in line:
-            begin_headers = True
-            continue
-        if begin_headers and line.strip() == '':
-            begin_data = True
-            continue
-        if 'END PGP %s' % kind in line:
-            return '\n'.join(stripped)
-        if begin_data:
-            stripped.append(line)
-    return ''
+# Kept for code that imported the helper from this module.
+_extract_data = extract_data
 
 
 class XEP_0027(BasePlugin):
 
+    """
+    XEP-0027: Current Jabber OpenPGP Usage
+
+    Outgoing presences are signed, and incoming signed presences
+    verified, by a :class:`~sleekxmpp.plugins.xep_0027.worker.GPGWorker`
+    so that gpg never runs on the event processing thread. A presence
+    whose status has not been signed before is held back until its
+    signature is ready, along with any presences sent after it.
+
+    Configuration:
+        gpg_binary -- The gpg executable to use.
+        gpg_home   -- The GnuPG home directory.
+        use_agent  -- Indicates if gpg-agent should be used.
+        keyring    -- Optional keyring file to use instead of the
+                      default one.
+        key_server -- The key server to fetch unknown keys from.
+        cache_size -- The number of signatures, and of verification
+                      results, to remember.
+    """
+
     name = 'xep_0027'
     description = 'XEP-0027: Current Jabber OpenPGP Usage'
     dependencies = set()
@@ -45,7 +54,8 @@ class XEP_0027(BasePlugin):
         'gpg_home': '',
         'use_agent': True,
         'keyring': None,
-        'key_server': 'pgp.mit.edu'
+        'key_server': 'pgp.mit.edu',
+        'cache_size': 1024
     }
 
     def plugin_init(self):
@@ -53,6 +63,9 @@ class XEP_0027(BasePlugin):
                        gpgbinary=self.gpg_binary,
                        use_agent=self.use_agent,
                        keyring=self.keyring)
+        self.worker = GPGWorker(self.gpg, cache_size=self.cache_size)
+        self._held = 0
+        self._held_lock = threading.Lock()
 
         self.xmpp.add_filter('out', self._sign_presence)
 
@@ -67,8 +80,7 @@ class XEP_0027(BasePlugin):
         register_stanza_plugin(Message, Encrypted)
 
         self.xmpp.add_event_handler('unverified_signed_presence',
-                self._handle_unverified_signed_presence,
-                threaded=True)
+                self._handle_unverified_signed_presence)
 
         self.xmpp.register_handler(
                 Callback('Signed Presence',
@@ -86,25 +98,62 @@ class XEP_0027(BasePlugin):
         self.xmpp.del_filter('out', self._sign_presence)
         self.xmpp.del_event_handler('unverified_signed_presence',
                 self._handle_unverified_signed_presence)
+        # Wait for a presence being signed, so that it cannot release
+        # its hold after the count is reset.
+        self.worker.shutdown(wait=True)
+        with self._held_lock:
+            self._held = 0
 
     def _sign_presence(self, stanza):
-        if isinstance(stanza, Presence):
-            if stanza['type'] == 'available' or \
-                    stanza['type'] in Presence.showtypes:
+        if not isinstance(stanza, Presence):
+            return stanza
+        if self.worker.in_worker():
+            # Held back presences are sent again from the worker.
+            if self._needs_signature(stanza):
                 stanza['signed'] = stanza['status']
+            return stanza
+        with self._held_lock:
+            if self._held:
+                # Keep presences in order behind those being signed.
+                self._hold(stanza)
+                return None
+        if self._needs_signature(stanza):
+            keyid = self.get_keyid(stanza['from'])
+            if keyid and not self.worker.has_signature(stanza['status'],
+                                                       keyid):
+                with self._held_lock:
+                    self._hold(stanza)
+                return None
+            stanza['signed'] = stanza['status']
         return stanza
 
+    def _hold(self, stanza):
+        if self.worker.submit(self._send_presence, stanza):
+            self._held += 1
+
+    def _needs_signature(self, stanza):
+        if stanza.xml.find(Signed.tag_name()) is not None:
+            return False
+        return stanza['type'] == 'available' or \
+               stanza['type'] in Presence.showtypes
+
+    def _send_presence(self, stanza):
+        try:
+            stanza.send()
+        finally:
+            with self._held_lock:
+                self._held = max(0, self._held - 1)
+
     def sign(self, data, jid=None):
         keyid = self.get_keyid(jid)
         if keyid:
-            signed = self.gpg.sign(data, keyid=keyid)
-            return _extract_data(signed.data, 'SIGNATURE')
+            return self.worker.sign(data, keyid)
 
     def encrypt(self, data, jid=None):
         keyid = self.get_keyid(jid)
         if keyid:
             enc = self.gpg.encrypt(data, keyid)
-            return _extract_data(enc.data, 'MESSAGE')
+            return extract_data(enc.data, 'MESSAGE')
 
     def decrypt(self, data, jid=None):
         template = '-----BEGIN PGP MESSAGE-----\n' + \
@@ -115,16 +164,8 @@ class XEP_0027(BasePlugin):
         return dec.data
 
     def verify(self, data, sig, jid=None):
-        template = '-----BEGIN PGP SIGNED MESSAGE-----\n' + \
-                   'Hash: SHA1\n' + \
-                   '\n' + \
-                   '%s\n' + \
-                   '-----BEGIN PGP SIGNATURE-----\n' + \
-                   '\n' + \
-                   '%s\n' + \
-                   '-----END PGP SIGNATURE-----\n'
-        v = self.gpg.verify(template % (data, sig))
-        return v
+        keyid = self.get_keyid(jid) if jid else None
+        return self.worker.verify(data, sig, keyid)
 
     def set_keyid(self, jid=None, keyid=None):
         self.api['set_keyid'](jid, args=keyid)
@@ -142,12 +183,19 @@ class XEP_0027(BasePlugin):
         self.xmpp.event('unverified_signed_presence', pres)
 
     def _handle_unverified_signed_presence(self, pres):
-        verified = self.verify(pres['status'], pres['signed'])
-        if verified.key_id:
+        self.worker.submit(self._verify_presence, pres)
+
+    def _verify_presence(self, pres):
+        verified = self.verify(pres['status'], pres['signed'], pres['from'])
+        if not verified.valid and verified.key_id and \
+                not self.get_keyid(pres['from']):
+            known_keyids = [e['keyid'] for e in self.gpg.list_keys()]
+            if verified.key_id not in known_keyids:
+                self.gpg.recv_keys(self.key_server, verified.key_id)
+                verified = self.verify(pres['status'], pres['signed'],
+                                       pres['from'])
+        if verified.valid:
             if not self.get_keyid(pres['from']):
-                known_keyids = [e['keyid'] for e in self.gpg.list_keys()]
-                if verified.key_id not in known_keyids:
-                    self.gpg.recv_keys(self.key_server, verified.key_id)
                 self.set_keyid(jid=pres['from'], keyid=verified.key_id)
             self.xmpp.event('signed_presence', pres)
 
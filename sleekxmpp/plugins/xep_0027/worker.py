@@ -0,0 +1,176 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2012 Nathanael C. Fritz, Lance J.T. Stout
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import logging
+import threading
+
+from sleekxmpp.thirdparty import OrderedDict
+from sleekxmpp.util import WorkerPool
+
+
+log = logging.getLogger(__name__)
+
+
+SIGNED_TEMPLATE = '-----BEGIN PGP SIGNED MESSAGE-----\n' + \
+                  'Hash: SHA1\n' + \
+                  '\n' + \
+                  '%s\n' + \
+                  '-----BEGIN PGP SIGNATURE-----\n' + \
+                  '\n' + \
+                  '%s\n' + \
+                  '-----END PGP SIGNATURE-----\n'
+
+
+def extract_data(data, kind):
+    """Return the body of an ASCII armored block of the given kind."""
+    stripped = []
+    begin_headers = False
+    begin_data = False
+    for line in data.split('\n'):
+        if not begin_headers and 'BEGIN PGP %s' % kind in line:
+            begin_headers = True
+            continue
+        if begin_headers and line.strip() == '':
+            begin_data = True
+            continue
+        if 'END PGP %s' % kind in line:
+            return '\n'.join(stripped)
+        if begin_data:
+            stripped.append(line)
+    return ''
+
+
+class GPGWorker(object):
+
+    """
+    Run GnuPG operations for XEP-0027 in the background and remember
+    their results.
+
+    Queued tasks run one at a time on a single long-lived thread, in
+    the order they were submitted, so a burst of presences neither
+    blocks the event thread nor starts a crowd of gpg processes at
+    once. Signatures are remembered per ``(data, key)`` so an unchanged
+    status is only signed once, and verification results per
+    ``(signature, data, key)`` so a status that is broadcast again is
+    not verified again. Up to ``cache_size`` entries of each are kept,
+    least recently used first.
+    """
+
+    def __init__(self, gpg, cache_size=1024):
+        """
+        Arguments:
+            gpg        -- The :class:`~sleekxmpp.thirdparty.GPG` object
+                          to run operations with.
+            cache_size -- The number of signatures, and of verification
+                          results, to remember.
+        """
+        self.gpg = gpg
+        #: The number of signatures and verification results kept.
+        self.cache_size = cache_size
+        self.pool = WorkerPool(max_workers=1, name='gpg worker')
+        self.lock = threading.Lock()
+        self._signatures = OrderedDict()
+        self._verified = OrderedDict()
+        self._local = threading.local()
+
+    def in_worker(self):
+        """Return ``True`` when called from a queued task."""
+        return getattr(self._local, 'active', False)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a call to ``func``, to run after all earlier tasks.
+
+        Returns ``False`` if the task was dropped because the worker
+        has been shut down.
+
+        Arguments:
+            func -- The function to call from the worker thread.
+        """
+        return self.pool.submit(self._run, func, args, kwargs)
+
+    def shutdown(self, wait=False):
+        """
+        Discard queued tasks and stop the worker thread.
+
+        Arguments:
+            wait -- If ``True``, block until a running task finishes.
+                    A task calling this does not wait for itself.
+        """
+        self.pool.shutdown(wait=wait)
+
+    def has_signature(self, data, keyid):
+        """Return ``True`` if a signature of ``data`` is remembered."""
+        with self.lock:
+            return (data, keyid) in self._signatures
+
+    def sign(self, data, keyid):
+        """
+        Return the ASCII armored signature of ``data`` without its
+        headers, or an empty string if signing failed.
+
+        Arguments:
+            data  -- The text to sign.
+            keyid -- The key to sign with.
+        """
+        key = (data, keyid)
+        with self.lock:
+            signature = self._signatures.pop(key, None)
+            if signature is not None:
+                self._signatures[key] = signature
+                return signature
+
+        signed = self.gpg.sign(data, keyid=keyid)
+        signature = extract_data(signed.data, 'SIGNATURE')
+        if signature:
+            self._remember(self._signatures, key, signature)
+        return signature
+
+    def verify(self, data, sig, keyid=None):
+        """
+        Verify a signature of ``data``, returning the
+        :class:`~sleekxmpp.thirdparty.gnupg.Verify` result.
+
+        Results are only remembered if the signature was found good or
+        bad, so that a signature made with a key that is not yet known
+        is checked again once the key is imported.
+
+        Arguments:
+            data  -- The signed text.
+            sig   -- The signature, without its headers.
+            keyid -- The key the signer is known to use, if any.
+        """
+        key = (sig, data, keyid)
+        with self.lock:
+            verified = self._verified.pop(key, None)
+            if verified is not None:
+                self._verified[key] = verified
+                return verified
+
+        verified = self.gpg.verify(SIGNED_TEMPLATE % (data, sig))
+        if getattr(verified, 'status', None) in ('signature good',
+                                                  'signature valid',
+                                                  'signature bad'):
+            self._remember(self._verified, key, verified)
+        return verified
+
+    def _remember(self, cache, key, value):
+        with self.lock:
+            cache.pop(key, None)
+            cache[key] = value
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+
+    def _run(self, func, args, kwargs):
+        self._local.active = True
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            log.exception('Error in GnuPG task: %s', func)
+        finally:
+            self._local.active = False
@@ -408,6 +408,8 @@ class XEP_0030(BasePlugin):
             iterator -- If True, return a result set iterator using
                         the XEP-0059 plugin, if the plugin is loaded.
                         Otherwise the parameter is ignored.
+            lookahead -- When using an iterator, the number of pages
+                        to fetch ahead of the caller. Defaults to 0.
             timeout_callback -- Optional callback to execute when no result
                         has been received in timeout seconds.
         """
@@ -424,7 +426,8 @@ class XEP_0030(BasePlugin):
         iq['type'] = 'get'
         iq['disco_items']['node'] = node if node else ''
         if kwargs.get('iterator', False) and self.xmpp['xep_0059']:
-            return self.xmpp['xep_0059'].iterate(iq, 'disco_items')
+            return self.xmpp['xep_0059'].iterate(iq, 'disco_items',
+                    lookahead=kwargs.get('lookahead', 0))
         else:
             return iq.send(timeout=kwargs.get('timeout', None),
                            block=kwargs.get('block', True),
@@ -705,7 +708,11 @@ class XEP_0030(BasePlugin):
         if isinstance(info, Iq):
             info = info['disco_info']
         if not info['node']:
-            if not info['identities']:
+            # Only look for the first child of each kind instead of
+            # building the full identity and feature lists, since
+            # this runs for every disco#info query we answer.
+            ns = info.namespace
+            if info.xml.find('{%s}identity' % ns) is None:
                 if self.xmpp.is_component:
                     log.debug("No identity found for this entity. " + \
                               "Using default component identity.")
@@ -714,10 +721,12 @@ class XEP_0030(BasePlugin):
                     log.debug("No identity found for this entity. " + \
                               "Using default client identity.")
                     info.add_identity('client', 'bot')
-            if not info['features']:
+                self.xmpp.forget_xml(info)
+            if info.xml.find('{%s}feature' % ns) is None:
                 log.debug("No features found for this entity. " + \
                           "Using default disco#info feature.")
                 info.add_feature(info.namespace)
+                self.xmpp.forget_xml(info)
         return result
 
     def _wrap(self, ito, ifrom, payload, force=False):
@@ -31,7 +31,8 @@ class StaticDisco(object):
 
     Attributes:
         nodes -- A dictionary mapping (JID, node) tuples to a dict
-                 containing a disco#info and a disco#items stanza.
+                 containing a disco#info and a disco#items stanza,
+                 and a version counter for the two stanzas.
         xmpp  -- The main SleekXMPP object.
     """
 
@@ -70,7 +71,8 @@ class StaticDisco(object):
                 ifrom = ifrom.full
             if (jid, node, ifrom) not in self.nodes:
                 self.nodes[(jid, node, ifrom)] = {'info': DiscoInfo(),
-                                           'items': DiscoItems()}
+                                           'items': DiscoItems(),
+                                           'version': 0}
                 self.nodes[(jid, node, ifrom)]['info']['node'] = node
                 self.nodes[(jid, node, ifrom)]['items']['node'] = node
 
@@ -102,6 +104,40 @@ class StaticDisco(object):
                 return False
             return True
 
+    def node_changed(self, jid=None, node=None, ifrom=None):
+        """
+        Discard any cached serializations of the stanzas for a
+        JID/node combination and increment its version counter.
+        Must be called whenever those stanzas are modified or replaced.
+
+        Arguments:
+            jid  -- The JID that owns the stanzas.
+            node -- The node that owns the stanzas.
+        """
+        with self.lock:
+            if self.node_exists(jid, node, ifrom):
+                stanzas = self.get_node(jid, node, ifrom)
+                self.xmpp.forget_xml(stanzas['info'])
+                self.xmpp.forget_xml(stanzas['items'])
+                stanzas['version'] += 1
+
+    def get_version(self, jid=None, node=None, ifrom=None):
+        """
+        Return the version counter for a JID/node combination, which
+        changes every time its stanzas are modified. Values derived
+        from a node's stanzas may be cached until the version changes.
+
+        Returns None if the node does not exist.
+
+        Arguments:
+            jid  -- The JID that owns the stanzas.
+            node -- The node that owns the stanzas.
+        """
+        with self.lock:
+            if not self.node_exists(jid, node, ifrom):
+                return None
+            return self.get_node(jid, node, ifrom)['version']
+
     # =================================================================
     # Node Handlers
     #
@@ -115,6 +151,10 @@ class StaticDisco(object):
     # This implementation does not allow different responses based on
     # the requester's JID, except for cached results. To do that,
     # register a custom node handler.
+    #
+    # Stored stanzas returned by get_info and get_items are memoized by
+    # the stream so that answering repeated queries does not serialize
+    # them again; every handler that modifies a node calls node_changed.
 
     def supports(self, jid, node, ifrom, data):
         """
@@ -206,7 +246,9 @@ class StaticDisco(object):
                 else:
                     raise XMPPError(condition='item-not-found')
             else:
-                return self.get_node(jid, node)['info']
+                info = self.get_node(jid, node)['info']
+                self.xmpp.memoize_xml(info)
+                return info
 
     def set_info(self, jid, node, ifrom, data):
         """
@@ -216,6 +258,7 @@ class StaticDisco(object):
         """
         with self.lock:
             self.add_node(jid, node)
+            self.node_changed(jid, node)
             self.get_node(jid, node)['info'] = data
 
     def del_info(self, jid, node, ifrom, data):
@@ -226,6 +269,7 @@ class StaticDisco(object):
         """
         with self.lock:
             if self.node_exists(jid, node):
+                self.node_changed(jid, node)
                 self.get_node(jid, node)['info'] = DiscoInfo()
 
     def get_items(self, jid, node, ifrom, data):
@@ -241,7 +285,9 @@ class StaticDisco(object):
                 else:
                     raise XMPPError(condition='item-not-found')
             else:
-                return self.get_node(jid, node)['items']
+                items = self.get_node(jid, node)['items']
+                self.xmpp.memoize_xml(items)
+                return items
 
     def set_items(self, jid, node, ifrom, data):
         """
@@ -254,6 +300,7 @@ class StaticDisco(object):
             items = data.get('items', set())
             self.add_node(jid, node)
             self.get_node(jid, node)['items']['items'] = items
+            self.node_changed(jid, node)
 
     def del_items(self, jid, node, ifrom, data):
         """
@@ -263,6 +310,7 @@ class StaticDisco(object):
         """
         with self.lock:
             if self.node_exists(jid, node):
+                self.node_changed(jid, node)
                 self.get_node(jid, node)['items'] = DiscoItems()
 
     def add_identity(self, jid, node, ifrom, data):
@@ -282,6 +330,7 @@ class StaticDisco(object):
                     data.get('itype', ''),
                     data.get('name', None),
                     data.get('lang', None))
+            self.node_changed(jid, node)
 
     def set_identities(self, jid, node, ifrom, data):
         """
@@ -295,6 +344,7 @@ class StaticDisco(object):
             identities = data.get('identities', set())
             self.add_node(jid, node)
             self.get_node(jid, node)['info']['identities'] = identities
+            self.node_changed(jid, node)
 
     def del_identity(self, jid, node, ifrom, data):
         """
@@ -313,6 +363,7 @@ class StaticDisco(object):
                         data.get('itype', ''),
                         data.get('name', None),
                         data.get('lang', None))
+                self.node_changed(jid, node)
 
     def del_identities(self, jid, node, ifrom, data):
         """
@@ -323,6 +374,7 @@ class StaticDisco(object):
         with self.lock:
             if self.node_exists(jid, node):
                 del self.get_node(jid, node)['info']['identities']
+                self.node_changed(jid, node)
 
     def add_feature(self, jid, node, ifrom, data):
         """
@@ -335,6 +387,7 @@ class StaticDisco(object):
             self.add_node(jid, node)
             self.get_node(jid, node)['info'].add_feature(
                     data.get('feature', ''))
+            self.node_changed(jid, node)
 
     def set_features(self, jid, node, ifrom, data):
         """
@@ -347,6 +400,7 @@ class StaticDisco(object):
             features = data.get('features', set())
             self.add_node(jid, node)
             self.get_node(jid, node)['info']['features'] = features
+            self.node_changed(jid, node)
 
     def del_feature(self, jid, node, ifrom, data):
         """
@@ -359,6 +413,7 @@ class StaticDisco(object):
             if self.node_exists(jid, node):
                 self.get_node(jid, node)['info'].del_feature(
                         data.get('feature', ''))
+                self.node_changed(jid, node)
 
     def del_features(self, jid, node, ifrom, data):
         """
@@ -370,6 +425,7 @@ class StaticDisco(object):
             if not self.node_exists(jid, node):
                 return
             del self.get_node(jid, node)['info']['features']
+            self.node_changed(jid, node)
 
     def add_item(self, jid, node, ifrom, data):
         """
@@ -387,6 +443,7 @@ class StaticDisco(object):
                     data.get('ijid', ''),
                     node=data.get('inode', ''),
                     name=data.get('name', ''))
+            self.node_changed(jid, node)
 
     def del_item(self, jid, node, ifrom, data):
         """
@@ -401,6 +458,7 @@ class StaticDisco(object):
                 self.get_node(jid, node)['items'].del_item(
                         data.get('ijid', ''),
                         node=data.get('inode', None))
+                self.node_changed(jid, node)
 
     def cache_info(self, jid, node, ifrom, data):
         """
@@ -109,6 +109,102 @@ class MUCPresence(ElementBase):
         return self
 
 
+class MUCRoom(dict):
+
+    """
+    The occupants of a joined room, mapping nicks to occupant entries.
+
+    Besides lookups by nick, the real JIDs of the occupants (when the
+    room reveals them) and the nicks holding each role and affiliation
+    are indexed, so that they can be found without scanning the whole
+    room. The indexes are kept up to date as entries are replaced or
+    removed, only touching the values that changed.
+
+    Attributes:
+        jids         -- A dictionary mapping real full JIDs to the
+                        set of nicks used by that JID.
+        roles        -- A dictionary mapping roles to sets of nicks.
+        affiliations -- A dictionary mapping affiliations to sets
+                        of nicks.
+    """
+
+    def __init__(self, occupants=None):
+        dict.__init__(self)
+        self.jids = {}
+        self.roles = {}
+        self.affiliations = {}
+        if occupants:
+            self.update(occupants)
+
+    def _link(self, index, key, nick):
+        if key:
+            if key not in index:
+                index[key] = set()
+            index[key].add(nick)
+
+    def _unlink(self, index, key, nick):
+        nicks = index.get(key, None)
+        if nicks is not None:
+            nicks.discard(nick)
+            if not nicks:
+                del index[key]
+
+    def _reindex(self, nick, old, new):
+        for index, field in ((self.roles, 'role'),
+                             (self.affiliations, 'affiliation')):
+            old_value = old.get(field, '') if old else ''
+            new_value = new.get(field, '') if new else ''
+            if old_value != new_value:
+                self._unlink(index, old_value, nick)
+                self._link(index, new_value, nick)
+        old_jid = old.get('jid', '') if old else ''
+        new_jid = new.get('jid', '') if new else ''
+        if isinstance(old_jid, JID):
+            old_jid = old_jid.full
+        if isinstance(new_jid, JID):
+            new_jid = new_jid.full
+        if old_jid != new_jid:
+            self._unlink(self.jids, old_jid, nick)
+            self._link(self.jids, new_jid, nick)
+
+    def __setitem__(self, nick, entry):
+        self._reindex(nick, dict.get(self, nick, None), entry)
+        dict.__setitem__(self, nick, entry)
+
+    def __delitem__(self, nick):
+        self._reindex(nick, dict.__getitem__(self, nick), None)
+        dict.__delitem__(self, nick)
+
+    def pop(self, nick, *args):
+        if nick in self:
+            self._reindex(nick, dict.__getitem__(self, nick), None)
+        return dict.pop(self, nick, *args)
+
+    def popitem(self):
+        nick, entry = dict.popitem(self)
+        self._reindex(nick, entry, None)
+        return nick, entry
+
+    def setdefault(self, nick, entry=None):
+        if nick not in self:
+            self[nick] = entry
+        return dict.__getitem__(self, nick)
+
+    def update(self, *args, **kwargs):
+        """
+        Add or replace many occupants at once, such as when loading
+        the initial presence flood of a large room.
+        """
+        for nick, entry in dict(*args, **kwargs).items():
+            self[nick] = entry
+
+    def clear(self):
+        dict.clear(self)
+        self.jids.clear()
+        self.roles.clear()
+        self.affiliations.clear()
+
+
 class XEP_0045(BasePlugin):
 
     """
@@ -139,7 +235,7 @@ class XEP_0045(BasePlugin):
         """ Handle an invite into a muc.
         """
         logging.debug("MUC invite to %s from %s: %s", inv['to'], inv["from"], inv)
-        if inv['from'] not in self.rooms.keys():
+        if inv['from'] not in self.rooms:
             self.xmpp.event("groupchat_invite", inv)
 
     def handle_config_change(self, msg):
@@ -152,20 +248,20 @@ class XEP_0045(BasePlugin):
         """
         got_offline = False
         got_online = False
-        if pr['muc']['room'] not in self.rooms.keys():
+        room = self.rooms.get(pr['muc']['room'], None)
+        if room is None:
             return
         entry = pr['muc'].getStanzaValues()
         entry['show'] = pr['show']
         entry['status'] = pr['status']
         entry['alt_nick'] = pr['nick']
         if pr['type'] == 'unavailable':
-            if entry['nick'] in self.rooms[entry['room']]:
-                del self.rooms[entry['room']][entry['nick']]
+            room.pop(entry['nick'], None)
             got_offline = True
         else:
-            if entry['nick'] not in self.rooms[entry['room']]:
+            if entry['nick'] not in room:
                 got_online = True
-            self.rooms[entry['room']][entry['nick']] = entry
+            room[entry['nick']] = entry
         log.debug("MUC presence from %s/%s : %s", entry['room'],entry['nick'], entry)
         self.xmpp.event("groupchat_presence", pr)
         self.xmpp.event("muc::%s::presence" % entry['room'], pr)
@@ -195,17 +291,22 @@ class XEP_0045(BasePlugin):
         self.xmpp.event('groupchat_subject', msg)
 
     def jidInRoom(self, room, jid):
-        for nick in self.rooms[room]:
-            entry = self.rooms[room][nick]
-            if entry is not None and entry['jid'].full == jid:
-                return True
-        return False
+        return jid in self.rooms[room].jids
 
     def getNick(self, room, jid):
-        for nick in self.rooms[room]:
-            entry = self.rooms[room][nick]
-            if entry is not None and entry['jid'].full == jid:
-                return nick
+        nicks = self.rooms[room].jids.get(jid, None)
+        if nicks:
+            return next(iter(nicks))
+
+    def getNicksByRole(self, room, role):
+        """ Get the set of nicks in a room having the given role.
+        """
+        return set(self.rooms[room].roles.get(role, ()))
+
+    def getNicksByAffiliation(self, room, affiliation):
+        """ Get the set of nicks in a room having the given affiliation.
+        """
+        return set(self.rooms[room].affiliations.get(affiliation, ()))
 
     def configureRoom(self, room, form=None, ifrom=None):
         if form is None:
@@ -250,7 +351,7 @@ class XEP_0045(BasePlugin):
             #wait for our own room presence back
             expect = ET.Element("{%s}presence" % self.xmpp.default_ns, {'from':"%s/%s" % (room, nick)})
             self.xmpp.send(stanza, expect)
-        self.rooms[room] = {}
+        self.rooms[room] = MUCRoom()
         self.ourNicks[room] = nick
 
     def destroy(self, room, reason='', altroom = '', ifrom=None):
@@ -393,7 +494,7 @@ class XEP_0045(BasePlugin):
     def getRoster(self, room):
         """ Get the list of nicks in a room.
         """
-        if room not in self.rooms.keys():
+        if room not in self.rooms:
             return None
         return self.rooms[room].keys()
 
@@ -10,13 +10,15 @@ import logging
 import time
 
 from sleekxmpp import Iq
-from sleekxmpp.exceptions import IqError
+from sleekxmpp.exceptions import IqError, XMPPError
 from sleekxmpp.xmlstream.handler import Callback
 from sleekxmpp.xmlstream.matcher import StanzaPath
 from sleekxmpp.xmlstream import register_stanza_plugin, JID
 from sleekxmpp.plugins import BasePlugin
 from sleekxmpp.plugins.xep_0050 import stanza
 from sleekxmpp.plugins.xep_0050 import Command
+from sleekxmpp.plugins.xep_0050.store import MemorySessionStore, \
+                                            SharedSessionStore
 from sleekxmpp.plugins.xep_0004 import Form
 
 
@@ -38,8 +40,22 @@ class XEP_0050(BasePlugin):
     Also see <http://xmpp.org/extensions/xep-0050.html>
 
     Configuration Values:
-        threaded -- Indicates if command events should be threaded.
-                    Defaults to True.
+        threaded             -- Indicates if command events should be
+                                threaded. Defaults to True.
+        session_db           -- Optional dictionary-like object to use
+                                for session storage instead of the
+                                default in-memory store.
+        session_file         -- Optional filename of an SQLite database
+                                used to share sessions between several
+                                processes serving the same JID.
+        session_timeout      -- Seconds after which an idle session is
+                                dropped, or None to keep sessions until
+                                they finish.
+        max_sessions         -- The largest number of sessions to keep.
+        max_sessions_per_jid -- The largest number of sessions to keep
+                                for any one bare JID.
+        max_session_bytes    -- The largest estimated total size of the
+                                sessions to keep.
 
     Events:
         command_execute  -- Received a command with action="execute"
@@ -52,17 +68,18 @@ class XEP_0050(BasePlugin):
                     Defaults to True.
         commands -- A dictionary mapping JID/node pairs to command
                     names and handlers.
-        sessions -- A dictionary or equivalent backend mapping
-                    session IDs to dictionaries containing data
-                    relevant to a command's session.
+        sessions -- A session store, or equivalent dictionary-like
+                    backend, mapping session IDs to dictionaries
+                    containing data relevant to a command's session.
 
     Methods:
         plugin_init       -- Overrides base_plugin.plugin_init
         post_init         -- Overrides base_plugin.post_init
         new_session       -- Return a new session ID.
-        prep_handlers     -- Placeholder. May call with a list of handlers
-                             to prepare them for use with the session storage
-                             backend, if needed.
+        prep_handlers     -- Call with a list of handlers to prepare them
+                             for use with the session storage backend,
+                             as needed when sessions are shared between
+                             processes.
         set_backend       -- Replace the default session storage with some
                              external storage mechanism, such as a database.
                              The provided backend wrapper must be able to
@@ -84,14 +101,33 @@ class XEP_0050(BasePlugin):
     stanza = stanza
     default_config = {
         'threaded': True,
-        'session_db': None
+        'session_db': None,
+        'session_file': None,
+        'session_timeout': 600,
+        'max_sessions': 1000,
+        'max_sessions_per_jid': 10,
+        'max_session_bytes': 8 * 1024 * 1024
     }
 
     def plugin_init(self):
         """Start the XEP-0050 plugin."""
         self.sessions = self.session_db
         if self.sessions is None:
-            self.sessions = {}
+            limits = {'idle_timeout': self.session_timeout,
+                      'max_sessions': self.max_sessions,
+                      'max_per_jid': self.max_sessions_per_jid,
+                      'max_bytes': self.max_session_bytes}
+            if self.session_file:
+                self.sessions = SharedSessionStore(self.session_file,
+                                                   **limits)
+            else:
+                self.sessions = MemorySessionStore(**limits)
+
+        if self.session_timeout:
+            self.xmpp.schedule('Ad-Hoc Session Expiry',
+                               self.session_timeout,
+                               self._expire_sessions,
+                               repeat=True)
 
         self.commands = {}
 
@@ -126,8 +162,12 @@ class XEP_0050(BasePlugin):
         self.xmpp.del_event_handler('command_complete',
                                     self._handle_command_complete)
         self.xmpp.remove_handler('Ad-Hoc Execute')
+        self.xmpp.scheduler.remove('Ad-Hoc Session Expiry')
         self.xmpp['xep_0030'].del_feature(feature=Command.namespace)
         self.xmpp['xep_0030'].set_items(node=Command.namespace, items=tuple())
+        close = getattr(self.sessions, 'close', None)
+        if close is not None:
+            close()
 
     def session_bind(self, jid):
         self.xmpp['xep_0030'].add_feature(Command.namespace)
@@ -150,13 +190,26 @@ class XEP_0050(BasePlugin):
         """
         Prepare a list of functions for use by the backend service.
 
-        Intended to be replaced by the backend service as needed.
+        Handlers that a session may name as its next, prev or cancel
+        step must be prepared when sessions are kept in a
+        SharedSessionStore, in every process that shares it. Other
+        backends may provide their own prep_handlers method.
 
         Arguments:
             handlers -- A list of function pointers
             **kwargs -- Any additional parameters required by the backend.
         """
-        pass
+        prep = getattr(self.sessions, 'prep_handlers', None)
+        if prep is not None:
+            prep(handlers, **kwargs)
+
+    def _expire_sessions(self):
+        """Drop sessions that have been idle for too long."""
+        expire = getattr(self.sessions, 'expire', None)
+        if expire is not None:
+            expired = expire()
+            if expired:
+                log.debug('Expired %s ad-hoc command sessions', expired)
 
     # =================================================================
     # Server side (command provider) API
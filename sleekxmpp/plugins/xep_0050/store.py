@@ -0,0 +1,468 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2011 Nathanael C. Fritz, Lance J.T. Stout
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from io import BytesIO
+
+from sleekxmpp.thirdparty import OrderedDict
+from sleekxmpp.xmlstream import ET, ElementBase, tostring
+from sleekxmpp.plugins.xep_0050.stanza import Command
+
+
+log = logging.getLogger(__name__)
+
+
+def session_owner(sessionid, session):
+    """
+    Return the bare JID that a session counts against.
+
+    Sessions we provide belong to the requesting entity, while
+    sessions for commands we run on a remote agent (whose IDs
+    start with ``client:``) belong to that agent.
+    """
+    if sessionid.startswith('client:'):
+        jid = session.get('jid', None)
+    else:
+        jid = session.get('from', None)
+    if jid is None:
+        return ''
+    return getattr(jid, 'bare', None) or str(jid)
+
+
+def session_size(session):
+    """
+    Estimate the size of a session, in characters.
+
+    Stanza payloads are counted by the length of their XML, strings
+    by their length, and any other value as a small constant.
+    """
+    size = 0
+    for key, value in session.items():
+        size += len(key)
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        for item in value:
+            if isinstance(item, ElementBase):
+                size += len(tostring(item.xml))
+            elif isinstance(item, (str, bytes)):
+                size += len(item)
+            else:
+                size += 16
+    return size
+
+
+def handler_name(func):
+    """Return a name for a command handler that is stable across processes."""
+    name = getattr(func, '__qualname__', None)
+    if name is None:
+        name = getattr(func, '__name__', repr(func))
+        owner = getattr(func, '__self__', None)
+        if owner is not None:
+            name = '%s.%s' % (owner.__class__.__name__, name)
+    return '%s:%s' % (getattr(func, '__module__', ''), name)
+
+
+class MemorySessionStore(object):
+
+    """
+    Keep sessions in memory, least recently used first.
+
+    Sessions left idle for ``idle_timeout`` seconds are dropped, as
+    are the least recently used sessions once there are more than
+    ``max_sessions`` in total, more than ``max_per_jid`` for a single
+    JID, or their estimated size exceeds ``max_bytes``.
+
+    The store acts like a dictionary mapping session IDs to session
+    dictionaries, so that it may be used as the ``sessions`` attribute
+    of :class:`~sleekxmpp.plugins.xep_0050.XEP_0050`. Other stores
+    derive from it and replace :meth:`get`, :meth:`set`,
+    :meth:`delete`, :meth:`expire` and ``__len__``.
+    """
+
+    def __init__(self, idle_timeout=None, max_sessions=None,
+                 max_per_jid=None, max_bytes=None):
+        """
+        Arguments:
+            idle_timeout -- Seconds after its last use that a session
+                            is dropped, or ``None`` to keep it.
+            max_sessions -- The largest number of sessions to keep.
+            max_per_jid  -- The largest number of sessions to keep
+                            for a single bare JID.
+            max_bytes    -- The largest estimated total size of the
+                            sessions kept, as given by
+                            :func:`session_size`.
+        """
+        #: Seconds after its last use that a session is dropped.
+        self.idle_timeout = idle_timeout
+        #: The largest number of sessions to keep.
+        self.max_sessions = max_sessions
+        #: The largest number of sessions to keep for one bare JID.
+        self.max_per_jid = max_per_jid
+        #: The largest estimated total size of the sessions kept.
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+        self.owners = {}
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessions)
+
+    def __getitem__(self, sessionid):
+        session = self.get(sessionid)
+        if session is None:
+            raise KeyError(sessionid)
+        return session
+
+    def __setitem__(self, sessionid, session):
+        self.set(sessionid, session)
+
+    def __delitem__(self, sessionid):
+        if not self.delete(sessionid):
+            raise KeyError(sessionid)
+
+    def __contains__(self, sessionid):
+        return self.get(sessionid) is not None
+
+    def prep_handlers(self, handlers, **kwargs):
+        """Prepare command handlers for being stored with sessions."""
+        pass
+
+    def close(self):
+        """Release any resources held by the store."""
+        pass
+
+    def get(self, sessionid, default=None):
+        """Return the session with the given ID, or ``default``."""
+        now = time.time()
+        with self.lock:
+            entry = self.sessions.pop(sessionid, None)
+            if entry is None:
+                return default
+            session, owner, size, used = entry
+            if self._expired(used, now):
+                self._forget(sessionid, entry)
+                return default
+            self.sessions[sessionid] = (session, owner, size, now)
+            ids = self.owners[owner]
+            del ids[sessionid]
+            ids[sessionid] = True
+            return session
+
+    def set(self, sessionid, session):
+        """Store a session, marking it as just used."""
+        owner = session_owner(sessionid, session)
+        size = session_size(session)
+        with self.lock:
+            old = self.sessions.pop(sessionid, None)
+            if old is not None:
+                self._forget(sessionid, old)
+            self.sessions[sessionid] = (session, owner, size, time.time())
+            self.owners.setdefault(owner, OrderedDict())[sessionid] = True
+            self.size += size
+
+            ids = self.owners[owner]
+            while self.max_per_jid and len(ids) > self.max_per_jid:
+                self._drop(next(iter(ids)))
+            while self.max_sessions and \
+                  len(self.sessions) > self.max_sessions:
+                self._drop(next(iter(self.sessions)))
+            while self.max_bytes and self.size > self.max_bytes and \
+                  len(self.sessions) > 1:
+                self._drop(next(iter(self.sessions)))
+
+    def delete(self, sessionid):
+        """Remove a session. Return ``True`` if it was stored."""
+        with self.lock:
+            entry = self.sessions.pop(sessionid, None)
+            if entry is None:
+                return False
+            self._forget(sessionid, entry)
+            return True
+
+    def expire(self):
+        """Remove idle sessions. Return the number removed."""
+        if self.idle_timeout is None:
+            return 0
+        now = time.time()
+        expired = 0
+        with self.lock:
+            # Sessions are ordered by last use, so the idle ones
+            # are all at the front.
+            while self.sessions:
+                sessionid = next(iter(self.sessions))
+                if not self._expired(self.sessions[sessionid][3], now):
+                    break
+                self._drop(sessionid)
+                expired += 1
+        return expired
+
+    def _expired(self, used, now):
+        return self.idle_timeout is not None and \
+               used + self.idle_timeout <= now
+
+    def _drop(self, sessionid):
+        log.debug('Dropping ad-hoc command session %s', sessionid)
+        self._forget(sessionid, self.sessions.pop(sessionid))
+
+    def _forget(self, sessionid, entry):
+        _, owner, size, _ = entry
+        self.size -= size
+        ids = self.owners[owner]
+        del ids[sessionid]
+        if not ids:
+            del self.owners[owner]
+
+
+class _SessionPickler(pickle.Pickler):
+
+    def __init__(self, output, store):
+        pickle.Pickler.__init__(self, output, 2)
+        self.store = store
+
+    def persistent_id(self, obj):
+        return self.store._persistent_id(obj)
+
+
+#: The globals that a stored session may refer to. Stanzas, stanza
+#: classes and handlers are stored by reference instead.
+SAFE_GLOBALS = set([('sleekxmpp.jid', 'JID'),
+                    ('__builtin__', 'set'),
+                    ('__builtin__', 'frozenset'),
+                    ('builtins', 'set'),
+                    ('builtins', 'frozenset'),
+                    ('_codecs', 'encode')])
+
+
+class _SessionUnpickler(pickle.Unpickler):
+
+    def __init__(self, data, store):
+        pickle.Unpickler.__init__(self, data)
+        self.store = store
+
+    def find_class(self, module, name):
+        if (module, name) not in SAFE_GLOBALS:
+            raise pickle.UnpicklingError('Refusing to load %s.%s from '
+                                         'a stored session' % (module, name))
+        return pickle.Unpickler.find_class(self, module, name)
+
+    def persistent_load(self, pid):
+        return self.store._persistent_load(pid)
+
+
+class SharedSessionStore(MemorySessionStore):
+
+    """
+    Keep sessions in an SQLite database that several processes may
+    share, so that any of them can continue a command session that
+    another one started.
+
+    Sessions are pickled. Stanza payloads are stored as XML and
+    command handlers by name, so every process must register the
+    handlers that a session may refer to with :meth:`prep_handlers`,
+    and handlers must keep their state in the session rather than
+    in closures. Limits behave as in :class:`MemorySessionStore`,
+    with a session's size being the length of its pickled form.
+
+    Every process that can write to the database can affect what
+    the others load, so the database must only be writable by
+    processes that are trusted. Loading is restricted to plain data,
+    JIDs, registered handlers and stanza classes, but a session
+    written by an untrusted process is still a session that will be
+    acted upon.
+    """
+
+    def __init__(self, db, idle_timeout=None, max_sessions=None,
+                 max_per_jid=None, max_bytes=None):
+        """
+        Arguments:
+            db           -- The filename of the SQLite database.
+            idle_timeout -- Seconds after its last use that a session
+                            is dropped, or ``None`` to keep it.
+            max_sessions -- The largest number of sessions to keep.
+            max_per_jid  -- The largest number of sessions to keep
+                            for a single bare JID.
+            max_bytes    -- The largest total size of the sessions kept.
+        """
+        MemorySessionStore.__init__(self, idle_timeout=idle_timeout,
+                                    max_sessions=max_sessions,
+                                    max_per_jid=max_per_jid,
+                                    max_bytes=max_bytes)
+        self.handlers = {}
+
+        self.db_lock = threading.Lock()
+        self.db = sqlite3.connect(db, timeout=30, check_same_thread=False)
+        with self.db_lock:
+            self.db.execute('CREATE TABLE IF NOT EXISTS adhoc_sessions ('
+                            'id TEXT PRIMARY KEY, owner TEXT NOT NULL, '
+                            'data BLOB NOT NULL, size INTEGER NOT NULL, '
+                            'used REAL NOT NULL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS adhoc_sessions_used '
+                            'ON adhoc_sessions (used)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS adhoc_sessions_owner '
+                            'ON adhoc_sessions (owner, used)')
+            self.db.commit()
+
+    def prep_handlers(self, handlers, **kwargs):
+        """
+        Register command handlers so that sessions referring to them
+        can be stored and loaded again, possibly by another process.
+
+        Arguments:
+            handlers -- A list of functions or bound methods.
+        """
+        for handler in handlers:
+            self.handlers[handler_name(handler)] = handler
+
+    def close(self):
+        """Close the database connection."""
+        with self.db_lock:
+            self.db.close()
+
+    def __len__(self):
+        with self.db_lock:
+            return self.db.execute('SELECT COUNT(*) '
+                                   'FROM adhoc_sessions').fetchone()[0]
+
+    def get(self, sessionid, default=None):
+        now = time.time()
+        with self.db_lock:
+            row = self.db.execute('SELECT data, used FROM adhoc_sessions '
+                                  'WHERE id = ?', (sessionid,)).fetchone()
+            if row is None:
+                return default
+            data, used = row
+            if self.idle_timeout is not None and \
+               used + self.idle_timeout <= now:
+                self._update('DELETE FROM adhoc_sessions WHERE id = ?',
+                             (sessionid,))
+                return default
+            self._update('UPDATE adhoc_sessions SET used = ? WHERE id = ?',
+                         (now, sessionid))
+        try:
+            return _SessionUnpickler(BytesIO(bytes(data)), self).load()
+        except Exception:
+            log.exception('Could not load ad-hoc command session %s',
+                          sessionid)
+            self.delete(sessionid)
+            return default
+
+    def set(self, sessionid, session):
+        output = BytesIO()
+        try:
+            _SessionPickler(output, self).dump(session)
+        except Exception as e:
+            raise ValueError('Could not store ad-hoc command session %s, '
+                             'are its handlers registered with '
+                             'prep_handlers()? %s' % (sessionid, e))
+        data = output.getvalue()
+        owner = session_owner(sessionid, session)
+        with self.db_lock:
+            try:
+                self.db.execute('INSERT OR REPLACE INTO adhoc_sessions '
+                                '(id, owner, data, size, used) '
+                                'VALUES (?, ?, ?, ?, ?)',
+                                (sessionid, owner, sqlite3.Binary(data),
+                                 len(data), time.time()))
+                self._enforce_limits(owner)
+                self.db.commit()
+            except sqlite3.Error as e:
+                self.db.rollback()
+                log.warning('Could not update ad-hoc session database: %s',
+                            e)
+
+    def delete(self, sessionid):
+        with self.db_lock:
+            return self._update('DELETE FROM adhoc_sessions WHERE id = ?',
+                                (sessionid,)) > 0
+
+    def expire(self):
+        if self.idle_timeout is None:
+            return 0
+        with self.db_lock:
+            return self._update('DELETE FROM adhoc_sessions WHERE used <= ?',
+                                (time.time() - self.idle_timeout,))
+
+    def _enforce_limits(self, owner):
+        if self.max_per_jid:
+            self.db.execute('DELETE FROM adhoc_sessions WHERE id IN ('
+                            'SELECT id FROM adhoc_sessions WHERE owner = ? '
+                            'ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                            (owner, self.max_per_jid))
+        if self.max_sessions:
+            self.db.execute('DELETE FROM adhoc_sessions WHERE id IN ('
+                            'SELECT id FROM adhoc_sessions '
+                            'ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                            (self.max_sessions,))
+        if self.max_bytes:
+            total = self.db.execute('SELECT SUM(size) '
+                                    'FROM adhoc_sessions').fetchone()[0]
+            rows = self.db.execute('SELECT id, size FROM adhoc_sessions '
+                                   'ORDER BY used').fetchall()
+            for sessionid, size in rows[:-1]:
+                if total <= self.max_bytes:
+                    break
+                self.db.execute('DELETE FROM adhoc_sessions WHERE id = ?',
+                                (sessionid,))
+                total -= size
+
+    def _update(self, sql, args):
+        try:
+            count = self.db.execute(sql, args).rowcount
+            self.db.commit()
+            return count
+        except sqlite3.Error as e:
+            log.warning('Could not update ad-hoc session database: %s', e)
+            return 0
+
+    def _persistent_id(self, obj):
+        if isinstance(obj, ElementBase):
+            return ('stanza', _class_ref(obj.__class__), tostring(obj.xml))
+        if isinstance(obj, type) and issubclass(obj, ElementBase):
+            return ('class', _class_ref(obj))
+        if callable(obj) and not isinstance(obj, type):
+            name = handler_name(obj)
+            if name not in self.handlers:
+                raise pickle.PicklingError('Unknown command handler: %s' %
+                                           name)
+            return ('handler', name)
+        return None
+
+    def _persistent_load(self, pid):
+        if pid[0] == 'stanza':
+            return _load_class(pid[1])(xml=ET.fromstring(pid[2]))
+        if pid[0] == 'class':
+            return _load_class(pid[1])
+        if pid[0] == 'handler':
+            if pid[1] not in self.handlers:
+                raise pickle.UnpicklingError('Unknown command handler: %s' %
+                                             pid[1])
+            return self.handlers[pid[1]]
+        raise pickle.UnpicklingError('Unknown reference: %s' % (pid,))
+
+
+def _class_ref(cls):
+    return (cls.__module__, cls.__name__, cls.tag_name())
+
+
+def _load_class(ref):
+    module, name, tag = ref
+    # Payload classes are registered with the command stanza,
+    # which also finds classes that cannot be imported by name.
+    cls = Command.plugin_tag_map.get(tag, None)
+    if cls is None or cls.__name__ != name:
+        cls = getattr(__import__(module, fromlist=[name]), name, None)
+    if not isinstance(cls, type) or not issubclass(cls, ElementBase):
+        raise pickle.UnpicklingError('Not a stanza class: %s.%s' %
+                                     (module, name))
+    return cls
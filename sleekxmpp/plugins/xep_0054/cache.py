@@ -0,0 +1,157 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2012 Nathanael C. Fritz, Lance J.T. Stout
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+from sleekxmpp.thirdparty import OrderedDict
+from sleekxmpp.xmlstream import ET, tostring
+from sleekxmpp.plugins.xep_0054.stanza import VCardTemp
+
+
+log = logging.getLogger(__name__)
+
+
+class VCardCache(object):
+
+    """
+    Keep the vCards of other entities as serialized XML.
+
+    Entries are kept in memory, least recently used first, until their
+    combined size exceeds ``max_bytes``. If a database filename is
+    given, entries are also written to an SQLite database, which is
+    consulted when an entry is not in memory and which survives
+    restarts. Entries older than ``ttl`` seconds are discarded from
+    both.
+
+    vCards are only turned back into stanza objects when they are
+    requested, so a large roster does not keep every contact's photo
+    resident as a parsed element tree.
+    """
+
+    def __init__(self, max_bytes=4 * 1024 * 1024, ttl=None, db=None):
+        """
+        Arguments:
+            max_bytes -- The largest total size, in characters of XML,
+                         of the vCards kept in memory.
+            ttl       -- Optional number of seconds after which a vCard
+                         is discarded.
+            db        -- Optional filename of an SQLite database to use
+                         as a backing store.
+        """
+        #: The largest total size of the vCards kept in memory.
+        self.max_bytes = max_bytes
+        #: Seconds after which a vCard is discarded, or ``None``.
+        self.ttl = ttl
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.db = None
+        if db:
+            self.db = sqlite3.connect(db, check_same_thread=False)
+            with self.lock:
+                self.db.execute('CREATE TABLE IF NOT EXISTS vcards ('
+                                'jid TEXT PRIMARY KEY, xml TEXT NOT NULL, '
+                                'stored REAL NOT NULL)')
+                self.db.commit()
+
+    def __len__(self):
+        """Return the number of vCards kept in memory."""
+        with self.lock:
+            return len(self.entries)
+
+    def close(self):
+        """Close the backing database, if any."""
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    def get(self, jid):
+        """
+        Return a new :class:`VCardTemp` for a bare JID, or ``None``.
+
+        Arguments:
+            jid -- The bare JID whose vCard is wanted.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.pop(jid, None)
+            if entry is not None:
+                stored, xml = entry
+                if self._expired(stored, now):
+                    self.size -= len(xml)
+                    self._db_update('DELETE FROM vcards WHERE jid = ?',
+                                    (jid,))
+                    return None
+                self.entries[jid] = entry
+            else:
+                row = self._db_query('SELECT stored, xml FROM vcards '
+                                     'WHERE jid = ?', (jid,))
+                if row is None:
+                    return None
+                stored, xml = row
+                if self._expired(stored, now):
+                    self._db_update('DELETE FROM vcards WHERE jid = ?',
+                                    (jid,))
+                    return None
+                self._add(jid, stored, xml)
+        return VCardTemp(xml=ET.fromstring(xml))
+
+    def set(self, jid, vcard):
+        """
+        Store the vCard of a bare JID.
+
+        Arguments:
+            jid   -- The bare JID the vCard belongs to.
+            vcard -- A :class:`VCardTemp` stanza object.
+        """
+        xml = tostring(vcard.xml)
+        stored = time.time()
+        with self.lock:
+            old = self.entries.pop(jid, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self._add(jid, stored, xml)
+            self._db_update('INSERT OR REPLACE INTO vcards (jid, xml, stored) '
+                            'VALUES (?, ?, ?)', (jid, xml, stored))
+
+    def delete(self, jid):
+        """Forget the vCard of a bare JID."""
+        with self.lock:
+            old = self.entries.pop(jid, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self._db_update('DELETE FROM vcards WHERE jid = ?', (jid,))
+
+    def _expired(self, stored, now):
+        return self.ttl is not None and stored + self.ttl <= now
+
+    def _add(self, jid, stored, xml):
+        self.entries[jid] = (stored, xml)
+        self.size += len(xml)
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, (_, old_xml) = self.entries.popitem(last=False)
+            self.size -= len(old_xml)
+
+    def _db_query(self, sql, args):
+        if self.db is None:
+            return None
+        return self.db.execute(sql, args).fetchone()
+
+    def _db_update(self, sql, args):
+        if self.db is None:
+            return
+        try:
+            self.db.execute(sql, args)
+            self.db.commit()
+        except sqlite3.Error as e:
+            log.warning('Could not update vCard database: %s', e)
@@ -15,6 +15,7 @@ from sleekxmpp.xmlstream.handler import Callback
 from sleekxmpp.xmlstream.matcher import StanzaPath
 from sleekxmpp.plugins import BasePlugin
 from sleekxmpp.plugins.xep_0054 import VCardTemp, stanza
+from sleekxmpp.plugins.xep_0054.cache import VCardCache
 
 
 log = logging.getLogger(__name__)
@@ -24,12 +25,28 @@ class XEP_0054(BasePlugin):
 
     """
     XEP-0054: vcard-temp
+
+    Our own vCards are kept in memory as published. The vCards of other
+    entities are kept in a :class:`~sleekxmpp.plugins.xep_0054.cache.VCardCache`.
+
+    Configuration:
+        cache_size -- The largest total size, in characters of XML, of
+                      the vCards of other entities kept in memory.
+        cache_ttl  -- Optional number of seconds after which a cached
+                      vCard is discarded.
+        vcard_db   -- Optional filename of an SQLite database used to
+                      keep cached vCards across restarts.
     """
 
     name = 'xep_0054'
     description = 'XEP-0054: vcard-temp'
     dependencies = set(['xep_0030', 'xep_0082'])
     stanza = stanza
+    default_config = {
+        'cache_size': 4 * 1024 * 1024,
+        'cache_ttl': None,
+        'vcard_db': None
+    }
 
     def plugin_init(self):
         """
@@ -43,6 +60,8 @@ class XEP_0054(BasePlugin):
         self.api.register(self._del_vcard, 'del_vcard', default=True)
 
         self._vcard_cache = {}
+        self.cache = VCardCache(self.cache_size, self.cache_ttl,
+                                self.vcard_db)
 
         self.xmpp.register_handler(
                 Callback('VCardTemp',
@@ -52,6 +71,7 @@ class XEP_0054(BasePlugin):
     def plugin_end(self):
         self.xmpp.remove_handler('VCardTemp')
         self.xmpp['xep_0030'].del_feature(feature='vcard-temp')
+        self.cache.close()
 
     def session_bind(self, jid):
         self.xmpp['xep_0030'].add_feature('vcard-temp')
@@ -60,7 +80,8 @@ class XEP_0054(BasePlugin):
         return VCardTemp()
 
     def get_vcard(self, jid=None, ifrom=None, local=None, cached=False,
-                  block=True, callback=None, timeout=None):
+                  block=True, callback=None, timeout=None,
+                  timeout_callback=None):
         if local is None:
             if jid is not None and not isinstance(jid, JID):
                 jid = JID(jid)
@@ -99,7 +120,8 @@ class XEP_0054(BasePlugin):
         iq['type'] = 'get'
         iq.enable('vcard_temp')
 
-        vcard = iq.send(block=block, callback=callback, timeout=timeout)
+        vcard = iq.send(block=block, callback=callback, timeout=timeout,
+                        timeout_callback=timeout_callback)
 
         if block:
             self.api['set_vcard'](vcard['from'], args=vcard['vcard_temp'])
@@ -135,12 +157,27 @@ class XEP_0054(BasePlugin):
 
     # =================================================================
 
+    def _is_local(self, jid):
+        if self.xmpp.is_component:
+            return jid.domain == self.xmpp.boundjid.domain
+        return jid.bare == self.xmpp.boundjid.bare
+
     def _set_vcard(self, jid, node, ifrom, vcard):
-        self._vcard_cache[jid.bare] = vcard
+        if self._is_local(jid):
+            self._vcard_cache[jid.bare] = vcard
+        elif vcard is None:
+            self.cache.delete(jid.bare)
+        else:
+            if isinstance(vcard, Iq):
+                vcard = vcard['vcard_temp']
+            self.cache.set(jid.bare, vcard)
 
     def _get_vcard(self, jid, node, ifrom, vcard):
-        return self._vcard_cache.get(jid.bare, None)
+        if self._is_local(jid):
+            return self._vcard_cache.get(jid.bare, None)
+        return self.cache.get(jid.bare)
 
     def _del_vcard(self, jid, node, ifrom, vcard):
         if jid.bare in self._vcard_cache:
             del self._vcard_cache[jid.bare]
+        self.cache.delete(jid.bare)
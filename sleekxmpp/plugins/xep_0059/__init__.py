@@ -9,7 +9,8 @@
 from sleekxmpp.plugins.base import register_plugin
 
 from sleekxmpp.plugins.xep_0059.stanza import Set
-from sleekxmpp.plugins.xep_0059.rsm import ResultIterator, XEP_0059
+from sleekxmpp.plugins.xep_0059.rsm import ResultIterator, PrefetchIterator, \
+                                         XEP_0059
 
 
 register_plugin(XEP_0059)
@@ -6,14 +6,19 @@
     See the file LICENSE for copying permission.
 """
 
+import copy
 import logging
+import threading
 
 import sleekxmpp
 from sleekxmpp import Iq
+from sleekxmpp.util import Queue, QueueEmpty
 from sleekxmpp.plugins import BasePlugin, register_plugin
 from sleekxmpp.xmlstream import register_stanza_plugin
+from sleekxmpp.xmlstream.handler import Callback
+from sleekxmpp.xmlstream.matcher import MatcherId
 from sleekxmpp.plugins.xep_0059 import stanza, Set
-from sleekxmpp.exceptions import XMPPError
+from sleekxmpp.exceptions import XMPPError, IqTimeout
 
 
 log = logging.getLogger(__name__)
@@ -102,6 +107,151 @@ class ResultIterator():
         except XMPPError:
             raise StopIteration
 
+    def items(self):
+        """
+        Iterate over the individual results of every page, instead
+        of over the pages themselves.
+        """
+        for page in self:
+            for item in page[self.interface][self.results]:
+                yield item
+
+
+class PrefetchIterator(ResultIterator):
+
+    """
+    A Result Set Management iterator that requests the next page of
+    results as soon as the previous one has been received, so that
+    network round trips overlap with the processing of earlier pages.
+
+    Since each RSM page is requested relative to the last item of the
+    previous one, pages are still requested in sequence; up to
+    ``lookahead`` received pages are kept ahead of the caller. Each
+    page is requested with a fresh copy of the template query.
+
+    Responses are handled in-stream, so the iterator may be used from
+    a non-threaded event handler.
+    """
+
+    def __init__(self, query, interface, results='substanzas', amount=10,
+                       start=None, reverse=False, lookahead=2, timeout=None):
+        """
+        Arguments:
+           query     -- The template query
+           interface -- The substanza of the query, for example disco_items
+           results   -- The query stanza's interface which provides a
+                        countable list of query results.
+           amount    -- The max amounts of items to request per iteration
+           start     -- From which item id to start
+           reverse   -- If True, page backwards through the results
+           lookahead -- The max number of pages to fetch ahead of
+                        the caller. Defaults to 2.
+           timeout   -- The time in seconds to wait for each page,
+                        defaulting to the stream's response timeout.
+                        IqTimeout is raised if no page arrives in time.
+        """
+        ResultIterator.__init__(self, query, interface, results,
+                                amount, start, reverse)
+        self.lookahead = max(1, lookahead)
+        self.timeout = timeout
+        self._pages = Queue()
+        self._lock = threading.Lock()
+        self._pending = None
+        self._buffered = 0
+
+    def next(self):
+        """
+        Return the next page of results from a query, waiting for it
+        to be received if needed.
+        """
+        with self._lock:
+            if self._pending is None and not self._buffered and \
+                    not self._stop:
+                self._request()
+
+        timeout = self.timeout
+        if timeout is None:
+            timeout = self.query.stream.response_timeout
+        try:
+            page = self._pages.get(True, timeout)
+        except QueueEmpty:
+            with self._lock:
+                iq = self._pending
+                if iq is not None:
+                    self.query.stream.remove_handler(
+                            'RSM_Page_%s' % iq['id'])
+                    self._pending = None
+                self._finish()
+            raise IqTimeout(iq)
+        if page is None:
+            # Leave the end marker for any later calls.
+            self._pages.put(None)
+            raise StopIteration
+
+        with self._lock:
+            self._buffered -= 1
+            if self._pending is None and not self._stop and \
+                    self._buffered < self.lookahead:
+                self._request()
+        return page
+
+    def _request(self):
+        """Send the query for the next page. Requires holding _lock."""
+        iq = copy.copy(self.query)
+        iq['id'] = iq.stream.new_id()
+        rsm = iq[self.interface]['rsm']
+        rsm['before'] = self.reverse
+        rsm['max'] = str(self.amount)
+        if self.start and self.reverse:
+            rsm['before'] = self.start
+        elif self.start:
+            rsm['after'] = self.start
+
+        self._pending = iq
+        iq.stream.register_handler(
+                Callback('RSM_Page_%s' % iq['id'],
+                         MatcherId(iq['id']),
+                         self._received,
+                         once=True,
+                         instream=True))
+        iq.send(block=False)
+
+    def _received(self, iq):
+        """Queue a received page and request the next one if the
+        caller is not too far behind."""
+        with self._lock:
+            if self._pending is None or self._pending['id'] != iq['id']:
+                return
+            self._pending = None
+            rsm = iq[self.interface]['rsm']
+            if iq['type'] == 'error' or (not rsm['first'] and
+                                         not rsm['last']):
+                self._finish()
+                return
+
+            if rsm['count'] and rsm['first_index']:
+                count = int(rsm['count'])
+                first = int(rsm['first_index'])
+                num_items = len(iq[self.interface][self.results])
+                if first + num_items == count:
+                    self._stop = True
+
+            if self.reverse:
+                self.start = rsm['first']
+            else:
+                self.start = rsm['last']
+
+            self._buffered += 1
+            self._pages.put(iq)
+            if self._stop:
+                self._pages.put(None)
+            elif self._buffered < self.lookahead:
+                self._request()
+
+    def _finish(self):
+        self._stop = True
+        self._pages.put(None)
+
 
 class XEP_0059(BasePlugin):
 
@@ -127,7 +277,8 @@ class XEP_0059(BasePlugin):
     def session_bind(self, jid):
         self.xmpp['xep_0030'].add_feature(Set.namespace)
 
-    def iterate(self, stanza, interface, results='substanzas'):
+    def iterate(self, stanza, interface, results='substanzas', amount=10,
+                      reverse=False, lookahead=0):
         """
         Create a new result set iterator for a given stanza query.
 
@@ -141,5 +292,14 @@ class XEP_0059(BasePlugin):
                          the interface 'disco_items' should be used.
             results   -- The name of the interface containing the
                          query results (typically just 'substanzas').
+            amount    -- The max amounts of items to request per page.
+            reverse   -- If True, page backwards through the results.
+            lookahead -- If greater than zero, return a PrefetchIterator
+                         fetching up to this many pages ahead.
         """
-        return ResultIterator(stanza, interface, results)
+        if lookahead:
+            return PrefetchIterator(stanza, interface, results,
+                                    amount=amount, reverse=reverse,
+                                    lookahead=lookahead)
+        return ResultIterator(stanza, interface, results,
+                              amount=amount, reverse=reverse)
@@ -7,6 +7,7 @@
 """
 
 import logging
+from collections import namedtuple
 
 from sleekxmpp.xmlstream import JID
 from sleekxmpp.xmlstream.handler import Callback
@@ -18,16 +19,45 @@ from sleekxmpp.plugins.xep_0060 import stanza
 log = logging.getLogger(__name__)
 
 
+#: A lightweight view of one published or retracted item, as delivered
+#: by the ``pubsub_items`` event. The ``type`` is either ``'publish'``
+#: or ``'retract'``, and ``payload`` is the item's XML payload, if any.
+ItemView = namedtuple('ItemView', ['type', 'id', 'publisher', 'payload'])
+
+#: The data of a ``pubsub_items`` event: the notification message, the
+#: node it concerns, and a list of :data:`ItemView` tuples in the order
+#: they were received. The message is shared with every handler, and
+#: must not be modified.
+ItemsEvent = namedtuple('ItemsEvent', ['msg', 'node', 'items'])
+
+
 class XEP_0060(BasePlugin):
 
     """
     XEP-0060 Publish Subscribe
+
+    Item notifications raise a single ``pubsub_items`` event with an
+    :data:`ItemsEvent`, followed by ``<name>_items`` for nodes mapped
+    with :meth:`map_node_event`. Notifications with a single item also
+    raise the ``pubsub_publish`` or ``pubsub_retract`` events, and
+    their mapped equivalents, with the original message.
+
+    Configuration Values:
+        per_item_events -- If True, notifications with several items
+                           also raise ``pubsub_publish`` and
+                           ``pubsub_retract`` events for each item,
+                           building a separate message for each one
+                           for the mapped node events. Defaults to
+                           False.
     """
 
     name = 'xep_0060'
     description = 'XEP-0060: Publish-Subscribe'
     dependencies = set(['xep_0030', 'xep_0004', 'xep_0082', 'xep_0131'])
     stanza = stanza
+    default_config = {
+        'per_item_events': False
+    }
 
     def plugin_init(self):
         self.node_event_map = {}
@@ -64,16 +94,39 @@ class XEP_0060(BasePlugin):
 
     def _handle_event_items(self, msg):
         """Raise events for publish and retraction notifications."""
-        node = msg['pubsub_event']['items']['node']
+        items = msg['pubsub_event']['items']
+        node = items['node']
+        event_name = self.node_event_map.get(node, None)
+
+        views = []
+        for item in items.xml:
+            if item.tag.endswith('}retract'):
+                event_type = 'retract'
+            elif item.tag.endswith('}item'):
+                event_type = 'publish'
+            else:
+                continue
+            payload = item[0] if len(item) else None
+            views.append(ItemView(event_type,
+                                  item.get('id', ''),
+                                  item.get('publisher', ''),
+                                  payload))
+
+        event = ItemsEvent(msg, node, views)
+        self.xmpp.event('pubsub_items', event)
+        if event_name:
+            self.xmpp.event('%s_items' % event_name, event)
+
+        multi = len(views) > 1
+        if multi and not self.per_item_events:
+            return
 
-        multi = len(msg['pubsub_event']['items']) > 1
         values = {}
         if multi:
             values = msg.values
             del values['pubsub_event']
 
-        for item in msg['pubsub_event']['items']:
-            event_name = self.node_event_map.get(node, None)
+        for item in items:
             event_type = 'publish'
             if item.name == 'retract':
                 event_type = 'retract'
@@ -140,9 +193,10 @@ class XEP_0060(BasePlugin):
             map_node_event('http://jabber.org/protocol/tune',
                            'user_tune')
 
-        will produce the events 'user_tune_publish' and 'user_tune_retract'
-        when the respective notifications are received from the node
-        'http://jabber.org/protocol/tune', among other events.
+        will produce the events 'user_tune_items', 'user_tune_publish'
+        and 'user_tune_retract' when the respective notifications are
+        received from the node 'http://jabber.org/protocol/tune', among
+        other events.
 
         Arguments:
             node       -- The node name to map to an event.
@@ -507,7 +561,7 @@ class XEP_0060(BasePlugin):
 
     def get_items(self, jid, node, item_ids=None, max_items=None,
                   iterator=False, ifrom=None, block=False,
-                  callback=None, timeout=None):
+                  callback=None, timeout=None, lookahead=0):
         """
         Request the contents of a node's items.
 
@@ -528,7 +582,8 @@ class XEP_0060(BasePlugin):
                 iq['pubsub']['items'].append(item)
 
         if iterator:
-            return self.xmpp['xep_0059'].iterate(iq, 'pubsub')
+            return self.xmpp['xep_0059'].iterate(iq, 'pubsub',
+                                                 lookahead=lookahead)
         else:
             return iq.send(block=block, callback=callback, timeout=timeout)
 
@@ -18,7 +18,7 @@ from sleekxmpp.xmlstream.handler import Callback
 from sleekxmpp.xmlstream.matcher import StanzaPath
 from sleekxmpp.exceptions import XMPPError, IqError, IqTimeout
 from sleekxmpp.plugins import BasePlugin
-from sleekxmpp.plugins.xep_0115 import stanza, StaticCaps
+from sleekxmpp.plugins.xep_0115 import stanza, StaticCaps, PersistentCaps
 
 
 log = logging.getLogger(__name__)
@@ -28,6 +28,14 @@ class XEP_0115(BasePlugin):
 
     """
     XEP-0115: Entity Capabalities
+
+    Configuration:
+        hash      -- The hash algorithm used for our own caps.
+        caps_node -- The node advertised in our own caps.
+        broadcast -- If true, add caps to outgoing presence.
+        caps_db   -- Optional filename of an SQLite database used to
+                     store verified caps, so they survive restarts and
+                     may be shared by several processes.
     """
 
     name = 'xep_0115'
@@ -37,7 +45,8 @@ class XEP_0115(BasePlugin):
     default_config = {
         'hash': 'sha-1',
         'caps_node': None,
-        'broadcast': True
+        'broadcast': True,
+        'caps_db': None
     }
 
     def plugin_init(self):
@@ -65,8 +74,7 @@ class XEP_0115(BasePlugin):
 
         self.xmpp.add_filter('out', self._filter_add_caps)
 
-        self.xmpp.add_event_handler('entity_caps', self._process_caps,
-                                    threaded=True)
+        self.xmpp.add_event_handler('entity_caps', self._process_caps)
 
         if not self.xmpp.is_component:
             self.xmpp.register_feature('caps',
@@ -75,7 +83,11 @@ class XEP_0115(BasePlugin):
                     order=10010)
 
         disco = self.xmpp['xep_0030']
-        self.static = StaticCaps(self.xmpp, disco.static)
+        if self.caps_db:
+            self.static = PersistentCaps(self.xmpp, disco.static,
+                                         self.caps_db)
+        else:
+            self.static = StaticCaps(self.xmpp, disco.static)
 
         for op in self._disco_ops:
             self.api.register(getattr(self.static, op), op, default=True)
@@ -87,11 +99,18 @@ class XEP_0115(BasePlugin):
 
         disco.cache_caps = self.cache_caps
         disco.update_caps = self.update_caps
+        disco.update_caps_many = self.update_caps_many
         disco.assign_verstring = self.assign_verstring
         disco.get_verstring = self.get_verstring
 
         self._processing_lock = threading.Lock()
-        self._processing = set()
+        self._processing = {}
+
+        # Verstrings generated for our own disco nodes, keyed by
+        # (JID, node) and tagged with the node's version, and the
+        # verstrings to add to presence sent from each of our JIDs.
+        self._local_caps = {}
+        self._local_vers = {}
 
     def plugin_end(self):
         self.xmpp['xep_0030'].del_feature(feature=stanza.Capabilities.namespace)
@@ -102,6 +121,8 @@ class XEP_0115(BasePlugin):
             self.xmpp.unregister_feature('caps', 10010)
         for op in ('supports', 'has_identity'):
             self.xmpp['xep_0030'].restore_defaults(op)
+        if isinstance(self.static, PersistentCaps):
+            self.static.close()
 
     def session_bind(self, jid):
         self.xmpp['xep_0030'].add_feature(stanza.Capabilities.namespace)
@@ -113,7 +134,12 @@ class XEP_0115(BasePlugin):
         if stanza['type'] not in ('available', 'chat', 'away', 'dnd', 'xa'):
             return stanza
 
-        ver = self.get_verstring(stanza['from'])
+        jid = stanza['from'].full or self.xmpp.boundjid.full
+        ver = self._local_vers.get(jid, None)
+        if ver is None:
+            ver = self.get_verstring(jid)
+            if ver:
+                self._local_vers[jid] = ver
         if ver:
             stanza['caps']['node'] = self.caps_node
             stanza['caps']['hash'] = self.hash
@@ -157,36 +183,50 @@ class XEP_0115(BasePlugin):
             return
 
         if pres['caps']['hash'] not in self.hashes:
-            try:
-                log.debug("Unknown caps hash: %s", pres['caps']['hash'])
-                self.xmpp['xep_0030'].get_info(jid=pres['from'])
-                return
-            except XMPPError:
-                return
+            log.debug("Unknown caps hash: %s", pres['caps']['hash'])
+            self.xmpp['xep_0030'].get_info(jid=pres['from'], block=False)
+            return
 
-        # Only lookup the same caps once at a time.
+        # Only lookup the same caps once at a time. Any other JIDs
+        # advertising the same verstring in the meantime will be
+        # assigned the result once it has been verified.
         with self._processing_lock:
             if ver in self._processing:
                 log.debug('Already processing verstring %s' % ver)
+                self._processing[ver].add(pres['from'].full)
                 return
-            self._processing.add(ver)
+            self._processing[ver] = set([pres['from'].full])
 
         log.debug("New caps verification string: %s", ver)
-        try:
-            node = '%s#%s' % (pres['caps']['node'], ver)
-            caps = self.xmpp['xep_0030'].get_info(pres['from'], node)
-
-            if isinstance(caps, Iq):
-                caps = caps['disco_info']
-
-            if self._validate_caps(caps, pres['caps']['hash'],
-                                         pres['caps']['ver']):
-                self.assign_verstring(pres['from'], pres['caps']['ver'])
-        except XMPPError:
-            log.debug("Could not retrieve disco#info results for caps for %s", node)
-
+        node = '%s#%s' % (pres['caps']['node'], ver)
+        hash = pres['caps']['hash']
+
+        def verify(iq):
+            if iq['type'] == 'result' and self._validate_caps(
+                    iq['disco_info'], hash, ver):
+                for jid in self._finish_processing(ver):
+                    self.assign_verstring(jid, ver)
+            else:
+                log.debug("Could not retrieve disco#info results " + \
+                          "for caps for %s", node)
+                self._finish_processing(ver)
+
+        def timeout(iq):
+            log.debug("Timed out retrieving disco#info for caps for %s",
+                      node)
+            self._finish_processing(ver)
+
+        self.xmpp['xep_0030'].get_info(pres['from'], node,
+                                       callback=verify,
+                                       timeout_callback=timeout)
+
+    def _finish_processing(self, ver):
+        """
+        Stop tracking a verstring lookup, returning the set of
+        JIDs that were waiting on its result.
+        """
         with self._processing_lock:
-            self._processing.remove(ver)
+            return self._processing.pop(ver, set())
 
     def _validate_caps(self, caps, hash, check_verstring):
         # Check Identities
@@ -293,26 +333,89 @@ class XEP_0115(BasePlugin):
         return base64.b64encode(binary).decode('utf-8')
 
     def update_caps(self, jid=None, node=None, preserve=False):
+        """
+        Regenerate the caps verstring for a local JID after its
+        disco#info data has changed, and broadcast the new caps.
+
+        Arguments:
+            jid      -- The JID to update.
+            node     -- The node to use for generating the verstring.
+            preserve -- If true, send the last presence to each
+                        roster contact instead of broadcasting it.
+        """
+        if self._update_caps(jid, node):
+            self._broadcast_caps(jid, preserve)
+
+    def update_caps_many(self, jids, node=None, preserve=False):
+        """
+        Regenerate the caps verstrings for many local JIDs at once,
+        such as when a component changes the features offered by all
+        of its JIDs. The updated presences are sent only after every
+        verstring has been generated.
+
+        Arguments:
+            jids     -- An iterable of JIDs to update.
+            node     -- The node to use for generating the verstrings.
+            preserve -- If true, send the last presence to each
+                        roster contact instead of broadcasting it.
+        """
+        updated = [jid for jid in jids if self._update_caps(jid, node)]
+        for jid in updated:
+            self._broadcast_caps(jid, preserve)
+
+    def _update_caps(self, jid=None, node=None):
         try:
-            info = self.xmpp['xep_0030'].get_info(jid, node, local=True)
-            if isinstance(info, Iq):
-                info = info['disco_info']
-            ver = self.generate_verstring(info, self.hash)
+            ver, info = self._generate_local_verstring(jid, node)
             self.xmpp['xep_0030'].set_info(
                     jid=jid,
                     node='%s#%s' % (self.caps_node, ver),
                     info=info)
-            self.cache_caps(ver, info)
             self.assign_verstring(jid, ver)
-
-            if self.xmpp.session_started_event.is_set() and self.broadcast:
-                if self.xmpp.is_component or preserve:
-                    for contact in self.xmpp.roster[jid]:
-                        self.xmpp.roster[jid][contact].send_last_presence()
-                else:
-                    self.xmpp.roster[jid].send_last_presence()
+            return True
         except XMPPError:
-            return
+            return False
+
+    def _generate_local_verstring(self, jid, node):
+        """
+        Return the verstring and disco#info data for a local JID/node,
+        reusing the last generated verstring if the static disco node
+        has not changed since.
+        """
+        if jid in (None, ''):
+            key = (self.xmpp.boundjid.full, node or '')
+        else:
+            key = (JID(jid).full, node or '')
+        static = self.xmpp['xep_0030'].static
+
+        # Read the version first, so that any concurrent change will
+        # invalidate the result cached below.
+        version = static.get_version(jid, node)
+
+        info = self.xmpp['xep_0030'].get_info(jid, node, local=True)
+        if isinstance(info, Iq):
+            info = info['disco_info']
+
+        cached = self._local_caps.get(key, None)
+        if cached is not None and cached[0] == version and \
+                cached[1] is info and cached[2] == self.hash:
+            return cached[3], info
+
+        ver = self.generate_verstring(info, self.hash)
+        self.cache_caps(ver, info)
+
+        # Info provided by a dynamic node handler has no version that
+        # can tell us when it changes, so it can not be cached.
+        if version is not None and info is static.get_node(jid, node)['info']:
+            self._local_caps[key] = (version, info, self.hash, ver)
+        return ver, info
+
+    def _broadcast_caps(self, jid=None, preserve=False):
+        if self.xmpp.session_started_event.is_set() and self.broadcast:
+            if self.xmpp.is_component or preserve:
+                for contact in self.xmpp.roster[jid]:
+                    self.xmpp.roster[jid][contact].send_last_presence()
+            else:
+                self.xmpp.roster[jid].send_last_presence()
 
     def get_verstring(self, jid=None):
         if jid in ('', None):
@@ -326,6 +429,7 @@ class XEP_0115(BasePlugin):
             jid = self.xmpp.boundjid.full
         if isinstance(jid, JID):
             jid = jid.full
+        self._local_vers.pop(jid, None)
         return self.api['assign_verstring'](jid, args={
             'verstring': verstring})
 
@@ -0,0 +1,171 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2011 Nathanael C. Fritz, Lance J.T. Stout
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import logging
+import sqlite3
+import threading
+
+from sleekxmpp.util import shared_workers
+from sleekxmpp.xmlstream import ET, JID, tostring
+from sleekxmpp.plugins.xep_0030 import DiscoInfo
+from sleekxmpp.plugins.xep_0115.static import StaticCaps
+
+
+log = logging.getLogger(__name__)
+
+
+class PersistentCaps(StaticCaps):
+
+    """
+    Extend the StaticCaps handlers to keep verified capabilities and
+    JID to verification string assignments in an SQLite database.
+
+    Since a verification string is a hash of the disco#info data it
+    describes, cached entries never need to be refreshed. Entries are
+    kept in memory once loaded, and the database file may be shared by
+    several processes so that a restart, or a new worker, does not have
+    to query disco#info again for clients that have already been seen.
+
+    Only the last resource and verification string of each bare JID
+    are stored, so contacts whose clients pick a new resource on every
+    connection do not add a row each time. Assignments that change
+    what is stored are collected in memory and written together every
+    ``flush_interval`` seconds from a worker thread, instead of
+    committing from the event thread for every presence.
+    """
+
+    def __init__(self, xmpp, static, db, flush_interval=5):
+        """
+        Augment the default XEP-0030 static handler object.
+
+        Arguments:
+            static         -- The default static XEP-0030 handler object.
+            db             -- The filename of the SQLite database to use.
+            flush_interval -- Seconds between writes of new verification
+                              string assignments.
+        """
+        StaticCaps.__init__(self, xmpp, static)
+        self.db_lock = threading.Lock()
+        self.db = sqlite3.connect(db, check_same_thread=False)
+        with self.db_lock:
+            self.db.execute('CREATE TABLE IF NOT EXISTS caps ('
+                            'ver TEXT PRIMARY KEY, info TEXT NOT NULL)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS contact_vers ('
+                            'jid TEXT PRIMARY KEY, resource TEXT, '
+                            'ver TEXT NOT NULL)')
+            self.db.commit()
+
+        # The stored (resource, verstring) of each bare JID, and those
+        # waiting to be written.
+        self._contacts = {}
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flush_task = 'Caps Flush %s' % id(self)
+        self.xmpp.schedule(self._flush_task, flush_interval,
+                           self._schedule_flush, repeat=True)
+
+    def close(self):
+        """Write pending assignments and close the database."""
+        self.xmpp.scheduler.remove(self._flush_task)
+        self.flush()
+        with self.db_lock:
+            self.db.close()
+
+    def flush(self):
+        """Write pending verification string assignments."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        with self.db_lock:
+            try:
+                self.db.executemany(
+                        'INSERT OR REPLACE INTO contact_vers '
+                        '(jid, resource, ver) VALUES (?, ?, ?)',
+                        [(jid, resource, ver) for jid, (resource, ver)
+                         in pending.items()])
+                self.db.commit()
+            except sqlite3.Error as e:
+                log.warning('Could not update caps database: %s', e)
+
+    def _schedule_flush(self):
+        if self._pending:
+            shared_workers().submit(self.flush)
+
+    def _query(self, sql, args):
+        with self.db_lock:
+            row = self.db.execute(sql, args).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def _update(self, sql, args):
+        with self.db_lock:
+            try:
+                self.db.execute(sql, args)
+                self.db.commit()
+            except sqlite3.Error as e:
+                log.warning('Could not update caps database: %s', e)
+
+    def cache_caps(self, jid, node, ifrom, data):
+        verstring = data.get('verstring', None)
+        info = data.get('info', None)
+        if not verstring or not info:
+            return
+        StaticCaps.cache_caps(self, jid, node, ifrom, data)
+        self._update('INSERT OR REPLACE INTO caps (ver, info) '
+                     'VALUES (?, ?)', (verstring, tostring(info.xml)))
+
+    def assign_verstring(self, jid, node, ifrom, data):
+        if not isinstance(jid, JID):
+            jid = JID(jid)
+        verstring = data.get('verstring', None)
+        StaticCaps.assign_verstring(self, jid.full, node, ifrom, data)
+        if not verstring:
+            return
+        entry = (jid.resource, verstring)
+        with self._pending_lock:
+            if self._contacts.get(jid.bare) == entry:
+                return
+            self._contacts[jid.bare] = entry
+            self._pending[jid.bare] = entry
+
+    def get_verstring(self, jid, node, ifrom, data):
+        if not isinstance(jid, JID):
+            jid = JID(jid)
+        verstring = StaticCaps.get_verstring(self, jid.full, node,
+                                             ifrom, data)
+        if verstring is not None:
+            return verstring
+        with self._pending_lock:
+            entry = self._contacts.get(jid.bare, None)
+        if entry is None:
+            with self.db_lock:
+                entry = self.db.execute('SELECT resource, ver '
+                                        'FROM contact_vers WHERE jid = ?',
+                                        (jid.bare,)).fetchone()
+            if entry is None:
+                return None
+            entry = tuple(entry)
+            with self._pending_lock:
+                entry = self._contacts.setdefault(jid.bare, entry)
+        if entry[0] == jid.resource:
+            return entry[1]
+        return None
+
+    def get_caps(self, jid, node, ifrom, data):
+        verstring = data.get('verstring', None)
+        info = StaticCaps.get_caps(self, jid, node, ifrom, data)
+        if info is None and verstring:
+            xml = self._query('SELECT info FROM caps WHERE ver = ?',
+                              (verstring,))
+            if xml is not None:
+                info = DiscoInfo(xml=ET.fromstring(xml))
+                with self.static.lock:
+                    self.ver_cache[verstring] = info
+        return info
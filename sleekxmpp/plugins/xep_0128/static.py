@@ -59,6 +59,7 @@ class StaticExtendedDisco(object):
             info = self.static.get_node(jid, node)['info']
             for form in forms:
                 info.append(form)
+            self.static.node_changed(jid, node)
 
     def del_extended_info(self, jid, node, ifrom, data):
         """
@@ -71,3 +72,4 @@ class StaticExtendedDisco(object):
                 info = self.static.get_node(jid, node)['info']
                 for form in info['substanza']:
                     info.xml.remove(form.xml)
+                self.static.node_changed(jid, node)
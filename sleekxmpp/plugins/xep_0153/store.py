@@ -0,0 +1,176 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2012 Nathanael C. Fritz, Lance J.T. Stout
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import logging
+import sqlite3
+import threading
+
+from sleekxmpp.thirdparty import OrderedDict
+
+
+log = logging.getLogger(__name__)
+
+
+class AvatarStore(object):
+
+    """
+    Keep avatar images, keyed by their SHA-1 hash, and the last known
+    avatar hash of each JID in an SQLite database.
+
+    Since an avatar hash identifies its image, stored images never need
+    to be refreshed; a contact advertising a hash that is already known
+    does not have its vCard fetched again. The database file may be
+    shared by several processes, and an in-memory database is used if
+    no filename is given.
+
+    Without a database file, images are kept in memory instead, least
+    recently used first, until their combined size exceeds
+    ``max_bytes``.
+
+    Changes to the hashes of JIDs are collected in memory, replacing
+    any earlier change to the same JID, until :meth:`flush` writes them
+    together.
+    """
+
+    def __init__(self, db=None, max_bytes=1024 * 1024):
+        """
+        Arguments:
+            db        -- Optional filename of the SQLite database to use.
+            max_bytes -- The largest total size of the images kept in
+                         memory when no database file is used.
+        """
+        #: The largest total size of the images kept in memory.
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.images = None
+        if not db:
+            self.images = OrderedDict()
+        self.db_lock = threading.Lock()
+        self.db = sqlite3.connect(db or ':memory:', check_same_thread=False)
+        self._known = set()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        with self.db_lock:
+            self.db.execute('CREATE TABLE IF NOT EXISTS avatars ('
+                            'hash TEXT PRIMARY KEY, type TEXT, '
+                            'data BLOB NOT NULL)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS jid_hashes ('
+                            'jid TEXT PRIMARY KEY, hash TEXT NOT NULL)')
+            self.db.commit()
+
+    def close(self):
+        """Write pending hash changes and close the database."""
+        self.flush()
+        with self.db_lock:
+            self.db.close()
+
+    def flush(self):
+        """Write pending hash changes in a single transaction."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        removed = [(jid,) for jid, avatar_hash in pending.items()
+                   if avatar_hash is None]
+        stored = [(jid, avatar_hash) for jid, avatar_hash in pending.items()
+                  if avatar_hash is not None]
+        with self.db_lock:
+            try:
+                self.db.executemany('DELETE FROM jid_hashes WHERE jid = ?',
+                                    removed)
+                self.db.executemany('INSERT OR REPLACE INTO jid_hashes '
+                                    '(jid, hash) VALUES (?, ?)', stored)
+                self.db.commit()
+            except sqlite3.Error as e:
+                log.warning('Could not update avatar database: %s', e)
+
+    @property
+    def pending(self):
+        """The number of hash changes waiting to be written."""
+        with self._pending_lock:
+            return len(self._pending)
+
+    def _query(self, sql, args):
+        with self.db_lock:
+            return self.db.execute(sql, args).fetchone()
+
+    def _update(self, sql, args):
+        with self.db_lock:
+            try:
+                self.db.execute(sql, args)
+                self.db.commit()
+            except sqlite3.Error as e:
+                log.warning('Could not update avatar database: %s', e)
+
+    def has_avatar(self, avatar_hash):
+        """Return ``True`` if the image for a hash is stored."""
+        if self.images is not None:
+            with self.db_lock:
+                return avatar_hash in self.images
+        if avatar_hash in self._known:
+            return True
+        row = self._query('SELECT 1 FROM avatars WHERE hash = ?',
+                          (avatar_hash,))
+        if row is not None:
+            self._known.add(avatar_hash)
+        return row is not None
+
+    def get_avatar(self, avatar_hash):
+        """Return a ``(mime type, data)`` tuple, or ``None``."""
+        if self.images is not None:
+            with self.db_lock:
+                entry = self.images.pop(avatar_hash, None)
+                if entry is not None:
+                    self.images[avatar_hash] = entry
+                return entry
+        row = self._query('SELECT type, data FROM avatars WHERE hash = ?',
+                          (avatar_hash,))
+        if row is None:
+            return None
+        return row[0], bytes(row[1])
+
+    def add_avatar(self, avatar_hash, mtype, data):
+        """Store an image. Images already stored are left untouched."""
+        if self.images is not None:
+            with self.db_lock:
+                if avatar_hash not in self.images:
+                    self._add(avatar_hash, mtype, bytes(data))
+            return
+        if avatar_hash in self._known:
+            return
+        self._update('INSERT OR IGNORE INTO avatars (hash, type, data) '
+                     'VALUES (?, ?, ?)',
+                     (avatar_hash, mtype, sqlite3.Binary(data)))
+        self._known.add(avatar_hash)
+
+    def _add(self, avatar_hash, mtype, data):
+        self.images[avatar_hash] = (mtype, data)
+        self.size += len(data)
+        while self.size > self.max_bytes and len(self.images) > 1:
+            _, (_, old_data) = self.images.popitem(last=False)
+            self.size -= len(old_data)
+
+    def get_hash(self, jid):
+        """Return the last stored avatar hash for a bare JID."""
+        with self._pending_lock:
+            if jid in self._pending:
+                return self._pending[jid]
+        row = self._query('SELECT hash FROM jid_hashes WHERE jid = ?',
+                          (jid,))
+        if row is None:
+            return None
+        return row[0]
+
+    def set_hash(self, jid, avatar_hash):
+        """
+        Store the avatar hash of a bare JID, or forget it if ``None``.
+
+        The change is written by the next :meth:`flush`.
+        """
+        with self._pending_lock:
+            self._pending[jid] = avatar_hash
@@ -9,12 +9,16 @@
 import hashlib
 import logging
 import threading
+from collections import deque
 
-from sleekxmpp.stanza import Presence
+from sleekxmpp import JID
+from sleekxmpp.stanza import Iq, Presence
 from sleekxmpp.exceptions import XMPPError
+from sleekxmpp.util import shared_workers
 from sleekxmpp.xmlstream import register_stanza_plugin
 from sleekxmpp.plugins.base import BasePlugin
 from sleekxmpp.plugins.xep_0153 import stanza, VCardTempUpdate
+from sleekxmpp.plugins.xep_0153.store import AvatarStore
 
 
 log = logging.getLogger(__name__)
@@ -22,16 +26,69 @@ log = logging.getLogger(__name__)
 
 class XEP_0153(BasePlugin):
 
+    """
+    XEP-0153: vCard-Based Avatars
+
+    Avatars advertised in presence are fetched in the background, at
+    most ``max_fetches`` at a time and once per bare JID however many
+    presences announce them. Fetched images are kept by hash in an
+    :class:`~sleekxmpp.plugins.xep_0153.store.AvatarStore`, so an
+    avatar that is already known is never downloaded again. Changed
+    hashes are written to the store every ``flush_interval`` seconds
+    from a worker thread.
+
+    The ``vcard_avatar_update`` event fires with the announcing
+    presence once the contact's new hash has been stored, which for an
+    unknown avatar is after its vCard has been fetched.
+
+    Configuration:
+        avatar_db        -- Optional filename of an SQLite database used
+                            to store avatar images and hashes, so they
+                            survive restarts.
+        cache_size       -- The largest total size in bytes of the
+                            images kept in memory when ``avatar_db``
+                            is not set.
+        max_fetches      -- The number of vCard requests for avatars
+                            that may be in progress at once.
+        fetch_queue_size -- The number of JIDs that may wait for an
+                            avatar fetch. Further requests are dropped
+                            until the queue drains.
+        fetch_timeout    -- Seconds to wait for each vCard, or ``None``
+                            to use the stream's response timeout.
+        flush_interval   -- Seconds between writes of changed hashes
+                            to the store.
+    """
+
     name = 'xep_0153'
     description = 'XEP-0153: vCard-Based Avatars'
     dependencies = set(['xep_0054'])
     stanza = stanza
+    default_config = {
+        'avatar_db': None,
+        'cache_size': 1024 * 1024,
+        'max_fetches': 4,
+        'fetch_queue_size': 1000,
+        'fetch_timeout': None,
+        'flush_interval': 5
+    }
 
     def plugin_init(self):
         self._hashes = {}
+        self._advertised = {}
 
         self._allow_advertising = threading.Event()
 
+        self.store = AvatarStore(self.avatar_db, max_bytes=self.cache_size)
+        self.xmpp.schedule('Avatar Store Flush', self.flush_interval,
+                           self._schedule_flush, repeat=True)
+
+        self._fetch_lock = threading.Lock()
+        self._fetching = {}
+        self._updates = {}
+        self._fetch_queue = deque()
+        self._active_fetches = 0
+        self._fetch_round = 0
+
         register_stanza_plugin(Presence, VCardTempUpdate)
 
         self.xmpp.add_filter('out', self._update_presence)
@@ -58,6 +115,9 @@ class XEP_0153(BasePlugin):
         self.xmpp.del_event_handler('presence_xa', self._recv_presence)
         self.xmpp.del_event_handler('presence_chat', self._recv_presence)
         self.xmpp.del_event_handler('presence_away', self._recv_presence)
+        self._cancel_fetches()
+        self.xmpp.scheduler.remove('Avatar Store Flush')
+        self.store.close()
 
     def set_avatar(self, jid=None, avatar=None, mtype=None, block=True,
                    timeout=None, callback=None):
@@ -71,24 +131,133 @@ class XEP_0153(BasePlugin):
 
         self.xmpp['xep_0054'].publish_vcard(jid=jid, vcard=vcard)
 
-        self.api['reset_hash'](jid)
+        # The new hash is known, so there is no need to fetch the
+        # vCard that was just published.
+        self._store_avatar(jid, mtype, avatar)
         self.xmpp.roster[jid].send_last_presence()
 
+    def get_avatar(self, jid):
+        """
+        Return the avatar of a JID as a ``(mime type, data)`` tuple,
+        or ``None`` if it has no avatar or it has not been fetched.
+
+        An avatar dropped from the in-memory cache is fetched again.
+
+        Arguments:
+            jid -- The JID whose avatar is wanted.
+        """
+        avatar_hash = self.api['get_hash'](jid)
+        if not avatar_hash:
+            return None
+        avatar = self.store.get_avatar(avatar_hash)
+        if avatar is None:
+            self.fetch_avatar(jid)
+        return avatar
+
+    def fetch_avatar(self, jid, ifrom=None):
+        """
+        Queue fetching the vCard avatar of a JID.
+
+        Only one fetch per bare JID is queued or running at a time.
+        Returns ``False`` if the fetch queue is full.
+
+        Arguments:
+            jid   -- The JID whose avatar should be fetched.
+            ifrom -- Optional JID to send the request from.
+        """
+        bare = JID(jid).bare
+        with self._fetch_lock:
+            if bare in self._fetching:
+                return True
+            if len(self._fetch_queue) >= self.fetch_queue_size:
+                log.debug('Avatar fetch queue is full, dropping %s', bare)
+                self._updates.pop(bare, None)
+                return False
+            self._fetching[bare] = ifrom
+            self._fetch_queue.append(bare)
+        self._next_fetch()
+        return True
+
+    def _next_fetch(self):
+        while True:
+            with self._fetch_lock:
+                if self._active_fetches >= self.max_fetches or \
+                   not self._fetch_queue:
+                    return
+                jid = self._fetch_queue.popleft()
+                ifrom = self._fetching[jid]
+                fetch_round = self._fetch_round
+                self._active_fetches += 1
+
+            def done(iq, jid=jid, ifrom=ifrom, fetch_round=fetch_round,
+                     local=False):
+                self._fetched(jid, ifrom, iq, fetch_round, local)
+
+            try:
+                iq = self.xmpp['xep_0054'].get_vcard(
+                        jid=jid, ifrom=ifrom, block=False,
+                        callback=done, timeout_callback=done,
+                        timeout=self.fetch_timeout)
+                if isinstance(iq, Iq):
+                    # Answered locally, without sending a request.
+                    done(iq, local=True)
+            except Exception:
+                log.exception('Could not request vCard for %s', jid)
+                done(None)
+
+    def _fetched(self, jid, ifrom, iq, fetch_round, local=False):
+        try:
+            if iq is not None and (local or iq['type'] == 'result'):
+                photo = iq['vcard_temp']['PHOTO']
+                self._store_avatar(jid, photo['TYPE'], photo['BINVAL'],
+                                   ifrom=ifrom)
+                with self._fetch_lock:
+                    pres = self._updates.pop(jid, None)
+                if pres is not None:
+                    self.xmpp.event('vcard_avatar_update', pres)
+            else:
+                log.debug('Could not retrieve vCard for %s' % jid)
+        finally:
+            with self._fetch_lock:
+                if fetch_round != self._fetch_round:
+                    return
+                self._fetching.pop(jid, None)
+                self._active_fetches -= 1
+            self._next_fetch()
+
+    def _cancel_fetches(self):
+        with self._fetch_lock:
+            self._fetch_round += 1
+            self._fetching.clear()
+            self._updates.clear()
+            self._fetch_queue.clear()
+            self._active_fetches = 0
+
+    def _store_avatar(self, jid, mtype, data, ifrom=None):
+        if not data:
+            new_hash = ''
+        else:
+            new_hash = hashlib.sha1(data).hexdigest()
+            self.store.add_avatar(new_hash, mtype, data)
+        self._store_hash(jid, new_hash, ifrom)
+
+    def _store_hash(self, jid, new_hash, ifrom=None):
+        self.api['set_hash'](jid, ifrom=ifrom, args=new_hash)
+        self._advertised.pop(JID(jid).bare, None)
+
     def _start(self, event):
         try:
             vcard = self.xmpp['xep_0054'].get_vcard(self.xmpp.boundjid.bare)
-            data = vcard['vcard_temp']['PHOTO']['BINVAL']
-            if not data:
-                new_hash = ''
-            else:
-                new_hash = hashlib.sha1(data).hexdigest()
-            self.api['set_hash'](self.xmpp.boundjid, args=new_hash)
+            photo = vcard['vcard_temp']['PHOTO']
+            self._store_avatar(self.xmpp.boundjid, photo['TYPE'],
+                               photo['BINVAL'])
             self._allow_advertising.set()
         except XMPPError:
             log.debug('Could not retrieve vCard for %s' % self.xmpp.boundjid.bare)
 
     def _end(self, event):
         self._allow_advertising.clear()
+        self._cancel_fetches()
 
     def _update_presence(self, stanza):
         if not isinstance(stanza, Presence):
@@ -97,7 +266,13 @@ class XEP_0153(BasePlugin):
         if stanza['type'] not in ('available', 'dnd', 'chat', 'away', 'xa'):
             return stanza
 
-        current_hash = self.api['get_hash'](stanza['from'])
+        # Our own hash rarely changes, so remember it per sender
+        # instead of asking the get_hash API for every presence.
+        sender = stanza['from'].bare or self.xmpp.boundjid.bare
+        current_hash = self._advertised.get(sender, False)
+        if current_hash is False:
+            current_hash = self.api['get_hash'](stanza['from'])
+            self._advertised[sender] = current_hash
         stanza['vcard_temp_update']['photo'] = current_hash
         return stanza
 
@@ -106,22 +281,11 @@ class XEP_0153(BasePlugin):
         if self.xmpp.is_component:
             own_jid = (jid.domain == self.xmpp.boundjid.domain)
 
-        self.api['set_hash'](jid, args=None)
+        self._store_hash(jid, None, ifrom)
         if own_jid:
             self.xmpp.roster[jid].send_last_presence()
 
-        try:
-            iq = self.xmpp['xep_0054'].get_vcard(jid=jid.bare, ifrom=ifrom)
-
-            data = iq['vcard_temp']['PHOTO']['BINVAL']
-            if not data:
-                new_hash = ''
-            else:
-                new_hash = hashlib.sha1(data).hexdigest()
-
-            self.api['set_hash'](jid, args=new_hash)
-        except XMPPError:
-            log.debug('Could not retrieve vCard for %s' % jid)
+        self.fetch_avatar(jid, ifrom=ifrom)
 
     def _recv_presence(self, pres):
         try:
@@ -129,24 +293,43 @@ class XEP_0153(BasePlugin):
                 # Don't process vCard avatars for MUC occupants
                 # since they all share the same bare JID.
                 return
-        except: pass    
+        except: pass
 
-        if not pres.match('presence/vcard_temp_update'):
-            self.api['set_hash'](pres['from'], args=None)
+        if pres.xml.find(VCardTempUpdate.tag_name()) is None:
+            if self.api['get_hash'](pres['from']) is not None:
+                self._store_hash(pres['from'], None)
             return
 
         data = pres['vcard_temp_update']['photo']
         if data is None:
             return
-        elif data == '' or data != self.api['get_hash'](pres['from']):
+        elif data != self.api['get_hash'](pres['from']):
             ifrom = pres['to'] if self.xmpp.is_component else None
-            self.api['reset_hash'](pres['from'], ifrom=ifrom)
-            self.xmpp.event('vcard_avatar_update', pres)
+            if data == '' or self.store.has_avatar(data):
+                self._store_hash(pres['from'], data, ifrom)
+                self.xmpp.event('vcard_avatar_update', pres)
+            else:
+                # Announced once the fetched avatar has been stored.
+                with self._fetch_lock:
+                    self._updates[pres['from'].bare] = pres
+                self.api['reset_hash'](pres['from'], ifrom=ifrom)
 
     # =================================================================
 
+    def _schedule_flush(self):
+        if self.store.pending:
+            shared_workers().submit(self.store.flush)
+
     def _get_hash(self, jid, node, ifrom, args):
-        return self._hashes.get(jid.bare, None)
+        if jid.bare in self._hashes:
+            return self._hashes[jid.bare]
+        avatar_hash = self.store.get_hash(jid.bare)
+        self._hashes[jid.bare] = avatar_hash
+        return avatar_hash
 
     def _set_hash(self, jid, node, ifrom, args):
+        if jid.bare in self._hashes and self._hashes[jid.bare] == args:
+            return
         self._hashes[jid.bare] = args
+        self._advertised.pop(jid.bare, None)
+        self.store.set_hash(jid.bare, args)
@@ -17,6 +17,7 @@ from sleekxmpp.xmlstream.matcher import StanzaPath
 from sleekxmpp.xmlstream import register_stanza_plugin
 from sleekxmpp.plugins.base import BasePlugin
 from sleekxmpp.plugins.xep_0231 import stanza, BitsOfBinary
+from sleekxmpp.plugins.xep_0231.store import BobStore
 
 
 log = logging.getLogger(__name__)
@@ -26,14 +27,44 @@ class XEP_0231(BasePlugin):
 
     """
     XEP-0231 Bits of Binary
+
+    Data is kept in a :class:`~sleekxmpp.plugins.xep_0231.store.BobStore`.
+    Data published with :meth:`set_bob` is kept until its max age has
+    passed or it is deleted, while data received from others is also
+    dropped, least recently used first, to stay within the cache limits.
+
+    Configuration:
+        cache_size      -- The largest total size in bytes of the
+                           received data kept in memory.
+        bob_dir         -- Optional directory in which to keep large
+                           pieces of data instead of memory.
+        spill_size      -- The size in bytes from which data is kept in
+                           ``bob_dir``.
+        disk_cache_size -- The largest total size in bytes of the
+                           received data kept in ``bob_dir``.
+        default_max_age -- Seconds to keep received data that does not
+                           give a max age, or ``None`` to keep it until
+                           it is dropped for space.
+        expiry_interval -- Seconds between checks for expired data.
     """
 
     name = 'xep_0231'
     description = 'XEP-0231: Bits of Binary'
     dependencies = set(['xep_0030'])
+    default_config = {
+        'cache_size': 8 * 1024 * 1024,
+        'bob_dir': None,
+        'spill_size': 64 * 1024,
+        'disk_cache_size': 64 * 1024 * 1024,
+        'default_max_age': 86400,
+        'expiry_interval': 60
+    }
 
     def plugin_init(self):
-        self._cids = {}
+        self.store = BobStore(max_bytes=self.cache_size,
+                              directory=self.bob_dir,
+                              spill_size=self.spill_size,
+                              max_disk_bytes=self.disk_cache_size)
 
         register_stanza_plugin(Iq, BitsOfBinary)
         register_stanza_plugin(Message, BitsOfBinary)
@@ -58,11 +89,19 @@ class XEP_0231(BasePlugin):
         self.api.register(self._set_bob, 'set_bob', default=True)
         self.api.register(self._del_bob, 'del_bob', default=True)
 
+        if self.expiry_interval:
+            self.xmpp.schedule('Bits of Binary Expiry',
+                               self.expiry_interval,
+                               self.store.expire,
+                               repeat=True)
+
     def plugin_end(self):
         self.xmpp['xep_0030'].del_feature(feature='urn:xmpp:bob')
         self.xmpp.remove_handler('Bits of Binary - Iq')
         self.xmpp.remove_handler('Bits of Binary - Message')
         self.xmpp.remove_handler('Bits of Binary - Presence')
+        self.xmpp.scheduler.remove('Bits of Binary Expiry')
+        self.store.clear()
 
     def session_bind(self, jid):
         self.xmpp['xep_0030'].add_feature('urn:xmpp:bob')
@@ -102,6 +141,23 @@ class XEP_0231(BasePlugin):
     def del_bob(self, cid):
         self.api['del_bob'](args=cid)
 
+    def get_bob_data(self, cid):
+        """
+        Return a ``(mime type, data)`` tuple for locally stored data,
+        or ``None``.
+
+        The data is a read-only ``memoryview`` of the stored bytes,
+        which avoids copying large blobs, and only reflects the default
+        storage backend.
+
+        Arguments:
+            cid -- The content ID of the data.
+        """
+        entry = self.store.get(cid)
+        if entry is None:
+            return None
+        return entry[0], entry[1]
+
     def _handle_bob_iq(self, iq):
         cid = iq['bob']['cid']
 
@@ -110,6 +166,8 @@ class XEP_0231(BasePlugin):
             self.xmpp.event('bob', iq)
         elif iq['type'] == 'get':
             data = self.api['get_bob'](iq['to'], None, iq['from'], args=cid)
+            if data is None:
+                raise XMPPError('item-not-found')
             if isinstance(data, Iq):
                 data['id'] = iq['id']
                 data.send()
@@ -127,14 +185,39 @@ class XEP_0231(BasePlugin):
     # =================================================================
 
     def _set_bob(self, jid, node, ifrom, bob):
-        self._cids[bob['cid']] = bob
+        # Data received from others arrives with ifrom set to the
+        # recipient, while our own data is published without it.
+        local = ifrom is None
+        try:
+            max_age = int(bob['max_age'])
+        except (TypeError, ValueError):
+            max_age = None
+
+        if local:
+            # A max age of zero only tells others not to cache the
+            # data, so it must still be kept for serving it.
+            ttl = max_age if max_age else None
+        elif max_age is None:
+            ttl = self.default_max_age
+        elif max_age > 0:
+            ttl = max_age
+        else:
+            # The sender asked for the data not to be cached.
+            return
+        self.store.set(bob['cid'], bob['type'], bob['data'],
+                       max_age=max_age, ttl=ttl, pinned=local)
 
     def _get_bob(self, jid, node, ifrom, cid):
-        if cid in self._cids:
-            return self._cids[cid]
-        else:
-            raise XMPPError('item-not-found')
+        entry = self.store.get(cid)
+        if entry is None:
+            return None
+        mtype, data, max_age = entry
+        bob = BitsOfBinary()
+        bob['cid'] = cid
+        bob['type'] = mtype
+        bob['max_age'] = max_age
+        bob['data'] = data
+        return bob
 
     def _del_bob(self, jid, node, ifrom, cid):
-        if cid in self._cids:
-            del self._cids[cid]
+        self.store.delete(cid)
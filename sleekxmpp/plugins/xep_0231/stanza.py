@@ -24,6 +24,8 @@ class BitsOfBinary(ElementBase):
         return self._get_attr('max-age')
 
     def set_max_age(self, value):
+        if value is not None:
+            value = str(value)
         self._set_attr('max-age', value)
 
     def get_data(self):
@@ -0,0 +1,281 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2012 Nathanael C. Fritz,
+                       Emmanuel Gil Peyrot <linkmauve@linkmauve.fr>
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import threading
+import time
+
+from sleekxmpp.thirdparty import OrderedDict
+
+
+log = logging.getLogger(__name__)
+
+
+class _Blob(object):
+
+    """The bytes of one piece of data, shared by every CID naming it."""
+
+    __slots__ = ('digest', 'size', 'data', 'path', 'refs', 'pins')
+
+    def __init__(self, digest, size, data=None, path=None):
+        self.digest = digest
+        self.size = size
+        self.data = data
+        self.path = path
+        self.refs = 0
+        #: The number of pinned entries referring to the blob.
+        self.pins = 0
+
+
+class BobStore(object):
+
+    """
+    Keep Bits of Binary data by content ID.
+
+    Data is stored once per distinct content, however many CIDs refer
+    to it. Blobs of ``spill_size`` bytes or more are written to files
+    in ``directory``, if one is given, and mapped into memory when they
+    are read; other blobs are kept in memory.
+
+    Entries older than their ``ttl`` are dropped by :meth:`expire` or
+    when next read. Entries that are not pinned are also dropped,
+    least recently used first, once the data held in memory exceeds
+    ``max_bytes`` or the data held on disk exceeds ``max_disk_bytes``.
+    Pinned entries, such as the data we publish ourselves, are only
+    removed when they expire or are deleted, and blobs referred to by a
+    pinned entry do not count towards either limit.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, directory=None,
+                 spill_size=64 * 1024, max_disk_bytes=64 * 1024 * 1024):
+        """
+        Arguments:
+            max_bytes      -- The largest total size of the unpinned
+                              data kept in memory.
+            directory      -- Optional directory for large blobs.
+            spill_size     -- The size from which blobs are written
+                              to ``directory``.
+            max_disk_bytes -- The largest total size of the unpinned
+                              data kept in ``directory``.
+        """
+        #: The largest total size of the unpinned data kept in memory.
+        self.max_bytes = max_bytes
+        #: Directory for large blobs, or ``None`` to keep all in memory.
+        self.directory = directory
+        #: The size from which blobs are written to :attr:`directory`.
+        self.spill_size = spill_size
+        #: The largest total size of the unpinned data kept on disk.
+        self.max_disk_bytes = max_disk_bytes
+        #: The total size of the blobs kept in memory.
+        self.memory_size = 0
+        #: The total size of the blobs kept on disk.
+        self.disk_size = 0
+        #: The part of ``memory_size`` used by pinned entries.
+        self.pinned_memory_size = 0
+        #: The part of ``disk_size`` used by pinned entries.
+        self.pinned_disk_size = 0
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.blobs = {}
+
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def __contains__(self, cid):
+        return self.get(cid) is not None
+
+    def get(self, cid):
+        """
+        Return a ``(mime type, data, max age)`` tuple for a CID, or
+        ``None``.
+
+        The data is a read-only ``memoryview`` of the stored bytes, or
+        of a memory map of the blob's file, so reading it does not copy
+        the data.
+
+        Arguments:
+            cid -- The content ID of the data.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.pop(cid, None)
+            if entry is None:
+                return None
+            digest, mtype, max_age, expires, pinned = entry
+            if expires is not None and expires <= now:
+                self._release(digest, pinned)
+                return None
+            self.entries[cid] = entry
+            blob = self.blobs[digest]
+            data = blob.data
+            path = blob.path
+        if path is not None:
+            data = self._map(path)
+            if data is None:
+                self.delete(cid)
+                return None
+        return mtype, memoryview(data), max_age
+
+    def set(self, cid, mtype, data, max_age=None, ttl=None, pinned=False):
+        """
+        Store data under a CID.
+
+        Arguments:
+            cid     -- The content ID of the data.
+            mtype   -- The MIME type of the data.
+            data    -- The data, as bytes.
+            max_age -- Optional max age to advertise with the data.
+            ttl     -- Optional number of seconds to keep the data.
+            pinned  -- If ``True``, the entry is never dropped to
+                       make room for other data.
+        """
+        expires = None
+        if ttl is not None:
+            expires = time.time() + ttl
+        digest = hashlib.sha1(data).hexdigest()
+        with self.lock:
+            blob = self.blobs.get(digest, None)
+            if blob is None:
+                blob = self._add_blob(digest, data)
+                if blob is None:
+                    return
+            blob.refs += 1
+            if pinned:
+                self._pin(blob)
+            old = self.entries.pop(cid, None)
+            if old is not None:
+                self._release(old[0], old[4])
+            self.entries[cid] = (digest, mtype, max_age, expires, pinned)
+            self._evict()
+
+    def delete(self, cid):
+        """Remove the data stored under a CID."""
+        with self.lock:
+            entry = self.entries.pop(cid, None)
+            if entry is not None:
+                self._release(entry[0], entry[4])
+
+    def expire(self):
+        """Remove the entries older than their TTL."""
+        now = time.time()
+        with self.lock:
+            expired = [cid for cid, entry in self.entries.items()
+                       if entry[3] is not None and entry[3] <= now]
+            for cid in expired:
+                entry = self.entries.pop(cid)
+                self._release(entry[0], entry[4])
+        return len(expired)
+
+    def clear(self):
+        """Remove all entries."""
+        with self.lock:
+            for entry in self.entries.values():
+                self._release(entry[0], entry[4])
+            self.entries.clear()
+
+    def _add_blob(self, digest, data):
+        size = len(data)
+        if self.directory and size >= self.spill_size:
+            path = os.path.join(self.directory, digest)
+            try:
+                with open(path, 'wb') as blob_file:
+                    blob_file.write(data)
+            except (IOError, OSError) as e:
+                log.warning('Could not store BOB data in %s: %s', path, e)
+                return None
+            blob = _Blob(digest, size, path=path)
+            self.disk_size += size
+        else:
+            blob = _Blob(digest, size, data=bytes(data))
+            self.memory_size += size
+        self.blobs[digest] = blob
+        return blob
+
+    def _pin(self, blob):
+        blob.pins += 1
+        if blob.pins == 1:
+            if blob.path is None:
+                self.pinned_memory_size += blob.size
+            else:
+                self.pinned_disk_size += blob.size
+
+    def _release(self, digest, pinned=False):
+        blob = self.blobs[digest]
+        if pinned:
+            blob.pins -= 1
+            if blob.pins == 0:
+                if blob.path is None:
+                    self.pinned_memory_size -= blob.size
+                else:
+                    self.pinned_disk_size -= blob.size
+        blob.refs -= 1
+        if blob.refs > 0:
+            return
+        del self.blobs[digest]
+        if blob.path is None:
+            self.memory_size -= blob.size
+        else:
+            self.disk_size -= blob.size
+            try:
+                os.remove(blob.path)
+            except OSError as e:
+                log.debug('Could not remove BOB data in %s: %s',
+                          blob.path, e)
+
+    def _over_memory(self):
+        return self.memory_size - self.pinned_memory_size > self.max_bytes
+
+    def _over_disk(self):
+        return self.disk_size - self.pinned_disk_size > \
+               self.max_disk_bytes
+
+    def _evict(self):
+        if not self._over_memory() and not self._over_disk():
+            return
+        for cid in list(self.entries):
+            digest, _, _, _, pinned = self.entries[cid]
+            if pinned:
+                continue
+            blob = self.blobs[digest]
+            if blob.pins:
+                # Dropping the entry would not free anything.
+                continue
+            if blob.path is None and not self._over_memory():
+                continue
+            if blob.path is not None and not self._over_disk():
+                continue
+            log.debug('Dropping BOB data for %s', cid)
+            del self.entries[cid]
+            self._release(digest)
+            if not self._over_memory() and not self._over_disk():
+                return
+
+    def _map(self, path):
+        try:
+            with open(path, 'rb') as blob_file:
+                mapped = mmap.mmap(blob_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError) as e:
+            log.warning('Could not read BOB data in %s: %s', path, e)
+            return None
+        try:
+            memoryview(mapped)
+        except TypeError:
+            # Memory maps do not support memoryview on Python 2.
+            data = mapped[:]
+            mapped.close()
+            return data
+        return mapped
@@ -10,9 +10,10 @@ import logging
 
 import sleekxmpp
 from sleekxmpp.stanza import Message, Iq
-from sleekxmpp.exceptions import XMPPError
-from sleekxmpp.xmlstream.handler import Collector
-from sleekxmpp.xmlstream.matcher import StanzaPath
+from sleekxmpp.exceptions import XMPPError, IqError, IqTimeout
+from sleekxmpp.util import Queue, QueueEmpty
+from sleekxmpp.xmlstream.handler import Callback, Collector
+from sleekxmpp.xmlstream.matcher import StanzaPath, MatcherId
 from sleekxmpp.xmlstream import register_stanza_plugin
 from sleekxmpp.plugins import BasePlugin
 from sleekxmpp.plugins.xep_0313 import stanza
@@ -76,6 +77,160 @@ class XEP_0313(BasePlugin):
                 collector.stop()
                 raise e
 
+    def stream_archive(self, jid=None, start=None, end=None, with_jid=None,
+                       ifrom=None, page_size=50, after=None, timeout=None,
+                       page_callback=None, done_callback=None,
+                       timeout_callback=None):
+        """
+        Retrieve archived messages one page at a time, so that the
+        size of the archive does not affect memory use.
+
+        Pages are requested with RSM, each starting after the last
+        message of the previous page, until the archive is exhausted.
+
+        By default, a generator is returned that yields each archived
+        message as it is received. The next page is only requested
+        once the current one has been received, and a timeout or
+        error response raises IqTimeout or IqError. Since results are
+        collected while processing the stream, the generator may be
+        consumed from an event handler.
+
+        If page_callback is given, the archive is instead retrieved
+        asynchronously and nothing is returned. The callback receives
+        the result Iq of each page, with the page's messages in
+        iq['mam']['results'].
+
+        Arguments:
+            jid              -- The JID of the archive to query.
+            start            -- Optional datetime of the oldest message.
+            end              -- Optional datetime of the newest message.
+            with_jid         -- Only return messages exchanged with
+                                this JID.
+            ifrom            -- Specify the sender's JID.
+            page_size        -- The maximum number of messages to
+                                request at a time. Defaults to 50.
+            after            -- Optional ID of the archived message
+                                after which to start.
+            timeout          -- The time in seconds to wait for each
+                                page. Defaults to the stream's
+                                response_timeout.
+            page_callback    -- Optional function called with the
+                                result of each page.
+            done_callback    -- Optional function called with the last
+                                result or error Iq once retrieval ends.
+            timeout_callback -- Optional function called with the
+                                pending query if a page times out.
+        """
+        query = dict(jid=jid, start=start, end=end, with_jid=with_jid,
+                     ifrom=ifrom, page_size=page_size)
+
+        if page_callback is None:
+            return self._stream_pages(query, after, timeout)
+
+        def request(after):
+            page = []
+            iq = self._page_query(after=after, **query)
+            handler = self._page_handler(iq, page.append)
+
+            def on_result(iq):
+                self.xmpp.remove_handler(handler.name)
+                if iq['type'] == 'error':
+                    if done_callback is not None:
+                        done_callback(iq)
+                    return
+                iq['mam']['results'] = page
+                page_callback(iq)
+                after = self._next_page(iq, len(page), page_size)
+                if after is not None:
+                    request(after)
+                elif done_callback is not None:
+                    done_callback(iq)
+
+            def on_timeout(iq):
+                self.xmpp.remove_handler(handler.name)
+                if timeout_callback is not None:
+                    timeout_callback(iq)
+
+            iq.send(block=False, timeout=timeout, callback=on_result,
+                    timeout_callback=on_timeout)
+
+        request(after)
+
+    def _stream_pages(self, query, after, timeout):
+        """Generate archived messages for :meth:`stream_archive`."""
+        if timeout is None:
+            timeout = self.xmpp.response_timeout
+
+        while True:
+            received = Queue()
+            iq = self._page_query(after=after, **query)
+            handler = self._page_handler(iq, received.put, instream=True)
+            result_handler = Callback('MAM_Page_%s' % iq['id'],
+                                      MatcherId(iq['id']),
+                                      received.put,
+                                      once=True,
+                                      instream=True)
+            self.xmpp.register_handler(result_handler)
+
+            count = 0
+            try:
+                iq.send(block=False)
+                while True:
+                    try:
+                        item = received.get(True, timeout)
+                    except QueueEmpty:
+                        raise IqTimeout(iq)
+                    if isinstance(item, Iq):
+                        break
+                    count += 1
+                    yield item
+            finally:
+                self.xmpp.remove_handler(handler.name)
+                self.xmpp.remove_handler(result_handler.name)
+
+            if item['type'] == 'error':
+                raise IqError(item)
+            after = self._next_page(item, count, query['page_size'])
+            if after is None:
+                return
+
+    def _page_query(self, jid, start, end, with_jid, ifrom, page_size,
+                    after):
+        """Build the query for a single page of archived messages."""
+        iq = self.xmpp.Iq()
+        iq['to'] = jid
+        iq['from'] = ifrom
+        iq['type'] = 'get'
+        iq['mam']['queryid'] = iq['id']
+        iq['mam']['start'] = start
+        iq['mam']['end'] = end
+        iq['mam']['with'] = with_jid
+        iq['mam']['rsm']['max'] = str(page_size)
+        if after is not None:
+            iq['mam']['rsm']['after'] = after
+        return iq
+
+    def _page_handler(self, iq, pointer, instream=False):
+        """Register a handler passing the messages for a page query
+        to the given function."""
+        handler = Callback(
+            'MAM_Results_%s' % iq['id'],
+            StanzaPath('message/mam_result@queryid=%s' % iq['id']),
+            pointer,
+            instream=instream)
+        self.xmpp.register_handler(handler)
+        return handler
+
+    def _next_page(self, iq, count, page_size):
+        """Return the ID to continue after, or None after the last page."""
+        rsm = iq['mam']['rsm']
+        if not rsm['last'] or count < page_size:
+            return None
+        if rsm['count'] and rsm['first_index']:
+            if int(rsm['first_index']) + count >= int(rsm['count']):
+                return None
+        return rsm['last']
+
     def set_preferences(self, jid=None, default=None, always=None, never=None,
                         ifrom=None, block=True, timeout=None, callback=None):
         iq = self.xmpp.Iq()
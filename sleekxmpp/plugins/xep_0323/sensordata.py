@@ -11,13 +11,13 @@
 import logging
 import time
 import datetime
-from threading import Thread, Lock, Timer
+from threading import Lock
 
-from sleekxmpp.plugins.xep_0323.timerreset import TimerReset
 
 from sleekxmpp.xmlstream.handler import Callback
 from sleekxmpp.xmlstream.matcher import StanzaPath
 from sleekxmpp.plugins.base import BasePlugin
+from sleekxmpp.util import shared_timers, shared_workers
 from sleekxmpp.plugins.xep_0323 import stanza
 from sleekxmpp.plugins.xep_0323.stanza import Sensordata
 
@@ -41,6 +41,10 @@ class XEP_0323(BasePlugin):
     Configuration Values:
         threaded -- Indicates if communication with sensors should be threaded.
                     Defaults to True.
+        timers   -- The TimerService used for communication timeouts and
+                    delayed requests. Defaults to the shared service.
+        workers  -- The WorkerPool used for threaded readouts. Defaults to
+                    the shared pool.
 
     Events:
         Sensor side
@@ -106,7 +110,9 @@ class XEP_0323(BasePlugin):
 
 
     default_config = {
-        'threaded': True
+        'threaded': True,
+        'timers': None,
+        'workers': None
     }
 
     def plugin_init(self):
@@ -158,6 +164,12 @@ class XEP_0323(BasePlugin):
 
         self.last_seqnr = 0
         self.seqnr_lock = Lock()
+        self.session_lock = Lock()
+
+        if self.timers is None:
+            self.timers = shared_timers()
+        if self.workers is None:
+            self.workers = shared_workers()
 
         ## For testing only
         self.test_authenticated_from = ""
@@ -180,6 +192,9 @@ class XEP_0323(BasePlugin):
 
     def plugin_end(self):
         """ Stop the XEP-0323 plugin """
+        for session in list(self.sessions.values()):
+            for timer in session.get("commTimers", {}).values():
+                timer.cancel()
         self.sessions.clear()
         self.xmpp.remove_handler('Sensordata Event:Req')
         self.xmpp.remove_handler('Sensordata Event:Accepted')
@@ -298,6 +313,7 @@ class XEP_0323(BasePlugin):
             self.sessions[session] = {"from": iq['from'], "to": iq['to'], "seqnr": seqnr}
             self.sessions[session]["commTimers"] = {}
             self.sessions[session]["nodeDone"] = {}
+            self.sessions[session]["nodesLeft"] = 0
 
             iq.reply()
             iq['accepted']['seqnr'] = seqnr
@@ -309,14 +325,12 @@ class XEP_0323(BasePlugin):
 
             if not request_delay_sec is None:
                 # Delay request to requested time
-                timer = Timer(request_delay_sec, self._event_delayed_req, args=(session, process_fields, req_flags))
+                timer = self.timers.schedule(request_delay_sec, self._event_delayed_req, args=(session, process_fields, req_flags))
                 self.sessions[session]["commTimers"]["delaytimer"] = timer
-                timer.start()
                 return
 
             if self.threaded:
-                tr_req = Thread(target=self._threaded_node_request, args=(session, process_fields, req_flags))
-                tr_req.start()
+                self.workers.submit(self._threaded_node_request, session, process_fields, req_flags)
             else:
                 self._threaded_node_request(session, process_fields, req_flags)
 
@@ -329,7 +343,7 @@ class XEP_0323(BasePlugin):
 
     def _threaded_node_request(self, session, process_fields, flags):
         """
-        Helper function to handle the device readouts in a separate thread.
+        Helper function to handle the device readouts in a worker thread.
 
         Arguments:
             session         -- The request session id
@@ -337,13 +351,21 @@ class XEP_0323(BasePlugin):
             flags           -- [optional] flags to pass to the devices, e.g. momentary
                                Formatted as a dictionary like { "flag name": "flag value" ... }
         """
-        for node in self.sessions[session]["node_list"]:
-            self.sessions[session]["nodeDone"][node] = False
+        if not session in self.sessions:
+            # The request was cancelled before it started.
+            return
 
-        for node in self.sessions[session]["node_list"]:
-            timer = TimerReset(self.nodes[node]['commTimeout'], self._event_comm_timeout, args=(session, node))
+        node_list = list(self.sessions[session]["node_list"])
+        with self.session_lock:
+            for node in node_list:
+                self.sessions[session]["nodeDone"][node] = False
+            self.sessions[session]["nodesLeft"] = len(node_list)
+
+        for node in node_list:
+            if not session in self.sessions:
+                return
+            timer = self.timers.schedule(self.nodes[node]['commTimeout'], self._event_comm_timeout, args=(session, node))
             self.sessions[session]["commTimers"][node] = timer
-            timer.start()
             self.nodes[node]['device'].request_fields(process_fields, flags=flags, session=session, callback=self._device_field_request_callback)
 
     def _event_comm_timeout(self, session, nodeId):
@@ -356,6 +378,9 @@ class XEP_0323(BasePlugin):
             session         -- The request session id
             nodeId          -- The id of the device which timed out
         """
+        if not session in self.sessions:
+            return
+
         msg = self.xmpp.Message()
         msg['from'] = self.sessions[session]['to']
         msg['to'] = self.sessions[session]['from']
@@ -365,12 +390,11 @@ class XEP_0323(BasePlugin):
         msg['failure']['error']['timestamp'] = datetime.datetime.now().replace(microsecond=0).isoformat()
 
         # Drop communication with this device and check if we are done
-        self.sessions[session]["nodeDone"][nodeId] = True
-        if (self._all_nodes_done(session)):
+        if self._node_done(session, nodeId):
             msg['failure']['done'] = 'true'
         msg.send()
         # The session is complete, delete it
-        del self.sessions[session]
+        self._end_session(session)
 
     def _event_delayed_req(self, session, process_fields, req_flags):
         """
@@ -382,6 +406,10 @@ class XEP_0323(BasePlugin):
             flags           -- [optional] flags to pass to the devices, e.g. momentary
                                Formatted as a dictionary like { "flag name": "flag value" ... }
         """
+        if not session in self.sessions:
+            return
+        self.sessions[session]["commTimers"].pop("delaytimer", None)
+
         msg = self.xmpp.Message()
         msg['from'] = self.sessions[session]['to']
         msg['to'] = self.sessions[session]['from']
@@ -389,8 +417,7 @@ class XEP_0323(BasePlugin):
         msg.send()
 
         if self.threaded:
-            tr_req = Thread(target=self._threaded_node_request, args=(session, process_fields, req_flags))
-            tr_req.start()
+            self.workers.submit(self._threaded_node_request, session, process_fields, req_flags)
         else:
             self._threaded_node_request(session, process_fields, req_flags)
 
@@ -401,10 +428,35 @@ class XEP_0323(BasePlugin):
         Arguments:
             session         -- The request session id
         """
-        for n in self.sessions[session]["nodeDone"]:
-            if not self.sessions[session]["nodeDone"][n]:
-                return False
-        return True
+        return self.sessions[session]["nodesLeft"] == 0
+
+    def _node_done(self, session, nodeId):
+        """
+        Marks a device as done with the readout, and returns True if it
+        was the last device the session was waiting for.
+
+        Arguments:
+            session         -- The request session id
+            nodeId          -- The id of the device which is done
+        """
+        with self.session_lock:
+            state = self.sessions[session]
+            if not state["nodeDone"].get(nodeId, True):
+                state["nodeDone"][nodeId] = True
+                state["nodesLeft"] -= 1
+            return state["nodesLeft"] == 0
+
+    def _end_session(self, session):
+        """
+        Deletes a session and stops any of its remaining timers.
+
+        Arguments:
+            session         -- The request session id
+        """
+        state = self.sessions.pop(session, None)
+        if state is not None:
+            for timer in list(state["commTimers"].values()):
+                timer.cancel()
 
     def _device_field_request_callback(self, session, nodeId, result, timestamp_block, error_msg=None):
         """
@@ -455,11 +507,10 @@ class XEP_0323(BasePlugin):
             msg['failure']['error']['timestamp'] = datetime.datetime.now().replace(microsecond=0).isoformat()
 
             # Drop communication with this device and check if we are done
-            self.sessions[session]["nodeDone"][nodeId] = True
-            if (self._all_nodes_done(session)):
+            if self._node_done(session, nodeId):
                 msg['failure']['done'] = 'true'
                 # The session is complete, delete it
-                del self.sessions[session]
+                self._end_session(session)
             msg.send()
         else:
             msg = self.xmpp.Message()
@@ -481,10 +532,9 @@ class XEP_0323(BasePlugin):
 
             if result == "done":
                 self.sessions[session]["commTimers"][nodeId].cancel()
-                self.sessions[session]["nodeDone"][nodeId] = True
-                if (self._all_nodes_done(session)):
+                if self._node_done(session, nodeId):
                     # The session is complete, delete it
-                    del self.sessions[session]
+                    self._end_session(session)
                     msg['fields']['done'] = 'true'
             else:
                 # Restart comm timer
@@ -10,11 +10,12 @@
 
 import logging
 import time
-from threading import Thread, Timer, Lock
+from threading import Lock
 
 from sleekxmpp.xmlstream.handler import Callback
 from sleekxmpp.xmlstream.matcher import StanzaPath
 from sleekxmpp.plugins.base import BasePlugin
+from sleekxmpp.util import shared_timers, shared_workers
 from sleekxmpp.plugins.xep_0325 import stanza
 from sleekxmpp.plugins.xep_0325.stanza import Control
 
@@ -42,6 +43,10 @@ class XEP_0325(BasePlugin):
     Configuration Values:
         threaded -- Indicates if communication with sensors should be threaded.
                     Defaults to True.
+        timers   -- The TimerService used for communication timeouts.
+                    Defaults to the shared service.
+        workers  -- The WorkerPool used for threaded commands. Defaults to
+                    the shared pool.
 
     Events:
         Sensor side
@@ -106,7 +111,9 @@ class XEP_0325(BasePlugin):
 
 
     default_config = {
-        'threaded': True
+        'threaded': True,
+        'timers': None,
+        'workers': None
 #        'session_db': None
     }
 
@@ -139,6 +146,12 @@ class XEP_0325(BasePlugin):
 
         self.last_seqnr = 0
         self.seqnr_lock = Lock()
+        self.session_lock = Lock()
+
+        if self.timers is None:
+            self.timers = shared_timers()
+        if self.workers is None:
+            self.workers = shared_workers()
 
         ## For testning only
         self.test_authenticated_from = ""
@@ -155,6 +168,9 @@ class XEP_0325(BasePlugin):
 
     def plugin_end(self):
         """ Stop the XEP-0325 plugin """
+        for session in list(self.sessions.values()):
+            for timer in session.get("commTimers", {}).values():
+                timer.cancel()
         self.sessions.clear()
         self.xmpp.remove_handler('Control Event:DirectSet')
         self.xmpp.remove_handler('Control Event:SetReq')
@@ -258,15 +274,13 @@ class XEP_0325(BasePlugin):
             self.sessions[session] = {"from": iq['from'], "to": iq['to'], "seqnr": iq['id']}
             self.sessions[session]["commTimers"] = {}
             self.sessions[session]["nodeDone"] = {}
+            self.sessions[session]["nodesLeft"] = 0
             # Flag that a reply is exected when we are done
             self.sessions[session]["reply"] = True
 
             self.sessions[session]["node_list"] = process_nodes
             if self.threaded:
-                #print("starting thread")
-                tr_req = Thread(target=self._threaded_node_request, args=(session, process_fields))
-                tr_req.start()
-                #print("started thread")
+                self.workers.submit(self._threaded_node_request, session, process_fields)
             else:
                 self._threaded_node_request(session, process_fields)
 
@@ -326,34 +340,36 @@ class XEP_0325(BasePlugin):
             self.sessions[session] = {"from": msg['from'], "to": msg['to']}
             self.sessions[session]["commTimers"] = {}
             self.sessions[session]["nodeDone"] = {}
+            self.sessions[session]["nodesLeft"] = 0
             self.sessions[session]["reply"] = False
 
             self.sessions[session]["node_list"] = process_nodes
             if self.threaded:
-                #print("starting thread")
-                tr_req = Thread(target=self._threaded_node_request, args=(session, process_fields))
-                tr_req.start()
-                #print("started thread")
+                self.workers.submit(self._threaded_node_request, session, process_fields)
             else:
                 self._threaded_node_request(session, process_fields)
 
 
     def _threaded_node_request(self, session, process_fields):
         """
-        Helper function to handle the device control in a separate thread.
+        Helper function to handle the device control in a worker thread.
 
         Arguments:
             session         -- The request session id
             process_fields  -- The fields to set in the devices. List of tuple format:
                                (name, datatype, value)
         """
-        for node in self.sessions[session]["node_list"]:
-            self.sessions[session]["nodeDone"][node] = False
-
-        for node in self.sessions[session]["node_list"]:
-            timer = Timer(self.nodes[node]['commTimeout'], self._event_comm_timeout, args=(session, node))
+        node_list = list(self.sessions[session]["node_list"])
+        with self.session_lock:
+            for node in node_list:
+                self.sessions[session]["nodeDone"][node] = False
+            self.sessions[session]["nodesLeft"] = len(node_list)
+
+        for node in node_list:
+            if not session in self.sessions:
+                return
+            timer = self.timers.schedule(self.nodes[node]['commTimeout'], self._event_comm_timeout, args=(session, node))
             self.sessions[session]["commTimers"][node] = timer
-            timer.start()
             self.nodes[node]['device'].set_control_fields(process_fields, session=session, callback=self._device_set_command_callback)
 
     def _event_comm_timeout(self, session, nodeId):
@@ -367,6 +383,8 @@ class XEP_0325(BasePlugin):
             session         -- The request session id
             nodeId          -- The id of the device which timed out
         """
+        if not session in self.sessions:
+            return
 
         if self.sessions[session]["reply"]:
             # Reply is exected when we are done
@@ -384,10 +402,9 @@ class XEP_0325(BasePlugin):
         ## TODO - should we send one timeout per node??
 
         # Drop communication with this device and check if we are done
-        self.sessions[session]["nodeDone"][nodeId] = True
-        if (self._all_nodes_done(session)):
+        if self._node_done(session, nodeId):
             # The session is complete, delete it
-            del self.sessions[session]
+            self._end_session(session)
 
     def _all_nodes_done(self, session):
         """
@@ -396,10 +413,35 @@ class XEP_0325(BasePlugin):
         Arguments:
             session         -- The request session id
         """
-        for n in self.sessions[session]["nodeDone"]:
-            if not self.sessions[session]["nodeDone"][n]:
-                return False
-        return True
+        return self.sessions[session]["nodesLeft"] == 0
+
+    def _node_done(self, session, nodeId):
+        """
+        Marks a device as done with the control command, and returns True
+        if it was the last device the session was waiting for.
+
+        Arguments:
+            session         -- The request session id
+            nodeId          -- The id of the device which is done
+        """
+        with self.session_lock:
+            state = self.sessions[session]
+            if not state["nodeDone"].get(nodeId, True):
+                state["nodeDone"][nodeId] = True
+                state["nodesLeft"] -= 1
+            return state["nodesLeft"] == 0
+
+    def _end_session(self, session):
+        """
+        Deletes a session and stops any of its remaining timers.
+
+        Arguments:
+            session         -- The request session id
+        """
+        state = self.sessions.pop(session, None)
+        if state is not None:
+            for timer in list(state["commTimers"].values()):
+                timer.cancel()
 
     def _device_set_command_callback(self, session, nodeId, result, error_field=None, error_msg=None):
         """
@@ -443,15 +485,13 @@ class XEP_0325(BasePlugin):
                 iq.send(block=False)
 
                 # Drop communication with this device and check if we are done
-                self.sessions[session]["nodeDone"][nodeId] = True
-                if (self._all_nodes_done(session)):
+                if self._node_done(session, nodeId):
                     # The session is complete, delete it
-                    del self.sessions[session]
+                    self._end_session(session)
         else:
             self.sessions[session]["commTimers"][nodeId].cancel()
 
-            self.sessions[session]["nodeDone"][nodeId] = True
-            if (self._all_nodes_done(session)):
+            if self._node_done(session, nodeId):
                 if self.sessions[session]["reply"]:
                     # Reply is exected when we are done
                     iq = self.xmpp.Iq()
@@ -463,7 +503,7 @@ class XEP_0325(BasePlugin):
                     iq.send(block=False)
 
                 # The session is complete, delete it
-                del self.sessions[session]
+                self._end_session(session)
 
 
     # =================================================================
@@ -9,3 +9,4 @@
 from sleekxmpp.test.mocksocket import TestSocket
 from sleekxmpp.test.livesocket import TestLiveSocket
 from sleekxmpp.test.sleektest import *
+from sleekxmpp.test.server import TestServer
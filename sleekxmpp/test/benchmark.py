@@ -0,0 +1,180 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010 Nathanael C. Fritz, Lance J.T. Stout
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import json
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+from sleekxmpp.test.sleektest import SleekTest
+
+
+class SleekBenchmark(SleekTest):
+
+    """
+    A SleekTest that measures throughput and latency instead of
+    checking behaviour.
+
+    Every method whose name starts with ``bench`` is a benchmark. It
+    runs in a fresh instance, between setUp and tearDown like a test,
+    and calls :meth:`measure` once for every figure it reports. Streams
+    started with ``stream_start`` use the in-memory TestSocket, so no
+    network I/O is included in the results.
+
+    Attributes:
+        rounds  -- How many times each measurement is repeated. The
+                   best time is kept. Defaults to 3.
+        results -- The results recorded by this instance.
+    """
+
+    rounds = 3
+
+    def __init__(self, *args, **kwargs):
+        SleekTest.__init__(self, *args, **kwargs)
+        self.results = []
+
+    def tearDown(self):
+        self.stream_close()
+
+    def measure(self, name, func, number, setup=None, rounds=None):
+        """
+        Time a function that performs a batch of operations.
+
+        Arguments:
+            name   -- Label for the result, unique within the benchmark.
+            func   -- Function performing ``number`` operations.
+            number -- The number of operations ``func`` performs.
+            setup  -- Optional function called before every round,
+                      outside of the timing. Its return value is
+                      passed to ``func``.
+            rounds -- Override the default number of repetitions.
+        """
+        times = []
+        for i in range(rounds or self.rounds):
+            if setup is not None:
+                args = (setup(),)
+            else:
+                args = ()
+            start = time.time()
+            func(*args)
+            times.append(time.time() - start)
+        best = max(min(times), 1e-9)
+        result = {'name': '%s.%s' % (type(self).__name__, name),
+                  'ops': number,
+                  'seconds': best,
+                  'ops_per_sec': number / best,
+                  'usec_per_op': best * 1e6 / number}
+        self.results.append(result)
+        return result
+
+    def counter(self, event, count):
+        """
+        Return a threading.Event that is set once ``event`` has fired
+        ``count`` times. The handler removes itself when done.
+
+        Arguments:
+            event -- The name of the event to count.
+            count -- The number of occurrences to wait for.
+        """
+        done = threading.Event()
+        seen = [0]
+
+        def handler(data):
+            seen[0] += 1
+            if seen[0] == count:
+                self.xmpp.del_event_handler(event, handler)
+                done.set()
+
+        self.xmpp.add_event_handler(event, handler)
+        return done
+
+    def wait(self, done, timeout=30):
+        """Wait for an event returned by :meth:`counter`, or fail."""
+        if not done.wait(timeout):
+            self.fail('Benchmark timed out after %s seconds.' % timeout)
+
+
+def benchmark_names(cls):
+    """Return the names of the benchmark methods of a class."""
+    return sorted(name for name in dir(cls)
+                  if name.startswith('bench') and
+                     callable(getattr(cls, name)))
+
+
+def run_benchmark(cls, name, rounds=None):
+    """
+    Run a single benchmark method and return its results.
+
+    Arguments:
+        cls    -- A SleekBenchmark subclass.
+        name   -- The name of the benchmark method.
+        rounds -- Override the class' number of repetitions.
+    """
+    bench = cls(name)
+    if rounds:
+        bench.rounds = rounds
+    bench.setUp()
+    try:
+        getattr(bench, name)()
+    finally:
+        bench.tearDown()
+    return bench.results
+
+
+def describe_environment():
+    """Return metadata identifying the code and interpreter measured."""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         stderr=subprocess.STDOUT)
+        commit = commit.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': sys.platform,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+
+def dump_results(results, output):
+    """
+    Write results as a JSON document that can be compared later.
+
+    Arguments:
+        results -- A list of result dictionaries.
+        output  -- A writable file object.
+    """
+    doc = {'environment': describe_environment(),
+           'results': results}
+    json.dump(doc, output, indent=2, sort_keys=True)
+    output.write('\n')
+
+
+def load_results(input):
+    """Read results written by :func:`dump_results`, keyed by name."""
+    doc = json.load(input)
+    return dict((r['name'], r) for r in doc['results'])
+
+
+def format_results(results, baseline=None):
+    """
+    Return a human readable table of results, optionally comparing
+    them against a baseline from :func:`load_results`.
+    """
+    lines = []
+    for result in results:
+        line = '%-40s %12.1f ops/s %10.1f us/op' % (
+                result['name'], result['ops_per_sec'], result['usec_per_op'])
+        old = (baseline or {}).get(result['name'])
+        if old:
+            change = result['ops_per_sec'] / old['ops_per_sec'] - 1
+            line += ' %+7.1f%%' % (change * 100)
+        lines.append(line)
+    return '\n'.join(lines)
@@ -0,0 +1,740 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010 Nathanael C. Fritz, Lance J.T. Stout
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import base64
+import errno
+import hashlib
+import logging
+import select
+import socket
+import threading
+import uuid
+from collections import deque
+from xml.parsers import expat
+
+try:
+    from time import monotonic as _now
+except ImportError:
+    from time import time as _now
+
+from sleekxmpp.jid import JID
+from sleekxmpp.stanza import Iq, Message, Presence
+from sleekxmpp.stanza.roster import Roster
+from sleekxmpp.features.feature_bind.stanza import Bind
+from sleekxmpp.xmlstream import ET, tostring, register_stanza_plugin
+
+
+log = logging.getLogger(__name__)
+
+
+STREAM_NS = 'http://etherx.jabber.org/streams'
+CLIENT_NS = 'jabber:client'
+COMPONENT_NS = 'jabber:component:accept'
+SASL_NS = 'urn:ietf:params:xml:ns:xmpp-sasl'
+BIND_NS = 'urn:ietf:params:xml:ns:xmpp-bind'
+SESSION_NS = 'urn:ietf:params:xml:ns:xmpp-session'
+STREAMS_NS = 'urn:ietf:params:xml:ns:xmpp-streams'
+
+register_stanza_plugin(Iq, Roster)
+register_stanza_plugin(Iq, Bind)
+
+
+#: Stanza classes used to build replies, by element name.
+STANZAS = {'iq': Iq, 'message': Message, 'presence': Presence}
+
+
+#: Map sets of subscription directions to roster subscription values.
+SUBSCRIPTIONS = {frozenset(): 'none',
+                 frozenset(['to']): 'to',
+                 frozenset(['from']): 'from',
+                 frozenset(['to', 'from']): 'both'}
+
+
+def _split_tag(name):
+    """Convert an expat ``'namespace name'`` pair to ElementTree form."""
+    if ' ' in name:
+        return '{%s}%s' % tuple(name.split(' ', 1))
+    return name
+
+
+class ServerConnection(object):
+
+    """
+    One client or component connection accepted by a :class:`TestServer`.
+
+    Attributes:
+        jid           -- The bound full JID of a client, or the domain
+                         of a component, once negotiated.
+        namespace     -- The default namespace of the stream.
+        authenticated -- Whether SASL or the component handshake has
+                         succeeded.
+        presence      -- The last available presence broadcast by a
+                         client, or ``None`` if it is unavailable.
+    """
+
+    def __init__(self, server, sock):
+        self.server = server
+        self.socket = sock
+        self.jid = None
+        self.user = None
+        self.namespace = CLIENT_NS
+        self.stream_id = None
+        self.authenticated = False
+        self.component = False
+        self.presence = None
+        self.closed = False
+        self.output = deque()
+        self.output_size = 0
+        self.reset()
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def reset(self):
+        """Prepare to parse a new stream on the connection."""
+        self.depth = 0
+        self.builder = None
+        self.restart = False
+        self.parser = expat.ParserCreate('UTF-8', ' ')
+        self.parser.StartElementHandler = self._start
+        self.parser.EndElementHandler = self._end
+        self.parser.CharacterDataHandler = self._data
+        self.parser.StartNamespaceDeclHandler = self._namespace
+
+    def feed(self, data):
+        """Parse data read from the socket."""
+        try:
+            self.parser.Parse(data, False)
+        except expat.ExpatError as e:
+            log.debug('Invalid XML from %s: %s', self.jid, e)
+            self.stream_error('not-well-formed')
+        if self.restart:
+            self.reset()
+
+    def send(self, data):
+        """
+        Queue a string for the socket, writing as much of it as the
+        socket accepts without blocking.
+        """
+        if self.closed:
+            return
+        data = data.encode('utf-8')
+        self.output.append(data)
+        self.output_size += len(data)
+        if self.output_size > self.server.max_output:
+            log.debug('Too much output queued for %s', self.jid)
+            self.server._close(self)
+            return
+        self.flush()
+
+    def flush(self):
+        """Write queued output until the socket would block."""
+        while self.output and not self.closed:
+            data = self.output[0]
+            try:
+                sent = self.socket.send(data)
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                log.debug('Could not write to %s: %s', self.jid, e)
+                self.server._close(self)
+                return
+            self.output_size -= sent
+            if sent < len(data):
+                self.output[0] = data[sent:]
+                return
+            self.output.popleft()
+
+    def send_xml(self, xml):
+        """Serialize and send an element in its own default namespace."""
+        if '}' in xml.tag:
+            xmlns = xml.tag[1:].split('}', 1)[0]
+        else:
+            xmlns = ''
+        self.send(tostring(xml, xmlns=xmlns))
+
+    def stream_error(self, condition):
+        """Send a stream error and close the connection."""
+        self.send('<stream:error><%s xmlns="%s" /></stream:error>' % (
+                  condition, STREAMS_NS))
+        self.server._close(self)
+
+    def _namespace(self, prefix, uri):
+        if self.depth == 0 and prefix is None:
+            self.namespace = uri
+
+    def _start(self, name, attrs):
+        tag = _split_tag(name)
+        if self.depth == 0:
+            self.depth = 1
+            self.server._stream_start(self, tag, attrs)
+            return
+        if self.depth == 1:
+            self.builder = ET.TreeBuilder()
+        self.depth += 1
+        self.builder.start(tag, dict((_split_tag(k), v)
+                                     for k, v in attrs.items()))
+
+    def _end(self, name):
+        self.depth -= 1
+        if self.depth == 0:
+            self.send('</stream:stream>')
+            self.server._close(self)
+            return
+        self.builder.end(_split_tag(name))
+        if self.depth == 1:
+            xml = self.builder.close()
+            self.builder = None
+            self.server._stanza(self, xml)
+
+    def _data(self, data):
+        if self.builder is not None:
+            self.builder.data(data)
+
+
+class TestServer(object):
+
+    """
+    A minimal XMPP server running in a single background thread, for
+    soak and load testing many local clients without a real server.
+
+    It supports stream negotiation without TLS, SASL PLAIN, resource
+    binding, legacy sessions, the roster with subscriptions, presence
+    broadcast and routing, message and Iq routing between connected
+    clients, and components using the XEP-0114 handshake. Only what
+    SleekXMPP clients need for testing is implemented; there is no
+    offline storage, privacy handling or federation.
+
+    Sockets are non-blocking: output that a connection cannot accept
+    yet is queued for it and written once it becomes writable, so one
+    slow client does not hold up the others. A connection with more
+    than ``max_output`` bytes queued is closed.
+
+    Example::
+
+        server = TestServer('localhost')
+        server.start()
+        xmpp = ClientXMPP('user@localhost/test', 'secret')
+        server.connect(xmpp)
+        xmpp.process()
+        ...
+        server.stop()
+
+    Attributes:
+        domain     -- The domain served.
+        accounts   -- A dictionary mapping bare JIDs to passwords. If
+                      ``None``, any credentials are accepted.
+        rosters    -- A dictionary mapping bare JIDs to rosters, each a
+                      dictionary mapping contact bare JIDs to item
+                      values as used by the roster stanza.
+        max_output -- The number of bytes that may be queued for a
+                      connection before it is closed.
+    """
+
+    def __init__(self, domain='localhost', accounts=None,
+                 host='127.0.0.1', port=0):
+        self.domain = domain
+        self.accounts = accounts
+        self.rosters = {}
+        self.components = {}
+        self.host = host
+        self.port = port
+        self.max_output = 4 * 1024 * 1024
+
+        self._listener = None
+        self._thread = None
+        self._running = False
+        self._connections = {}
+        self._sessions = {}
+        self._component_conns = {}
+        self._changed = threading.Condition()
+        self._wakeup = None
+
+    @property
+    def address(self):
+        """The ``(host, port)`` tuple the server is listening on."""
+        return (self.host, self.port)
+
+    def start(self):
+        """Start listening and serving connections in a new thread."""
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET,
+                                  socket.SO_REUSEADDR, 1)
+        self._listener.bind((self.host, self.port))
+        self._listener.listen(128)
+        self._listener.setblocking(False)
+        self.port = self._listener.getsockname()[1]
+        self._wakeup = socket.socketpair()
+        self._running = True
+        self._thread = threading.Thread(name='test server',
+                                        target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self.address
+
+    def stop(self):
+        """Close all connections and stop the server thread."""
+        if not self._running:
+            return
+        self._running = False
+        self._wakeup[1].send(b'x')
+        self._thread.join()
+        for conn in list(self._connections.values()):
+            conn.send('</stream:stream>')
+            self._close(conn)
+        self._listener.close()
+        for sock in self._wakeup:
+            sock.close()
+
+    def set_roster(self, jid, items):
+        """
+        Replace the roster of a user.
+
+        Arguments:
+            jid   -- The bare JID of the roster's owner.
+            items -- A dictionary mapping contact JIDs to dictionaries
+                     with ``name``, ``subscription`` and ``groups``.
+        """
+        roster = {}
+        for contact, item in items.items():
+            roster[JID(contact).bare] = {
+                    'name': item.get('name', ''),
+                    'subscription': item.get('subscription', 'none'),
+                    'groups': list(item.get('groups', []))}
+        self.rosters[JID(jid).bare] = roster
+
+    def add_component(self, domain, secret):
+        """Allow a component to connect for a domain."""
+        self.components[domain] = secret
+
+    def connect(self, xmpp, **kwargs):
+        """
+        Connect a ClientXMPP or ComponentXMPP instance to the server,
+        allowing unencrypted SASL PLAIN for clients.
+
+        Extra keyword arguments are passed to ``xmpp.connect()``.
+        """
+        kwargs.setdefault('reattempt', False)
+        if getattr(xmpp, 'is_component', False):
+            return xmpp.connect(self.host, self.port, **kwargs)
+        xmpp['feature_mechanisms'].unencrypted_plain = True
+        kwargs.setdefault('use_tls', False)
+        return xmpp.connect(self.address, **kwargs)
+
+    def sessions(self):
+        """Return the full JIDs of all bound client sessions."""
+        with self._changed:
+            return [conn.jid.full for resources in self._sessions.values()
+                    for conn in resources.values()]
+
+    def wait_for_sessions(self, count, timeout=None):
+        """
+        Block until at least ``count`` client sessions are bound.
+
+        Returns ``True`` if they were, ``False`` on timeout.
+        """
+        with self._changed:
+            if timeout is None:
+                while self._session_count() < count:
+                    self._changed.wait()
+                return True
+            end = _now() + timeout
+            while self._session_count() < count:
+                remaining = end - _now()
+                if remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            return True
+
+    def _session_count(self):
+        return sum(len(r) for r in self._sessions.values())
+
+    # ------------------------------------------------------------------
+    # I/O loop
+
+    def _run(self):
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            read, write = select.POLLIN, select.POLLOUT
+            hangup = select.POLLHUP | select.POLLERR
+            register = modify = poller.register
+            unregister = poller.unregister
+            poll = poller.poll
+        else:
+            read, write, hangup = 1, 4, 0
+            fds = {}
+            register = modify = fds.__setitem__
+            unregister = fds.pop
+
+            def poll():
+                readers = [fd for fd, events in fds.items() if events & read]
+                writers = [fd for fd, events in fds.items()
+                           if events & write]
+                readable, writable, _ = select.select(readers, writers, [])
+                ready = dict((fd, read) for fd in readable)
+                for fd in writable:
+                    ready[fd] = ready.get(fd, 0) | write
+                return ready.items()
+
+        register(self._listener.fileno(), read)
+        register(self._wakeup[0].fileno(), read)
+        registered = {}
+        while self._running:
+            for fd, conn in self._connections.items():
+                events = read | write if conn.output else read
+                if registered.get(fd) != events:
+                    modify(fd, events)
+                    registered[fd] = events
+            for fd in set(registered) - set(self._connections):
+                unregister(fd)
+                del registered[fd]
+
+            try:
+                ready = poll()
+            except (select.error, OSError) as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fd, events in ready:
+                if fd == self._listener.fileno():
+                    self._accept()
+                elif fd == self._wakeup[0].fileno():
+                    self._wakeup[0].recv(64)
+                else:
+                    conn = self._connections.get(fd, None)
+                    if conn is not None and events & write:
+                        conn.flush()
+                    conn = self._connections.get(fd, None)
+                    if conn is not None and events & (read | hangup):
+                        self._read(conn)
+
+    def _accept(self):
+        while True:
+            try:
+                sock, addr = self._listener.accept()
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            sock.setblocking(False)
+            conn = ServerConnection(self, sock)
+            self._connections[conn.fileno()] = conn
+
+    def _read(self, conn):
+        try:
+            data = conn.socket.recv(65536)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = b''
+        if not data:
+            self._close(conn)
+        else:
+            conn.feed(data)
+
+    def _close(self, conn):
+        if conn.closed:
+            return
+        if conn.presence is not None:
+            self._set_presence(conn, None)
+        conn.closed = True
+        self._connections.pop(conn.socket.fileno(), None)
+        with self._changed:
+            if conn.component:
+                if self._component_conns.get(conn.jid) is conn:
+                    del self._component_conns[conn.jid]
+            elif conn.jid is not None:
+                resources = self._sessions.get(conn.jid.bare, {})
+                if resources.get(conn.jid.resource) is conn:
+                    del resources[conn.jid.resource]
+                if not resources:
+                    self._sessions.pop(conn.jid.bare, None)
+            self._changed.notify_all()
+        try:
+            conn.socket.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        conn.socket.close()
+
+    # ------------------------------------------------------------------
+    # Stream negotiation
+
+    def _stream_start(self, conn, tag, attrs):
+        conn.stream_id = uuid.uuid4().hex
+        if conn.namespace == COMPONENT_NS:
+            conn.component = True
+            conn.jid = attrs.get('to', '')
+            conn.send("<?xml version='1.0'?><stream:stream "
+                      "xmlns:stream='%s' xmlns='%s' from='%s' id='%s'>" % (
+                      STREAM_NS, COMPONENT_NS, conn.jid, conn.stream_id))
+            return
+
+        conn.send("<?xml version='1.0'?><stream:stream "
+                  "xmlns:stream='%s' xmlns='%s' from='%s' id='%s' "
+                  "version='1.0'>" % (STREAM_NS, CLIENT_NS,
+                                      self.domain, conn.stream_id))
+        if not conn.authenticated:
+            features = ('<mechanisms xmlns="%s">'
+                        '<mechanism>PLAIN</mechanism>'
+                        '</mechanisms>' % SASL_NS)
+        else:
+            features = ('<bind xmlns="%s" />'
+                        '<session xmlns="%s" />' % (BIND_NS, SESSION_NS))
+        conn.send('<stream:features>%s</stream:features>' % features)
+
+    def _stanza(self, conn, xml):
+        if conn.component:
+            if not conn.authenticated:
+                self._handshake(conn, xml)
+            else:
+                self._route(conn, xml)
+        elif not conn.authenticated:
+            self._auth(conn, xml)
+        elif conn.jid is None:
+            self._bind(conn, xml)
+        else:
+            xml.set('from', conn.jid.full)
+            self._route(conn, xml)
+
+    def _handshake(self, conn, xml):
+        secret = self.components.get(conn.jid, None)
+        if secret is not None:
+            expected = hashlib.sha1(
+                    (conn.stream_id + secret).encode('utf-8')).hexdigest()
+            if xml.tag == '{%s}handshake' % COMPONENT_NS and \
+               (xml.text or '').strip().lower() == expected:
+                conn.authenticated = True
+                with self._changed:
+                    self._component_conns[conn.jid] = conn
+                    self._changed.notify_all()
+                conn.send('<handshake />')
+                return
+        conn.stream_error('not-authorized')
+
+    def _auth(self, conn, xml):
+        if xml.tag == '{%s}auth' % SASL_NS and \
+           xml.get('mechanism') == 'PLAIN':
+            try:
+                creds = base64.b64decode((xml.text or '').encode('utf-8'))
+                authzid, user, password = creds.decode('utf-8').split('\0')
+            except (ValueError, TypeError, UnicodeError):
+                user = password = None
+            if user is not None:
+                jid = JID('%s@%s' % (user, self.domain))
+                if self.accounts is None or \
+                   self.accounts.get(jid.bare, None) == password:
+                    conn.authenticated = True
+                    conn.user = jid
+                    conn.send('<success xmlns="%s" />' % SASL_NS)
+                    conn.restart = True
+                    return
+        conn.send('<failure xmlns="%s"><not-authorized /></failure>' % (
+                  SASL_NS))
+
+    def _bind(self, conn, xml):
+        iq = Iq(xml=xml)
+        if iq['type'] != 'set' or iq.xml.find('{%s}bind' % BIND_NS) is None:
+            return self._error(conn, xml, 'not-authorized', 'auth')
+
+        resource = iq['bind']['resource'] or uuid.uuid4().hex[:8]
+        with self._changed:
+            resources = self._sessions.setdefault(conn.user.bare, {})
+            if resource in resources:
+                resource = '%s-%s' % (resource, uuid.uuid4().hex[:8])
+            conn.jid = JID('%s/%s' % (conn.user.bare, resource))
+            resources[resource] = conn
+            self._changed.notify_all()
+
+        iq.reply()
+        iq['bind']['jid'] = conn.jid.full
+        conn.send_xml(iq.xml)
+
+    # ------------------------------------------------------------------
+    # Routing
+
+    def _route(self, conn, xml):
+        kind = xml.tag.split('}', 1)[-1]
+        sto = JID(xml.get('to', ''))
+        stype = xml.get('type', '')
+
+        target = self._component_conns.get(sto.domain, None)
+        if target is not None:
+            return target.send_xml(xml)
+
+        if kind == 'presence':
+            if not xml.get('to'):
+                if stype in ('', 'unavailable'):
+                    self._set_presence(conn, xml)
+                return
+            if stype in ('subscribe', 'subscribed',
+                         'unsubscribe', 'unsubscribed'):
+                return self._subscription(conn, xml, sto, stype)
+
+        if not sto.user or (kind == 'iq' and not sto.resource and
+                            conn.jid is not None and
+                            sto.bare == JID(conn.jid).bare):
+            if sto.domain in ('', self.domain):
+                if kind == 'iq':
+                    self._server_iq(conn, xml)
+                return
+
+        if sto.domain != self.domain:
+            return self._error(conn, xml, 'remote-server-not-found',
+                               'cancel')
+
+        resources = self._sessions.get(sto.bare, {})
+        if sto.resource and sto.resource in resources:
+            return resources[sto.resource].send_xml(xml)
+
+        if kind == 'iq':
+            return self._error(conn, xml, 'service-unavailable', 'cancel')
+
+        targets = [c for c in resources.values() if c.presence is not None]
+        if not targets and kind == 'message':
+            return self._error(conn, xml, 'service-unavailable', 'cancel')
+        for target in targets:
+            target.send_xml(xml)
+
+    def _error(self, conn, xml, condition, etype):
+        """Bounce a stanza back to its sender with an error."""
+        if xml.get('type') in ('error', 'result'):
+            return
+        kind = xml.tag.split('}', 1)[-1]
+        stanza = STANZAS.get(kind, Iq)(xml=xml)
+        sfrom = stanza['to'] or self.domain
+        stanza.reply(clear=False)
+        stanza['from'] = sfrom
+        stanza['type'] = 'error'
+        stanza['error']['condition'] = condition
+        stanza['error']['type'] = etype
+        conn.send_xml(stanza.xml)
+
+    def _server_iq(self, conn, xml):
+        iq = Iq(xml=xml)
+        if iq['type'] not in ('get', 'set'):
+            return
+        payload = iq.xml.find('{jabber:iq:roster}query')
+        if payload is not None and not conn.component:
+            return self._roster_iq(conn, iq)
+        if iq.xml.find('{%s}session' % SESSION_NS) is not None or \
+           iq.xml.find('{urn:xmpp:ping}ping') is not None:
+            iq.reply()
+            iq['from'] = self.domain
+            return conn.send_xml(iq.xml)
+        self._error(conn, xml, 'service-unavailable', 'cancel')
+
+    def _roster_iq(self, conn, iq):
+        user = conn.jid.bare
+        roster = self.rosters.setdefault(user, {})
+        if iq['type'] == 'get':
+            items = dict(roster)
+            iq.reply()
+            iq['roster']['items'] = items
+            return conn.send_xml(iq.xml)
+
+        for jid, item in iq['roster']['items'].items():
+            jid = JID(jid).bare
+            if item.get('subscription') == 'remove':
+                roster.pop(jid, None)
+                self._roster_push(user, jid, {'subscription': 'remove'})
+            else:
+                entry = roster.setdefault(jid, {'subscription': 'none'})
+                entry['name'] = item.get('name', '')
+                entry['groups'] = item.get('groups', [])
+                self._roster_push(user, jid, entry)
+        iq.reply()
+        conn.send_xml(iq.xml)
+
+    def _roster_push(self, user, jid, item):
+        for conn in list(self._sessions.get(user, {}).values()):
+            push = Iq(sto=conn.jid, stype='set')
+            push['id'] = uuid.uuid4().hex[:8]
+            push['roster']['items'] = {jid: item}
+            conn.send_xml(push.xml)
+
+    def _subscribed(self, user, contact):
+        """Return the set of directions ``user`` is subscribed with."""
+        item = self.rosters.get(user, {}).get(contact, None)
+        if item is None:
+            return set()
+        return set(d for d in ('to', 'from')
+                   if item.get('subscription') in (d, 'both'))
+
+    def _update_subscription(self, user, contact, add=None, remove=None):
+        directions = self._subscribed(user, contact)
+        if add:
+            directions.add(add)
+        if remove:
+            directions.discard(remove)
+        roster = self.rosters.setdefault(user, {})
+        item = roster.setdefault(contact, {'name': '', 'groups': []})
+        item['subscription'] = SUBSCRIPTIONS[frozenset(directions)]
+        self._roster_push(user, contact, item)
+
+    def _subscription(self, conn, xml, sto, stype):
+        user = JID(xml.get('from')).bare
+        contact = sto.bare
+        xml.set('from', user)
+        xml.set('to', contact)
+        if stype == 'subscribed':
+            self._update_subscription(user, contact, add='from')
+            self._update_subscription(contact, user, add='to')
+        elif stype == 'unsubscribed':
+            self._update_subscription(user, contact, remove='from')
+            self._update_subscription(contact, user, remove='to')
+        elif stype == 'unsubscribe':
+            self._update_subscription(user, contact, remove='to')
+            self._update_subscription(contact, user, remove='from')
+
+        for target in list(self._sessions.get(contact, {}).values()):
+            target.send_xml(xml)
+
+        if stype == 'subscribed':
+            # Let the new subscriber know who is online.
+            for source in list(self._sessions.get(user, {}).values()):
+                if source.presence is not None:
+                    for target in self._sessions.get(contact, {}).values():
+                        self._send_presence(source, target)
+
+    def _send_presence(self, source, target, available=True):
+        if available:
+            pres = Presence(xml=ET.fromstring(tostring(source.presence)))
+        else:
+            pres = Presence(stype='unavailable')
+        pres['from'] = source.jid
+        pres['to'] = target.jid
+        target.send_xml(pres.xml)
+
+    def _set_presence(self, conn, xml):
+        """Broadcast a client's presence to its subscribers."""
+        user = conn.jid.bare
+        initial = conn.presence is None
+        if xml is not None and xml.get('type') == 'unavailable':
+            xml = None
+        conn.presence = xml
+
+        contacts = [jid for jid in self.rosters.get(user, {})
+                    if 'from' in self._subscribed(user, jid)]
+        targets = [c for r in [self._sessions.get(user, {})] +
+                   [self._sessions.get(jid, {}) for jid in contacts]
+                   for c in r.values() if c.presence is not None and
+                   c is not conn]
+        for target in targets:
+            self._send_presence(conn, target, xml is not None)
+
+        if xml is not None and initial:
+            # Respond to the implied probes of an initial presence.
+            contacts = [jid for jid in self.rosters.get(user, {})
+                        if 'to' in self._subscribed(user, jid)]
+            sources = [c for r in [self._sessions.get(user, {})] +
+                       [self._sessions.get(jid, {}) for jid in contacts]
+                       for c in r.values() if c.presence is not None and
+                       c is not conn]
+            for source in sources:
+                self._send_presence(source, conn)
@@ -18,6 +18,10 @@ class StateMachine(object):
     def __init__(self, states=None):
         if not states: states = []
         self.lock = threading.Condition()
+        # The thread running a transition's function, if any. The lock
+        # itself is only held briefly, so that waiting for a transition
+        # to finish does not require polling the lock.
+        self.__owner = None
         self.__states = []
         self.addStates(states)
         self.__default_state = self.__states[0]
@@ -95,45 +99,43 @@ class StateMachine(object):
         if self.__current_state == to_state:
             return True
 
+        current = threading.current_thread()
         start = time.time()
-        while not self.lock.acquire(False):
-            time.sleep(.001)
-            if (start + wait - time.time()) <= 0.0:
-                log.debug("==== Could not acquire lock in %s sec: %s -> %s ", wait, self.__current_state, to_state)
-                return False
-
-        while not self.__current_state in from_states:
-            # detect timeout:
-            remainder = start + wait - time.time()
-            if remainder > 0:
+        self.lock.acquire()
+        try:
+            while self.__owner not in (None, current) or \
+                  not self.__current_state in from_states:
+                # detect timeout:
+                remainder = start + wait - time.time()
+                if remainder <= 0.0:
+                    if self.__owner not in (None, current):
+                        log.debug("==== Could not acquire lock in %s sec: %s -> %s ", wait, self.__current_state, to_state)
+                    else:
+                        log.debug("State was not ready")
+                    return False
                 self.lock.wait(remainder)
-            else:
-                log.debug("State was not ready")
-                self.lock.release()
-                return False
-
-        try: # lock is acquired; all other threads will return false or wait until notify/timeout
-            if self.__current_state in from_states: # should always be True due to lock
-
-                # Note that func might throw an exception, but that's OK, it aborts the transition
-                return_val = func(*args,**kwargs) if func is not None else True
-
-                # some 'false' value returned from func,
-                # indicating that transition should not occur:
-                if not return_val:
-                    return return_val
+            # all other threads will return false or wait until notify/timeout
+            outer = self.__owner
+            self.__owner = current
+        finally:
+            self.lock.release()
 
-                log.debug(' ==== TRANSITION %s -> %s', self.__current_state, to_state)
-                self._set_state(to_state)
-                return return_val  # some 'true' value returned by func or True if func was None
-            else:
-                log.error("StateMachine bug!!  The lock should ensure this doesn't happen!")
-                return False
+        try:
+            # Note that func might throw an exception, but that's OK, it aborts the transition
+            return_val = func(*args,**kwargs) if func is not None else True
+            # some 'false' value returned from func,
+            # indicating that transition should not occur:
+            if not return_val:
+                return return_val
+            log.debug(' ==== TRANSITION %s -> %s', self.__current_state, to_state)
+            self._set_state(to_state)
+            return return_val  # some 'true' value returned by func or True if func was None
         finally:
+            self.lock.acquire()
+            self.__owner = outer
             self.lock.notify_all()
             self.lock.release()
 
-
     def transition_ctx(self, from_state, to_state, wait=0.0):
         '''
         Use the state machine as a context manager.  The transition occurs on /exit/ from
@@ -200,18 +202,22 @@ class StateMachine(object):
         # avoid an operation occurring in the wrong state.
         # TODO another option would be an ensure_ctx that uses a semaphore to allow
         # threads to indicate they want to remain in a particular state.
+        current = threading.current_thread()
         self.lock.acquire()
-        start = time.time()
-        while not self.__current_state in states:
-            # detect timeout:
-            remainder = start + wait - time.time()
-            if remainder > 0:
-                self.lock.wait(remainder)
-            else:
-                self.lock.release()
-                return False
-        self.lock.release()
-        return True
+        try:
+            while self.__owner not in (None, current):
+                self.lock.wait()
+            start = time.time()
+            while not self.__current_state in states:
+                # detect timeout:
+                remainder = start + wait - time.time()
+                if remainder > 0:
+                    self.lock.wait(remainder)
+                else:
+                    return False
+            return True
+        finally:
+            self.lock.release()
 
     def reset(self):
         # TODO need to lock before calling this?
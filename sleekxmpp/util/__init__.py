@@ -46,3 +46,8 @@ class Queue(_queue):
         return _queue.put(self, item, block, timeout)
 
 QueueEmpty = queue.Empty
+
+
+from sleekxmpp.util.timers import Timer, TimerService, shared_timers
+from sleekxmpp.util.workers import WorkerPool, shared_workers
+from sleekxmpp.util.events import WakeupEvent
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+    sleekxmpp.util.events
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    This module provides an event flag that can wake up threads
+    waiting on other conditions.
+
+    Part of SleekXMPP: The Sleek XMPP Library
+
+    :copyright: (c) 2012 Nathanael C. Fritz, Lance J.T. Stout
+    :license: MIT, see LICENSE for more details
+"""
+
+import threading
+
+
+# threading.Event is only a factory function before Python 3.
+_Event = getattr(threading, '_Event', threading.Event)
+
+
+class WakeupEvent(_Event):
+
+    """
+    A :class:`threading.Event` that also notifies any linked
+    :class:`threading.Condition` when set.
+
+    A thread can then block on a condition until either this event
+    or some other state changes, instead of waking up periodically to
+    check the event.
+    """
+
+    def __init__(self):
+        _Event.__init__(self)
+        self._linked = []
+
+    def link(self, condition):
+        """
+        Notify a condition every time the event is set.
+
+        Arguments:
+            condition -- A :class:`threading.Condition`.
+        """
+        self._linked.append(condition)
+
+    def unlink(self, condition):
+        """Stop notifying a condition."""
+        if condition in self._linked:
+            self._linked.remove(condition)
+
+    def set(self):
+        _Event.set(self)
+        for condition in list(self._linked):
+            with condition:
+                condition.notify_all()
@@ -18,15 +18,74 @@
 import sys
 import hmac
 import random
+import threading
 
 from base64 import b64encode, b64decode
 
+try:
+    from hashlib import pbkdf2_hmac
+except ImportError:
+    pbkdf2_hmac = None
+
+from sleekxmpp.thirdparty import OrderedDict
 from sleekxmpp.util import bytes, hash, XOR, quote, num_to_bytes
 from sleekxmpp.util.sasl.client import sasl_mech, Mech, \
                                        SASLCancelled, SASLFailed, \
                                        SASLMutualAuthFailed
 
 
+class SCRAMCache(object):
+
+    """
+    A bounded, thread safe cache of SCRAM client and server keys.
+
+    Deriving the keys requires running PBKDF2 with the iteration count
+    chosen by the server, which is by far the most expensive part of
+    a SCRAM exchange. As permitted by RFC 5802, the derived keys may be
+    reused for as long as the password, salt, iteration count and hash
+    stay the same, making reconnections skip the derivation entirely.
+
+    Entries are keyed by the hash name, salt and iteration count, along
+    with an HMAC of the password so that the password itself is not
+    kept in the cache. The least recently used entries are discarded
+    once ``size`` entries are stored.
+
+    To enable caching for all SCRAM mechanisms::
+
+        from sleekxmpp.util.sasl import SCRAM, SCRAMCache
+        SCRAM.cache = SCRAMCache()
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the cached keys for ``key``, or ``None``."""
+        with self.lock:
+            keys = self.entries.pop(key, None)
+            if keys is not None:
+                self.entries[key] = keys
+            return keys
+
+    def set(self, key, keys):
+        """Store a ``(client_key, server_key)`` tuple for ``key``."""
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = keys
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all cached keys."""
+        with self.lock:
+            self.entries.clear()
+
+
 @sasl_mech(0)
 class ANONYMOUS(Mech):
 
@@ -189,6 +248,10 @@ class SCRAM(Mech):
     optional_credentials = set(['authzid', 'channel_binding'])
     security = set(['encrypted', 'unencrypted_scram'])
 
+    #: An optional :class:`SCRAMCache` shared by all SCRAM mechanisms
+    #: for reusing derived keys across authentications.
+    cache = None
+
     def setup(self, name):
         self.use_channel_binding = False
         if name[-5:] == '-PLUS':
@@ -212,6 +275,8 @@ class SCRAM(Mech):
 
     def Hi(self, text, salt, iterations):
         text = bytes(text)
+        if pbkdf2_hmac is not None:
+            return pbkdf2_hmac(self.hash().name, text, salt, iterations)
         ui1 = self.HMAC(text, salt + b'\0\0\0\01')
         ui = ui1
         for i in range(iterations - 1):
@@ -222,6 +287,28 @@ class SCRAM(Mech):
     def H(self, text):
         return self.hash(text).digest()
 
+    def keys(self, salt, iterations):
+        """
+        Return the ClientKey and ServerKey derived from the password,
+        using :attr:`cache` if it has been set.
+        """
+        password = self.credentials['password']
+        cache = self.cache
+        if cache is not None:
+            key = (self.hash_name, salt, iterations,
+                   self.HMAC(salt, password))
+            keys = cache.get(key)
+            if keys is not None:
+                return keys
+
+        salted_password = self.Hi(password, salt, iterations)
+        keys = (self.HMAC(salted_password, b'Client Key'),
+                self.HMAC(salted_password, b'Server Key'))
+
+        if cache is not None:
+            cache.set(key, keys)
+        return keys
+
     def saslname(self, value):
         value = value.decode("utf-8")
         escaped = []
@@ -295,17 +382,13 @@ class SCRAM(Mech):
         client_final_message_without_proof = channel_binding + b',' + \
                                              b'r=' + nonce
 
-        salted_password = self.Hi(self.credentials['password'],
-                                       salt,
-                                       iteration_count)
-        client_key = self.HMAC(salted_password, b'Client Key')
+        client_key, server_key = self.keys(salt, iteration_count)
         stored_key = self.H(client_key)
         auth_message = self.client_first_message_bare + b',' + \
                        challenge + b',' + \
                        client_final_message_without_proof
         client_signature = self.HMAC(stored_key, auth_message)
         client_proof = XOR(client_key, client_signature)
-        server_key = self.HMAC(salted_password, b'Server Key')
 
         self.server_signature = self.HMAC(server_key, auth_message)
 
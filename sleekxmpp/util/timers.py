@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+    sleekxmpp.util.timers
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    This module provides a timer service that runs any number of
+    one-shot, resettable timers from a single thread.
+
+    Part of SleekXMPP: The Sleek XMPP Library
+
+    :copyright: (c) 2012 Nathanael C. Fritz, Lance J.T. Stout
+    :license: MIT, see LICENSE for more details
+"""
+
+import atexit
+import heapq
+import itertools
+import logging
+import threading
+
+try:
+    from time import monotonic as _now
+except ImportError:
+    from time import time as _now
+
+
+log = logging.getLogger(__name__)
+
+
+class Timer(object):
+
+    """
+    A handle for a callback scheduled with a :class:`TimerService`.
+
+    The interface mirrors :class:`threading.Timer`, with the addition
+    of :meth:`reset` to push the deadline back, but no thread is used
+    per timer.
+    """
+
+    __slots__ = ('service', 'interval', 'deadline', 'callback',
+                 'args', 'kwargs', 'finished', '_when')
+
+    def __init__(self, service, interval, callback, args=None, kwargs=None):
+        self.service = service
+        self.interval = interval
+        self.deadline = _now() + interval
+        self.callback = callback
+        self.args = args or ()
+        self.kwargs = kwargs or {}
+        self.finished = False
+        self._when = self.deadline
+
+    def cancel(self):
+        """Stop the timer if it has not fired yet."""
+        self.service._cancel(self)
+
+    def reset(self, interval=None):
+        """
+        Restart the countdown, optionally with a new interval.
+
+        Arguments:
+            interval -- The new number of seconds to wait.
+        """
+        self.service._reset(self, interval)
+
+    def is_alive(self):
+        """Return ``True`` while the timer is waiting to fire."""
+        return not self.finished
+
+
+class TimerService(object):
+
+    """
+    Run timers from a single thread, ordered by deadline in a heap.
+
+    Scheduling and cancelling are O(log n) and O(1). Resetting a timer
+    to a later deadline only updates the timer; the heap entry is
+    moved when it reaches the top. The thread sleeps until the next
+    deadline instead of ticking, so an idle service never wakes up.
+
+    Callbacks run in the timer thread and should return quickly;
+    long running work belongs in a :class:`~sleekxmpp.util.WorkerPool`.
+    """
+
+    def __init__(self, name='timers'):
+        #: The name given to the timer thread.
+        self.name = name
+        self._heap = []
+        self._counter = itertools.count()
+        self._dead = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        """Return the number of pending timers."""
+        with self._condition:
+            return len(self._heap) - self._dead
+
+    def schedule(self, interval, callback, args=None, kwargs=None):
+        """
+        Call ``callback`` after ``interval`` seconds.
+
+        Arguments:
+            interval -- The number of seconds to wait.
+            callback -- The function to call.
+            args     -- Positional arguments for the callback.
+            kwargs   -- Keyword arguments for the callback.
+
+        Returns a :class:`Timer` that can be cancelled or reset.
+        """
+        timer = Timer(self, interval, callback, args, kwargs)
+        with self._condition:
+            self._push(timer)
+            if self._thread is None:
+                self._thread = threading.Thread(name=self.name,
+                                                target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        return timer
+
+    def stop(self):
+        """Drop all pending timers and end the timer thread."""
+        with self._condition:
+            for entry in self._heap:
+                entry[2].finished = True
+            self._heap = []
+            self._dead = 0
+            thread, self._thread = self._thread, None
+            self._condition.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _push(self, timer):
+        timer._when = timer.deadline
+        heapq.heappush(self._heap, (timer.deadline,
+                                    next(self._counter),
+                                    timer))
+        if self._heap[0][2] is timer:
+            self._condition.notify()
+
+    def _cancel(self, timer):
+        with self._condition:
+            if timer.finished:
+                return
+            timer.finished = True
+            self._dead += 1
+            # Dead entries are normally skipped when they reach the
+            # top of the heap; rebuild it once they dominate.
+            if self._dead > 64 and self._dead * 2 > len(self._heap):
+                self._heap = [e for e in self._heap
+                              if not e[2].finished and e[0] == e[2]._when]
+                heapq.heapify(self._heap)
+                self._dead = 0
+
+    def _reset(self, timer, interval):
+        with self._condition:
+            if timer.finished:
+                return
+            if interval is not None:
+                timer.interval = interval
+            timer.deadline = _now() + timer.interval
+            if timer.deadline < timer._when:
+                # The old heap entry becomes stale and is skipped.
+                self._dead += 1
+                self._push(timer)
+
+    def _next(self):
+        """Block until a timer is due, and return it."""
+        current = threading.current_thread()
+        with self._condition:
+            while self._thread is current:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                when, _, timer = self._heap[0]
+                delay = when - _now()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                if timer.finished or when != timer._when:
+                    self._dead -= 1
+                elif timer.deadline > when:
+                    self._push(timer)
+                else:
+                    timer.finished = True
+                    return timer
+            return None
+
+    def _run(self):
+        while True:
+            timer = self._next()
+            if timer is None:
+                return
+            try:
+                timer.callback(*timer.args, **timer.kwargs)
+            except Exception:
+                log.exception('Error in timer callback: %s', timer.callback)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_timers():
+    """Return the process wide :class:`TimerService`."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = TimerService(name='shared timers')
+            atexit.register(_shared.stop)
+        return _shared
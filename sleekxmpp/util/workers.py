@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+    sleekxmpp.util.workers
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    This module provides a bounded pool of worker threads for running
+    blocking tasks outside of the event processing thread.
+
+    Part of SleekXMPP: The Sleek XMPP Library
+
+    :copyright: (c) 2012 Nathanael C. Fritz, Lance J.T. Stout
+    :license: MIT, see LICENSE for more details
+"""
+
+import atexit
+import logging
+import threading
+from collections import deque
+
+
+log = logging.getLogger(__name__)
+
+
+class WorkerPool(object):
+
+    """
+    Run submitted tasks on at most ``max_workers`` threads.
+
+    Threads are started on demand, only when no existing worker is
+    idle, and tasks beyond the pool size wait in a FIFO queue instead
+    of starting more threads.
+
+    Once :meth:`shutdown` has been called, submitted tasks are dropped
+    until the pool is reopened with :meth:`start`.
+    """
+
+    def __init__(self, max_workers=8, name='worker'):
+        #: The largest number of threads the pool will start.
+        self.max_workers = max_workers
+        #: The prefix used for worker thread names.
+        self.name = name
+        self._tasks = deque()
+        self._condition = threading.Condition()
+        self._threads = set()
+        self._idle = 0
+        self._running = True
+
+    def __len__(self):
+        """Return the number of tasks waiting for a worker."""
+        with self._condition:
+            return len(self._tasks)
+
+    @property
+    def size(self):
+        """The number of started worker threads."""
+        with self._condition:
+            return len(self._threads)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a call to ``func`` with the given arguments.
+
+        Returns ``False`` if the task was dropped because the pool has
+        been shut down.
+
+        Arguments:
+            func -- The function to call from a worker thread.
+        """
+        with self._condition:
+            if not self._running:
+                log.debug('Dropping task for stopped %s pool: %s',
+                          self.name, func)
+                return False
+            self._tasks.append((func, args, kwargs))
+            if self._idle > len(self._tasks) - 1:
+                self._condition.notify()
+            elif len(self._threads) < self.max_workers:
+                thread = threading.Thread(
+                        name='%s-%s' % (self.name, len(self._threads)),
+                        target=self._run)
+                thread.daemon = True
+                self._threads.add(thread)
+                thread.start()
+        return True
+
+    def start(self):
+        """Accept tasks again after :meth:`shutdown`."""
+        with self._condition:
+            self._running = True
+
+    def shutdown(self, wait=True):
+        """
+        Discard waiting tasks and stop the worker threads.
+
+        Arguments:
+            wait -- If ``True``, block until running tasks finish.
+        """
+        with self._condition:
+            self._running = False
+            self._tasks.clear()
+            threads = list(self._threads)
+            self._condition.notify_all()
+        if wait:
+            current = threading.current_thread()
+            for thread in threads:
+                if thread is not current:
+                    thread.join()
+
+    def _run(self):
+        current = threading.current_thread()
+        while True:
+            with self._condition:
+                while self._running and not self._tasks:
+                    self._idle += 1
+                    self._condition.wait()
+                    self._idle -= 1
+                if not self._running:
+                    self._threads.discard(current)
+                    return
+                func, args, kwargs = self._tasks.popleft()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                log.exception('Error in worker task: %s', func)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_workers():
+    """Return the process wide :class:`WorkerPool`."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = WorkerPool(name='shared worker')
+            atexit.register(_shared.shutdown, False)
+        return _shared
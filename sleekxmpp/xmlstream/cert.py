@@ -1,6 +1,12 @@
+import calendar
+import hashlib
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 
+from sleekxmpp.thirdparty import OrderedDict
+
 # Make a call to strptime before starting threads to
 # prevent thread safety issues.
 datetime.strptime('1970-01-01 12:00:00', "%Y-%m-%d %H:%M:%S")
@@ -8,6 +14,7 @@ datetime.strptime('1970-01-01 12:00:00', "%Y-%m-%d %H:%M:%S")
 
 try:
     from pyasn1.codec.der import decoder, encoder
+    from pyasn1.error import PyAsn1Error
     from pyasn1.type.univ import Any, ObjectIdentifier, OctetString
     from pyasn1.type.char import BMPString, IA5String, UTF8String
     from pyasn1.type.useful import GeneralizedTime
@@ -28,16 +35,146 @@ except ImportError:
 log = logging.getLogger(__name__)
 
 
+#: The number of decoded certificates kept by :func:`get_info`.
+CACHE_SIZE = 256
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
 class CertificateError(Exception):
     pass
 
 
+class CertInfo(object):
+
+    """
+    The subject names and validity window of a certificate.
+
+    Attributes:
+        names      -- A dictionary of sets of names, keyed by type:
+                      ``'CN'``, ``'DNS'``, ``'SRV'``, ``'URI'`` and
+                      ``'XMPPAddr'``.
+        not_before -- The start of the validity window, in UTC.
+        not_after  -- The end of the validity window, in UTC.
+    """
+
+    __slots__ = ('names', 'not_before', 'not_after')
+
+    def __init__(self, names, not_before, not_after):
+        self.names = names
+        self.not_before = not_before
+        self.not_after = not_after
+
+
+def get_info(raw_cert, decoded=None):
+    """
+    Return the :class:`CertInfo` for a DER encoded certificate.
+
+    Certificates are decoded once and cached by their SHA-256 digest,
+    so reconnecting to a server, or connecting many streams to it,
+    does not decode its certificate again.
+
+    When available, the certificate as decoded by the ``ssl`` module
+    (the result of ``getpeercert()``) is used. It lacks the XMPP
+    specific otherName entries, so pyasn1 is still used for the names
+    of certificates that have them. Returns ``None`` if the certificate
+    can not be decoded.
+
+    Arguments:
+        raw_cert -- The DER encoded certificate.
+        decoded  -- Optional dictionary from ``SSLSocket.getpeercert()``.
+    """
+    key = hashlib.sha256(raw_cert).digest()
+    with _cache_lock:
+        info = _cache.pop(key, None)
+        if info is not None:
+            _cache[key] = info
+            return info
+
+    info = _decode(raw_cert, decoded)
+    if info is None:
+        return None
+
+    with _cache_lock:
+        _cache[key] = info
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return info
+
+
+def clear_cache():
+    """Drop all decoded certificates."""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _decode(raw_cert, decoded):
+    if decoded:
+        not_before = _parse_time(decoded.get('notBefore'))
+        not_after = _parse_time(decoded.get('notAfter'))
+        if HAVE_PYASN1 and (not_before is None or not_after is None):
+            try:
+                not_before, not_after = _extract_dates(raw_cert)
+            except (PyAsn1Error, ValueError) as e:
+                log.debug('Could not read certificate dates: %s', e)
+        alt_names = decoded.get('subjectAltName', ())
+        if HAVE_PYASN1 and any(t == 'othername' for t, _ in alt_names):
+            names = _extract_names(raw_cert)
+        else:
+            names = _names_from_decoded(decoded)
+        return CertInfo(names, not_before, not_after)
+    if HAVE_PYASN1:
+        not_before, not_after = _extract_dates(raw_cert)
+        return CertInfo(_extract_names(raw_cert), not_before, not_after)
+    return None
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.utcfromtimestamp(calendar.timegm(
+            time.strptime(value, '%b %d %H:%M:%S %Y GMT')))
+    except ValueError:
+        log.debug('Could not parse certificate time: %s', value)
+        return None
+
+
+def _names_from_decoded(decoded):
+    results = {'CN': set(),
+               'DNS': set(),
+               'SRV': set(),
+               'URI': set(),
+               'XMPPAddr': set()}
+
+    for rdns in decoded.get('subject', ()):
+        for name, value in rdns:
+            if name == 'commonName':
+                results['CN'].add(value)
+
+    for name_type, value in decoded.get('subjectAltName', ()):
+        if name_type == 'DNS':
+            results['DNS'].add(value)
+        elif name_type == 'URI' and value.startswith('xmpp:'):
+            results['URI'].add(value[5:])
+
+    return results
+
+
 def decode_str(data):
     encoding = 'utf-16-be' if isinstance(data, BMPString) else 'utf-8'
     return bytes(data).decode(encoding)
 
 
 def extract_names(raw_cert):
+    info = get_info(raw_cert)
+    if info is None:
+        return _extract_names(raw_cert)
+    return dict((name, set(values)) for name, values in info.names.items())
+
+
+def _extract_names(raw_cert):
     results = {'CN': set(),
                'DNS': set(),
                'SRV': set(),
@@ -97,11 +234,16 @@ def extract_names(raw_cert):
 
 
 def extract_dates(raw_cert):
-    if not HAVE_PYASN1:
+    info = get_info(raw_cert)
+    if info is None:
         log.warning("Could not find pyasn1 and pyasn1_modules. " + \
                     "SSL certificate expiration COULD NOT BE VERIFIED.")
         return None, None
 
+    return info.not_before, info.not_after
+
+
+def _extract_dates(raw_cert):
     cert = decoder.decode(raw_cert, asn1Spec=Certificate())[0]
     tbs = cert.getComponentByName('tbsCertificate')
     validity = tbs.getComponentByName('validity')
@@ -133,13 +275,18 @@ def get_ttl(raw_cert):
 
 
 def verify(expected, raw_cert):
-    if not HAVE_PYASN1:
+    info = get_info(raw_cert)
+    if info is None:
         log.warning("Could not find pyasn1 and pyasn1_modules. " + \
                     "SSL certificate COULD NOT BE VERIFIED.")
         return
 
-    not_before, not_after = extract_dates(raw_cert)
-    cert_names = extract_names(raw_cert)
+    not_before, not_after = info.not_before, info.not_after
+    cert_names = info.names
+
+    if not_before is None or not_after is None:
+        raise CertificateError(
+                'Could not read the certificate validity dates.')
 
     now = datetime.utcnow()
 
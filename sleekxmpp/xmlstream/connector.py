@@ -0,0 +1,178 @@
+# -*- encoding: utf-8 -*-
+
+"""
+    sleekxmpp.xmlstream.connector
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Staggered, parallel connection attempts in the style of
+    "Happy Eyeballs" (RFC 8305).
+
+    :copyright: (c) 2012 Nathanael C. Fritz
+    :license: MIT, see LICENSE for more details
+"""
+
+import errno
+import logging
+import os
+import select
+import socket
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+#: The default delay in seconds between starting connection attempts.
+ATTEMPT_DELAY = 0.25
+
+#: Error codes meaning a non-blocking connect is under way.
+IN_PROGRESS = set([0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY,
+                   getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK)])
+
+
+def interleave(answers):
+    """Order DNS answers so that address families alternate.
+
+    The order within each family is kept, and the family of the first
+    answer goes first. Duplicate addresses are dropped.
+
+    :param answers: An iterable of ``(host, address, port)`` tuples,
+                    such as returned by
+                    :func:`~sleekxmpp.xmlstream.resolver.resolve`.
+    """
+    seen = set()
+    families = ([], [])
+    first = None
+    for answer in answers:
+        if answer[1:] in seen:
+            continue
+        seen.add(answer[1:])
+        ipv6 = ':' in answer[1]
+        if first is None:
+            first = ipv6
+        families[ipv6 != first].append(answer)
+
+    results = []
+    for i in range(max(len(families[0]), len(families[1]))):
+        for family in families:
+            if i < len(family):
+                results.append(family[i])
+    return results
+
+
+def connect_any(answers, socket_class=socket.socket, delay=ATTEMPT_DELAY,
+                timeout=None):
+    """Connect to the first address that accepts a connection.
+
+    A new attempt is started every ``delay`` seconds, or immediately
+    when an attempt fails, while earlier attempts keep running. The
+    first connection to succeed is returned and the others are closed.
+    Address families are interleaved with :func:`interleave`, so that
+    a broken IPv6 or IPv4 path costs at most one ``delay``.
+
+    :param answers: An iterable of ``(host, address, port)`` tuples.
+    :param socket_class: The class used to create the sockets.
+    :param delay: Seconds to wait before starting the next attempt.
+    :param timeout: Optional limit in seconds for the whole process.
+
+    :returns: A ``(socket, (host, address, port))`` tuple. The socket
+              is connected and in blocking mode.
+    :raises socket.error: If no connection could be made. The error
+                          is the one from the last failed attempt.
+    """
+    answers = interleave(answers)
+    if not answers:
+        raise socket.error(errno.EHOSTUNREACH, 'No addresses to connect to')
+
+    attempts = {}
+    error = socket.error(errno.ETIMEDOUT, 'Connection timed out')
+    deadline = time.time() + timeout if timeout is not None else None
+    next_attempt = 0
+    try:
+        while True:
+            now = time.time()
+            if answers and (not attempts or now >= next_attempt):
+                answer = answers.pop(0)
+                sock, err = start_attempt(socket_class, answer)
+                if err == 0:
+                    return _finish(sock, answer)
+                elif err in IN_PROGRESS:
+                    attempts[sock] = answer
+                    next_attempt = now + delay
+                else:
+                    error = socket.error(err, os.strerror(err))
+                    if sock is not None:
+                        sock.close()
+                continue
+
+            if not attempts:
+                raise error
+
+            wait = next_attempt - now if answers else None
+            if deadline is not None:
+                if now >= deadline:
+                    raise error
+                wait = min(wait, deadline - now) if wait is not None \
+                       else deadline - now
+
+            for sock in _wait(list(attempts), wait):
+                answer = attempts.pop(sock)
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err == 0:
+                    return _finish(sock, answer)
+                log.debug('Could not connect to %s:%s: %s',
+                          answer[1], answer[2], os.strerror(err))
+                error = socket.error(err, os.strerror(err))
+                sock.close()
+                next_attempt = 0
+    finally:
+        for sock in attempts:
+            sock.close()
+
+
+def start_attempt(socket_class, answer):
+    """Begin a non-blocking connection attempt.
+
+    :param socket_class: The class used to create the socket.
+    :param answer: A ``(host, address, port)`` tuple.
+
+    :returns: A ``(socket, error code)`` tuple. The socket is ``None``
+              if it could not be created, and the error code is one of
+              :data:`IN_PROGRESS` if the attempt is under way.
+    """
+    host, address, port = answer
+    family = socket.AF_INET6 if ':' in address else socket.AF_INET
+    log.debug('Connecting to %s:%s', address, port)
+    try:
+        sock = socket_class(family, socket.SOCK_STREAM)
+    except socket.error as err:
+        return None, err.errno or errno.EAFNOSUPPORT
+    sock.setblocking(False)
+    try:
+        return sock, sock.connect_ex((address, port))
+    except socket.error as err:
+        return sock, err.errno or errno.ECONNREFUSED
+
+
+def _wait(socks, timeout):
+    """Return the sockets whose connection attempts have finished.
+
+    ``poll`` is used when available, since ``select`` can not watch
+    descriptors above ``FD_SETSIZE``.
+    """
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        fds = {}
+        for sock in socks:
+            fds[sock.fileno()] = sock
+            poller.register(sock, select.POLLOUT)
+        if timeout is not None:
+            timeout = max(0, int(timeout * 1000))
+        return [fds[fd] for fd, event in poller.poll(timeout)]
+    _, writable, failed = select.select([], socks, socks, timeout)
+    return set(writable + failed)
+
+
+def _finish(sock, answer):
+    sock.setblocking(True)
+    return sock, answer
@@ -0,0 +1,1135 @@
+# -*- coding: utf-8 -*-
+"""
+    sleekxmpp.xmlstream.hub
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    This module provides a hub that runs any number of XML streams
+    on a small, shared set of threads.
+
+    Part of SleekXMPP: The Sleek XMPP Library
+
+    :copyright: (c) 2012 Nathanael C. Fritz, Lance J.T. Stout
+    :license: MIT, see LICENSE for more details
+"""
+
+import errno
+import logging
+import math
+import os
+import random
+import select
+import socket
+import ssl
+import threading
+import time
+from collections import deque
+
+from sleekxmpp.util import Queue, QueueEmpty, WorkerPool, shared_timers
+from sleekxmpp.xmlstream.connector import IN_PROGRESS, interleave, \
+                                          start_attempt
+from sleekxmpp.xmlstream.metrics import SIZE_BUCKETS
+from sleekxmpp.xmlstream.scheduler import Scheduler, Task
+from sleekxmpp.xmlstream.stanzabase import ET
+from sleekxmpp.xmlstream.xmlstream import StanzaReader, StanzaLimitExceeded
+
+
+log = logging.getLogger(__name__)
+
+
+#: The number of bytes to read from a socket at once.
+READ_SIZE = 65536
+
+#: The number of queued events a worker runs for one stream before
+#: letting the other streams have their turn.
+EVENT_BATCH = 64
+
+#: The number of bytes taken from a stream's send queue for writing
+#: before waiting for the socket to accept them.
+WRITE_BUFFER = 65536
+
+#: Error codes meaning a non-blocking socket operation should be tried
+#: again once the socket is ready.
+WOULD_BLOCK = set([errno.EAGAIN, errno.EWOULDBLOCK])
+
+#: SSL error codes meaning the same.
+SSL_WOULD_BLOCK = set([ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE])
+
+
+class TimerScheduler(object):
+
+    """
+    The interface of :class:`~sleekxmpp.xmlstream.scheduler.Scheduler`,
+    implemented with a :class:`~sleekxmpp.util.TimerService` instead
+    of a thread per stream.
+
+    Tasks given an event queue are put in it when due, like with the
+    scheduler. Since the timer thread is shared, other tasks are run
+    by a :class:`~sleekxmpp.util.WorkerPool` instead of in that thread.
+
+    :param timers: The :class:`~sleekxmpp.util.TimerService` to use.
+    :param workers: The :class:`~sleekxmpp.util.WorkerPool` running
+                    tasks without an event queue.
+    """
+
+    def __init__(self, timers, workers):
+        self.timers = timers
+        self.workers = workers
+        #: The scheduled tasks and their timers, by task name.
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    def process(self, threaded=True, daemon=False):
+        """Provided for compatibility; the timer service runs tasks."""
+        pass
+
+    def add(self, name, seconds, callback, args=None,
+            kwargs=None, repeat=False, qpointer=None):
+        """Schedule a new task.
+
+        :param string name: The name of the task.
+        :param int seconds: The number of seconds to wait before executing.
+        :param callback: The function to execute.
+        :param tuple args: The arguments to pass to the callback.
+        :param dict kwargs: The keyword arguments to pass to the callback.
+        :param bool repeat: Indicates if the task should repeat.
+                            Defaults to ``False``.
+        :param pointer: A pointer to an event queue for queuing callback
+                        execution instead of executing immediately.
+        """
+        task = Task(name, seconds, callback, args, kwargs, repeat, qpointer)
+        with self.lock:
+            if name in self.tasks:
+                raise ValueError("Key %s already exists" % name)
+            self._schedule(task, seconds)
+
+    def remove(self, name):
+        """Remove a scheduled task ahead of schedule, and without
+        executing it.
+
+        :param string name: The name of the task to remove.
+        """
+        with self.lock:
+            entry = self.tasks.pop(name, None)
+        if entry is not None:
+            entry[1].cancel()
+
+    def quit(self):
+        """Cancel all scheduled tasks."""
+        with self.lock:
+            entries = list(self.tasks.values())
+            self.tasks.clear()
+        for task, timer in entries:
+            timer.cancel()
+
+    def _schedule(self, task, seconds):
+        timer = self.timers.schedule(seconds, self._fire, args=(task,))
+        self.tasks[task.name] = (task, timer)
+
+    def _fire(self, task):
+        with self.lock:
+            entry = self.tasks.get(task.name, None)
+            if entry is None or entry[0] is not task:
+                return
+            if task.repeat:
+                self._schedule(task, task.seconds)
+            else:
+                del self.tasks[task.name]
+        if task.qpointer is not None:
+            task.run()
+        else:
+            self.workers.submit(task.run)
+
+
+class StreamHub(object):
+
+    """
+    Run many :class:`~sleekxmpp.xmlstream.xmlstream.XMLStream` objects,
+    such as :class:`~sleekxmpp.clientxmpp.ClientXMPP` or
+    :class:`~sleekxmpp.componentxmpp.ComponentXMPP` instances, without
+    any threads of their own.
+
+    A single thread waits on all of the sockets with ``poll()`` (or
+    ``select()`` where it is not available) and parses whatever data
+    arrives, matching stanzas against each stream's handlers as the
+    read thread of a stream would. The queued stream and event handlers
+    of a stream then run on a shared :class:`~sleekxmpp.util.WorkerPool`,
+    one batch at a time, so that the handlers of each stream still run
+    in order and never concurrently. Scheduled tasks use a shared
+    :class:`~sleekxmpp.util.TimerService`.
+
+    Sockets are put in non-blocking mode while in the hub. Data is
+    written by the thread sending it for as long as the socket accepts
+    it, and the rest by the I/O thread once the socket is writable, so
+    a peer that stops reading only holds up its own stream. TLS
+    handshakes after STARTTLS are driven by the I/O thread in the same
+    way.
+
+    Lost connections are made again without tying up a thread: each
+    attempt is started by a timer once the reconnection delay has
+    passed, and the I/O thread waits for the non-blocking connect, and
+    any SSL handshake, to complete. Only resolving the server's address
+    runs on a worker, as does connecting through a proxy, which is done
+    by blocking.
+
+    Streams keep their own plugins, handlers and state; the number of
+    threads only depends on the size of the worker pool.
+
+    Example::
+
+        hub = StreamHub(max_workers=16)
+        for jid, password in accounts:
+            xmpp = ClientXMPP(jid, password)
+            ...
+            hub.connect(xmpp)
+
+    Event handlers registered with ``threaded=True`` run on the worker
+    pool too, so handlers blocking for a long time should be rare, or
+    the pool large enough to accommodate them.
+
+    :param max_workers: The size of the worker pool created for the
+                        hub, if ``workers`` is not given. Defaults to 8.
+    :param workers: A :class:`~sleekxmpp.util.WorkerPool` to use.
+    :param timers: A :class:`~sleekxmpp.util.TimerService` to use.
+                   Defaults to the shared service.
+    """
+
+    def __init__(self, max_workers=8, workers=None, timers=None):
+        self._own_workers = workers is None
+        #: The pool running stream handlers, events and reconnections.
+        self.workers = workers or WorkerPool(max_workers, name='hub worker')
+        #: The timer service running scheduled tasks.
+        self.timers = timers or shared_timers()
+        self._streams = {}
+        self._fds = {}
+        #: The streams with a connection attempt under way.
+        self._connecting = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wakeup = None
+        self._dirty = False
+
+    def __len__(self):
+        """Return the number of streams in the hub."""
+        return len(self._streams)
+
+    @property
+    def streams(self):
+        """The streams in the hub."""
+        return [hs.xmpp for hs in list(self._streams.values())]
+
+    def add(self, xmpp):
+        """
+        Let the hub process a stream.
+
+        The stream's scheduler and queues are replaced with ones served
+        by the hub, so this should be done before connecting.
+
+        :param xmpp: The :class:`~sleekxmpp.xmlstream.xmlstream.XMLStream`
+                     to add.
+        """
+        if xmpp.hub is self:
+            return
+        if xmpp.hub is not None:
+            raise ValueError('The stream already belongs to a hub.')
+
+        hs = _HubStream(xmpp)
+        old_events = xmpp.event_queue
+        old_sends = xmpp.send_queue
+        old_scheduler = xmpp.scheduler
+
+        xmpp.hub = self
+        xmpp.scheduler = TimerScheduler(self.timers, self.workers)
+        xmpp.event_queue = _EventQueue(self, hs)
+        xmpp.send_queue = _SendQueue(self, hs)
+
+        # Carry over anything queued or scheduled so far.
+        now = time.time()
+        with old_scheduler.schedule_lock:
+            tasks = list(old_scheduler.schedule)
+        with xmpp.scheduler.lock:
+            for task in tasks:
+                if task.qpointer is old_events:
+                    task.qpointer = xmpp.event_queue
+                xmpp.scheduler._schedule(task, max(task.next - now, 0))
+        for old, new in ((old_events, xmpp.event_queue),
+                         (old_sends, xmpp.send_queue)):
+            while True:
+                try:
+                    item = old.get(False)
+                except QueueEmpty:
+                    break
+                if item is not None:
+                    new.put(item)
+
+        xmpp.add_event_handler('connected', hs.connected)
+        xmpp.add_event_handler('disconnected', hs.disconnected)
+
+        with self._lock:
+            self._streams[id(xmpp)] = hs
+            if self._thread is None:
+                if self._own_workers:
+                    self.workers.start()
+                self._wakeup = socket.socketpair()
+                self._wakeup[1].setblocking(False)
+                self._thread = threading.Thread(name='stream hub',
+                                                target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+        if xmpp.state.ensure('connected'):
+            self._register(hs)
+
+    def remove(self, xmpp):
+        """
+        Stop processing a stream, which should be disconnected first.
+
+        The stream gets a scheduler and queues of its own again, so
+        that :meth:`XMLStream.process()
+        <sleekxmpp.xmlstream.xmlstream.XMLStream.process>` may be used.
+
+        :param xmpp: The stream to remove.
+        """
+        with self._lock:
+            hs = self._streams.pop(id(xmpp), None)
+        if hs is None:
+            return
+        self._cancel_reconnect(hs)
+        self._unregister(hs)
+        xmpp.del_event_handler('connected', hs.connected)
+        xmpp.del_event_handler('disconnected', hs.disconnected)
+        xmpp.scheduler.quit()
+
+        xmpp.scheduler = Scheduler(xmpp.stop)
+        xmpp.event_queue = Queue()
+        xmpp.send_queue = Queue(maxsize=256)
+        xmpp.hub = None
+
+    def connect(self, xmpp, *args, **kwargs):
+        """
+        Add a stream to the hub if needed, and connect it.
+
+        Arguments are passed to the stream's ``connect()`` method,
+        which blocks while connecting.
+
+        :param xmpp: The stream to connect.
+        """
+        self.add(xmpp)
+        return xmpp.connect(*args, **kwargs)
+
+    def stop(self, timeout=10):
+        """
+        Disconnect every stream, then stop the hub's threads.
+
+        :param timeout: The maximum number of seconds to wait for the
+                        streams to disconnect. Defaults to 10.
+        """
+        streams = self.streams
+        done = threading.Condition()
+        pending = [len(streams)]
+
+        def disconnect(xmpp):
+            try:
+                if xmpp.state.ensure('connected'):
+                    xmpp.disconnect()
+            finally:
+                with done:
+                    pending[0] -= 1
+                    done.notify_all()
+
+        for xmpp in streams:
+            self.workers.submit(disconnect, xmpp)
+        end = time.time() + timeout
+        with done:
+            while pending[0] > 0 and time.time() < end:
+                done.wait(end - time.time())
+
+        for xmpp in streams:
+            self.remove(xmpp)
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._wake()
+            thread.join()
+            for sock in self._wakeup:
+                sock.close()
+        if self._own_workers:
+            self.workers.shutdown(wait=False)
+
+    # ------------------------------------------------------------------
+    # Socket registration
+
+    def _register(self, hs):
+        """Start reading from the stream's current socket."""
+        xmpp = hs.xmpp
+        with self._lock:
+            if hs.fileno is not None and self._fds.get(hs.fileno) is hs:
+                del self._fds[hs.fileno]
+            hs.reset(xmpp.socket)
+            self._fds[hs.fileno] = hs
+            self._dirty = True
+        self._wake()
+        if hs.handshake is not None:
+            # The stream restarts once the TLS handshake is done.
+            self._handshake(hs)
+        elif not xmpp.session_started_event.is_set():
+            xmpp.send_raw(xmpp.stream_header, now=True)
+
+    def _unregister(self, hs):
+        with self._lock:
+            if hs.fileno is not None and self._fds.get(hs.fileno) is hs:
+                del self._fds[hs.fileno]
+                self._dirty = True
+            hs.want_write = False
+            with hs.write_lock:
+                hs.socket = None
+                hs.fileno = None
+                hs.handshake = None
+                hs.connecting = None
+                hs.clear_output()
+        self._wake()
+
+    def _watch(self, hs, sock):
+        """Wait for a socket being connected to become writable.
+
+        Only called from the I/O thread.
+        """
+        with self._lock:
+            with hs.write_lock:
+                hs.socket = sock
+            hs.fileno = sock.fileno()
+            hs.want_write = True
+            self._fds[hs.fileno] = hs
+            self._dirty = True
+
+    def _want_write(self, hs, want):
+        """Start or stop waiting for the stream's socket to be writable."""
+        with self._lock:
+            if hs.want_write == want:
+                return
+            hs.want_write = want
+            self._dirty = True
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wakeup[1].send(b'x')
+        except (socket.error, TypeError):
+            pass
+
+    # ------------------------------------------------------------------
+    # I/O loop
+
+    def _run(self):
+        current = threading.current_thread()
+        wakeup = self._wakeup[0].fileno()
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            read, write = select.POLLIN, select.POLLOUT
+            hangup = select.POLLHUP | select.POLLERR
+            # Registering a descriptor again changes its events.
+            register = poller.register
+            unregister = poller.unregister
+
+            def poll(timeout):
+                if timeout is not None:
+                    timeout = int(math.ceil(timeout * 1000))
+                return poller.poll(timeout)
+        else:
+            read, write, hangup = 1, 4, 0
+            fds = {}
+            register = fds.__setitem__
+            unregister = fds.pop
+
+            def poll(timeout):
+                readers = [fd for fd, events in fds.items() if events & read]
+                writers = [fd for fd, events in fds.items()
+                           if events & write]
+                readable, writable, _ = select.select(readers, writers, [],
+                                                      timeout)
+                ready = dict((fd, read) for fd in readable)
+                for fd in writable:
+                    ready[fd] = ready.get(fd, 0) | write
+                return ready.items()
+
+        register(wakeup, read)
+        registered = {}
+        while self._thread is current:
+            timeout = None
+            if self._connecting:
+                timeout = self._check_connecting()
+            if self._dirty:
+                with self._lock:
+                    self._dirty = False
+                    wanted = dict((fd, read | write if hs.want_write
+                                           else read)
+                                  for fd, hs in self._fds.items())
+                for fd, events in wanted.items():
+                    if registered.get(fd) != events:
+                        register(fd, events)
+                for fd in set(registered) - set(wanted):
+                    unregister(fd)
+                registered = wanted
+
+            try:
+                ready = poll(timeout)
+            except (select.error, socket.error, OSError) as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                if e.args[0] == errno.EBADF:
+                    # A socket was closed before being unregistered.
+                    self._dirty = True
+                    registered = {}
+                    continue
+                raise
+
+            for fd, events in ready:
+                if fd == wakeup:
+                    try:
+                        self._wakeup[0].recv(4096)
+                    except socket.error:
+                        pass
+                    continue
+                hs = self._fds.get(fd, None)
+                if hs is None:
+                    if fd in registered:
+                        unregister(fd)
+                        del registered[fd]
+                    continue
+                try:
+                    if hs.handshake is not None:
+                        self._handshake(hs)
+                        continue
+                    if hs.connecting is not None:
+                        self._connect_ready(hs)
+                        continue
+                    if events & write:
+                        self._flush(hs)
+                    if events & (read | hangup) and hs.fileno == fd:
+                        self._read(hs)
+                except Exception:
+                    log.exception('Error in stream hub')
+
+    def _read(self, hs):
+        sock = hs.socket
+        error = None
+        try:
+            data = sock.recv(READ_SIZE)
+            while data and hasattr(sock, 'pending') and sock.pending():
+                data += sock.recv(READ_SIZE)
+        except ssl.SSLError as e:
+            if e.args[0] in SSL_WOULD_BLOCK:
+                return
+            data, error = None, e
+        except socket.error as e:
+            if e.args[0] == errno.EINTR or e.args[0] in WOULD_BLOCK:
+                return
+            data, error = None, e
+        except (AttributeError, ValueError):
+            # The socket has been closed.
+            data = None
+
+        if not data:
+            self._closed(hs, error)
+        else:
+            self._feed(hs, data)
+
+    def _feed(self, hs, data):
+        xmpp = hs.xmpp
+        reader = hs.reader
+        error = None
+        reader.received(data)
+        try:
+            hs.parser.feed(data)
+        except SyntaxError as e:
+            error = e
+
+        # Handle the events parsed before any error first.
+        events, hs.events[:] = list(hs.events), []
+        try:
+            for event, xml in events:
+                result = xmpp._handle_xml_event(reader, event, xml)
+                if result is True:
+                    return self._restart(hs)
+                elif result is False:
+                    return self._closed(hs)
+            if error is not None:
+                raise error
+            reader.check()
+        except StanzaLimitExceeded as e:
+            xmpp._reject_stanza(e)
+            return self._closed(hs)
+        except SyntaxError as e:
+            log.error("Error reading from XML stream.")
+            xmpp.exception(e)
+            return self._closed(hs)
+        except Exception as e:
+            if not xmpp.stop.is_set():
+                log.error('Connection error.')
+            xmpp.exception(e)
+            return self._closed(hs)
+        self._flush(hs)
+
+    def _restart(self, hs):
+        """Parse a new stream after a stream restart."""
+        xmpp = hs.xmpp
+        if xmpp.socket is not hs.socket:
+            # TLS or compression replaced the socket.
+            self._register(hs)
+            return
+        hs.reset(xmpp.socket)
+        if not xmpp.session_started_event.is_set():
+            xmpp.send_raw(xmpp.stream_header, now=True)
+
+    # ------------------------------------------------------------------
+    # TLS
+
+    def _start_tls(self, xmpp):
+        """Do a TLS handshake on the stream's wrapped socket, without
+        blocking, before the stream restarts."""
+        with self._lock:
+            hs = self._streams.get(id(xmpp), None)
+        if hs is None:
+            return
+        with hs.write_lock:
+            hs.handshake = time.time()
+
+    def _handshake(self, hs):
+        """Continue a TLS handshake for as long as it does not block."""
+        sock = hs.socket
+        error = None
+        try:
+            sock.do_handshake()
+        except ssl.SSLError as e:
+            if e.args[0] == ssl.SSL_ERROR_WANT_READ:
+                return self._want_write(hs, False)
+            if e.args[0] == ssl.SSL_ERROR_WANT_WRITE:
+                return self._want_write(hs, True)
+            error = e
+        except socket.error as e:
+            if e.args[0] == errno.EINTR or e.args[0] in WOULD_BLOCK:
+                return
+            error = e
+        except (AttributeError, ValueError):
+            # The socket has been closed.
+            return
+
+        # Checking the certificate runs event handlers, so leave it
+        # to a worker, and read again once it is done.
+        start = hs.handshake
+        if hs.connecting is not None:
+            with self._lock:
+                self._connecting.discard(hs)
+            self._unregister(hs)
+            self.workers.submit(self._connected, hs, start, error)
+            return
+        self._unregister(hs)
+        self.workers.submit(self._handshake_done, hs, start, error)
+
+    def _handshake_done(self, hs, start, error):
+        xmpp = hs.xmpp
+        if error is not None:
+            log.debug('TLS handshake failed: %s', error)
+            xmpp._tls_failed()
+            return
+        xmpp._ssl_handshake_done(start)
+        if xmpp._tls_established() and not _is_closed(xmpp.socket):
+            self._register(hs)
+
+    # ------------------------------------------------------------------
+    # Connection loss
+
+    def _closed(self, hs, error=None):
+        """Handle the end of the stream or of the connection."""
+        sock = hs.socket
+        self._unregister(hs)
+        if sock is not hs.xmpp.socket or _is_closed(sock):
+            # The stream closed the socket, and deals with the rest.
+            return
+        self.workers.submit(self._end_stream, hs.xmpp, error)
+
+    def _end_stream(self, xmpp, error):
+        if error is not None:
+            xmpp.event('socket_error', error, direct=True)
+            log.error('Socket Error #%s: %s', error.errno, error.strerror)
+        if not xmpp.stop.is_set() and xmpp.auto_reconnect:
+            # The disconnected event has the hub connect again. There
+            # is no one left to send the stream footer to.
+            xmpp.state.transition('connected', 'disconnected',
+                                  func=xmpp._disconnect,
+                                  args=(True, False, False))
+        else:
+            # Unlike disconnect(), do not wait for a disconnection
+            # already in progress.
+            xmpp.state.transition('connected', 'disconnected',
+                                  func=xmpp._disconnect)
+
+    # ------------------------------------------------------------------
+    # Reconnection
+
+    def _reconnect(self, xmpp):
+        """Connect a disconnected stream again.
+
+        Each attempt waits for the stream's reconnection delay on a
+        timer, which doubles after every failed attempt, so that no
+        thread waits for a server to come back.
+        """
+        with self._lock:
+            hs = self._streams.get(id(xmpp), None)
+        if hs is None:
+            return
+        with hs.lock:
+            if hs.reconnecting:
+                return
+            hs.reconnecting = True
+            hs.attempts = xmpp.reconnect_max_attempts
+        self._schedule_attempt(hs)
+
+    def _schedule_attempt(self, hs):
+        xmpp = hs.xmpp
+        if xmpp.reconnect_delay is None:
+            xmpp.reconnect_delay = 1.0
+        delay = min(xmpp.reconnect_delay * 2, xmpp.reconnect_max_delay)
+        delay = max(0, random.normalvariate(delay, delay * 0.1))
+        xmpp.reconnect_delay = delay
+        log.debug('Waiting %s seconds before connecting.', delay)
+        with hs.lock:
+            if not hs.reconnecting:
+                return
+            hs.timer = self.timers.schedule(delay, self.workers.submit,
+                                            args=(self._attempt, hs))
+
+    def _cancel_reconnect(self, hs):
+        with hs.lock:
+            hs.reconnecting = False
+            timer, hs.timer = hs.timer, None
+        if timer is not None:
+            timer.cancel()
+        with self._lock:
+            connecting = hs in self._connecting
+            self._connecting.discard(hs)
+        if connecting and hs.socket is not None:
+            hs.socket.close()
+
+    def _attempt(self, hs):
+        """Start a connection attempt, carried out by the I/O thread."""
+        xmpp = hs.xmpp
+        with hs.lock:
+            hs.timer = None
+            if not hs.reconnecting:
+                return
+        with self._lock:
+            current = self._streams.get(id(xmpp), None) is hs
+        if not current or xmpp.stop.is_set() or \
+           not xmpp.state.ensure('disconnected'):
+            self._cancel_reconnect(hs)
+            return
+
+        xmpp.scheduler.remove('Session timeout check')
+        if xmpp.use_proxy:
+            if xmpp.state.transition('disconnected', 'connected',
+                                     func=xmpp._connect, args=(False,)):
+                self._cancel_reconnect(hs)
+            else:
+                self._attempt_failed(hs)
+            return
+
+        if xmpp.default_domain:
+            answers = xmpp.get_dns_records(xmpp.default_domain,
+                                           xmpp.address[1])
+        else:
+            answers = [(xmpp.address[0],) + tuple(xmpp.address)]
+        answers = interleave(answers)
+        if not answers:
+            log.debug('No addresses to connect to.')
+            self._attempt_failed(hs)
+            return
+
+        deadline = None
+        if xmpp.session_timeout is not None:
+            # Give up when the session would have timed out anyway.
+            deadline = time.time() + xmpp.session_timeout
+        with self._lock:
+            hs.answers = answers
+            hs.deadline = deadline
+            self._connecting.add(hs)
+        self._wake()
+
+    def _attempt_failed(self, hs):
+        """Schedule the next attempt, unless none are left."""
+        xmpp = hs.xmpp
+        with hs.lock:
+            if hs.attempts is not None:
+                hs.attempts -= 1
+            give_up = hs.attempts is not None and hs.attempts <= 0
+        if give_up or xmpp.stop.is_set():
+            self._cancel_reconnect(hs)
+            if give_up:
+                xmpp.event('connection_failed', direct=True)
+            return
+        self._schedule_attempt(hs)
+
+    def _check_connecting(self):
+        """Start the connection attempts handed to the I/O thread, and
+        end those past their deadline.
+
+        Returns the number of seconds until the next deadline, or
+        ``None``.
+        """
+        now = time.time()
+        timeout = None
+        with self._lock:
+            streams = list(self._connecting)
+        for hs in streams:
+            if hs.deadline is not None and hs.deadline <= now:
+                log.debug('Timed out connecting to %s', hs.xmpp.address)
+                self._connect_failed(hs)
+                continue
+            if hs.socket is None:
+                self._connect_next(hs)
+            if hs.deadline is not None and hs in self._connecting:
+                left = hs.deadline - now
+                timeout = left if timeout is None else min(timeout, left)
+        return timeout
+
+    def _connect_next(self, hs):
+        """Start connecting to the next address of the attempt."""
+        while hs.answers:
+            answer = hs.answers.pop(0)
+            sock, err = start_attempt(hs.xmpp.socket_class, answer)
+            if err in IN_PROGRESS:
+                hs.connecting = answer
+                self._watch(hs, sock)
+                return
+            log.debug('Could not connect to %s:%s: %s',
+                      answer[1], answer[2], os.strerror(err))
+            if sock is not None:
+                sock.close()
+        self._connect_failed(hs)
+
+    def _connect_failed(self, hs):
+        sock = hs.socket
+        with self._lock:
+            self._connecting.discard(hs)
+        self._unregister(hs)
+        if sock is not None:
+            sock.close()
+        self.workers.submit(self._attempt_failed, hs)
+
+    def _connect_ready(self, hs):
+        """Continue once the socket being connected is writable."""
+        xmpp = hs.xmpp
+        sock = hs.socket
+        answer = hs.connecting
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            log.debug('Could not connect to %s:%s: %s',
+                      answer[1], answer[2], os.strerror(err))
+            self._unregister(hs)
+            sock.close()
+            self._connect_next(hs)
+            return
+
+        xmpp.address = answer[1:]
+        if xmpp.default_domain:
+            xmpp._service_name = answer[0]
+        xmpp.socket = sock
+        xmpp.configure_socket()
+        if not xmpp.use_ssl:
+            with self._lock:
+                self._connecting.discard(hs)
+            self._unregister(hs)
+            self.workers.submit(self._connected, hs)
+            return
+
+        log.debug("Socket Wrapped for SSL")
+        xmpp._wrap_ssl()
+        xmpp.socket.setblocking(False)
+        with hs.write_lock:
+            hs.socket = xmpp.socket
+            hs.handshake = time.time()
+        self._handshake(hs)
+
+    def _connected(self, hs, start=None, error=None):
+        """Finish a connection attempt once the socket is connected
+        and, with direct SSL, the handshake is done."""
+        xmpp = hs.xmpp
+        if start is not None:
+            if error is None:
+                xmpp._ssl_handshake_done(start)
+            else:
+                log.error('CERT: Invalid certificate trust chain.')
+                if xmpp.event_handled('ssl_invalid_chain'):
+                    xmpp.event('ssl_invalid_chain', direct=True)
+            if error is not None or not xmpp._verify_cert():
+                xmpp.socket.close()
+                self._attempt_failed(hs)
+                return
+
+        def established():
+            xmpp.set_socket(xmpp.socket, ignore=True)
+            xmpp.event('connected', direct=True)
+            return True
+
+        self._cancel_reconnect(hs)
+        if not xmpp.state.transition('disconnected', 'connected',
+                                     func=established):
+            xmpp.socket.close()
+
+    # ------------------------------------------------------------------
+    # Events and sending
+
+    def _wants_events(self, hs):
+        with hs.lock:
+            if hs.scheduled:
+                return
+            hs.scheduled = True
+        self.workers.submit(self._run_events, hs)
+
+    def _run_events(self, hs):
+        xmpp = hs.xmpp
+        queue = xmpp.event_queue
+        try:
+            for i in range(EVENT_BATCH):
+                if xmpp.stop.is_set():
+                    break
+                try:
+                    event = queue.get(False)
+                except QueueEmpty:
+                    break
+                if event is not None:
+                    xmpp._run_event(event)
+        finally:
+            with hs.lock:
+                again = not xmpp.stop.is_set() and not queue.empty()
+                hs.scheduled = again
+            if again:
+                self.workers.submit(self._run_events, hs)
+            self._flush(hs)
+
+    def _send(self, xmpp, data):
+        """Write data ahead of the send queue, as ``send_raw()`` does."""
+        with self._lock:
+            hs = self._streams.get(id(xmpp), None)
+        if hs is None:
+            return
+        with hs.write_lock:
+            if hs.socket is None:
+                log.debug('Not connected, dropping: %s', data)
+                return
+            hs.add_output(data.encode('utf-8'))
+        self._flush(hs)
+
+    def _flush(self, hs):
+        """Write queued data once the session has started.
+
+        Data is only taken from the send queue while less than
+        :data:`WRITE_BUFFER` bytes are waiting to be written, so that
+        data for a slow peer waits in its queue.
+        """
+        xmpp = hs.xmpp
+        queue = xmpp.send_queue
+        while True:
+            with hs.write_lock:
+                while hs.socket is not None and \
+                      hs.output_size < WRITE_BUFFER and \
+                      xmpp.session_started_event.is_set() and \
+                      not xmpp.stop.is_set():
+                    try:
+                        data = queue.get(False)
+                    except QueueEmpty:
+                        break
+                    if data is not None:
+                        if xmpp.metrics is not None:
+                            xmpp.metrics.observe('send_queue',
+                                                 queue.qsize(),
+                                                 SIZE_BUCKETS)
+                        log.debug('SEND: %s', data)
+                        hs.add_output(data.encode('utf-8'))
+                    queue.task_done()
+            if not self._write(hs):
+                return
+
+    def _write(self, hs):
+        """Write buffered data until the socket would block.
+
+        Returns ``True`` if everything was written and more data is
+        waiting in the send queue.
+        """
+        xmpp = hs.xmpp
+        error = None
+        with hs.write_lock:
+            if hs.handshake is not None or hs.connecting is not None:
+                # Written once the connection is ready.
+                return False
+            sock = hs.socket
+            while sock is not None and hs.output:
+                data = hs.output[0]
+                try:
+                    sent = sock.send(data)
+                except ssl.SSLError as e:
+                    if e.args[0] in SSL_WOULD_BLOCK:
+                        break
+                    error = e
+                    break
+                except socket.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    if e.args[0] in WOULD_BLOCK:
+                        break
+                    error = e
+                    break
+                except (AttributeError, ValueError):
+                    # The socket has been closed.
+                    break
+                if xmpp.metrics is not None:
+                    xmpp.metrics.incr('bytes_out', sent)
+                hs.output_size -= sent
+                if sent < len(data):
+                    hs.output[0] = data[sent:]
+                else:
+                    hs.output.popleft()
+            pending = sock is not None and bool(hs.output) and \
+                      error is None
+
+        if error is not None:
+            xmpp.event('socket_error', error, direct=True)
+            log.warning('Failed to send to %s: %s', xmpp.boundjid, error)
+            self._closed(hs)
+            return False
+        self._want_write(hs, pending)
+        return sock is not None and not pending and \
+               not xmpp.send_queue.empty() and \
+               xmpp.session_started_event.is_set() and \
+               not xmpp.stop.is_set()
+
+
+class _HubStream(object):
+
+    """The hub's state for a single stream."""
+
+    def __init__(self, xmpp):
+        self.xmpp = xmpp
+        self.lock = threading.Lock()
+        #: Whether a worker has been asked to run the stream's events.
+        self.scheduled = False
+        self.socket = None
+        self.fileno = None
+        self.reader = None
+        self.parser = None
+        self.events = []
+        #: Guards the socket and the output waiting to be written.
+        self.write_lock = threading.RLock()
+        self.output = deque()
+        self.output_size = 0
+        #: Whether the I/O thread waits for the socket to be writable.
+        self.want_write = False
+        #: When a TLS handshake in progress started, or ``None``.
+        self.handshake = None
+        #: The ``(host, address, port)`` being connected to, or ``None``.
+        self.connecting = None
+        #: The addresses left to try in the current connection attempt.
+        self.answers = []
+        #: When the current connection attempt is abandoned.
+        self.deadline = None
+        #: Whether the stream is being connected again.
+        self.reconnecting = False
+        #: The connection attempts left, or ``None`` for no limit.
+        self.attempts = None
+        #: The timer starting the next connection attempt.
+        self.timer = None
+
+    def reset(self, sock):
+        """Prepare to parse a new stream from a socket."""
+        sock.setblocking(False)
+        with self.write_lock:
+            if sock is not self.socket:
+                self.clear_output()
+            self.socket = sock
+        self.fileno = sock.fileno()
+        self.reader = StanzaReader(None, self.xmpp)
+        self.events = []
+        self.parser = ET.XMLParser(target=_EventTarget(self.events))
+
+    def add_output(self, data):
+        """Buffer encoded data for writing."""
+        self.output.append(data)
+        self.output_size += len(data)
+
+    def clear_output(self):
+        """Drop the data still waiting to be written."""
+        self.output.clear()
+        self.output_size = 0
+
+    def connected(self, event):
+        self.xmpp.hub._register(self)
+
+    def disconnected(self, event):
+        xmpp = self.xmpp
+        xmpp.hub._unregister(self)
+        if xmpp.auto_reconnect and not xmpp.stop.is_set():
+            xmpp.hub._reconnect(xmpp)
+
+
+class _EventTarget(object):
+
+    """
+    A parser target building elements like ``iterparse``, and recording
+    the same start and end events for them.
+    """
+
+    def __init__(self, events):
+        self.events = events
+        self.builder = ET.TreeBuilder()
+
+    def start(self, tag, attrib):
+        xml = self.builder.start(tag, attrib)
+        self.events.append((b'start', xml))
+        return xml
+
+    def end(self, tag):
+        xml = self.builder.end(tag)
+        self.events.append((b'end', xml))
+        return xml
+
+    def data(self, data):
+        self.builder.data(data)
+
+    def close(self):
+        return self.builder.close()
+
+
+class _EventQueue(Queue):
+
+    """An event queue handing the stream to a worker when filled."""
+
+    def __init__(self, hub, hs):
+        Queue.__init__(self)
+        self.hub = hub
+        self.hs = hs
+
+    def put(self, item, block=True, timeout=None):
+        Queue.put(self, item, block, timeout)
+        if item is not None:
+            self.hub._wants_events(self.hs)
+
+
+class _SendQueue(Queue):
+
+    """A send queue flushed by the sending thread."""
+
+    def __init__(self, hub, hs):
+        Queue.__init__(self)
+        self.hub = hub
+        self.hs = hs
+
+    def put(self, item, block=True, timeout=None):
+        Queue.put(self, item, block, timeout)
+        if item is not None:
+            self.hub._flush(self.hs)
+
+
+def _is_closed(sock):
+    try:
+        return sock.fileno() < 0
+    except (socket.error, AttributeError, ValueError):
+        return True
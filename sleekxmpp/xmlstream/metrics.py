@@ -0,0 +1,159 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import bisect
+import threading
+import time
+
+
+#: Histogram bucket bounds for durations, from 1us to about 16s.
+TIME_BUCKETS = tuple(1e-6 * 2 ** i for i in range(25))
+
+#: Histogram bucket bounds for sizes and queue depths, up to 1M.
+SIZE_BUCKETS = tuple(2 ** i for i in range(21))
+
+
+class Histogram(object):
+
+    """
+    Count observed values in fixed, exponentially sized buckets.
+
+    Each bucket counts the values less than or equal to its bound and
+    greater than the previous bound; the last bucket also holds every
+    value larger than the largest bound.
+    """
+
+    __slots__ = ('bounds', 'buckets', 'count', 'total', 'min', 'max')
+
+    def __init__(self, bounds=TIME_BUCKETS):
+        self.bounds = bounds
+        self.buckets = [0] * len(bounds)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        """Record a single value."""
+        index = bisect.bisect_left(self.bounds, value)
+        self.buckets[min(index, len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        """Return the histogram's state as a dictionary."""
+        mean = float(self.total) / self.count if self.count else None
+        return {'count': self.count,
+                'sum': self.total,
+                'min': self.min,
+                'max': self.max,
+                'mean': mean,
+                'buckets': [(bound, n) for bound, n in
+                            zip(self.bounds, self.buckets) if n]}
+
+
+class StreamMetrics(object):
+
+    """
+    Counters and histograms describing the work done by an XMLStream.
+
+    An instance is created by :meth:`XMLStream.enable_metrics`; while
+    :attr:`XMLStream.metrics` is ``None`` no measurements are taken.
+
+    Counters:
+        stanzas_in  -- Stanzas received and dispatched.
+        stanzas_out -- Stanza objects serialized for sending.
+        bytes_in    -- Bytes read from the socket.
+        bytes_out   -- Bytes written to the socket.
+        tls_full    -- TLS handshakes that created a new session.
+        tls_resumed -- TLS handshakes that resumed a saved session.
+
+    Histograms:
+        parse       -- Seconds spent parsing each chunk read.
+        process     -- Seconds spent filtering and matching each
+                       incoming stanza against the stream handlers.
+        tostring    -- Seconds spent serializing each outgoing stanza.
+        event_queue -- Depth of the event queue, sampled when the
+                       event runner takes an item from it.
+        send_queue  -- Depth of the send queue, sampled when the send
+                       thread takes an item from it.
+        tls_handshake -- Seconds spent in each TLS handshake.
+
+    Stream handler run times are kept by handler name, and custom event
+    handler run times by event name if ``events`` is enabled.
+    """
+
+    def __init__(self, events=False):
+        #: If ``True``, also time custom event handlers.
+        self.events = events
+        #: When the metrics were started.
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.handlers = {}
+        self.event_timings = {}
+        self.lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        """Add to a counter."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, bounds=TIME_BUCKETS):
+        """Record a value in a histogram, creating it if needed."""
+        self._observe(self.histograms, name, value, bounds)
+
+    def observe_handler(self, name, seconds):
+        """Record the run time of a stream handler."""
+        self._observe(self.handlers, name, seconds, TIME_BUCKETS)
+
+    def observe_event(self, name, seconds):
+        """Record the run time of a custom event handler."""
+        self._observe(self.event_timings, name, seconds, TIME_BUCKETS)
+
+    def timed_event(self, name, func):
+        """Wrap an event handler so that its run time is recorded."""
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.observe_event(name, time.time() - start)
+        return timed
+
+    def _observe(self, table, name, value, bounds):
+        with self.lock:
+            histogram = table.get(name, None)
+            if histogram is None:
+                histogram = table[name] = Histogram(bounds)
+            histogram.observe(value)
+
+    def snapshot(self):
+        """
+        Return a copy of all measurements as a dictionary of plain
+        values, suitable for serializing as JSON. Rates are averages
+        since the metrics were started.
+        """
+        with self.lock:
+            uptime = max(time.time() - self.started, 1e-9)
+            counters = dict(self.counters)
+            return {
+                'uptime': uptime,
+                'counters': counters,
+                'rates': dict((name, value / uptime) for name, value
+                              in counters.items()),
+                'histograms': dict((name, h.snapshot()) for name, h
+                                   in self.histograms.items()),
+                'handlers': dict((name, h.snapshot()) for name, h
+                                 in self.handlers.items()),
+                'events': dict((name, h.snapshot()) for name, h
+                               in self.event_timings.items())}
@@ -11,6 +11,8 @@
 import socket
 import logging
 import random
+import threading
+import time
 
 
 log = logging.getLogger(__name__)
@@ -41,6 +43,93 @@ except ImportError as e:
               "Not all features will be available")
 
 
+class DNSCache(object):
+
+    """Cache DNS answers for as long as their TTLs allow.
+
+    A single cache is shared by every stream by default (see
+    :data:`default_cache`), so reconnecting many accounts on the same
+    domain performs one set of DNS queries instead of one per account.
+    Concurrent lookups of the same name wait for the first one to
+    finish instead of sending their own queries.
+
+    Answers from the operating system resolver carry no TTL, and are
+    kept for :attr:`default_ttl` seconds. Failed queries, such as
+    timeouts, are not cached.
+
+    :param default_ttl: Seconds to keep answers that have no TTL.
+    :param max_ttl: The longest time to keep any answer.
+    :param max_entries: The number of answers to keep.
+    """
+
+    def __init__(self, default_ttl=60, max_ttl=3600, max_entries=4096):
+        #: Seconds to keep answers that have no TTL.
+        self.default_ttl = default_ttl
+        #: The longest time in seconds to keep any answer.
+        self.max_ttl = max_ttl
+        #: The number of answers to keep.
+        self.max_entries = max_entries
+        self.entries = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def lookup(self, key, query):
+        """Return a cached answer, or run a query to get a fresh one.
+
+        :param key: A hashable key identifying the query.
+        :param query: A function returning a ``(value, ttl)`` tuple.
+                      A ``ttl`` of ``None`` uses :attr:`default_ttl`,
+                      and a ``ttl`` of ``0`` prevents caching.
+        """
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is not None and entry[0] > time.time():
+                return entry[1]
+            pending = self.pending.get(key, None)
+            if pending is None:
+                pending = self.pending[key] = [threading.Event(), None]
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            pending[0].wait()
+            return pending[1]
+
+        value, ttl = None, 0
+        try:
+            value, ttl = query()
+            return value
+        finally:
+            if ttl is None:
+                ttl = self.default_ttl
+            with self.lock:
+                del self.pending[key]
+                if ttl > 0:
+                    self._store(key, value, min(ttl, self.max_ttl))
+            pending[1] = value
+            pending[0].set()
+
+    def _store(self, key, value, ttl):
+        now = time.time()
+        if len(self.entries) >= self.max_entries:
+            for old_key, entry in list(self.entries.items()):
+                if entry[0] <= now:
+                    del self.entries[old_key]
+            while len(self.entries) >= self.max_entries:
+                self.entries.popitem()
+        self.entries[key] = (now + ttl, value)
+
+    def clear(self):
+        """Drop all cached answers."""
+        with self.lock:
+            self.entries.clear()
+
+
+#: The DNS cache shared by all streams by default.
+default_cache = DNSCache()
+
+
 def default_resolver():
     """Return a basic DNS resolver object.
 
@@ -53,7 +142,7 @@ def default_resolver():
 
 
 def resolve(host, port=None, service=None, proto='tcp',
-            resolver=None, use_ipv6=True, use_dnspython=True):
+            resolver=None, use_ipv6=True, use_dnspython=True, cache=None):
     """Peform DNS resolution for a given hostname.
 
     Resolution may perform SRV record lookups if a service and protocol
@@ -80,6 +169,8 @@ def resolve(host, port=None, service=None, proto='tcp',
     :param use_dnspython: Optionally control if dnspython is used to make
                           the DNS queries instead of the built-in DNS
                           library.
+    :param    cache: Optionally provide a :class:`DNSCache` for
+                     reusing earlier answers.
 
     :type     host: string
     :type     port: int
@@ -88,6 +179,7 @@ def resolve(host, port=None, service=None, proto='tcp',
     :type resolver: :class:`dns.resolver.Resolver`
     :type use_ipv6: bool
     :type use_dnspython: bool
+    :type    cache: :class:`DNSCache`
 
     :return: An iterable of IP address, port pairs in the order
              dictated by SRV priorities and weights, if applicable.
@@ -133,9 +225,10 @@ def resolve(host, port=None, service=None, proto='tcp',
     if not service:
         hosts = [(host, port)]
     else:
-        hosts = get_SRV(host, port, service, proto, 
+        hosts = get_SRV(host, port, service, proto,
                         resolver=resolver,
-                        use_dnspython=use_dnspython)
+                        use_dnspython=use_dnspython,
+                        cache=cache)
 
     for host, port in hosts:
         results = []
@@ -144,18 +237,20 @@ def resolve(host, port=None, service=None, proto='tcp',
                 results.append((host, '::1', port))
             results.append((host, '127.0.0.1', port))
         if use_ipv6:
-            for address in get_AAAA(host, resolver=resolver, 
-                                          use_dnspython=use_dnspython):
+            for address in get_AAAA(host, resolver=resolver,
+                                          use_dnspython=use_dnspython,
+                                          cache=cache):
                 results.append((host, address, port))
         for address in get_A(host, resolver=resolver,
-                                   use_dnspython=use_dnspython):
+                                   use_dnspython=use_dnspython,
+                                   cache=cache):
             results.append((host, address, port))
 
         for host, address, port in results:
             yield host, address, port
 
 
-def get_A(host, resolver=None, use_dnspython=True):
+def get_A(host, resolver=None, use_dnspython=True, cache=None):
     """Lookup DNS A records for a given host.
 
     If ``resolver`` is not provided, or is ``None``, then resolution will
@@ -166,13 +261,25 @@ def get_A(host, resolver=None, use_dnspython=True):
     :param use_dnspython: Optionally control if dnspython is used to make
                           the DNS queries instead of the built-in DNS
                           library.
+    :param    cache: Optionally provide a :class:`DNSCache` for
+                     reusing earlier answers.
 
     :type     host: string
     :type resolver: :class:`dns.resolver.Resolver` or ``None``
     :type use_dnspython: bool
+    :type    cache: :class:`DNSCache`
 
     :return: A list of IPv4 literals.
     """
+    if cache is not None:
+        key = ('A', host, resolver is not None and use_dnspython)
+        return cache.lookup(key, lambda: _query_A(host, resolver,
+                                                  use_dnspython))
+    return _query_A(host, resolver, use_dnspython)[0]
+
+
+def _query_A(host, resolver, use_dnspython):
+    """Return a list of A record addresses and their TTL."""
     log.debug("DNS: Querying %s for A records." % host)
 
     # If not using dnspython, attempt lookup using the OS level
@@ -181,28 +288,28 @@ def get_A(host, resolver=None, use_dnspython=True):
         try:
             recs = socket.getaddrinfo(host, None, socket.AF_INET,
                                                   socket.SOCK_STREAM)
-            return [rec[4][0] for rec in recs]
+            return [rec[4][0] for rec in recs], None
         except socket.gaierror:
             log.debug("DNS: Error retreiving A address info for %s." % host)
-            return []
+            return [], 0
 
     # Using dnspython:
     try:
         recs = resolver.query(host, dns.rdatatype.A)
-        return [rec.to_text() for rec in recs]
+        return [rec.to_text() for rec in recs], recs.rrset.ttl
     except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
         log.debug("DNS: No A records for %s" % host)
-        return []
+        return [], None
     except dns.exception.Timeout:
         log.debug("DNS: A record resolution timed out for %s" % host)
-        return []
+        return [], 0
     except dns.exception.DNSException as e:
         log.debug("DNS: Error querying A records for %s" % host)
         log.exception(e)
-        return []
+        return [], 0
 
 
-def get_AAAA(host, resolver=None, use_dnspython=True):
+def get_AAAA(host, resolver=None, use_dnspython=True, cache=None):
     """Lookup DNS AAAA records for a given host.
 
     If ``resolver`` is not provided, or is ``None``, then resolution will
@@ -213,13 +320,25 @@ def get_AAAA(host, resolver=None, use_dnspython=True):
     :param use_dnspython: Optionally control if dnspython is used to make
                           the DNS queries instead of the built-in DNS
                           library.
+    :param    cache: Optionally provide a :class:`DNSCache` for
+                     reusing earlier answers.
 
     :type     host: string
     :type resolver: :class:`dns.resolver.Resolver` or ``None``
     :type use_dnspython: bool
+    :type    cache: :class:`DNSCache`
 
     :return: A list of IPv6 literals.
     """
+    if cache is not None:
+        key = ('AAAA', host, resolver is not None and use_dnspython)
+        return cache.lookup(key, lambda: _query_AAAA(host, resolver,
+                                                     use_dnspython))
+    return _query_AAAA(host, resolver, use_dnspython)[0]
+
+
+def _query_AAAA(host, resolver, use_dnspython):
+    """Return a list of AAAA record addresses and their TTL."""
     log.debug("DNS: Querying %s for AAAA records." % host)
 
     # If not using dnspython, attempt lookup using the OS level
@@ -227,33 +346,34 @@ def get_AAAA(host, resolver=None, use_dnspython=True):
     if resolver is None or not use_dnspython:
         if not socket.has_ipv6:
             log.debug("Unable to query %s for AAAA records: IPv6 is not supported", host)
-            return []
+            return [], None
         try:
             recs = socket.getaddrinfo(host, None, socket.AF_INET6,
                                                   socket.SOCK_STREAM)
-            return [rec[4][0] for rec in recs]
+            return [rec[4][0] for rec in recs], None
         except (OSError, socket.gaierror):
             log.debug("DNS: Error retreiving AAAA address " + \
                       "info for %s." % host)
-            return []
+            return [], 0
 
     # Using dnspython:
     try:
         recs = resolver.query(host, dns.rdatatype.AAAA)
-        return [rec.to_text() for rec in recs]
+        return [rec.to_text() for rec in recs], recs.rrset.ttl
     except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
         log.debug("DNS: No AAAA records for %s" % host)
-        return []
+        return [], None
     except dns.exception.Timeout:
         log.debug("DNS: AAAA record resolution timed out for %s" % host)
-        return []
+        return [], 0
     except dns.exception.DNSException as e:
         log.debug("DNS: Error querying AAAA records for %s" % host)
         log.exception(e)
-        return []
+        return [], 0
 
 
-def get_SRV(host, port, service, proto='tcp', resolver=None, use_dnspython=True):
+def get_SRV(host, port, service, proto='tcp', resolver=None,
+            use_dnspython=True, cache=None):
     """Perform SRV record resolution for a given host.
 
     .. note::
@@ -269,12 +389,16 @@ def get_SRV(host, port, service, proto='tcp', resolver=None, use_dnspython=True)
     :param    proto: Optional SRV protocol name without leading underscore.
     :param resolver: Optionally provide a DNS resolver object that has
                      been custom configured.
+    :param    cache: Optionally provide a :class:`DNSCache` for
+                     reusing earlier answers. The records are cached,
+                     but are ordered by weight anew for every call.
 
     :type     host: string
     :type     port: int
     :type  service: string
     :type    proto: string
     :type resolver: :class:`dns.resolver.Resolver`
+    :type    cache: :class:`DNSCache`
 
     :return: A list of hostname, port pairs in the order dictacted
              by SRV priorities and weights.
@@ -283,32 +407,25 @@ def get_SRV(host, port, service, proto='tcp', resolver=None, use_dnspython=True)
         log.warning("DNS: dnspython not found. Can not use SRV lookup.")
         return [(host, port)]
 
-    log.debug("DNS: Querying SRV records for %s" % host)
-    try:
-        recs = resolver.query('_%s._%s.%s' % (service, proto, host),
-                              dns.rdatatype.SRV)
-    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
-        log.debug("DNS: No SRV records for %s." % host)
-        return [(host, port)]
-    except dns.exception.Timeout:
-        log.debug("DNS: SRV record resolution timed out for %s." % host)
-        return [(host, port)]
-    except dns.exception.DNSException as e:
-        log.debug("DNS: Error querying SRV records for %s." % host)
-        log.exception(e)
-        return [(host, port)]
+    if cache is not None:
+        key = ('SRV', host, service, proto)
+        recs = cache.lookup(key, lambda: _query_SRV(host, service, proto,
+                                                    resolver))
+    else:
+        recs = _query_SRV(host, service, proto, resolver)[0]
 
-    if len(recs) == 1 and recs[0].target == '.':
+    if not recs:
         return [(host, port)]
 
     answers = {}
     for rec in recs:
-        if rec.priority not in answers:
-            answers[rec.priority] = []
-        if rec.weight == 0:
-            answers[rec.priority].insert(0, rec)
+        priority, weight = rec[0], rec[1]
+        if priority not in answers:
+            answers[priority] = []
+        if weight == 0:
+            answers[priority].insert(0, rec)
         else:
-            answers[rec.priority].append(rec)
+            answers[priority].append(rec)
 
     sorted_recs = []
     for priority in sorted(answers.keys()):
@@ -316,18 +433,46 @@ def get_SRV(host, port, service, proto='tcp', resolver=None, use_dnspython=True)
             running_sum = 0
             sums = {}
             for rec in answers[priority]:
-                running_sum += rec.weight
+                running_sum += rec[1]
                 sums[running_sum] = rec
 
             selected = random.randint(0, running_sum + 1)
             for running_sum in sums:
                 if running_sum >= selected:
                     rec = sums[running_sum]
-                    host = rec.target.to_text()
-                    if host.endswith('.'):
-                        host = host[:-1]
-                    sorted_recs.append((host, rec.port))
+                    sorted_recs.append((rec[3], rec[2]))
                     answers[priority].remove(rec)
                     break
 
     return sorted_recs
+
+
+def _query_SRV(host, service, proto, resolver):
+    """Return SRV records as (priority, weight, port, target) tuples,
+    along with their TTL. An empty list means no usable records."""
+    log.debug("DNS: Querying SRV records for %s" % host)
+    try:
+        recs = resolver.query('_%s._%s.%s' % (service, proto, host),
+                              dns.rdatatype.SRV)
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        log.debug("DNS: No SRV records for %s." % host)
+        return [], None
+    except dns.exception.Timeout:
+        log.debug("DNS: SRV record resolution timed out for %s." % host)
+        return [], 0
+    except dns.exception.DNSException as e:
+        log.debug("DNS: Error querying SRV records for %s." % host)
+        log.exception(e)
+        return [], 0
+
+    results = []
+    for rec in recs:
+        target = rec.target.to_text()
+        if target.endswith('.'):
+            target = target[:-1]
+        results.append((rec.priority, rec.weight, rec.port, target))
+
+    if len(results) == 1 and not results[0][3]:
+        return [], recs.rrset.ttl
+
+    return results, recs.rrset.ttl
@@ -17,11 +17,11 @@ import threading
 import logging
 import itertools
 
-from sleekxmpp.util import Queue, QueueEmpty
+from sleekxmpp.util import WakeupEvent
 
 
-#: The time in seconds to wait for events from the event queue, and also the
-#: time between checks for the process stop signal.
+#: The time in seconds between checks for the process stop signal, when
+#: the stop event can not wake up the scheduler.
 WAIT_TIMEOUT = 1.0
 
 
@@ -98,16 +98,20 @@ class Scheduler(object):
     A threaded scheduler that allows for updates mid-execution unlike the
     scheduler in the standard library.
 
+    The scheduler thread sleeps until the next task is due, or until
+    it is woken up by a new task or by stopping. No time is spent
+    while there is nothing to do.
+
     Based on: http://docs.python.org/library/sched.html#module-sched
 
     :param parentstop: An :class:`~threading.Event` to signal stopping
-                       the scheduler.
+                       the scheduler. A
+                       :class:`~sleekxmpp.util.WakeupEvent` wakes the
+                       scheduler immediately; any other event is
+                       checked every :attr:`wait_timeout` seconds.
     """
 
     def __init__(self, parentstop=None):
-        #: A queue for storing tasks
-        self.addq = Queue()
-
         #: A list of tasks in order of execution time.
         self.schedule = []
 
@@ -120,15 +124,23 @@ class Scheduler(object):
 
         #: An :class:`~threading.Event` instance for signalling to stop
         #: the scheduler.
-        self.stop = parentstop
+        self.stop = parentstop if parentstop is not None else WakeupEvent()
 
         #: Lock for accessing the task queue.
         self.schedule_lock = threading.RLock()
 
-        #: The time in seconds to wait for events from the event queue,
-        #: and also the time between checks for the process stop signal.
+        #: Condition notified when the schedule changes or the
+        #: scheduler is stopped.
+        self.schedule_changed = threading.Condition(self.schedule_lock)
+
+        #: The time in seconds between checks for the process stop
+        #: signal, if it can not wake up the scheduler.
         self.wait_timeout = WAIT_TIMEOUT
 
+        self._linked = hasattr(self.stop, 'link')
+        if self._linked:
+            self.stop.link(self.schedule_changed)
+
     def process(self, threaded=True, daemon=False):
         """Begin accepting and processing scheduled tasks.
 
@@ -147,52 +159,31 @@ class Scheduler(object):
         """Process scheduled tasks."""
         self.run = True
         try:
-            while self.run and not self.stop.is_set():
-                updated = False
-                if self.schedule:
-                    wait = self.schedule[0].next - time.time()
-                else:
-                    wait = self.wait_timeout
-                try:
-                    if wait <= 0.0:
-                        newtask = self.addq.get(False)
+            with self.schedule_lock:
+                while self.run and not self.stop.is_set():
+                    if self.schedule:
+                        wait = self.schedule[0].next - time.time()
                     else:
-                        newtask = None
-                        while self.run and \
-                              not self.stop.is_set() and \
-                              newtask is None and \
-                              wait > 0:
-                            try:
-                                newtask = self.addq.get(True, min(wait, self.wait_timeout))
-                            except QueueEmpty:          # Nothing to add, nothing to do. Check run flags and continue waiting.
-                                wait -= self.wait_timeout
-                except QueueEmpty:                      # Time to run some tasks, and no new tasks to add.
-                    self.schedule_lock.acquire()
-                    # select only those tasks which are to be executed now
-                    relevant = itertools.takewhile(
-                        lambda task: time.time() >= task.next, self.schedule)
-                    # run the tasks and keep the return value in a tuple
-                    status = map(lambda task: (task, task.run()), relevant)
-                    # remove non-repeating tasks
-                    for task, doRepeat in status:
-                        if not doRepeat:
+                        wait = None
+                    if wait is None or wait > 0:
+                        if not self._linked:
+                            wait = min(wait or self.wait_timeout,
+                                       self.wait_timeout)
+                        self.schedule_changed.wait(wait)
+                        continue
+
+                    # Run the tasks which are due, keeping the
+                    # repeating ones.
+                    now = time.time()
+                    relevant = list(itertools.takewhile(
+                        lambda task: now >= task.next, self.schedule))
+                    for task in relevant:
+                        if not task.run():
                             try:
                                 self.schedule.remove(task)
                             except ValueError:
                                 pass
-                        else:
-                            # only need to resort tasks if a repeated task has
-                            # been kept in the list.
-                            updated = True
-                else:                                   # Add new task
-                    self.schedule_lock.acquire()
-                    if newtask is not None:
-                        self.schedule.append(newtask)
-                        updated = True
-                finally:
-                    if updated:
-                        self.schedule.sort(key=lambda task: task.next)
-                    self.schedule_lock.release()
+                    self.schedule.sort(key=lambda task: task.next)
         except KeyboardInterrupt:
             self.run = False
         except SystemExit:
@@ -213,18 +204,15 @@ class Scheduler(object):
         :param pointer: A pointer to an event queue for queuing callback
                         execution instead of executing immediately.
         """
-        try:
-            self.schedule_lock.acquire()
+        with self.schedule_lock:
             for task in self.schedule:
                 if task.name == name:
                     raise ValueError("Key %s already exists" % name)
 
-            self.addq.put(Task(name, seconds, callback, args,
-                               kwargs, repeat, qpointer))
-        except:
-            raise
-        finally:
-            self.schedule_lock.release()
+            self.schedule.append(Task(name, seconds, callback, args,
+                                      kwargs, repeat, qpointer))
+            self.schedule.sort(key=lambda task: task.next)
+            self.schedule_changed.notify_all()
 
     def remove(self, name):
         """Remove a scheduled task ahead of schedule, and without
@@ -232,19 +220,16 @@ class Scheduler(object):
 
         :param string name: The name of the task to remove.
         """
-        try:
-            self.schedule_lock.acquire()
+        with self.schedule_lock:
             the_task = None
             for task in self.schedule:
                 if task.name == name:
                     the_task = task
             if the_task is not None:
                 self.schedule.remove(the_task)
-        except:
-            raise
-        finally:
-            self.schedule_lock.release()
 
     def quit(self):
         """Shutdown the scheduler."""
-        self.run = False
+        with self.schedule_lock:
+            self.run = False
+            self.schedule_changed.notify_all()
@@ -0,0 +1,125 @@
+"""
+    SleekXMPP: The Sleek XMPP Library
+    Copyright (C) 2010  Nathanael C. Fritz
+    This file is part of SleekXMPP.
+
+    See the file LICENSE for copying permission.
+"""
+
+import logging
+import ssl
+import threading
+import time
+
+from sleekxmpp.thirdparty import OrderedDict
+
+
+log = logging.getLogger(__name__)
+
+
+#: ``True`` if the ssl module supports ``SSLContext`` objects
+#: (Python 2.7.9 and later, and Python 3).
+HAVE_CONTEXT = hasattr(ssl, 'SSLContext')
+
+#: ``True`` if TLS sessions can be saved and resumed (Python 3.6+).
+HAVE_SESSIONS = hasattr(ssl, 'SSLSession')
+
+
+class TLSCache(object):
+
+    """
+    Share ``SSLContext`` objects and TLS sessions between streams.
+
+    Building a context loads the CA certificates and the client
+    certificate from disk, so contexts are kept per combination of
+    certificate files, cipher list and protocol version. Streams using
+    the same context can also resume each other's TLS sessions with
+    the same server, so reconnecting after a network failure does not
+    require full handshakes.
+
+    A single cache, :data:`default_cache`, is used by every stream
+    unless :attr:`XMLStream.tls_cache
+    <sleekxmpp.xmlstream.xmlstream.XMLStream.tls_cache>` is replaced.
+
+    :param max_sessions: The number of TLS sessions to keep. The least
+                         recently used sessions are dropped first.
+    """
+
+    def __init__(self, max_sessions=1024):
+        #: The number of TLS sessions to keep.
+        self.max_sessions = max_sessions
+        self.contexts = {}
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def context(self, certfile=None, keyfile=None, ca_certs=None,
+                ciphers=None, version=ssl.PROTOCOL_TLSv1):
+        """Return the shared ``SSLContext`` for the given settings.
+
+        Returns ``None`` if ``SSLContext`` is not supported by the
+        running version of Python.
+        """
+        if not HAVE_CONTEXT:
+            return None
+        key = (certfile, keyfile, ca_certs, ciphers, version)
+        with self.lock:
+            context = self.contexts.get(key, None)
+            if context is None:
+                context = self.contexts[key] = self._build(*key)
+        return context
+
+    def _build(self, certfile, keyfile, ca_certs, ciphers, version):
+        log.debug('Creating SSL context: %s', (certfile, ca_certs, version))
+        context = ssl.SSLContext(version)
+        if ca_certs is None:
+            context.verify_mode = ssl.CERT_NONE
+        else:
+            context.verify_mode = ssl.CERT_REQUIRED
+            context.load_verify_locations(ca_certs)
+        if certfile is not None:
+            context.load_cert_chain(certfile, keyfile)
+        if ciphers is not None:
+            context.set_ciphers(ciphers)
+        return context
+
+    def get_session(self, context, server):
+        """Return a saved TLS session for a server, if one is usable.
+
+        :param context: The ``SSLContext`` the session was created in.
+        :param server: A ``(host, port)`` tuple naming the server.
+        """
+        key = (id(context), server)
+        with self.lock:
+            session = self.sessions.pop(key, None)
+            if session is None:
+                return None
+            if session.time + session.timeout < time.time():
+                return None
+            self.sessions[key] = session
+            return session
+
+    def save_session(self, context, server, session):
+        """Save a TLS session so that other connections can resume it.
+
+        :param context: The ``SSLContext`` the session was created in.
+        :param server: A ``(host, port)`` tuple naming the server.
+        :param session: An ``ssl.SSLSession``.
+        """
+        if session is None:
+            return
+        key = (id(context), server)
+        with self.lock:
+            self.sessions.pop(key, None)
+            self.sessions[key] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached contexts and sessions."""
+        with self.lock:
+            self.contexts.clear()
+            self.sessions.clear()
+
+
+#: The cache shared by all streams by default.
+default_cache = TLSCache()
@@ -49,6 +49,27 @@ def tostring(xml=None, xmlns='', stream=None, outbuffer='',
 
     :rtype: Unicode string
     """
+    # Reuse the serialization of elements the stream has memoized,
+    # such as frequently requested disco#info payloads.
+    if stream is not None and stream.xml_memo and \
+            not (top_level or open_only or namespaces):
+        memo = stream.xml_memo.get(xml, None)
+        if memo is not None:
+            text = memo.get(xmlns, None)
+            if text is None:
+                text = _tostring(xml, xmlns, stream)
+                memo[xmlns] = text
+            return outbuffer + text
+    return _tostring(xml, xmlns, stream, outbuffer,
+                     top_level, open_only, namespaces)
+
+
+def _tostring(xml, xmlns='', stream=None, outbuffer='',
+              top_level=False, open_only=False, namespaces=None):
+    """Serialize an XML object, ignoring any memoized result for it.
+
+    See :func:`tostring` for the meaning of the parameters.
+    """
     # Add previous results to the start of the output.
     output = [outbuffer]
 
@@ -31,13 +31,16 @@ import errno
 from xml.parsers.expat import ExpatError
 
 import sleekxmpp
-from sleekxmpp.util import Queue, QueueEmpty, safedict
+from sleekxmpp.util import Queue, QueueEmpty, WakeupEvent, safedict
 from sleekxmpp.thirdparty.statemachine import StateMachine
-from sleekxmpp.xmlstream import Scheduler, tostring, cert
+from sleekxmpp.xmlstream import Scheduler, tostring, cert, tls
 from sleekxmpp.xmlstream.stanzabase import StanzaBase, ET, ElementBase
 from sleekxmpp.xmlstream.handler import Waiter, XMLCallback
 from sleekxmpp.xmlstream.matcher import MatchXMLMask
 from sleekxmpp.xmlstream.resolver import resolve, default_resolver
+from sleekxmpp.xmlstream.resolver import default_cache as default_dns_cache
+from sleekxmpp.xmlstream.connector import connect_any, ATTEMPT_DELAY
+from sleekxmpp.xmlstream.metrics import StreamMetrics, SIZE_BUCKETS
 
 # In Python 2.x, file socket objects are broken. A patched socket
 # wrapper is provided for this case in filesocket.py.
@@ -87,6 +90,81 @@ class RestartStream(Exception):
     """
 
 
+class StanzaLimitExceeded(Exception):
+    """
+    Exception raised while parsing when an incoming stanza exceeds
+    the size or complexity limits configured for the stream.
+    """
+
+
+class StanzaReader(object):
+    """
+    A wrapper for a file socket that counts the bytes read, so that
+    the parser can stop reading a stanza once it has grown too large.
+    When the stream's metrics are enabled, it also records the bytes
+    read and the time the parser spends on each chunk.
+
+    The limit is checked before each read, against the data already
+    handed to the parser. Since the parser always reports the end of
+    a stanza before asking for more data, that data all belongs to
+    the current stanza and no stanza can be rejected prematurely.
+
+    The reader also holds the state of the stream being parsed, so
+    that data pushed to a parser by a :class:`~sleekxmpp.xmlstream.hub.StreamHub`
+    can be handled the same way, using :meth:`received` and
+    :meth:`check` around each chunk instead of :meth:`read`.
+    """
+
+    def __init__(self, source, stream=None):
+        self.source = source
+        self.stream = stream
+        #: The total number of bytes read.
+        self.count = 0
+        #: The value of :attr:`count` that the stanza currently
+        #: being parsed may not exceed, if any.
+        self.limit = None
+        #: Seconds spent processing stanzas since the last read, which
+        #: are not counted as parsing time.
+        self.processing = 0
+        self.returned = None
+        #: The nesting depth of the element being parsed.
+        self.depth = 0
+        #: The stream's root element, once received.
+        self.root = None
+        #: The number of elements started in the current stanza.
+        self.elements = 0
+        #: Whether the current stanza is checked against limits.
+        self.limited = False
+
+    def read(self, *args, **kwargs):
+        self.check()
+        data = self.source.read(*args, **kwargs)
+        self.received(data)
+        return data
+
+    def check(self):
+        """Enforce the size limit once the last chunk has been parsed."""
+        if self.limit is not None and self.count > self.limit:
+            raise StanzaLimitExceeded('Stanza is too large.')
+        if self.returned is not None and self.stream.metrics is not None:
+            self.stream.metrics.observe('parse', time.time() -
+                                                 self.returned -
+                                                 self.processing)
+        self.returned = None
+
+    def received(self, data):
+        """Account for a chunk of data about to be parsed."""
+        if data:
+            self.count += len(data)
+        metrics = self.stream.metrics if self.stream is not None else None
+        if metrics is not None and data:
+            metrics.incr('bytes_in', len(data))
+            self.returned = time.time()
+            self.processing = 0
+        else:
+            self.returned = None
+
+
 class XMLStream(object):
     """
     An XML stream connection manager and event dispatcher.
@@ -148,7 +226,15 @@ class XMLStream(object):
         #: client certificate to use for authenticating via SASL EXTERNAL.
         self.keyfile = keyfile
 
+        #: The :class:`~sleekxmpp.xmlstream.tls.TLSCache` holding the
+        #: SSL contexts and TLS sessions used by this stream. Streams
+        #: share :data:`~sleekxmpp.xmlstream.tls.default_cache` unless
+        #: it is replaced; set to ``None`` to build a new context and
+        #: do a full handshake for every connection.
+        self.tls_cache = tls.default_cache
+
         self._der_cert = None
+        self._ssl_context = None
 
         #: The time in seconds to wait for events from the event queue,
         #: and also the time between checks for the process stop signal.
@@ -266,19 +352,25 @@ class XMLStream(object):
         #: :attr:`whitespace_keepalive` is enabled.
         self.whitespace_keepalive_interval = 300
 
-        #: An :class:`~threading.Event` to signal that the application
-        #: is stopping, and that all threads should shutdown.
-        self.stop = threading.Event()
+        #: A :class:`~sleekxmpp.util.WakeupEvent` to signal that the
+        #: application is stopping, and that all threads should shutdown.
+        self.stop = WakeupEvent()
 
         #: An :class:`~threading.Event` to signal receiving a closing
         #: stream tag from the server.
         self.stream_end_event = threading.Event()
         self.stream_end_event.set()
 
-        #: An :class:`~threading.Event` to signal the start of a stream
-        #: session. Until this event fires, the send queue is not used
-        #: and data is sent immediately over the wire.
-        self.session_started_event = threading.Event()
+        #: A :class:`~sleekxmpp.util.WakeupEvent` to signal the start of
+        #: a stream session. Until this event fires, the send queue is not
+        #: used and data is sent immediately over the wire.
+        self.session_started_event = WakeupEvent()
+
+        # Notified when either of the events above is set, so that the
+        # send thread can wait for both at once.
+        self.__send_wakeup = threading.Condition()
+        self.stop.link(self.__send_wakeup)
+        self.session_started_event.link(self.__send_wakeup)
 
         #: The default time in seconds to wait for a session to start
         #: after connecting before reconnecting and trying again.
@@ -304,6 +396,50 @@ class XMLStream(object):
         #: A mapping of XML namespaces to well-known prefixes.
         self.namespace_map = {StanzaBase.xml_ns: 'xml'}
 
+        #: Cached serializations of XML objects that are sent often
+        #: without changing, keyed by element and then by the namespace
+        #: of the wrapping element. See :meth:`memoize_xml`.
+        self.xml_memo = {}
+
+        #: Limits on the size and complexity of each incoming stanza,
+        #: enforced while the stanza is still being parsed. A stanza
+        #: exceeding a limit is rejected by closing the stream with a
+        #: ``policy-violation`` error. A value of ``None`` disables the
+        #: corresponding check.
+        #:
+        #: The maximum size in bytes is enforced with the granularity
+        #: of the parser's reads (16 KiB), never rejecting a stanza
+        #: below the limit.
+        self.max_stanza_size = None
+
+        #: The maximum nesting depth of an incoming stanza, counting
+        #: the stanza element itself.
+        self.max_stanza_depth = None
+
+        #: The maximum number of elements contained in an incoming
+        #: stanza, at any depth.
+        self.max_stanza_children = None
+
+        #: The maximum number of attributes of any single element in
+        #: an incoming stanza.
+        self.max_stanza_attributes = None
+
+        #: The number of incoming stanzas rejected for exceeding the
+        #: limits above.
+        self.stanzas_rejected = 0
+
+        #: A :class:`~sleekxmpp.xmlstream.metrics.StreamMetrics` object
+        #: recording counters and timings for the stream, or ``None``
+        #: if metrics are disabled. See :meth:`enable_metrics`.
+        self.metrics = None
+        self.__metrics_exporters = []
+
+        #: The :class:`~sleekxmpp.xmlstream.hub.StreamHub` providing
+        #: the threads for this stream, or ``None`` if the stream runs
+        #: its own. See :meth:`StreamHub.add()
+        #: <sleekxmpp.xmlstream.hub.StreamHub.add>`.
+        self.hub = None
+
         self.__thread = {}
         self.__root_stanza = []
         self.__handlers = []
@@ -341,6 +477,18 @@ class XMLStream(object):
         #: ``_xmpp-client._tcp`` service.
         self.dns_service = None
 
+        #: The :class:`~sleekxmpp.xmlstream.resolver.DNSCache` used for
+        #: DNS lookups, shared by all streams by default. Set to
+        #: ``None`` to query DNS on every connection attempt.
+        self.dns_cache = default_dns_cache
+
+        #: When connecting to a domain, the seconds to wait before
+        #: starting a connection attempt to the next address while
+        #: earlier attempts are still running (see
+        #: :func:`~sleekxmpp.xmlstream.connector.connect_any`). Set to
+        #: ``None`` to try a single address per connection attempt.
+        self.connect_attempt_delay = ATTEMPT_DELAY
+
         self.add_event_handler('connected', self._session_timeout_check)
         self.add_event_handler('disconnected', self._remove_schedules)
         self.add_event_handler('session_start', self._start_keepalive)
@@ -469,11 +617,8 @@ class XMLStream(object):
             delay = min(self.reconnect_delay * 2, self.reconnect_max_delay)
             delay = random.normalvariate(delay, delay * 0.1)
             log.debug('Waiting %s seconds before connecting.', delay)
-            elapsed = 0
             try:
-                while elapsed < delay and not self.stop.is_set():
-                    time.sleep(0.1)
-                    elapsed += 0.1
+                self.stop.wait(delay)
             except KeyboardInterrupt:
                 self.set_stop()
                 return False
@@ -481,7 +626,30 @@ class XMLStream(object):
                 self.set_stop()
                 return False
 
-        if self.default_domain:
+        raced = False
+        if self.default_domain and not self.use_proxy and \
+                self.connect_attempt_delay is not None:
+            answers = self.get_dns_records(self.default_domain,
+                                           self.address[1])
+            try:
+                # Give up on the attempts when the session would have
+                # timed out anyway.
+                self.socket, answer = connect_any(
+                        answers, self.socket_class,
+                        delay=self.connect_attempt_delay,
+                        timeout=self.session_timeout)
+            except Socket.error as serr:
+                self.event('socket_error', serr, direct=True)
+                log.error("Could not connect to %s. Socket Error #%s: %s",
+                          self.default_domain, serr.errno, serr.strerror)
+                if reattempt:
+                    self.reconnect_delay = delay
+                return False
+            host, address, port = answer
+            self.address = (address, port)
+            self._service_name = host
+            raced = True
+        elif self.default_domain:
             try:
                 host, address, port = self.pick_dns_answer(self.default_domain,
                                                            self.address[1])
@@ -494,16 +662,17 @@ class XMLStream(object):
                     self.reconnect_delay = delay
                 return False
 
-        af = Socket.AF_INET
-        proto = 'IPv4'
-        if ':' in self.address[0]:
-            af = Socket.AF_INET6
-            proto = 'IPv6'
-        try:
-            self.socket = self.socket_class(af, Socket.SOCK_STREAM)
-        except Socket.error:
-            log.debug("Could not connect using %s", proto)
-            return False
+        if not raced:
+            af = Socket.AF_INET
+            proto = 'IPv4'
+            if ':' in self.address[0]:
+                af = Socket.AF_INET6
+                proto = 'IPv6'
+            try:
+                self.socket = self.socket_class(af, Socket.SOCK_STREAM)
+            except Socket.error:
+                log.debug("Could not connect using %s", proto)
+                return False
 
         self.configure_socket()
 
@@ -516,43 +685,20 @@ class XMLStream(object):
 
         if self.use_ssl:
             log.debug("Socket Wrapped for SSL")
-            if self.ca_certs is None:
-                cert_policy = ssl.CERT_NONE
-            else:
-                cert_policy = ssl.CERT_REQUIRED
-
-            ssl_args = safedict({
-                'certfile': self.certfile,
-                'keyfile': self.keyfile,
-                'ca_certs': self.ca_certs,
-                'cert_reqs': cert_policy,
-                'do_handshake_on_connect': False,
-                "ssl_version": self.ssl_version
-            })
-
-            if sys.version_info >= (2, 7):
-                ssl_args['ciphers'] = self.ciphers
-
-            ssl_socket = ssl.wrap_socket(self.socket, **ssl_args)
-
-            if hasattr(self.socket, 'socket'):
-                # We are using a testing socket, so preserve the top
-                # layer of wrapping.
-                self.socket.socket = ssl_socket
-            else:
-                self.socket = ssl_socket
+            self._wrap_ssl()
 
         try:
             if not self.use_proxy:
-                domain = self.address[0]
-                if ':' in domain:
-                    domain = '[%s]' % domain
-                log.debug("Connecting to %s:%s", domain, self.address[1])
-                self.socket.connect(self.address)
+                if not raced:
+                    domain = self.address[0]
+                    if ':' in domain:
+                        domain = '[%s]' % domain
+                    log.debug("Connecting to %s:%s", domain, self.address[1])
+                    self.socket.connect(self.address)
 
                 if self.use_ssl:
                     try:
-                        self.socket.do_handshake()
+                        self._ssl_handshake()
                     except (Socket.error, ssl.SSLError):
                         log.error('CERT: Invalid certificate trust chain.')
                         if not self.event_handled('ssl_invalid_chain'):
@@ -562,21 +708,8 @@ class XMLStream(object):
                             self.event('ssl_invalid_chain', direct=True)
                         return False
 
-                    self._der_cert = self.socket.getpeercert(binary_form=True)
-                    pem_cert = ssl.DER_cert_to_PEM_cert(self._der_cert)
-                    log.debug('CERT: %s', pem_cert)
-
-                    self.event('ssl_cert', pem_cert, direct=True)
-                    try:
-                        cert.verify(self._expected_server_name, self._der_cert)
-                    except cert.CertificateError as err:
-                        if not self.event_handled('ssl_invalid_cert'):
-                            log.error(err)
-                            self.disconnect(send_close=False)
-                        else:
-                            self.event('ssl_invalid_cert',
-                                       pem_cert,
-                                       direct=True)
+                    if not self._verify_cert():
+                        self.disconnect(send_close=False)
 
             self.set_socket(self.socket, ignore=True)
             #this event is where you should set your application state
@@ -732,6 +865,7 @@ class XMLStream(object):
                 self._wait_for_threads()
 
         try:
+            self._save_tls_session()
             self.socket.shutdown(Socket.SHUT_RDWR)
             self.socket.close()
             self.filesocket.close()
@@ -757,7 +891,12 @@ class XMLStream(object):
         self.event("killed", direct=True)
 
     def reconnect(self, reattempt=True, wait=False, send_close=True):
-        """Reset the stream's state and reconnect to the server."""
+        """Reset the stream's state and reconnect to the server.
+
+        In a :class:`~sleekxmpp.xmlstream.hub.StreamHub`, the hub makes
+        the connection attempts in the background and ``False`` is
+        returned without waiting for them.
+        """
         log.debug("reconnecting...")
         if self.state.ensure('connected'):
             self.state.transition('connected', 'disconnected',
@@ -765,6 +904,10 @@ class XMLStream(object):
                     func=self._disconnect,
                     args=(True, wait, send_close))
 
+        if self.hub is not None:
+            self.hub._reconnect(self)
+            return False
+
         attempts = self.reconnect_max_attempts
 
         log.debug("connecting...")
@@ -811,7 +954,9 @@ class XMLStream(object):
     def configure_socket(self):
         """Set timeout and other options for self.socket.
 
-        Meant to be overridden.
+        Meant to be overridden. When the address was chosen by racing
+        several connection attempts (see :attr:`connect_attempt_delay`),
+        the socket is already connected when this is called.
         """
         self.socket.settimeout(None)
 
@@ -841,43 +986,44 @@ class XMLStream(object):
         log.info("Negotiating TLS")
         ssl_versions = {3: 'TLS 1.0', 1: 'SSL 3', 2: 'SSL 2/3'}
         log.info("Using SSL version: %s", ssl_versions[self.ssl_version])
-        if self.ca_certs is None:
-            cert_policy = ssl.CERT_NONE
-        else:
-            cert_policy = ssl.CERT_REQUIRED
-
-        ssl_args = safedict({
-            'certfile': self.certfile,
-            'keyfile': self.keyfile,
-            'ca_certs': self.ca_certs,
-            'cert_reqs': cert_policy,
-            'do_handshake_on_connect': False,
-            "ssl_version": self.ssl_version
-        })
+        self._wrap_ssl()
 
-        if sys.version_info >= (2, 7):
-            ssl_args['ciphers'] = self.ciphers
-
-        ssl_socket = ssl.wrap_socket(self.socket, **ssl_args)
-
-        if hasattr(self.socket, 'socket'):
-            # We are using a testing socket, so preserve the top
-            # layer of wrapping.
-            self.socket.socket = ssl_socket
-        else:
-            self.socket = ssl_socket
+        if self.hub is not None:
+            # The hub's I/O thread must not wait for the peer, so the
+            # hub does the handshake without blocking once the stream
+            # restarts, and then calls _tls_established().
+            self.hub._start_tls(self)
+            return True
 
         try:
-            self.socket.do_handshake()
+            self._ssl_handshake()
         except (Socket.error, ssl.SSLError):
-            log.error('CERT: Invalid certificate trust chain.')
-            if not self.event_handled('ssl_invalid_chain'):
-                self.disconnect(self.auto_reconnect, send_close=False)
-            else:
-                self._der_cert = self.socket.getpeercert(binary_form=True)
-                self.event('ssl_invalid_chain', direct=True)
-            return False
+            return self._tls_failed()
+        return self._tls_established()
+
+    def _tls_failed(self):
+        """Handle a failed TLS handshake."""
+        log.error('CERT: Invalid certificate trust chain.')
+        if not self.event_handled('ssl_invalid_chain'):
+            self.disconnect(self.auto_reconnect, send_close=False)
+        else:
+            self._der_cert = self.socket.getpeercert(binary_form=True)
+            self.event('ssl_invalid_chain', direct=True)
+        return False
+
+    def _tls_established(self):
+        """Check the certificate once a TLS handshake has completed."""
+        if not self._verify_cert():
+            self.disconnect(self.auto_reconnect, send_close=False)
+        self.set_socket(self.socket)
+        return True
+
+    def _verify_cert(self):
+        """Announce the server's certificate and verify it.
 
+        Returns ``False`` if the certificate is invalid and there is
+        no ``ssl_invalid_cert`` handler to decide what to do.
+        """
         self._der_cert = self.socket.getpeercert(binary_form=True)
         pem_cert = ssl.DER_cert_to_PEM_cert(self._der_cert)
         log.debug('CERT: %s', pem_cert)
@@ -888,12 +1034,108 @@ class XMLStream(object):
         except cert.CertificateError as err:
             if not self.event_handled('ssl_invalid_cert'):
                 log.error(err)
-                self.disconnect(self.auto_reconnect, send_close=False)
+                return False
+            self.event('ssl_invalid_cert', pem_cert, direct=True)
+        return True
+
+    def _wrap_ssl(self):
+        """Wrap the current socket for SSL/TLS, without a handshake.
+
+        When possible, the context is taken from :attr:`tls_cache`
+        together with any session saved from an earlier connection to
+        the same server, so that the handshake can resume it.
+        """
+        cache = self.tls_cache
+        context = None
+        if cache is not None:
+            context = cache.context(self.certfile, self.keyfile,
+                                    self.ca_certs, self.ciphers,
+                                    self.ssl_version)
+        self._ssl_context = context
+
+        if context is not None:
+            ssl_args = {'do_handshake_on_connect': False}
+            if tls.HAVE_SESSIONS:
+                session = cache.get_session(context, self._tls_server())
+                if session is not None:
+                    ssl_args['session'] = session
+            ssl_socket = context.wrap_socket(self.socket, **ssl_args)
+        else:
+            if self.ca_certs is None:
+                cert_policy = ssl.CERT_NONE
             else:
-                self.event('ssl_invalid_cert', pem_cert, direct=True)
+                cert_policy = ssl.CERT_REQUIRED
 
-        self.set_socket(self.socket)
-        return True
+            ssl_args = safedict({
+                'certfile': self.certfile,
+                'keyfile': self.keyfile,
+                'ca_certs': self.ca_certs,
+                'cert_reqs': cert_policy,
+                'do_handshake_on_connect': False,
+                "ssl_version": self.ssl_version
+            })
+
+            if sys.version_info >= (2, 7):
+                ssl_args['ciphers'] = self.ciphers
+
+            ssl_socket = ssl.wrap_socket(self.socket, **ssl_args)
+
+        if hasattr(self.socket, 'socket'):
+            # We are using a testing socket, so preserve the top
+            # layer of wrapping.
+            self.socket.socket = ssl_socket
+        else:
+            self.socket = ssl_socket
+
+    def _ssl_handshake(self):
+        """Perform the SSL/TLS handshake on a wrapped socket.
+
+        The handshake time is recorded in the ``tls_handshake``
+        histogram, and resumed handshakes counted as ``tls_resumed``.
+        The session is saved in :attr:`tls_cache` for reuse.
+        """
+        start = time.time()
+        self.socket.do_handshake()
+        self._ssl_handshake_done(start)
+
+    def _ssl_handshake_done(self, start):
+        """Record a handshake started at ``start``, and save its session."""
+        ssl_socket = getattr(self.socket, 'socket', self.socket)
+        resumed = getattr(ssl_socket, 'session_reused', False)
+
+        # Let the certificate checks use the ssl module's decoding of
+        # the certificate, if it did one.
+        der_cert = self.socket.getpeercert(binary_form=True)
+        if der_cert:
+            cert.get_info(der_cert, self.socket.getpeercert())
+
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.observe('tls_handshake', time.time() - start)
+            metrics.incr('tls_resumed' if resumed else 'tls_full')
+
+        self._save_tls_session()
+
+    def _save_tls_session(self):
+        """Save the current TLS session in :attr:`tls_cache`.
+
+        With TLS 1.3 the server sends session tickets after the
+        handshake, so this is also done again before closing.
+        """
+        context = self._ssl_context
+        if context is None or not tls.HAVE_SESSIONS or \
+                self.tls_cache is None:
+            return
+        ssl_socket = getattr(self.socket, 'socket', self.socket)
+        session = getattr(ssl_socket, 'session', None)
+        if session is not None:
+            self.tls_cache.save_session(context, self._tls_server(),
+                                        session)
+
+    def _tls_server(self):
+        """Return the ``(host, port)`` key for saving TLS sessions."""
+        return (self._expected_server_name or self.address[0],
+                self.address[1])
 
     def _cert_expiration(self, event):
         """Schedule an event for when the TLS certificate expires."""
@@ -1093,7 +1335,8 @@ class XMLStream(object):
         return resolve(domain, port, service=self.dns_service,
                                      resolver=resolver,
                                      use_ipv6=self.use_ipv6,
-                                     use_dnspython=self.use_dnspython)
+                                     use_dnspython=self.use_dnspython,
+                                     cache=self.dns_cache)
 
     def pick_dns_answer(self, domain, port=None):
         """Pick a server and port from DNS answers.
@@ -1171,15 +1414,21 @@ class XMLStream(object):
         log.debug("Event triggered: " + name)
 
         handlers = self.__event_handlers.get(name, [])
+        metrics = self.metrics
+        timed = metrics is not None and metrics.events
         for handler in handlers:
             #TODO:  Data should not be copied, but should be read only,
             #       but this might break current code so it's left for future.
 
             out_data = copy.copy(data) if len(handlers) > 1 else data
             old_exception = getattr(data, 'exception', None)
+            queued = handler
+            if timed:
+                queued = (metrics.timed_event(name, handler[0]),
+                          handler[1], handler[2])
             if direct:
                 try:
-                    handler[0](out_data)
+                    queued[0](out_data)
                 except Exception as e:
                     error_msg = 'Error processing event handler: %s'
                     log.exception(error_msg,  str(handler[0]))
@@ -1188,7 +1437,7 @@ class XMLStream(object):
                     else:
                         self.exception(e)
             else:
-                self.event_queue.put(('event', handler, out_data))
+                self.event_queue.put(('event', queued, out_data))
             if handler[2]:
                 # If the handler is disposable, we will go ahead and
                 # remove it now instead of waiting for it to be
@@ -1226,6 +1475,73 @@ class XMLStream(object):
         """
         return xml
 
+    def enable_metrics(self, events=False):
+        """Start recording counters and timings for the stream.
+
+        Calling this again keeps the measurements taken so far.
+
+        :param bool events: Also time custom event handlers, keyed by
+                            event name. Defaults to ``False``.
+        :returns: The :class:`~sleekxmpp.xmlstream.metrics.StreamMetrics`
+                  object holding the measurements.
+        """
+        if self.metrics is None:
+            self.metrics = StreamMetrics(events)
+        else:
+            self.metrics.events = events
+        return self.metrics
+
+    def disable_metrics(self):
+        """Stop recording metrics and discard the measurements."""
+        self.metrics = None
+
+    def metrics_snapshot(self):
+        """Return the current metrics as a dictionary of plain values.
+
+        In addition to the contents of
+        :meth:`StreamMetrics.snapshot()
+        <sleekxmpp.xmlstream.metrics.StreamMetrics.snapshot>`,
+        the current depths of the event and send queues are included
+        under ``'queues'``. Returns ``None`` if metrics are disabled.
+        """
+        metrics = self.metrics
+        if metrics is None:
+            return None
+        snapshot = metrics.snapshot()
+        snapshot['queues'] = {'event_queue': self.event_queue.qsize(),
+                              'send_queue': self.send_queue.qsize()}
+        return snapshot
+
+    def add_metrics_exporter(self, exporter, interval=60):
+        """Periodically pass a metrics snapshot to an exporter.
+
+        The exporter is called from the event runner thread with the
+        result of :meth:`metrics_snapshot`, as long as metrics are
+        enabled.
+
+        :param exporter: A function accepting a snapshot dictionary.
+        :param interval: Seconds between exports. Defaults to 60.
+        """
+        name = 'Metrics Exporter %s' % self.new_id()
+        self.__metrics_exporters.append((exporter, name))
+        self.schedule(name, interval, self._export_metrics,
+                      args=(exporter,), repeat=True)
+
+    def del_metrics_exporter(self, exporter):
+        """Stop passing metrics snapshots to an exporter.
+
+        :param exporter: A function given to :meth:`add_metrics_exporter`.
+        """
+        for entry in list(self.__metrics_exporters):
+            if entry[0] == exporter:
+                self.__metrics_exporters.remove(entry)
+                self.scheduler.remove(entry[1])
+
+    def _export_metrics(self, exporter):
+        snapshot = self.metrics_snapshot()
+        if snapshot is not None:
+            exporter(snapshot)
+
     def send(self, data, mask=None, timeout=None, now=False, use_filters=True):
         """A wrapper for :meth:`send_raw()` for sending stanza objects.
 
@@ -1274,15 +1590,50 @@ class XMLStream(object):
                         data = filter(data)
                         if data is None:
                             return
+                metrics = self.metrics
+                if metrics is not None:
+                    start = time.time()
                 str_data = tostring(data.xml, xmlns=self.default_ns,
                                               stream=self,
                                               top_level=True)
+                if metrics is not None:
+                    metrics.observe('tostring', time.time() - start)
+                    metrics.incr('stanzas_out')
                 self.send_raw(str_data, now)
         else:
             self.send_raw(data, now)
         if mask is not None:
             return wait_for.wait(timeout)
 
+    def memoize_xml(self, xml):
+        """Serialize an XML object only once when it is sent repeatedly.
+
+        Once registered, the element is converted to a string the first
+        time it appears inside an outgoing stanza, and that string is
+        spliced into every later stanza that includes the same element.
+
+        The element must not be modified while it is registered; call
+        :meth:`forget_xml` after making any changes.
+
+        :param xml: The :class:`~xml.etree.ElementTree.Element` or
+                    :class:`~sleekxmpp.xmlstream.stanzabase.ElementBase`
+                    object to memoize.
+        """
+        if isinstance(xml, ElementBase):
+            xml = xml.xml
+        self.xml_memo.setdefault(xml, {})
+
+    def forget_xml(self, xml):
+        """Drop any cached serialization for an XML object.
+
+        :param xml: The :class:`~xml.etree.ElementTree.Element` or
+                    :class:`~sleekxmpp.xmlstream.stanzabase.ElementBase`
+                    object that was memoized.
+        """
+        if isinstance(xml, ElementBase):
+            xml = xml.xml
+        self.xml_memo.pop(xml, None)
+
     def send_xml(self, data, mask=None, timeout=None, now=False):
         """Send an XML object on the stream, and optionally wait
         for a response.
@@ -1316,6 +1667,11 @@ class XMLStream(object):
         """
         if now:
             log.debug("SEND (IMMED): %s", data)
+            if self.hub is not None:
+                # The hub's sockets do not block; it buffers what can
+                # not be written yet.
+                self.hub._send(self, data)
+                return True
             try:
                 data = data.encode('utf-8')
                 total = len(data)
@@ -1346,6 +1702,8 @@ class XMLStream(object):
                                 raise
                 if count > 1:
                     log.debug('SENT: %d chunks', count)
+                if self.metrics is not None:
+                    self.metrics.incr('bytes_out', sent)
             except (Socket.error, ssl.SSLError) as serr:
                 self.event('socket_error', serr, direct=True)
                 log.warning("Failed to send %s", data)
@@ -1440,6 +1798,11 @@ class XMLStream(object):
         - The event queue processor
         - The send queue processor
         - The scheduler
+
+        If the stream was added to a
+        :class:`~sleekxmpp.xmlstream.hub.StreamHub`, no threads are
+        started since the hub already processes the stream. With
+        ``block=True``, the call then waits until the stream stops.
         """
         if 'threaded' in kwargs and 'block' in kwargs:
             raise ValueError("process() called with both " + \
@@ -1449,6 +1812,12 @@ class XMLStream(object):
         else:
             threaded = kwargs.get('threaded', True)
 
+        if self.hub is not None:
+            if not threaded:
+                while not self.stop.wait(60):
+                    pass
+            return
+
         for t in range(0, HANDLER_THREADS):
             log.debug("Starting HANDLER THREAD")
             self._start_thread('event_thread_%s' % t, self._event_runner)
@@ -1481,7 +1850,7 @@ class XMLStream(object):
                 # be resent and processing will resume.
                 while not self.stop.is_set():
                     # Only process the stream while connected to the server
-                    if not self.state.ensure('connected', wait=0.1):
+                    if not self.state.ensure('connected'):
                         break
                     # Ensure the stream header is sent for any
                     # new connections.
@@ -1527,47 +1896,123 @@ class XMLStream(object):
 
         Stream events are raised for each received stanza.
         """
-        depth = 0
-        root = None
-        for event, xml in ET.iterparse(self.filesocket, (b'end', b'start')):
-            if event == b'start':
-                if depth == 0:
-                    # We have received the start of the root element.
-                    root = xml
-                    log.debug('RECV: %s', tostring(root, xmlns=self.default_ns,
-                                                         stream=self,
-                                                         top_level=True,
-                                                         open_only=True))
-                    # Perform any stream initialization actions, such
-                    # as handshakes.
-                    self.stream_end_event.clear()
-                    self.start_stream_handler(root)
-
-                    # We have a successful stream connection, so reset
-                    # exponential backoff for new reconnect attempts.
-                    self.reconnect_delay = 1.0
-                depth += 1
-            if event == b'end':
-                depth -= 1
-                if depth == 0:
-                    # The stream's root element has closed,
-                    # terminating the stream.
-                    log.debug("End of stream recieved")
-                    self.stream_end_event.set()
-                    return False
-                elif depth == 1:
-                    # We only raise events for stanzas that are direct
-                    # children of the root element.
-                    try:
-                        self.__spawn_event(xml)
-                    except RestartStream:
-                        return True
-                    if root is not None:
-                        # Keep the root element empty of children to
-                        # save on memory use.
-                        root.clear()
+        reader = StanzaReader(self.filesocket, self)
+        try:
+            for event, xml in ET.iterparse(reader, (b'end', b'start')):
+                result = self._handle_xml_event(reader, event, xml)
+                if result is not None:
+                    return result
+        except StanzaLimitExceeded as e:
+            self._reject_stanza(e)
+            return False
         log.debug("Ending read XML loop")
 
+    def _handle_xml_event(self, reader, event, xml):
+        """Process a single event from the stream parser.
+
+        :param reader: The :class:`StanzaReader` holding the parse state.
+        :param event: Either ``b'start'`` or ``b'end'``.
+        :param xml: The element that was started or ended.
+        :returns: ``False`` if the stream has ended, ``True`` if the
+                  stream must be restarted, and ``None`` otherwise.
+        """
+        if event == b'start':
+            if reader.depth == 0:
+                # We have received the start of the root element.
+                reader.root = xml
+                log.debug('RECV: %s', tostring(xml,
+                                               xmlns=self.default_ns,
+                                               stream=self,
+                                               top_level=True,
+                                               open_only=True))
+                # Perform any stream initialization actions, such
+                # as handshakes.
+                self.stream_end_event.clear()
+                self.start_stream_handler(xml)
+
+                # We have a successful stream connection, so reset
+                # exponential backoff for new reconnect attempts.
+                self.reconnect_delay = 1.0
+            else:
+                if reader.depth == 1:
+                    reader.elements = 0
+                    reader.limited = self.max_stanza_depth is not None or \
+                        self.max_stanza_children is not None or \
+                        self.max_stanza_attributes is not None
+                    if self.max_stanza_size is not None:
+                        reader.limit = reader.count + self.max_stanza_size
+                if reader.limited:
+                    reader.elements += 1
+                    self.__check_stanza_limits(xml, reader.depth,
+                                               reader.elements)
+            reader.depth += 1
+        if event == b'end':
+            reader.depth -= 1
+            if reader.depth == 0:
+                # The stream's root element has closed,
+                # terminating the stream.
+                log.debug("End of stream recieved")
+                self.stream_end_event.set()
+                return False
+            elif reader.depth == 1:
+                reader.limit = None
+                metrics = self.metrics
+                if metrics is not None:
+                    start = time.time()
+                # We only raise events for stanzas that are direct
+                # children of the root element.
+                try:
+                    self.__spawn_event(xml)
+                except RestartStream:
+                    return True
+                if metrics is not None:
+                    elapsed = time.time() - start
+                    reader.processing += elapsed
+                    metrics.observe('process', elapsed)
+                    metrics.incr('stanzas_in')
+                if reader.root is not None:
+                    # Keep the root element empty of children to
+                    # save on memory use.
+                    reader.root.clear()
+        return None
+
+    def _reject_stanza(self, error):
+        """Close the stream after an incoming stanza exceeded a limit.
+
+        :param error: The :class:`StanzaLimitExceeded` exception raised.
+        """
+        self.stanzas_rejected += 1
+        if self.metrics is not None:
+            self.metrics.incr('stanzas_rejected')
+        log.warning('Rejecting incoming stanza: %s', error)
+        xml = ET.Element('{%s}error' % self.stream_ns)
+        ET.SubElement(xml, '{%s}policy-violation' % (
+            'urn:ietf:params:xml:ns:xmpp-streams'))
+        self.send_raw(tostring(xml, xmlns=self.default_ns,
+                                    stream=self,
+                                    top_level=True), now=True)
+        self.event('stanza_rejected', error, direct=True)
+
+    def __check_stanza_limits(self, xml, depth, elements):
+        """Raise :class:`StanzaLimitExceeded` if the stanza being
+        parsed has grown past any of the configured limits.
+
+        :param xml: The element that was just started.
+        :param int depth: The depth of the element in the stanza,
+                          where the stanza element itself is 1.
+        :param int elements: The number of elements started so far
+                             in the stanza, including itself.
+        """
+        if self.max_stanza_depth is not None and \
+                depth > self.max_stanza_depth:
+            raise StanzaLimitExceeded('Stanza is nested too deeply.')
+        if self.max_stanza_children is not None and \
+                elements - 1 > self.max_stanza_children:
+            raise StanzaLimitExceeded('Stanza has too many children.')
+        if self.max_stanza_attributes is not None and \
+                len(xml.attrib) > self.max_stanza_attributes:
+            raise StanzaLimitExceeded('Stanza has too many attributes.')
+
     def _build_stanza(self, xml, default_ns=None):
         """Create a stanza object from a given XML object.
 
@@ -1674,46 +2119,7 @@ class XMLStream(object):
                 event = self.event_queue.get()
                 if event is None:
                     continue
-
-                etype, handler = event[0:2]
-                args = event[2:]
-                orig = copy.copy(args[0])
-
-                if etype == 'stanza':
-                    try:
-                        handler.run(args[0])
-                    except Exception as e:
-                        error_msg = 'Error processing stream handler: %s'
-                        log.exception(error_msg, handler.name)
-                        orig.exception(e)
-                elif etype == 'schedule':
-                    name = args[2]
-                    try:
-                        log.debug('Scheduled event: %s: %s', name, args[0])
-                        handler(*args[0], **args[1])
-                    except Exception as e:
-                        log.exception('Error processing scheduled task')
-                        self.exception(e)
-                elif etype == 'event':
-                    func, threaded, disposable = handler
-                    try:
-                        if threaded:
-                            x = threading.Thread(
-                                    name="Event_%s" % str(func),
-                                    target=self._threaded_event_wrapper,
-                                    args=(func, args))
-                            x.daemon = self._use_daemons
-                            x.start()
-                        else:
-                            func(*args)
-                    except Exception as e:
-                        error_msg = 'Error processing event handler: %s'
-                        log.exception(error_msg, str(func))
-                        if hasattr(orig, 'exception'):
-                            orig.exception(e)
-                        else:
-                            self.exception(e)
-                elif etype == 'quit':
+                if not self._run_event(event):
                     log.debug("Quitting event runner thread")
                     break
         except KeyboardInterrupt:
@@ -1726,13 +2132,77 @@ class XMLStream(object):
 
         self._end_thread('event runner')
 
+    def _run_event(self, event):
+        """Execute a single item taken from the event queue.
+
+        :param event: A tuple of the event type, the handler, and
+                      the handler's arguments.
+        :returns: ``False`` if the item asks the runner to quit.
+        """
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.observe('event_queue', self.event_queue.qsize(),
+                            SIZE_BUCKETS)
+
+        etype, handler = event[0:2]
+        args = event[2:]
+        orig = copy.copy(args[0])
+
+        if etype == 'stanza':
+            if metrics is not None:
+                start = time.time()
+            try:
+                handler.run(args[0])
+            except Exception as e:
+                error_msg = 'Error processing stream handler: %s'
+                log.exception(error_msg, handler.name)
+                orig.exception(e)
+            if metrics is not None:
+                metrics.observe_handler(handler.name, time.time() - start)
+        elif etype == 'schedule':
+            name = args[2]
+            try:
+                log.debug('Scheduled event: %s: %s', name, args[0])
+                handler(*args[0], **args[1])
+            except Exception as e:
+                log.exception('Error processing scheduled task')
+                self.exception(e)
+        elif etype == 'event':
+            func, threaded, disposable = handler
+            try:
+                if threaded and self.hub is not None:
+                    self.hub.workers.submit(self._threaded_event_wrapper,
+                                            func, args)
+                elif threaded:
+                    x = threading.Thread(
+                            name="Event_%s" % str(func),
+                            target=self._threaded_event_wrapper,
+                            args=(func, args))
+                    x.daemon = self._use_daemons
+                    x.start()
+                else:
+                    func(*args)
+            except Exception as e:
+                error_msg = 'Error processing event handler: %s'
+                log.exception(error_msg, str(func))
+                if hasattr(orig, 'exception'):
+                    orig.exception(e)
+                else:
+                    self.exception(e)
+        elif etype == 'quit':
+            return False
+        return True
+
     def _send_thread(self):
         """Extract stanzas from the send queue and send them on the stream."""
         try:
             while not self.stop.is_set():
-                while not self.stop.is_set() and \
-                      not self.session_started_event.is_set():
-                    self.session_started_event.wait(timeout=0.1)                            # Wait for session start
+                with self.__send_wakeup:
+                    while not self.stop.is_set() and \
+                          not self.session_started_event.is_set():
+                        self.__send_wakeup.wait()                   # Wait for session start
+                if self.stop.is_set():
+                    break
                 if self.__failed_send_stanza is not None:
                     data = self.__failed_send_stanza
                     self.__failed_send_stanza = None
@@ -1740,6 +2210,10 @@ class XMLStream(object):
                     data = self.send_queue.get()                                            # Wait for data to send
                     if data is None:
                         continue
+                    if self.metrics is not None:
+                        self.metrics.observe('send_queue',
+                                             self.send_queue.qsize(),
+                                             SIZE_BUCKETS)
                 log.debug("SEND: %s", data)
                 enc_data = data.encode('utf-8')
                 total = len(enc_data)
@@ -1770,6 +2244,8 @@ class XMLStream(object):
                                     raise
                     if count > 1:
                         log.debug('SENT: %d chunks', count)
+                    if self.metrics is not None:
+                        self.metrics.incr('bytes_out', sent)
                     self.send_queue.task_done()
                 except (Socket.error, ssl.SSLError) as serr:
                     self.event('socket_error', serr, direct=True)
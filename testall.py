@@ -43,6 +43,56 @@ def run_tests():
     return result
 
 
+def run_benchmarks(names=None, rounds=None, output=None, baseline=None):
+    """
+    Find and run all benchmarks in the benchmarks/ directory.
+
+    Arguments:
+        names    -- Only run benchmarks whose name contains one of
+                    these strings.
+        rounds   -- Override the number of repetitions.
+        output   -- Filename to write the JSON results to.
+        baseline -- Filename of earlier JSON results to compare with.
+    """
+    from sleekxmpp.test.benchmark import SleekBenchmark, benchmark_names, \
+                                         run_benchmark, dump_results, \
+                                         load_results, format_results
+
+    logging.basicConfig(level=100)
+    logging.disable(100)
+
+    cases = []
+    for t in sorted(glob(pjoin('benchmarks', 'bench_*.py'))):
+        name = 'benchmarks.%s' % splitext(basename(t))[0]
+        __import__(name)
+        module = sys.modules[name]
+        for attr in sorted(dir(module)):
+            cls = getattr(module, attr)
+            if isinstance(cls, type) and issubclass(cls, SleekBenchmark) \
+               and cls.__module__ == name:
+                for method in benchmark_names(cls):
+                    full = '%s.%s.%s' % (name, attr, method)
+                    if not names or [n for n in names if n in full]:
+                        cases.append((cls, method))
+
+    if baseline:
+        with open(baseline) as f:
+            baseline = load_results(f)
+
+    results = []
+    for cls, method in cases:
+        new = run_benchmark(cls, method, rounds)
+        print(format_results(new, baseline))
+        results.extend(new)
+
+    if output == '-':
+        dump_results(results, sys.stdout)
+    elif output:
+        with open(output, 'w') as f:
+            dump_results(results, f)
+    return results
+
+
 # Add a 'test' command for setup.py
 
 class TestCommand(distutils.core.Command):
@@ -59,7 +109,44 @@ class TestCommand(distutils.core.Command):
         run_tests()
 
 
-if __name__ == '__main__':
+# Add a 'benchmark' command for setup.py
+
+class BenchmarkCommand(distutils.core.Command):
+
+    description = 'run the benchmark suite'
+    user_options = [
+        ('output=', 'o', 'write JSON results to this file'),
+        ('baseline=', 'b', 'compare with JSON results from this file'),
+        ('rounds=', 'r', 'number of times to repeat each measurement'),
+    ]
+
+    def initialize_options(self):
+        self.output = None
+        self.baseline = None
+        self.rounds = None
+
+    def finalize_options(self):
+        if self.rounds is not None:
+            self.rounds = int(self.rounds)
+
+    def run(self):
+        run_benchmarks(rounds=self.rounds,
+                       output=self.output,
+                       baseline=self.baseline)
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ['benchmark']:
+    from optparse import OptionParser
+    optp = OptionParser(usage='%prog benchmark [options] [name ...]')
+    optp.add_option('-o', '--output', dest='output',
+                    help='write JSON results to a file, or - for stdout')
+    optp.add_option('-b', '--baseline', dest='baseline',
+                    help='compare with JSON results from an earlier run')
+    optp.add_option('-r', '--rounds', type='int', dest='rounds',
+                    help='number of times to repeat each measurement')
+    opts, args = optp.parse_args(sys.argv[2:])
+    run_benchmarks(args, opts.rounds, opts.output, opts.baseline)
+elif __name__ == '__main__':
     result = run_tests()
     print("<tests %s ran='%s' errors='%s' fails='%s' success='%s' gevent_enabled=%s/>" % (
         "xmlns='http//andyet.net/protocol/tests'",
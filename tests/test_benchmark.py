@@ -0,0 +1,54 @@
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from sleekxmpp.test import *
+from sleekxmpp.test.benchmark import SleekBenchmark, run_benchmark, \
+                                     dump_results, load_results, \
+                                     format_results
+
+
+class CountingBenchmark(SleekBenchmark):
+
+    rounds = 2
+
+    def bench_messages(self):
+        self.stream_start(plugins=[])
+
+        def setup():
+            return self.counter('message', 10)
+
+        def run(done):
+            for i in range(10):
+                self.xmpp.socket.recv_data('<message><body>%s</body>'
+                                           '</message>' % i)
+            self.wait(done, timeout=5)
+        self.measure('messages', run, 10, setup=setup)
+
+
+class TestBenchmark(SleekTest):
+
+    def testRunBenchmark(self):
+        """Test running a benchmark and recording its results."""
+        results = run_benchmark(CountingBenchmark, 'bench_messages')
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['name'], 'CountingBenchmark.messages')
+        self.assertEqual(results[0]['ops'], 10)
+        self.assertTrue(results[0]['ops_per_sec'] > 0)
+
+    def testResultsRoundTrip(self):
+        """Test comparing results against a stored baseline."""
+        results = [{'name': 'Bench.a', 'ops': 10, 'seconds': 0.5,
+                    'ops_per_sec': 20.0, 'usec_per_op': 50000.0}]
+        output = StringIO()
+        dump_results(results, output)
+        output.seek(0)
+        baseline = load_results(output)
+        self.assertEqual(baseline['Bench.a']['ops_per_sec'], 20.0)
+
+        results[0]['ops_per_sec'] = 30.0
+        self.assertTrue(format_results(results, baseline).endswith('+50.0%'))
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestBenchmark)
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import unittest
+from sleekxmpp.test import SleekTest
+from sleekxmpp.xmlstream import cert
+
+
+def cert_time(when):
+    return when.strftime('%b %d %H:%M:%S %Y GMT')
+
+
+class TestCertInfo(SleekTest):
+
+    """
+    Test decoding and caching certificate names and dates.
+    """
+
+    def setUp(self):
+        cert.clear_cache()
+        now = datetime.utcnow().replace(microsecond=0)
+        self.not_before = now - timedelta(days=1)
+        self.not_after = now + timedelta(days=30)
+        self.raw = b'fake DER certificate'
+        self.decoded = {
+            'subject': ((('countryName', 'US'),),
+                        (('commonName', 'example.com'),)),
+            'subjectAltName': (('DNS', '*.example.com'),
+                               ('URI', 'xmpp:chat.example.com'),
+                               ('URI', 'http://example.com')),
+            'notBefore': cert_time(self.not_before),
+            'notAfter': cert_time(self.not_after)}
+
+    def tearDown(self):
+        cert.clear_cache()
+
+    def testDecoded(self):
+        """Test reading a certificate decoded by the ssl module."""
+        info = cert.get_info(self.raw, self.decoded)
+        self.assertEqual(info.names['CN'], set(['example.com']))
+        self.assertEqual(info.names['DNS'], set(['*.example.com']))
+        self.assertEqual(info.names['URI'], set(['chat.example.com']))
+        self.assertEqual(info.not_before, self.not_before)
+        self.assertEqual(info.not_after, self.not_after)
+
+    def testCached(self):
+        """Test that certificates are looked up by their digest."""
+        info = cert.get_info(self.raw, self.decoded)
+        self.assertTrue(cert.get_info(self.raw) is info)
+        self.assertEqual(cert.extract_dates(self.raw),
+                         (self.not_before, self.not_after))
+        names = cert.extract_names(self.raw)
+        names['CN'].add('changed')
+        self.assertEqual(cert.extract_names(self.raw)['CN'],
+                         set(['example.com']))
+
+    def testVerify(self):
+        """Test verifying a server name against a cached certificate."""
+        cert.get_info(self.raw, self.decoded)
+        self.assertTrue(cert.verify('example.com', self.raw))
+        self.assertTrue(cert.verify('xmpp.example.com', self.raw))
+        self.assertTrue(cert.verify('chat.example.com', self.raw))
+        self.assertRaises(cert.CertificateError, cert.verify,
+                          'example.org', self.raw)
+
+    def testExpired(self):
+        """Test that an expired certificate fails verification."""
+        self.decoded['notAfter'] = cert_time(
+                datetime.utcnow() - timedelta(hours=1))
+        cert.get_info(self.raw, self.decoded)
+        self.assertRaises(cert.CertificateError, cert.verify,
+                          'example.com', self.raw)
+        self.assertTrue(cert.get_ttl(self.raw) < timedelta(0))
+
+    def testUnreadableDates(self):
+        """Test that unreadable dates fail verification."""
+        self.decoded['notAfter'] = 'sometime next year'
+        cert.get_info(self.raw, self.decoded)
+        self.assertRaises(cert.CertificateError, cert.verify,
+                          'example.com', self.raw)
+
+    def testCacheSize(self):
+        """Test that the oldest certificates are dropped."""
+        size = cert.CACHE_SIZE
+        cert.CACHE_SIZE = 2
+        try:
+            for raw in (b'a', b'b', b'c'):
+                cert.get_info(raw, self.decoded)
+            self.assertEqual(len(cert._cache), 2)
+        finally:
+            cert.CACHE_SIZE = size
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestCertInfo)
@@ -0,0 +1,210 @@
+import errno
+import socket
+import threading
+import time
+
+import unittest
+import sleekxmpp
+from sleekxmpp.test import SleekTest, TestServer
+from sleekxmpp.xmlstream import resolver
+from sleekxmpp.xmlstream.connector import connect_any, interleave
+from sleekxmpp.xmlstream.resolver import DNSCache
+
+
+class TestDNSCache(SleekTest):
+
+    """
+    Test caching DNS answers.
+    """
+
+    def setUp(self):
+        self.cache = DNSCache(default_ttl=60)
+        self.queries = []
+
+    def query(self, value, ttl):
+        def run():
+            self.queries.append(value)
+            return value, ttl
+        return run
+
+    def testCached(self):
+        """Test that answers are reused until they expire."""
+        self.assertEqual(self.cache.lookup('a', self.query(1, None)), 1)
+        self.assertEqual(self.cache.lookup('a', self.query(2, None)), 1)
+        self.assertEqual(self.cache.lookup('b', self.query(3, 0.1)), 3)
+        time.sleep(0.2)
+        self.assertEqual(self.cache.lookup('b', self.query(4, 0.1)), 4)
+        self.assertEqual(self.queries, [1, 3, 4])
+
+    def testFailuresNotCached(self):
+        """Test that answers with a TTL of zero are not kept."""
+        self.assertEqual(self.cache.lookup('a', self.query([], 0)), [])
+        self.assertEqual(self.cache.lookup('a', self.query([1], 0)), [1])
+        self.assertEqual(self.queries, [[], [1]])
+
+    def testConcurrentLookups(self):
+        """Test that concurrent lookups share a single query."""
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def slow():
+            self.queries.append('slow')
+            started.set()
+            release.wait(5)
+            return ['10.0.0.1'], 0
+
+        def lookup():
+            results.append(self.cache.lookup('host', slow))
+
+        threads = [threading.Thread(target=lookup) for i in range(5)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(self.queries, ['slow'])
+        self.assertEqual(results, [['10.0.0.1']] * 5)
+
+    def testResolve(self):
+        """Test that resolve() uses the cache for address lookups."""
+        calls = []
+        getaddrinfo = socket.getaddrinfo
+
+        def counting(*args, **kwargs):
+            calls.append(args[0])
+            return getaddrinfo(*args, **kwargs)
+
+        resolver.socket.getaddrinfo = counting
+        try:
+            for i in range(3):
+                answers = list(resolver.resolve('localhost', 5222,
+                                                use_ipv6=False,
+                                                use_dnspython=False,
+                                                cache=self.cache))
+                self.assertTrue(('localhost', '127.0.0.1', 5222) in answers)
+        finally:
+            resolver.socket.getaddrinfo = getaddrinfo
+        self.assertEqual(calls, ['localhost'])
+
+
+class TestConnector(SleekTest):
+
+    """
+    Test racing connection attempts.
+    """
+
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(5)
+        self.port = self.listener.getsockname()[1]
+
+        # A port with nothing listening on it.
+        closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed.bind(('127.0.0.1', 0))
+        self.closed_port = closed.getsockname()[1]
+        closed.close()
+
+    def tearDown(self):
+        self.listener.close()
+
+    def testInterleave(self):
+        """Test alternating address families."""
+        answers = [('a', '::1', 1), ('a', '::2', 1), ('a', '::1', 1),
+                   ('a', '10.0.0.1', 1), ('b', '10.0.0.2', 2)]
+        self.assertEqual(interleave(answers),
+                         [('a', '::1', 1), ('a', '10.0.0.1', 1),
+                          ('a', '::2', 1), ('b', '10.0.0.2', 2)])
+
+    def testFailover(self):
+        """Test moving on at once when an address refuses connections."""
+        answers = [('a', '127.0.0.1', self.closed_port),
+                   ('b', '127.0.0.1', self.port)]
+        start = time.time()
+        sock, answer = connect_any(answers, delay=5)
+        sock.close()
+        self.assertEqual(answer, ('b', '127.0.0.1', self.port))
+        self.assertTrue(time.time() - start < 1)
+
+    def testAllFail(self):
+        """Test that the last error is raised if no address works."""
+        answers = [('a', '127.0.0.1', self.closed_port)]
+        self.assertRaises(socket.error, connect_any, answers)
+        self.assertRaises(socket.error, connect_any, [])
+
+    def testTimeout(self):
+        """Test giving up on attempts that never finish."""
+        socks = []
+
+        class Stalled(object):
+
+            # A socket that never becomes writable, like a connection
+            # attempt to a host dropping packets.
+
+            def __init__(self, family, type):
+                self.sock, peer = socket.socketpair()
+                socks.extend([self.sock, peer])
+                self.sock.setblocking(False)
+                try:
+                    while True:
+                        self.sock.send(b'x' * 65536)
+                except socket.error:
+                    pass
+
+            def __getattr__(self, name):
+                return getattr(self.sock, name)
+
+            def connect_ex(self, address):
+                return errno.EINPROGRESS
+
+        answers = [('a', '127.0.0.1', 1), ('a', '::1', 1)]
+        start = time.time()
+        try:
+            self.assertRaises(socket.error, connect_any, answers,
+                              socket_class=Stalled, delay=0.05,
+                              timeout=0.3)
+        finally:
+            for sock in socks:
+                sock.close()
+        self.assertTrue(0.3 <= time.time() - start < 2)
+
+
+class TestConnectDomain(SleekTest):
+
+    """
+    Test connecting a stream to a domain name.
+    """
+
+    def setUp(self):
+        self.server = TestServer('localhost')
+        self.server.start()
+        self.xmpp = sleekxmpp.ClientXMPP('user@localhost/race', 'x')
+        self.xmpp.auto_reconnect = False
+
+    def tearDown(self):
+        self.xmpp.disconnect(wait=False)
+        self.xmpp.stop.set()
+        self.server.stop()
+
+    def testConnectByName(self):
+        """Test connecting by name through the racing connector."""
+        ready = threading.Event()
+        self.xmpp.add_event_handler('session_start', lambda e: ready.set())
+        self.xmpp['feature_mechanisms'].unencrypted_plain = True
+        self.xmpp.use_dnspython = False
+        self.xmpp.connect(('localhost', self.server.address[1]),
+                          use_tls=False, reattempt=False)
+        self.xmpp.process(block=False)
+        self.assertTrue(ready.wait(10), 'Session did not start.')
+        self.assertEqual(self.xmpp.address,
+                         ('127.0.0.1', self.server.address[1]))
+
+
+suite = unittest.TestSuite([
+    unittest.TestLoader().loadTestsFromTestCase(TestDNSCache),
+    unittest.TestLoader().loadTestsFromTestCase(TestConnector),
+    unittest.TestLoader().loadTestsFromTestCase(TestConnectDomain)])
@@ -150,6 +150,30 @@ class TestPlugins(unittest.TestCase):
         self.assertTrue('end_c' in events, "Dependent C not disabled.")
         self.assertTrue('end_d' in events, "Dependent D not disabled.")
 
+    def test_defer(self):
+        """Enable a deferred plugin on first access."""
+        p = PluginManager(None)
+
+        events = []
+
+        A.plugin_init = lambda s: events.append('init_a')
+        B.plugin_init = lambda s: events.append('init_b')
+
+        p.defer('a')
+        p.defer('f', namespaces=['urn:test:f'])
+
+        self.assertEqual(len(p), 0, "Deferred plugins were enabled.")
+        self.assertTrue(p.deferred('a'), "Plugin A not deferred.")
+
+        p['a']
+        self.assertEqual(events, ['init_a'], "Plugin A not enabled.")
+        self.assertFalse(p.deferred('a'), "Plugin A still deferred.")
+
+        self.assertFalse(p.enable_namespace('urn:test:other'))
+        self.assertTrue(p.enable_namespace('urn:test:f'))
+        self.assertEqual(len(p), 3, "Wrong number of enabled plugins.")
+        self.assertFalse(p.enable_namespace('urn:test:f'),
+                "Namespace still mapped to an enabled plugin.")
 
 
 suite = unittest.TestLoader().loadTestsFromTestCase(TestPlugins)
@@ -0,0 +1,65 @@
+import unittest
+from sleekxmpp.test import SleekTest
+from sleekxmpp.util import sasl
+
+
+class TestSCRAM(SleekTest):
+
+    """
+    Test the SCRAM-SHA-1 mechanism using the example from RFC 5802.
+    """
+
+    def setUp(self):
+        self.cache = sasl.SCRAMCache()
+
+    def tearDown(self):
+        sasl.SCRAM.cache = None
+
+    def authenticate(self):
+        def credentials(required, optional):
+            return {'username': 'user', 'password': 'pencil'}
+
+        def security(values):
+            return {'encrypted': True}
+
+        mech = sasl.choose(['SCRAM-SHA-1'], credentials, security)
+        mech.process()
+        mech.cnonce = b'fyko+d2lbbFgONRv9qkxdawL'
+        mech.client_first_message_bare = b'n=user,r=' + mech.cnonce
+
+        result = mech.process(b'r=fyko+d2lbbFgONRv9qkxdawL3rfcNHYJY1ZVvWVs'
+                              b'7j,s=QSXCR+Q6sek8bf92,i=4096')
+        self.assertEqual(result,
+                b'c=biws,r=fyko+d2lbbFgONRv9qkxdawL3rfcNHYJY1ZVvWVs7j,'
+                b'p=v0X8v3Bz2T0CJGbJQyF0X+HI4Ts=')
+        mech.process(b'v=rmF9pqV8S7suAoZWja4dJRkFsKQ=')
+        return mech
+
+    def testHi(self):
+        """Test that both PBKDF2 implementations agree."""
+        mech = self.authenticate()
+        pbkdf2_hmac = sasl.mechanisms.pbkdf2_hmac
+        try:
+            sasl.mechanisms.pbkdf2_hmac = None
+            slow = mech.Hi(b'pencil', b'salt', 16)
+        finally:
+            sasl.mechanisms.pbkdf2_hmac = pbkdf2_hmac
+        self.assertEqual(slow, mech.Hi(b'pencil', b'salt', 16))
+
+    def testCachedKeys(self):
+        """Test reusing derived keys from the credential cache."""
+        sasl.SCRAM.cache = self.cache
+        self.authenticate()
+        self.assertEqual(len(self.cache), 1)
+
+        def Hi(mech, text, salt, iterations):
+            self.fail("Keys were derived again.")
+
+        original = sasl.SCRAM.__dict__['Hi']
+        sasl.SCRAM.Hi = Hi
+        try:
+            self.authenticate()
+        finally:
+            sasl.SCRAM.Hi = original
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestSCRAM)
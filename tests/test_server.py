@@ -0,0 +1,177 @@
+import socket
+import threading
+
+import unittest
+import sleekxmpp
+from sleekxmpp.test import SleekTest, TestServer
+from sleekxmpp.test.server import ServerConnection
+
+
+class TestServerRouting(SleekTest):
+
+    """
+    Test routing stanzas between real clients connected to the
+    in-process test server.
+    """
+
+    def setUp(self):
+        self.server = TestServer('localhost', accounts={
+            'alice@localhost': 'a',
+            'bob@localhost': 'b'})
+        self.server.set_roster('alice@localhost', {
+            'bob@localhost': {'subscription': 'both'}})
+        self.server.set_roster('bob@localhost', {
+            'alice@localhost': {'subscription': 'both'}})
+        self.server.start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.disconnect(wait=False)
+        for client in self.clients:
+            client.stop.set()
+        self.server.stop()
+
+    def connect(self, jid, password):
+        """Connect a client and wait for its session to start."""
+        xmpp = sleekxmpp.ClientXMPP(jid, password)
+        xmpp.auto_reconnect = False
+        ready = threading.Event()
+        xmpp.add_event_handler('session_start', lambda e: ready.set())
+        self.server.connect(xmpp)
+        xmpp.process(block=False)
+        self.clients.append(xmpp)
+        self.assertTrue(ready.wait(10), 'Session did not start.')
+        return xmpp
+
+    def testMessage(self):
+        """Test routing a message between two clients."""
+        received = []
+        done = threading.Event()
+
+        alice = self.connect('alice@localhost/home', 'a')
+        bob = self.connect('bob@localhost/work', 'b')
+
+        def on_message(msg):
+            received.append((msg['from'].full, msg['body']))
+            done.set()
+
+        bob.add_event_handler('message', on_message)
+        alice.send_message(mto='bob@localhost/work', mbody='hi')
+        self.assertTrue(done.wait(10))
+        self.assertEqual(received, [('alice@localhost/home', 'hi')])
+
+    def testAuthFailure(self):
+        """Test that wrong credentials are rejected."""
+        xmpp = sleekxmpp.ClientXMPP('alice@localhost/home', 'wrong')
+        xmpp.auto_reconnect = False
+        failed = threading.Event()
+        xmpp.add_event_handler('failed_auth', lambda e: failed.set())
+        self.server.connect(xmpp)
+        xmpp.process(block=False)
+        self.clients.append(xmpp)
+        self.assertTrue(failed.wait(10))
+        self.assertEqual(self.server.sessions(), [])
+
+    def testRosterAndPresence(self):
+        """Test fetching the roster and receiving contact presence."""
+        alice = self.connect('alice@localhost/home', 'a')
+        bob = self.connect('bob@localhost/work', 'b')
+
+        updated = threading.Event()
+        alice.add_event_handler('roster_update', lambda e: updated.set())
+        alice.get_roster()
+        self.assertTrue(updated.wait(10))
+        self.assertEqual(alice.client_roster['bob@localhost']['subscription'],
+                         'both')
+
+        online = threading.Event()
+        alice.add_event_handler('got_online',
+                lambda p: p['from'].bare == 'bob@localhost' and online.set())
+        alice.send_presence()
+        bob.get_roster()
+        bob.send_presence()
+        self.assertTrue(online.wait(10))
+
+    def testIq(self):
+        """Test Iq routing, and errors for unknown recipients."""
+        alice = self.connect('alice@localhost/home', 'a')
+        bob = self.connect('bob@localhost/work', 'b')
+        bob.register_plugin('xep_0199')
+
+        alice.register_plugin('xep_0199')
+        rtt = alice['xep_0199'].ping('bob@localhost/work', timeout=10)
+        self.assertTrue(rtt is not None and rtt is not False)
+
+        iq = alice.Iq(sto='bob@localhost/gone', stype='get')
+        iq.enable('ping')
+        try:
+            iq.send(timeout=10)
+        except sleekxmpp.exceptions.IqError as e:
+            self.assertEqual(e.condition, 'service-unavailable')
+        else:
+            self.fail('Expected an error reply.')
+
+    def testComponent(self):
+        """Test routing between a client and a component."""
+        self.server.add_component('bot.localhost', 'secret')
+        component = sleekxmpp.ComponentXMPP('bot.localhost', 'secret',
+                                            'localhost', 0)
+        component.auto_reconnect = False
+        ready = threading.Event()
+        component.add_event_handler('session_start', lambda e: ready.set())
+        self.server.connect(component)
+        component.process(block=False)
+        self.clients.append(component)
+        self.assertTrue(ready.wait(10))
+
+        alice = self.connect('alice@localhost/home', 'a')
+        received = threading.Event()
+
+        def echo(msg):
+            msg.reply('echo: %s' % msg['body']).send()
+
+        def on_reply(msg):
+            if msg['body'] == 'echo: ping':
+                received.set()
+
+        component.add_event_handler('message', echo)
+        alice.add_event_handler('message', on_reply)
+        alice.send_message(mto='bot.localhost', mbody='ping')
+        self.assertTrue(received.wait(10))
+
+    def testManySessions(self):
+        """Test binding many sessions for the same account."""
+        for i in range(20):
+            self.connect('alice@localhost/r%s' % i, 'a')
+        self.assertTrue(self.server.wait_for_sessions(20, timeout=10))
+        self.assertEqual(len(self.server.sessions()), 20)
+
+    def testQueuedOutput(self):
+        """Test that output for a slow reader is queued, not blocking."""
+        ours, theirs = socket.socketpair()
+        ours.setblocking(False)
+        conn = ServerConnection(self.server, ours)
+        self.server.max_output = 1024 * 1024
+        data = 'x' * (1024 * 1024)
+        conn.send(data)
+        self.assertTrue(conn.output_size > 0)
+
+        received = []
+        size = 0
+        while size < len(data):
+            chunk = theirs.recv(65536)
+            received.append(chunk)
+            size += len(chunk)
+            conn.flush()
+        self.assertEqual(conn.output_size, 0)
+        self.assertEqual(b''.join(received), data.encode('utf-8'))
+
+        conn.send('y' * 1024)
+        self.assertFalse(conn.closed)
+        conn.send('z' * (1024 * 1024 + 1))
+        self.assertTrue(conn.closed)
+        theirs.close()
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestServerRouting)
@@ -310,5 +310,28 @@ class TestJabberRPC(SleekTest):
         self.assertEqual(params, xml2py(expected_xml),
                          "XML to struct conversion")
 
+    def testConvertNested(self):
+        params = [{"list": [1, [2.5, {"deep": [None, True, "x"]}]],
+                   "empty": [],
+                   "struct": {"a": {}}}]
+        self.assertEqual(params, xml2py(py2xml(*params)),
+                         "Nested values round trip")
+
+    def testConvertDeeplyNested(self):
+        depth = 3 * sys.getrecursionlimit()
+        xml = '<array><data><value>' * depth + \
+              '<i4>1</i4>' + \
+              '</value></data></array>' * depth
+        params_xml = self.parse_xml("""
+            <params xmlns="jabber:iq:rpc">
+                <param><value>%s</value></param>
+            </params>
+        """ % xml)
+        value = xml2py(params_xml)[0]
+        for i in range(depth):
+            self.assertEqual(len(value), 1)
+            value = value[0]
+        self.assertEqual(value, 1)
+
 suite = unittest.TestLoader().loadTestsFromTestCase(TestJabberRPC)
 
@@ -77,4 +77,29 @@ class TestStreamTester(SleekTest):
                 "Stream error event not raised: %s" % events)
 
 
+    def testLazyPlugins(self):
+        """Test enabling deferred plugins when they are needed."""
+        self.stream_start(mode='client', plugins=[])
+        self.xmpp.lazy_plugins = True
+        self.xmpp.plugin_whitelist = ['xep_0030', 'xep_0092', 'xep_0199']
+        self.xmpp.register_plugins()
+
+        for name in self.xmpp.plugin_whitelist:
+            self.assertFalse(self.xmpp.plugin.enabled(name),
+                    "Plugin %s enabled before being used." % name)
+
+        self.recv("""
+          <iq type="get" id="1" from="user@localhost">
+            <ping xmlns="urn:xmpp:ping" />
+          </iq>
+        """)
+        self.send("""
+          <iq type="result" id="1" to="user@localhost" />
+        """)
+        self.assertTrue(self.xmpp.plugin.enabled('xep_0199'))
+        self.assertFalse(self.xmpp.plugin.enabled('xep_0092'))
+
+        self.assertTrue(self.xmpp['xep_0092'])
+        self.assertTrue(self.xmpp.plugin.enabled('xep_0092'))
+
 suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamTester)
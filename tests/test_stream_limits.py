@@ -0,0 +1,85 @@
+import time
+import unittest
+from sleekxmpp.test import SleekTest
+
+
+class TestStanzaLimits(SleekTest):
+
+    """
+    Test rejecting incoming stanzas that exceed the stream's limits.
+    """
+
+    def setUp(self):
+        self.stream_start(mode='client')
+        self.received = []
+        self.rejected = []
+        self.xmpp.add_event_handler('message', self.received.append)
+        self.xmpp.add_event_handler('stanza_rejected', self.rejected.append)
+
+    def tearDown(self):
+        self.stream_close()
+
+    def recv_message(self, payload=''):
+        self.recv("""
+          <message from="user@localhost">%s</message>
+        """ % payload)
+        time.sleep(0.1)
+
+    def check_rejected(self):
+        sent = self.xmpp.socket.next_sent(timeout=1)
+        if isinstance(sent, bytes):
+            sent = sent.decode("utf-8")
+        self.assertTrue(sent is not None and 'policy-violation' in sent,
+                "Stream error not sent: %s" % sent)
+        self.assertEqual(self.xmpp.stanzas_rejected, 1)
+        self.assertEqual(len(self.rejected), 1)
+        self.assertEqual(self.received, [])
+
+    def testWithinLimits(self):
+        """Test that stanzas within the limits are accepted."""
+        self.xmpp.max_stanza_size = 1024
+        self.xmpp.max_stanza_depth = 2
+        self.xmpp.max_stanza_children = 2
+        self.xmpp.max_stanza_attributes = 1
+        self.recv_message('<subject>Hi</subject><body>Hi!</body>')
+        self.assertEqual(len(self.received), 1)
+        self.assertEqual(self.xmpp.stanzas_rejected, 0)
+
+    def testMaxDepth(self):
+        """Test rejecting a deeply nested stanza."""
+        self.xmpp.max_stanza_depth = 3
+        self.recv_message('<a><b><c /></b></a>')
+        self.check_rejected()
+
+    def testMaxChildren(self):
+        """Test rejecting a stanza with too many elements."""
+        self.xmpp.max_stanza_children = 3
+        self.recv_message('<a /><b /><c /><d />')
+        self.check_rejected()
+
+    def testMaxAttributes(self):
+        """Test rejecting an element with too many attributes."""
+        self.xmpp.max_stanza_attributes = 2
+        self.recv_message('<a x="1" y="2" z="3" />')
+        self.check_rejected()
+
+    def testMaxSize(self):
+        """Test rejecting a stanza larger than the size limit."""
+        self.xmpp.max_stanza_size = 1024
+        self.recv("<message from='user@localhost'><body>")
+        self.recv('x' * 2048)
+        self.recv('</body></message>')
+        time.sleep(0.1)
+        self.check_rejected()
+
+    def testRejectedMetrics(self):
+        """Test that rejected stanzas are counted in the metrics."""
+        self.xmpp.enable_metrics()
+        self.xmpp.max_stanza_depth = 3
+        self.recv_message('<a><b><c /></b></a>')
+        self.check_rejected()
+        snapshot = self.xmpp.metrics_snapshot()
+        self.assertEqual(snapshot['counters'].get('stanzas_rejected'), 1)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestStanzaLimits)
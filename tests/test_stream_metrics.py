@@ -0,0 +1,89 @@
+import time
+import unittest
+from sleekxmpp.test import SleekTest
+from sleekxmpp.xmlstream.handler import Callback
+from sleekxmpp.xmlstream.matcher import StanzaPath
+
+
+class TestStreamMetrics(SleekTest):
+
+    """
+    Test recording counters and timings for a stream.
+    """
+
+    def setUp(self):
+        self.stream_start(mode='client', plugins=[])
+
+    def tearDown(self):
+        self.stream_close()
+
+    def testDisabled(self):
+        """Test that metrics are disabled by default."""
+        self.assertEqual(self.xmpp.metrics, None)
+        self.assertEqual(self.xmpp.metrics_snapshot(), None)
+
+    def testStanzaMetrics(self):
+        """Test counting and timing incoming and outgoing stanzas."""
+        self.xmpp.enable_metrics()
+        self.xmpp.register_handler(
+                Callback('Test Handler',
+                         StanzaPath('message/body'),
+                         lambda msg: msg.reply('Thanks').send()))
+
+        self.recv("""
+          <message from="user@localhost" to="tester@localhost">
+            <body>Hello</body>
+          </message>
+        """)
+        self.send("""
+          <message to="user@localhost">
+            <body>Thanks</body>
+          </message>
+        """)
+        time.sleep(0.1)
+
+        snapshot = self.xmpp.metrics_snapshot()
+        counters = snapshot['counters']
+        self.assertEqual(counters['stanzas_in'], 1)
+        self.assertEqual(counters['stanzas_out'], 1)
+        self.assertTrue(counters['bytes_in'] > 0)
+        self.assertTrue(counters['bytes_out'] > 0)
+        self.assertTrue(snapshot['rates']['stanzas_in'] > 0)
+
+        for name in ('parse', 'process', 'tostring',
+                     'event_queue', 'send_queue'):
+            self.assertTrue(snapshot['histograms'][name]['count'] > 0,
+                    "No %s measurements: %s" % (name, snapshot))
+        self.assertEqual(snapshot['histograms']['process']['count'], 1)
+        self.assertEqual(snapshot['handlers']['Test Handler']['count'], 1)
+        self.assertEqual(snapshot['events'], {})
+        self.assertEqual(snapshot['queues'],
+                         {'event_queue': 0, 'send_queue': 0})
+
+    def testEventMetrics(self):
+        """Test timing custom event handlers by event name."""
+        self.xmpp.enable_metrics(events=True)
+        self.xmpp.add_event_handler('test_event', lambda data: None)
+        self.xmpp.event('test_event', direct=True)
+        self.xmpp.event('test_event')
+        time.sleep(0.1)
+
+        snapshot = self.xmpp.metrics_snapshot()
+        self.assertEqual(snapshot['events']['test_event']['count'], 2)
+
+    def testExporter(self):
+        """Test passing snapshots to an exporter."""
+        exported = []
+        self.xmpp.enable_metrics()
+        self.xmpp.add_metrics_exporter(exported.append, interval=0.1)
+
+        end = time.time() + 3
+        while not exported and time.time() < end:
+            time.sleep(0.05)
+        self.xmpp.del_metrics_exporter(exported.append)
+
+        self.assertTrue(exported, "No snapshot was exported.")
+        self.assertTrue('counters' in exported[0])
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamMetrics)
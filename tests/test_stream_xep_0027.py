@@ -0,0 +1,135 @@
+import threading
+import time
+
+import unittest
+from sleekxmpp.test import SleekTest
+
+
+class FakeResult(object):
+
+    def __init__(self, data='', valid=False, status=None, key_id=None):
+        self.data = data
+        self.valid = valid
+        self.status = status
+        self.key_id = key_id
+
+
+class FakeGPG(object):
+
+    """
+    Stand in for GnuPG, recording the operations requested.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.threads = set()
+        self.release = threading.Event()
+        self.release.set()
+
+    def sign(self, data, keyid=None):
+        self.release.wait(5)
+        self.calls.append(('sign', data))
+        self.threads.add(threading.current_thread().name)
+        return FakeResult('-----BEGIN PGP SIGNATURE-----\n'
+                          '\n'
+                          'sig:%s\n'
+                          '-----END PGP SIGNATURE-----\n' % data)
+
+    def verify(self, data):
+        self.calls.append(('verify', data))
+        self.threads.add(threading.current_thread().name)
+        if 'sig:' in data:
+            return FakeResult(valid=True, status='signature good',
+                              key_id='ABCD')
+        return FakeResult(status='signature bad', key_id='ABCD')
+
+
+class TestSignedPresence(SleekTest):
+
+    """
+    Test signing and verifying presence through the GnuPG worker.
+    """
+
+    def setUp(self):
+        self.stream_start(mode='client', plugins=['xep_0027'])
+        self.gpg = FakeGPG()
+        self.xmpp['xep_0027'].gpg = self.gpg
+        self.xmpp['xep_0027'].worker.gpg = self.gpg
+        self.xmpp['xep_0027'].set_keyid(jid='tester@localhost',
+                                        keyid='ABCD')
+
+    def tearDown(self):
+        self.stream_close()
+
+    def testSignatureReused(self):
+        """Test that an unchanged status is only signed once."""
+        for i in range(2):
+            self.xmpp.send_presence(pstatus='Busy')
+            self.send("""
+              <presence>
+                <status>Busy</status>
+                <x xmlns="jabber:x:signed">sig:Busy</x>
+              </presence>
+            """, use_values=False)
+        self.assertEqual(self.gpg.calls, [('sign', 'Busy')])
+        self.assertEqual(self.gpg.threads, set(['gpg worker-0']))
+
+    def testPresenceOrder(self):
+        """Test that presences wait behind one being signed."""
+        self.gpg.release.clear()
+        self.xmpp.send_presence(pstatus='Away')
+        self.xmpp.send_presence(ptype='unavailable')
+        self.gpg.release.set()
+        self.send("""
+          <presence>
+            <status>Away</status>
+            <x xmlns="jabber:x:signed">sig:Away</x>
+          </presence>
+        """, use_values=False)
+        self.send("""<presence type="unavailable" />""")
+
+    def testEndWhileSigning(self):
+        """Test ending the plugin while a presence is being signed."""
+        plugin = self.xmpp['xep_0027']
+        self.gpg.release.clear()
+        self.xmpp.send_presence(pstatus='Away')
+        time.sleep(0.1)
+        ending = threading.Thread(target=plugin.plugin_end)
+        ending.start()
+        time.sleep(0.1)
+        self.assertTrue(ending.is_alive())
+        self.gpg.release.set()
+        ending.join(5)
+        self.assertFalse(ending.is_alive())
+        self.assertEqual(plugin._held, 0)
+
+    def testVerify(self):
+        """Test that verification results are remembered."""
+        events = []
+        self.xmpp.add_event_handler('signed_presence', events.append)
+        for i in range(2):
+            self.recv("""
+              <presence from="foo@bar/a" to="tester@localhost">
+                <status>Here</status>
+                <x xmlns="jabber:x:signed">sig:Here</x>
+              </presence>
+            """)
+        self.recv("""
+          <presence from="foo@bar/b" to="tester@localhost">
+            <status>Here</status>
+            <x xmlns="jabber:x:signed">forged</x>
+          </presence>
+        """)
+        time.sleep(0.3)
+
+        self.assertEqual([str(pres['from']) for pres in events],
+                         ['foo@bar/a', 'foo@bar/a'])
+        self.assertEqual(self.xmpp['xep_0027'].get_keyid('foo@bar/a'),
+                         'ABCD')
+        # The second presence is checked against the key learned from
+        # the first, and the forged one is checked once.
+        self.assertEqual(len(self.gpg.calls), 3)
+        self.assertEqual(self.gpg.threads, set(['gpg worker-0']))
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestSignedPresence)
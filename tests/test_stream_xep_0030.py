@@ -572,5 +572,73 @@ class TestStreamDisco(SleekTest):
         self.assertEqual(raised_exceptions, [True],
              "StopIteration was not raised: %s" % raised_exceptions)
 
+    def testInfoMemoized(self):
+        """Test reusing the serialized info for repeated queries."""
+        self.stream_start(mode='client',
+                          plugins=['xep_0030'])
+
+        self.xmpp['xep_0030'].add_feature('urn:test:foo')
+        info = self.xmpp['xep_0030'].static.get_node()['info']
+
+        for qid in ('1', '2'):
+            self.recv("""
+              <iq type="get" id="%s" from="user@localhost/a">
+                <query xmlns="http://jabber.org/protocol/disco#info" />
+              </iq>
+            """ % qid)
+
+            self.send("""
+              <iq type="result" id="%s" to="user@localhost/a">
+                <query xmlns="http://jabber.org/protocol/disco#info">
+                  <identity category="client" type="bot" />
+                  <feature var="urn:test:foo" />
+                </query>
+              </iq>
+            """ % qid)
+
+        self.assertTrue(self.xmpp.xml_memo.get(info.xml),
+                "Disco info serialization was not memoized.")
+
+    def testInfoMemoInvalidated(self):
+        """Test that modifying a node discards its memoized info."""
+        self.stream_start(mode='client',
+                          plugins=['xep_0030'])
+
+        self.xmpp['xep_0030'].add_identity('client', 'bot')
+        self.xmpp['xep_0030'].add_feature('urn:test:foo')
+
+        self.recv("""
+          <iq type="get" id="1">
+            <query xmlns="http://jabber.org/protocol/disco#info" />
+          </iq>
+        """)
+
+        self.send("""
+          <iq type="result" id="1">
+            <query xmlns="http://jabber.org/protocol/disco#info">
+              <identity category="client" type="bot" />
+              <feature var="urn:test:foo" />
+            </query>
+          </iq>
+        """)
+
+        self.xmpp['xep_0030'].add_feature('urn:test:bar')
+        self.xmpp['xep_0030'].del_feature(feature='urn:test:foo')
+
+        self.recv("""
+          <iq type="get" id="2">
+            <query xmlns="http://jabber.org/protocol/disco#info" />
+          </iq>
+        """)
+
+        self.send("""
+          <iq type="result" id="2">
+            <query xmlns="http://jabber.org/protocol/disco#info">
+              <identity category="client" type="bot" />
+              <feature var="urn:test:bar" />
+            </query>
+          </iq>
+        """)
+
 
 suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamDisco)
@@ -0,0 +1,77 @@
+import time
+
+import unittest
+from sleekxmpp.test import SleekTest
+
+
+class TestStreamMUC(SleekTest):
+
+    """
+    Test using the XEP-0045 plugin.
+    """
+
+    def setUp(self):
+        self.stream_start(mode='client',
+                          plugins=['xep_0030', 'xep_0045'])
+        self.muc = self.xmpp['xep_0045']
+        self.muc.joinMUC('room@muc.localhost', 'tester')
+        self.send("""
+          <presence to="room@muc.localhost/tester">
+            <x xmlns="http://jabber.org/protocol/muc">
+              <history maxchars="0" />
+            </x>
+          </presence>
+        """, use_values=False)
+
+    def tearDown(self):
+        self.stream_close()
+
+    def recv_occupant(self, nick, jid, role='participant',
+                      affiliation='none', ptype=None):
+        self.recv("""
+          <presence from="room@muc.localhost/%s" %s>
+            <x xmlns="http://jabber.org/protocol/muc#user">
+              <item affiliation="%s" role="%s" jid="%s" />
+            </x>
+          </presence>
+        """ % (nick, 'type="%s"' % ptype if ptype else '',
+               affiliation, role, jid))
+
+    def testOccupantIndexes(self):
+        """Test looking up occupants by real JID, role and affiliation."""
+        self.recv_occupant('alice', 'alice@localhost/a',
+                           role='moderator', affiliation='owner')
+        self.recv_occupant('bob', 'bob@localhost/b')
+        time.sleep(0.1)
+
+        room = 'room@muc.localhost'
+        self.assertTrue(self.muc.jidInRoom(room, 'bob@localhost/b'))
+        self.assertFalse(self.muc.jidInRoom(room, 'carol@localhost/c'))
+        self.assertEqual(self.muc.getNick(room, 'alice@localhost/a'), 'alice')
+        self.assertEqual(self.muc.getNicksByRole(room, 'moderator'),
+                         set(['alice']))
+        self.assertEqual(self.muc.getNicksByAffiliation(room, 'none'),
+                         set(['bob']))
+
+    def testOccupantChanges(self):
+        """Test that the indexes follow role changes and departures."""
+        self.recv_occupant('bob', 'bob@localhost/b')
+        self.recv_occupant('bob', 'bob@localhost/b', role='moderator')
+        time.sleep(0.1)
+
+        room = 'room@muc.localhost'
+        self.assertEqual(self.muc.getNicksByRole(room, 'participant'), set())
+        self.assertEqual(self.muc.getNicksByRole(room, 'moderator'),
+                         set(['bob']))
+
+        self.recv_occupant('bob', 'bob@localhost/b',
+                           role='none', ptype='unavailable')
+        time.sleep(0.1)
+
+        self.assertFalse(self.muc.jidInRoom(room, 'bob@localhost/b'))
+        self.assertEqual(self.muc.getNick(room, 'bob@localhost/b'), None)
+        self.assertEqual(self.muc.getNicksByRole(room, 'moderator'), set())
+        self.assertEqual(list(self.muc.getRoster(room)), [])
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamMUC)
@@ -1,9 +1,15 @@
+import os
+import shutil
+import tempfile
 import time
 import logging
 
 import unittest
+from sleekxmpp import JID
 from sleekxmpp.test import SleekTest
 from sleekxmpp.xmlstream import ElementBase, register_stanza_plugin
+from sleekxmpp.plugins.xep_0050.store import MemorySessionStore, \
+                                            SharedSessionStore
 
 
 class TestAdHocCommands(SleekTest):
@@ -781,4 +787,185 @@ class TestAdHocCommands(SleekTest):
 
 
 
-suite = unittest.TestLoader().loadTestsFromTestCase(TestAdHocCommands)
+class TestAdHocSessions(SleekTest):
+
+    """
+    Test storing and expiring ad-hoc command sessions.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.db = os.path.join(self.tempdir, 'sessions.db')
+
+    def tearDown(self):
+        self.stream_close()
+        shutil.rmtree(self.tempdir)
+
+    def session(self, jid='foo@bar/a', **kwargs):
+        session = {'from': JID(jid), 'payload': None, 'next': None}
+        session.update(kwargs)
+        return session
+
+    def testMemoryLimits(self):
+        """Test that the least recently used sessions are dropped."""
+        store = MemorySessionStore(max_sessions=3, max_per_jid=2)
+        store['1'] = self.session('a@x/1')
+        store['2'] = self.session('a@x/2')
+        store['3'] = self.session('b@x')
+        self.assertTrue(store.get('1') is not None)
+        store['4'] = self.session('a@x/3')
+        self.assertEqual(store.get('2'), None)
+        store['5'] = self.session('c@x')
+        self.assertEqual(store.get('3'), None)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(sorted(store.owners), ['a@x', 'c@x'])
+
+        del store['1']
+        self.assertFalse('1' in store)
+        self.assertRaises(KeyError, store.__delitem__, '1')
+
+    def testMemorySize(self):
+        """Test limiting the total size of stored sessions."""
+        store = MemorySessionStore(max_bytes=1000)
+        store['1'] = self.session(notes='x' * 600)
+        store['2'] = self.session(notes='x' * 100)
+        self.assertTrue(store.size > 700)
+        store['3'] = self.session(notes='x' * 600)
+        self.assertEqual(store.get('1'), None)
+        self.assertTrue(store.size <= 1000)
+        store.delete('2')
+        store.delete('3')
+        self.assertEqual(store.size, 0)
+
+    def testMemoryExpiry(self):
+        """Test dropping idle sessions."""
+        store = MemorySessionStore(idle_timeout=0.2)
+        store['1'] = self.session()
+        store['2'] = self.session()
+        time.sleep(0.1)
+        store.get('2')
+        time.sleep(0.15)
+        self.assertEqual(store.expire(), 1)
+        self.assertEqual(len(store), 1)
+        time.sleep(0.25)
+        self.assertEqual(store.get('2'), None)
+        self.assertEqual(store.owners, {})
+
+    def testSharedStore(self):
+        """Test sharing sessions between two stores."""
+        def step(form, session):
+            return session
+
+        form_store = SharedSessionStore(self.db)
+        self.stream_start(mode='client',
+                          plugins=['xep_0030', 'xep_0004', 'xep_0050'])
+        form = self.xmpp['xep_0004'].make_form('form')
+        form.add_field(var='foo', ftype='text-single', value='bar')
+
+        form_store.prep_handlers([step])
+        self.assertRaises(ValueError, form_store.set, '1',
+                          self.session(next=lambda form, session: None))
+        form_store['1'] = self.session(payload=form, next=step,
+                                       payload_classes=set([form.__class__]))
+
+        other = SharedSessionStore(self.db, max_per_jid=1)
+        other.prep_handlers([step])
+        session = other['1']
+        self.assertTrue(session['next'] is step)
+        self.assertEqual(session['from'], JID('foo@bar/a'))
+        self.assertEqual(session['payload'].get_values(), {'foo': 'bar'})
+        self.assertEqual(session['payload_classes'], set([form.__class__]))
+
+        other['2'] = self.session()
+        self.assertEqual(form_store.get('1'), None)
+        self.assertEqual(len(form_store), 1)
+        form_store.close()
+        other.close()
+
+    def testSharedUntrusted(self):
+        """Test that stored sessions cannot name arbitrary globals."""
+        store = SharedSessionStore(self.db)
+        store.db.execute('INSERT INTO adhoc_sessions '
+                         '(id, owner, data, size, used) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         ('1', '', b"cos\nsystem\n(S'false'\ntR.", 0,
+                          time.time()))
+        store.db.commit()
+        self.assertEqual(store.get('1'), None)
+        self.assertEqual(len(store), 0)
+        store.close()
+
+    def testSharedExpiry(self):
+        """Test dropping idle sessions from a shared store."""
+        store = SharedSessionStore(self.db, idle_timeout=0.2)
+        store['1'] = self.session()
+        store['2'] = self.session()
+        time.sleep(0.1)
+        store.get('2')
+        time.sleep(0.15)
+        self.assertEqual(store.expire(), 1)
+        self.assertEqual(len(store), 1)
+        store.close()
+
+    def testExpiredSession(self):
+        """Test continuing a command whose session has expired."""
+        self.stream_start(mode='client',
+                          plugins=['xep_0030', 'xep_0004', 'xep_0050'],
+                          plugin_config={
+                              'xep_0050': {'session_timeout': 0.2}})
+        self.xmpp['xep_0050'].new_session = lambda: '_sessionid_'
+
+        def handle_command(iq, session):
+            session['payload'] = None
+            session['next'] = lambda form, session: None
+            session['has_next'] = True
+            return session
+
+        self.xmpp['xep_0050'].add_command('tester@localhost', 'foo',
+                                          'Do Foo', handle_command)
+        self.recv("""
+          <iq id="11" type="set" to="tester@localhost" from="foo@bar">
+            <command xmlns="http://jabber.org/protocol/commands"
+                     node="foo"
+                     action="execute" />
+          </iq>
+        """)
+        self.send("""
+          <iq id="11" type="result" to="foo@bar">
+            <command xmlns="http://jabber.org/protocol/commands"
+                     node="foo"
+                     status="executing"
+                     sessionid="_sessionid_">
+              <actions>
+                <next />
+              </actions>
+            </command>
+          </iq>
+        """)
+        self.assertEqual(len(self.xmpp['xep_0050'].sessions), 1)
+
+        time.sleep(0.3)
+        self.xmpp['xep_0050']._expire_sessions()
+        self.assertEqual(len(self.xmpp['xep_0050'].sessions), 0)
+
+        self.recv("""
+          <iq id="12" type="set" to="tester@localhost" from="foo@bar">
+            <command xmlns="http://jabber.org/protocol/commands"
+                     node="foo"
+                     action="next"
+                     sessionid="_sessionid_" />
+          </iq>
+        """)
+        # Other tests may have enabled legacy error codes, so only
+        # check for the condition.
+        sent = self.xmpp.socket.next_sent(timeout=1)
+        if isinstance(sent, bytes):
+            sent = sent.decode('utf-8')
+        self.assertTrue(sent is not None and 'type="error"' in sent,
+                        'Error not sent: %s' % sent)
+        self.assertTrue('<item-not-found' in sent, sent)
+
+
+suite = unittest.TestSuite([
+    unittest.TestLoader().loadTestsFromTestCase(TestAdHocCommands),
+    unittest.TestLoader().loadTestsFromTestCase(TestAdHocSessions)])
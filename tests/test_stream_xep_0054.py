@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import time
+
+import unittest
+from sleekxmpp.test import SleekTest
+from sleekxmpp.xmlstream import tostring
+from sleekxmpp.plugins.xep_0054 import VCardTemp
+from sleekxmpp.plugins.xep_0054.cache import VCardCache
+
+
+def make_vcard(name):
+    vcard = VCardTemp()
+    vcard['FN'] = name
+    return vcard
+
+
+class TestVCardCache(SleekTest):
+
+    """
+    Test keeping vCards of other entities within size and age limits.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.dir, 'vcards.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testRehydrate(self):
+        """Test that each lookup returns a fresh stanza object."""
+        cache = VCardCache()
+        cache.set('alice@example.com', make_vcard('Alice'))
+        first = cache.get('alice@example.com')
+        first['FN'] = 'Changed'
+        self.assertEqual(cache.get('alice@example.com')['FN'], 'Alice')
+        self.assertEqual(cache.get('bob@example.com'), None)
+
+    def testSizeLimit(self):
+        """Test that the least recently used vCards are evicted."""
+        entry_size = len(tostring(make_vcard('A').xml))
+        cache = VCardCache(max_bytes=2 * entry_size)
+
+        cache.set('a@example.com', make_vcard('A'))
+        cache.set('b@example.com', make_vcard('B'))
+        cache.get('a@example.com')
+        cache.set('c@example.com', make_vcard('C'))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b@example.com'), None)
+        self.assertEqual(cache.get('a@example.com')['FN'], 'A')
+        self.assertEqual(cache.size, sum(len(xml) for _, xml in
+                                         cache.entries.values()))
+
+    def testTTL(self):
+        """Test that old vCards are discarded."""
+        cache = VCardCache(ttl=0.1, db=self.db)
+        cache.set('alice@example.com', make_vcard('Alice'))
+        self.assertEqual(cache.get('alice@example.com')['FN'], 'Alice')
+        time.sleep(0.2)
+        self.assertEqual(cache.get('alice@example.com'), None)
+        cache.close()
+
+    def testPersistence(self):
+        """Test reloading vCards from the backing database."""
+        cache = VCardCache(db=self.db)
+        cache.set('alice@example.com', make_vcard('Alice'))
+        cache.close()
+
+        cache = VCardCache(db=self.db)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('alice@example.com')['FN'], 'Alice')
+        self.assertEqual(len(cache), 1)
+        cache.delete('alice@example.com')
+        cache.close()
+
+        cache = VCardCache(db=self.db)
+        self.assertEqual(cache.get('alice@example.com'), None)
+        cache.close()
+
+
+class TestVCardStream(SleekTest):
+
+    """
+    Test the XEP-0054 plugin's use of the vCard cache.
+    """
+
+    def setUp(self):
+        self.stream_start(mode='client', plugins=['xep_0030', 'xep_0054'])
+
+    def tearDown(self):
+        self.stream_close()
+
+    def testCacheResult(self):
+        """Test that received vCards are served from the cache."""
+        self.xmpp['xep_0054'].get_vcard('alice@example.com', block=False)
+        self.send("""
+          <iq type="get" id="1" to="alice@example.com">
+            <vCard xmlns="vcard-temp" />
+          </iq>
+        """)
+        self.recv("""
+          <iq type="result" id="1" from="alice@example.com"
+              to="tester@localhost">
+            <vCard xmlns="vcard-temp"><FN>Alice</FN></vCard>
+          </iq>
+        """)
+        time.sleep(0.1)
+
+        iq = self.xmpp['xep_0054'].get_vcard('alice@example.com',
+                                             cached=True)
+        self.assertEqual(iq['vcard_temp']['FN'], 'Alice')
+        self.send(None)
+
+    def testOwnVCard(self):
+        """Test that our own vCard is kept as published."""
+        vcard = make_vcard('Tester')
+        self.xmpp['xep_0054'].api['set_vcard'](self.xmpp.boundjid,
+                                                args=vcard)
+        self.assertTrue(self.xmpp['xep_0054'].api['get_vcard'](
+                self.xmpp.boundjid) is vcard)
+        self.assertEqual(len(self.xmpp['xep_0054'].cache), 0)
+
+
+suite = unittest.TestSuite([
+    unittest.TestLoader().loadTestsFromTestCase(TestVCardCache),
+    unittest.TestLoader().loadTestsFromTestCase(TestVCardStream)])
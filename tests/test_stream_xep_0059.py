@@ -2,9 +2,10 @@ import threading
 
 import unittest
 from sleekxmpp.test import SleekTest
+from sleekxmpp.exceptions import IqTimeout
 from sleekxmpp.xmlstream import register_stanza_plugin
 from sleekxmpp.plugins.xep_0030 import DiscoItems
-from sleekxmpp.plugins.xep_0059 import ResultIterator, Set
+from sleekxmpp.plugins.xep_0059 import ResultIterator, PrefetchIterator, Set
 
 
 class TestStreamSet(SleekTest):
@@ -160,4 +161,143 @@ class TestStreamSet(SleekTest):
         self.failUnless(self.items == ['item2', 'item1'])
 
 
+    def testPrefetchIterator(self):
+        """Test fetching the next page while the current one is used."""
+        self.items = []
+        self.stream_start(mode='client')
+
+        q = self.xmpp.Iq()
+        q['type'] = 'get'
+        it = PrefetchIterator(q, 'disco_items', 'items', amount=1)
+        proceed = threading.Event()
+
+        def consume():
+            for item in it.items():
+                self.items.append(item[0])
+                proceed.wait()
+
+        t = threading.Thread(target=consume)
+        t.start()
+
+        self.send("""
+          <iq type="get" id="2">
+            <query xmlns="http://jabber.org/protocol/disco#items">
+              <set xmlns="http://jabber.org/protocol/rsm">
+                <max>1</max>
+              </set>
+            </query>
+          </iq>
+        """)
+        self.recv("""
+          <iq type="result" id="2">
+            <query xmlns="http://jabber.org/protocol/disco#items">
+              <item jid="item1" />
+              <set xmlns="http://jabber.org/protocol/rsm">
+                <first index="0">item1</first>
+                <last>item1</last>
+                <count>2</count>
+              </set>
+            </query>
+          </iq>
+        """)
+        # The next page is requested before the first one is consumed.
+        self.send("""
+          <iq type="get" id="3">
+            <query xmlns="http://jabber.org/protocol/disco#items">
+              <set xmlns="http://jabber.org/protocol/rsm">
+                <max>1</max>
+                <after>item1</after>
+              </set>
+            </query>
+          </iq>
+        """)
+        self.recv("""
+          <iq type="result" id="3">
+            <query xmlns="http://jabber.org/protocol/disco#items">
+              <item jid="item2" />
+              <set xmlns="http://jabber.org/protocol/rsm">
+                <first index="1">item2</first>
+                <last>item2</last>
+                <count>2</count>
+              </set>
+            </query>
+          </iq>
+        """)
+        self.send(None)
+
+        proceed.set()
+        t.join(timeout=2)
+        self.assertFalse(t.is_alive(), "Iteration did not end.")
+        self.assertEqual(self.items, ['item1', 'item2'])
+
+    def testPrefetchInHandler(self):
+        """Test iterating from a non-threaded event handler."""
+        self.items = []
+        self.stream_start(mode='client')
+        done = threading.Event()
+
+        q = self.xmpp.Iq()
+        q['type'] = 'get'
+        it = PrefetchIterator(q, 'disco_items', 'items', amount=1)
+
+        def iterate(event):
+            for item in it.items():
+                self.items.append(item[0])
+            done.set()
+
+        self.xmpp.add_event_handler('iterate', iterate)
+        self.xmpp.event('iterate')
+
+        self.send("""
+          <iq type="get" id="2">
+            <query xmlns="http://jabber.org/protocol/disco#items">
+              <set xmlns="http://jabber.org/protocol/rsm">
+                <max>1</max>
+              </set>
+            </query>
+          </iq>
+        """)
+        self.recv("""
+          <iq type="result" id="2">
+            <query xmlns="http://jabber.org/protocol/disco#items">
+              <item jid="item1" />
+              <set xmlns="http://jabber.org/protocol/rsm">
+                <first index="0">item1</first>
+                <last>item1</last>
+                <count>1</count>
+              </set>
+            </query>
+          </iq>
+        """)
+        done.wait(2)
+        self.assertTrue(done.is_set(), "Iteration did not end.")
+        self.assertEqual(self.items, ['item1'])
+
+    def testPrefetchTimeout(self):
+        """Test that a page that never arrives raises IqTimeout."""
+        self.stream_start(mode='client')
+        errors = []
+        done = threading.Event()
+
+        q = self.xmpp.Iq()
+        q['type'] = 'get'
+        it = PrefetchIterator(q, 'disco_items', 'items', amount=1,
+                              timeout=0.2)
+
+        def iterate(event):
+            try:
+                next(it)
+            except IqTimeout as e:
+                errors.append(e.iq['id'])
+            try:
+                next(it)
+            except StopIteration:
+                errors.append('stop')
+            done.set()
+
+        self.xmpp.add_event_handler('iterate', iterate)
+        self.xmpp.event('iterate')
+        done.wait(2)
+        self.assertEqual(errors, ['2', 'stop'])
+
 suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamSet)
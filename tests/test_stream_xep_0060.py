@@ -1,3 +1,4 @@
+import time
 import threading
 
 import unittest
@@ -790,4 +791,59 @@ class TestStreamPubsub(SleekTest):
         """)
 
 
+    items_notification = """
+      <message from="pubsub.example.com" to="tester@localhost">
+        <event xmlns="http://jabber.org/protocol/pubsub#event">
+          <items node="blog">
+            <item id="a" publisher="user@example.com">
+              <entry xmlns="http://www.w3.org/2005/Atom" />
+            </item>
+            <item id="b" />
+            <retract id="c" />
+          </items>
+        </event>
+      </message>
+    """
+
+    def testItemsEvent(self):
+        """Test receiving a batch of items in a single event."""
+        events = []
+        published = []
+        self.xmpp['xep_0060'].map_node_event('blog', 'blog')
+        self.xmpp.add_event_handler('pubsub_items', events.append)
+        self.xmpp.add_event_handler('blog_items', events.append)
+        self.xmpp.add_event_handler('blog_publish', published.append)
+
+        self.recv(self.items_notification)
+        time.sleep(0.1)
+
+        self.assertEqual(len(events), 2)
+        self.assertTrue(events[0] is events[1])
+        self.assertEqual(events[0].node, 'blog')
+        self.assertEqual([(i.type, i.id) for i in events[0].items],
+                         [('publish', 'a'), ('publish', 'b'),
+                          ('retract', 'c')])
+        self.assertEqual(events[0].items[0].publisher, 'user@example.com')
+        self.assertEqual(events[0].items[0].payload.tag,
+                         '{http://www.w3.org/2005/Atom}entry')
+        self.assertEqual(events[0].items[1].payload, None)
+        self.assertEqual(published, [],
+                "Per item events raised without being enabled.")
+
+    def testPerItemEvents(self):
+        """Test opting in to events for each item of a batch."""
+        published = []
+        retracted = []
+        self.xmpp['xep_0060'].per_item_events = True
+        self.xmpp['xep_0060'].map_node_event('blog', 'blog')
+        self.xmpp.add_event_handler('blog_publish', published.append)
+        self.xmpp.add_event_handler('blog_retract', retracted.append)
+
+        self.recv(self.items_notification)
+        time.sleep(0.1)
+
+        self.assertEqual([list(msg['pubsub_event']['items'])[0]['id']
+                          for msg in published], ['a', 'b'])
+        self.assertEqual(len(retracted), 1)
+
 suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamPubsub)
@@ -0,0 +1,190 @@
+import os
+import time
+import tempfile
+
+import unittest
+from sleekxmpp.test import SleekTest
+
+
+class TestStreamCaps(SleekTest):
+
+    """
+    Test using the XEP-0115 plugin.
+    """
+
+    ver = 'QgayPKawpkPSDYmwT/WM94uAlu0='
+
+    caps_presence = """
+      <presence from="%s">
+        <c xmlns="http://jabber.org/protocol/caps"
+           hash="sha-1"
+           node="http://code.google.com/p/exodus"
+           ver="QgayPKawpkPSDYmwT/WM94uAlu0=" />
+      </presence>
+    """
+
+    caps_query = """
+      <iq type="get" id="%s" to="%s">
+        <query xmlns="http://jabber.org/protocol/disco#info"
+               node="http://code.google.com/p/exodus#QgayPKawpkPSDYmwT/WM94uAlu0=" />
+      </iq>
+    """
+
+    caps_result = """
+      <iq type="result" id="%s" from="%s" to="tester@localhost">
+        <query xmlns="http://jabber.org/protocol/disco#info"
+               node="http://code.google.com/p/exodus#QgayPKawpkPSDYmwT/WM94uAlu0=">
+          <identity category="client" type="pc" name="Exodus 0.9.1" />
+          <feature var="http://jabber.org/protocol/caps" />
+          <feature var="http://jabber.org/protocol/disco#info" />
+          <feature var="http://jabber.org/protocol/disco#items" />
+          <feature var="http://jabber.org/protocol/muc" />
+        </query>
+      </iq>
+    """
+
+    def setUp(self):
+        fd, self.db = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+
+    def tearDown(self):
+        self.stream_close()
+        os.remove(self.db)
+
+    def wait_for_verstring(self, jid, timeout=1):
+        end = time.time() + timeout
+        ver = None
+        while ver is None and time.time() < end:
+            ver = self.xmpp['xep_0115'].get_verstring(jid)
+            if ver is None:
+                time.sleep(0.01)
+        return ver
+
+    def testCoalesceVerification(self):
+        """Test that a verstring is only queried once at a time."""
+        self.stream_start(mode='client',
+                          plugins=['xep_0030', 'xep_0115'])
+
+        self.recv(self.caps_presence % 'a@localhost/x')
+        self.send(self.caps_query % ('1', 'a@localhost/x'))
+
+        self.recv(self.caps_presence % 'b@localhost/y')
+        self.send(None)
+
+        self.recv(self.caps_result % ('1', 'a@localhost/x'))
+
+        self.assertEqual(self.wait_for_verstring('a@localhost/x'), self.ver)
+        self.assertEqual(self.wait_for_verstring('b@localhost/y'), self.ver)
+
+    def testPersistentCaps(self):
+        """Test reusing verified caps stored by a previous session."""
+        self.stream_start(mode='client',
+                          plugins=['xep_0030', 'xep_0115'],
+                          plugin_config={'xep_0115': {'caps_db': self.db}})
+
+        self.recv(self.caps_presence % 'a@localhost/x')
+        self.send(self.caps_query % ('1', 'a@localhost/x'))
+        self.recv(self.caps_result % ('1', 'a@localhost/x'))
+        self.assertEqual(self.wait_for_verstring('a@localhost/x'), self.ver)
+
+        self.stream_close()
+        self.stream_start(mode='client',
+                          plugins=['xep_0030', 'xep_0115'],
+                          plugin_config={'xep_0115': {'caps_db': self.db}})
+
+        self.recv(self.caps_presence % 'b@localhost/y')
+        self.send(None)
+        self.assertEqual(self.wait_for_verstring('b@localhost/y'), self.ver)
+
+        caps = self.xmpp['xep_0115'].get_caps('b@localhost/y')
+        self.assertTrue('http://jabber.org/protocol/muc' in caps['features'],
+                "Cached caps were not restored: %s" % caps)
+
+    def testPersistentAssignments(self):
+        """Test that only changed assignments are written, per bare JID."""
+        self.stream_start(mode='client',
+                          plugins=['xep_0030', 'xep_0115'],
+                          plugin_config={'xep_0115': {'caps_db': self.db}})
+        caps = self.xmpp['xep_0115']
+        store = caps.static
+
+        for i in range(3):
+            caps.assign_verstring('a@localhost/x', 'v1')
+        self.assertEqual(store._pending, {'a@localhost': ('x', 'v1')})
+        store.flush()
+        self.assertEqual(store._pending, {})
+        caps.assign_verstring('a@localhost/x', 'v1')
+        self.assertEqual(store._pending, {})
+
+        caps.assign_verstring('a@localhost/y', 'v1')
+        store.flush()
+        rows = store.db.execute('SELECT jid, resource, ver '
+                                'FROM contact_vers').fetchall()
+        self.assertEqual([tuple(row) for row in rows],
+                         [('a@localhost', 'y', 'v1')])
+
+        store.jid_vers.clear()
+        store._contacts.clear()
+        self.assertEqual(caps.get_verstring('a@localhost/y'), 'v1')
+        self.assertEqual(caps.get_verstring('a@localhost/x'), None)
+
+    def testLocalVerstringCached(self):
+        """Test that our verstring is only regenerated after changes."""
+        self.stream_start(mode='client',
+                          plugins=['xep_0030', 'xep_0115'])
+
+        caps = self.xmpp['xep_0115']
+        generated = []
+        generate_verstring = caps.generate_verstring
+
+        def counting_generate(info, hash):
+            ver = generate_verstring(info, hash)
+            generated.append(ver)
+            return ver
+        caps.generate_verstring = counting_generate
+
+        caps_presence = """
+          <presence>
+            <c xmlns="http://jabber.org/protocol/caps"
+               hash="sha-1"
+               node="%s"
+               ver="%s" />
+          </presence>
+        """
+
+        self.xmpp['xep_0030'].add_feature('urn:test:foo')
+        caps.update_caps()
+        ver = caps.get_verstring()
+        self.send(caps_presence % (caps.caps_node, ver))
+
+        caps.update_caps()
+        self.send(caps_presence % (caps.caps_node, ver))
+        self.assertEqual(generated, [ver],
+                "Verstring regenerated without changes: %s" % generated)
+
+        self.xmpp['xep_0030'].add_feature('urn:test:bar')
+        caps.update_caps()
+        new_ver = caps.get_verstring()
+        self.send(caps_presence % (caps.caps_node, new_ver))
+        self.assertEqual(generated, [ver, new_ver],
+                "Verstring not regenerated after changes: %s" % generated)
+        self.assertNotEqual(ver, new_ver)
+
+    def testUpdateCapsMany(self):
+        """Test updating the caps for many component JIDs at once."""
+        self.stream_start(mode='component',
+                          jid='tester.localhost',
+                          plugins=['xep_0030', 'xep_0115'])
+
+        jids = ['user%s@tester.localhost' % i for i in range(5)]
+        for jid in jids:
+            self.xmpp['xep_0030'].add_feature('urn:test:foo', jid=jid)
+        self.xmpp['xep_0115'].update_caps_many(jids)
+
+        vers = set(self.xmpp['xep_0115'].get_verstring(jid) for jid in jids)
+        self.assertEqual(len(vers), 1,
+                "Unexpected verstrings: %s" % vers)
+        self.assertFalse(None in vers)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamCaps)
@@ -0,0 +1,229 @@
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import unittest
+from sleekxmpp.test import SleekTest
+from sleekxmpp.plugins.xep_0153.store import AvatarStore
+
+
+AVATAR = b'not really a png'
+AVATAR_HASH = hashlib.sha1(AVATAR).hexdigest()
+AVATAR_B64 = base64.b64encode(AVATAR).decode('ascii')
+
+
+class TestAvatarFetching(SleekTest):
+
+    """
+    Test fetching vCard avatars advertised in presence.
+    """
+
+    def setUp(self):
+        self.stream_start(mode='client',
+                          plugins=['xep_0030', 'xep_0054', 'xep_0153'])
+        self.avatars = self.xmpp['xep_0153']
+
+    def tearDown(self):
+        self.stream_close()
+
+    def recv_presence(self, jid, photo):
+        self.recv("""
+          <presence from="%s" to="tester@localhost">
+            <x xmlns="vcard-temp:x:update"><photo>%s</photo></x>
+          </presence>
+        """ % (jid, photo))
+
+    def send_vcard_request(self, jid, id):
+        self.send("""
+          <iq type="get" id="%s" to="%s"><vCard xmlns="vcard-temp" /></iq>
+        """ % (id, jid))
+
+    def recv_vcard(self, jid, id):
+        self.recv("""
+          <iq type="result" id="%s" from="%s" to="tester@localhost">
+            <vCard xmlns="vcard-temp">
+              <PHOTO><TYPE>image/png</TYPE><BINVAL>%s</BINVAL></PHOTO>
+            </vCard>
+          </iq>
+        """ % (id, jid, AVATAR_B64))
+
+    def testFetch(self):
+        """Test fetching and storing an unknown avatar."""
+        self.recv_presence('alice@example.com/a', AVATAR_HASH)
+        self.send_vcard_request('alice@example.com', '1')
+        self.recv_vcard('alice@example.com', '1')
+        time.sleep(0.1)
+
+        self.assertEqual(self.avatars.get_avatar('alice@example.com'),
+                         ('image/png', AVATAR))
+
+    def testUpdateEvent(self):
+        """Test that the update event fires once the avatar is stored."""
+        updates = []
+
+        def on_update(pres):
+            updates.append(self.avatars.get_avatar(pres['from']))
+
+        self.xmpp.add_event_handler('vcard_avatar_update', on_update)
+        self.recv_presence('alice@example.com/a', AVATAR_HASH)
+        self.send_vcard_request('alice@example.com', '1')
+        time.sleep(0.1)
+        self.assertEqual(updates, [])
+
+        self.recv_vcard('alice@example.com', '1')
+        time.sleep(0.1)
+        self.assertEqual(updates, [('image/png', AVATAR)])
+
+    def testRefetchDropped(self):
+        """Test fetching again an avatar dropped from memory."""
+        self.recv_presence('alice@example.com/a', AVATAR_HASH)
+        self.send_vcard_request('alice@example.com', '1')
+        self.recv_vcard('alice@example.com', '1')
+        time.sleep(0.1)
+
+        self.avatars.store.add_avatar('0' * 40, 'image/png',
+                                      b'x' * self.avatars.store.max_bytes)
+        self.assertEqual(self.avatars.get_avatar('alice@example.com'), None)
+        self.send_vcard_request('alice@example.com', '2')
+
+    def testDeduplicate(self):
+        """Test that repeated presences share a single fetch."""
+        self.recv_presence('alice@example.com/a', AVATAR_HASH)
+        self.recv_presence('alice@example.com/b', AVATAR_HASH)
+        self.send_vcard_request('alice@example.com', '1')
+        self.send(None)
+
+    def testKnownAvatar(self):
+        """Test that a known avatar is not fetched again."""
+        self.recv_presence('alice@example.com/a', AVATAR_HASH)
+        self.send_vcard_request('alice@example.com', '1')
+        self.recv_vcard('alice@example.com', '1')
+        time.sleep(0.1)
+
+        self.recv_presence('bob@example.com/b', AVATAR_HASH)
+        self.send(None)
+        self.assertEqual(self.avatars.get_avatar('bob@example.com'),
+                         ('image/png', AVATAR))
+
+    def testConcurrencyLimit(self):
+        """Test that fetches beyond max_fetches wait their turn."""
+        self.avatars.max_fetches = 1
+        self.recv_presence('alice@example.com/a', AVATAR_HASH)
+        self.recv_presence('bob@example.com/b', 'b' * 40)
+        self.send_vcard_request('alice@example.com', '1')
+        self.send(None)
+
+        self.recv_vcard('alice@example.com', '1')
+        self.send_vcard_request('bob@example.com', '2')
+
+    def testNoAvatar(self):
+        """Test that an empty photo does not cause a fetch."""
+        self.recv_presence('alice@example.com/a', '')
+        self.send(None)
+
+    def testHashCached(self):
+        """Test that stored hashes are only looked up once."""
+        self.avatars.store.set_hash('alice@example.com', AVATAR_HASH)
+        lookups = []
+        get_hash = self.avatars.store.get_hash
+
+        def counting_get_hash(jid):
+            lookups.append(jid)
+            return get_hash(jid)
+
+        self.avatars.store.get_hash = counting_get_hash
+        for i in range(3):
+            self.recv_presence('alice@example.com/a', AVATAR_HASH)
+            self.recv("""
+              <presence from="bob@example.com/b" to="tester@localhost" />
+            """)
+        self.send(None)
+        self.assertEqual(sorted(lookups),
+                         ['alice@example.com', 'bob@example.com'])
+
+    def testAdvertiseOwnHash(self):
+        """Test advertising our own avatar hash in presence."""
+        self.avatars.api['set_hash'](self.xmpp.boundjid, args=AVATAR_HASH)
+        self.xmpp.send_presence()
+        self.send("""
+          <presence>
+            <x xmlns="vcard-temp:x:update"><photo>%s</photo></x>
+          </presence>
+        """ % AVATAR_HASH)
+
+        self.avatars.api['set_hash'](self.xmpp.boundjid, args='')
+        self.xmpp.send_presence()
+        self.send("""
+          <presence>
+            <x xmlns="vcard-temp:x:update"><photo /></x>
+          </presence>
+        """, use_values=False)
+
+
+class TestAvatarStore(SleekTest):
+
+    """
+    Test keeping avatars in an SQLite database.
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.dir, 'avatars.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testPersistence(self):
+        """Test that avatars and hashes survive a restart."""
+        store = AvatarStore(self.db)
+        store.add_avatar(AVATAR_HASH, 'image/png', AVATAR)
+        store.set_hash('alice@example.com', AVATAR_HASH)
+        store.close()
+
+        store = AvatarStore(self.db)
+        self.assertTrue(store.has_avatar(AVATAR_HASH))
+        self.assertFalse(store.has_avatar('0' * 40))
+        self.assertEqual(store.get_avatar(AVATAR_HASH), ('image/png', AVATAR))
+        self.assertEqual(store.get_hash('alice@example.com'), AVATAR_HASH)
+        store.set_hash('alice@example.com', None)
+        self.assertEqual(store.get_hash('alice@example.com'), None)
+        store.close()
+
+    def testMemoryLimit(self):
+        """Test that images kept in memory are bounded."""
+        store = AvatarStore(max_bytes=25)
+        store.add_avatar('a', 'image/png', b'a' * 10)
+        store.add_avatar('b', 'image/png', b'b' * 10)
+        store.get_avatar('a')
+        store.add_avatar('c', 'image/png', b'c' * 10)
+        self.assertFalse(store.has_avatar('b'))
+        self.assertEqual(store.get_avatar('a'), ('image/png', b'a' * 10))
+        self.assertTrue(store.has_avatar('c'))
+        self.assertEqual(store.size, 20)
+        store.close()
+
+    def testCoalesceHashes(self):
+        """Test that hash changes are written together on flush."""
+        store = AvatarStore(self.db)
+        store.set_hash('alice@example.com', '1' * 40)
+        store.set_hash('alice@example.com', AVATAR_HASH)
+        store.set_hash('bob@example.com', AVATAR_HASH)
+        store.set_hash('bob@example.com', None)
+        self.assertEqual(store.pending, 2)
+        self.assertEqual(store.get_hash('alice@example.com'), AVATAR_HASH)
+        self.assertEqual(store._query('SELECT COUNT(*) FROM jid_hashes',
+                                      ())[0], 0)
+        store.flush()
+        self.assertEqual(store.pending, 0)
+        self.assertEqual(store._query('SELECT jid, hash FROM jid_hashes',
+                                      ()),
+                         ('alice@example.com', AVATAR_HASH))
+        store.close()
+
+
+suite = unittest.TestSuite([
+    unittest.TestLoader().loadTestsFromTestCase(TestAvatarFetching),
+    unittest.TestLoader().loadTestsFromTestCase(TestAvatarStore)])
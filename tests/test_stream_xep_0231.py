@@ -0,0 +1,192 @@
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import unittest
+from sleekxmpp.test import SleekTest
+from sleekxmpp.plugins.xep_0231.store import BobStore
+
+
+DATA = b'not really a png'
+DATA_B64 = base64.b64encode(DATA).decode('ascii')
+CID = 'sha1+%s@bob.xmpp.org' % hashlib.sha1(DATA).hexdigest()
+
+
+class TestBobStore(SleekTest):
+
+    """
+    Test storing Bits of Binary data.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def testSharedContent(self):
+        """Test that identical data is stored once."""
+        store = BobStore()
+        store.set('a', 'image/png', DATA)
+        store.set('b', 'image/png', DATA)
+        self.assertEqual(store.memory_size, len(DATA))
+        mtype, data, max_age = store.get('a')
+        self.assertTrue(isinstance(data, memoryview))
+        self.assertEqual(data.tobytes(), DATA)
+        store.delete('a')
+        self.assertEqual(store.memory_size, len(DATA))
+        store.delete('b')
+        self.assertEqual(store.memory_size, 0)
+        self.assertEqual(store.get('b'), None)
+
+    def testCapacity(self):
+        """Test that unpinned data is dropped once over capacity."""
+        store = BobStore(max_bytes=15)
+        store.set('own', 'text/plain', b'x' * 10, pinned=True)
+        store.set('a', 'text/plain', b'a' * 10)
+        store.set('b', 'text/plain', b'b' * 10)
+        self.assertEqual(store.get('a'), None)
+        store.set('c', 'text/plain', b'c' * 10)
+        self.assertEqual(store.get('b'), None)
+        self.assertTrue('own' in store)
+        self.assertTrue('c' in store)
+        self.assertEqual(store.memory_size, 20)
+
+    def testPinnedCapacity(self):
+        """Test that pinned data does not count against the capacity."""
+        store = BobStore(max_bytes=100)
+        store.set('own', 'text/plain', b'x' * 150, pinned=True)
+        store.set('r1', 'text/plain', b'a' * 10)
+        self.assertNotEqual(store.get('r1'), None)
+        self.assertEqual(store.pinned_memory_size, 150)
+        store.delete('own')
+        self.assertEqual(store.pinned_memory_size, 0)
+        self.assertEqual(store.memory_size, 10)
+
+    def testExpiry(self):
+        """Test dropping data older than its TTL."""
+        store = BobStore()
+        store.set('a', 'text/plain', b'a', max_age=0, ttl=0.1)
+        store.set('b', 'text/plain', b'b', ttl=5)
+        store.set('c', 'text/plain', b'c')
+        self.assertEqual(store.get('a')[2], 0)
+        time.sleep(0.2)
+        self.assertEqual(store.expire(), 1)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.memory_size, 2)
+
+    def testSpill(self):
+        """Test keeping large data on disk."""
+        store = BobStore(directory=self.tempdir, spill_size=10,
+                         max_disk_bytes=40)
+        store.set('small', 'text/plain', b's')
+        store.set('a', 'text/plain', b'a' * 30)
+        self.assertEqual(store.memory_size, 1)
+        self.assertEqual(store.disk_size, 30)
+        self.assertEqual(len(os.listdir(self.tempdir)), 1)
+
+        data = store.get('a')[1]
+        self.assertTrue(isinstance(data, memoryview))
+        self.assertEqual(data.tobytes(), b'a' * 30)
+        del data
+
+        store.set('b', 'text/plain', b'b' * 30)
+        self.assertEqual(store.get('a'), None)
+        self.assertEqual(store.disk_size, 30)
+        self.assertEqual(len(os.listdir(self.tempdir)), 1)
+        store.clear()
+        self.assertEqual(os.listdir(self.tempdir), [])
+
+
+class TestBitsOfBinary(SleekTest):
+
+    """
+    Test serving and caching Bits of Binary data.
+    """
+
+    def setUp(self):
+        self.stream_start(mode='client', plugins=['xep_0030', 'xep_0231'])
+        self.bob = self.xmpp['xep_0231']
+
+    def tearDown(self):
+        self.stream_close()
+
+    def testServe(self):
+        """Test serving published data."""
+        cid = self.bob.set_bob(DATA, 'image/png', max_age=0)
+        self.assertEqual(cid, CID)
+        self.assertEqual(self.bob.get_bob_data(cid)[1].tobytes(), DATA)
+
+        self.recv("""
+          <iq type="get" id="1" from="foo@bar/a" to="tester@localhost">
+            <data xmlns="urn:xmpp:bob" cid="%s" />
+          </iq>
+        """ % CID)
+        self.send("""
+          <iq type="result" id="1" to="foo@bar/a">
+            <data xmlns="urn:xmpp:bob" cid="%s" type="image/png"
+                  max-age="0">%s</data>
+          </iq>
+        """ % (CID, DATA_B64), use_values=False)
+
+        self.recv("""
+          <iq type="get" id="2" from="foo@bar/a" to="tester@localhost">
+            <data xmlns="urn:xmpp:bob" cid="missing@bob.xmpp.org" />
+          </iq>
+        """)
+        sent = self.xmpp.socket.next_sent(timeout=1)
+        if isinstance(sent, bytes):
+            sent = sent.decode('utf-8')
+        self.assertTrue(sent is not None and '<item-not-found' in sent,
+                        'Error not sent: %s' % sent)
+
+    def testCacheReceived(self):
+        """Test caching received data according to its max age."""
+        self.recv("""
+          <message from="foo@bar/a" to="tester@localhost">
+            <data xmlns="urn:xmpp:bob" cid="a@bob.xmpp.org"
+                  type="image/png" max-age="86400">%s</data>
+          </message>
+        """ % DATA_B64)
+        self.recv("""
+          <message from="foo@bar/a" to="tester@localhost">
+            <data xmlns="urn:xmpp:bob" cid="b@bob.xmpp.org"
+                  type="image/png" max-age="0">%s</data>
+          </message>
+        """ % DATA_B64)
+        time.sleep(0.1)
+
+        self.assertTrue('a@bob.xmpp.org' in self.bob.store)
+        self.assertFalse('b@bob.xmpp.org' in self.bob.store)
+        self.assertFalse(self.bob.store.entries['a@bob.xmpp.org'][4])
+
+    def testCacheWithPublished(self):
+        """Test caching received data after publishing a lot of our own."""
+        self.bob.store.max_bytes = 100
+        self.bob.set_bob(b'x' * 150, 'text/plain')
+        self.recv("""
+          <message from="foo@bar/a" to="tester@localhost">
+            <data xmlns="urn:xmpp:bob" cid="a@bob.xmpp.org"
+                  type="image/png" max-age="86400">%s</data>
+          </message>
+        """ % DATA_B64)
+        time.sleep(0.1)
+
+        self.assertTrue('a@bob.xmpp.org' in self.bob.store)
+
+    def testFetchUncached(self):
+        """Test that a cached lookup asks the sender for unknown data."""
+        self.bob.get_bob('foo@bar/a', 'a@bob.xmpp.org', block=False)
+        self.send("""
+          <iq type="get" id="1" to="foo@bar/a">
+            <data xmlns="urn:xmpp:bob" cid="a@bob.xmpp.org" />
+          </iq>
+        """)
+
+
+suite = unittest.TestSuite([
+    unittest.TestLoader().loadTestsFromTestCase(TestBobStore),
+    unittest.TestLoader().loadTestsFromTestCase(TestBitsOfBinary)])
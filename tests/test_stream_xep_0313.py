@@ -0,0 +1,106 @@
+import threading
+
+import unittest
+from sleekxmpp.test import SleekTest
+
+
+class TestStreamMAM(SleekTest):
+
+    """
+    Test using the XEP-0313 plugin.
+    """
+
+    def setUp(self):
+        self.stream_start(mode='client',
+                          plugins=['xep_0030', 'xep_0050', 'xep_0059',
+                                   'xep_0297', 'xep_0313'])
+
+    def tearDown(self):
+        self.stream_close()
+
+    def send_query(self, iq_id, after=None):
+        self.send("""
+          <iq type="get" id="%s">
+            <query xmlns="urn:xmpp:mam:tmp" queryid="%s">
+              <set xmlns="http://jabber.org/protocol/rsm">
+                <max>2</max>
+                %s
+              </set>
+            </query>
+          </iq>
+        """ % (iq_id, iq_id, '<after>%s</after>' % after if after else ''),
+        use_values=False)
+
+    def recv_archived(self, iq_id, msg_id):
+        self.recv("""
+          <message to="tester@localhost">
+            <result xmlns="urn:xmpp:mam:tmp" queryid="%s" id="%s">
+              <forwarded xmlns="urn:xmpp:forward:0">
+                <message from="user@localhost/a">
+                  <body>%s</body>
+                </message>
+              </forwarded>
+            </result>
+          </message>
+        """ % (iq_id, msg_id, msg_id))
+
+    def recv_page(self, iq_id, ids):
+        for msg_id in ids:
+            self.recv_archived(iq_id, msg_id)
+        self.recv("""
+          <iq type="result" id="%s">
+            <query xmlns="urn:xmpp:mam:tmp">
+              <set xmlns="http://jabber.org/protocol/rsm">
+                <first>%s</first>
+                <last>%s</last>
+              </set>
+            </query>
+          </iq>
+        """ % (iq_id, ids[0], ids[-1]))
+
+    def testStreamArchive(self):
+        """Test iterating over an archive one page at a time."""
+        results = []
+
+        def consume():
+            stream = self.xmpp['xep_0313'].stream_archive(page_size=2,
+                                                          timeout=2)
+            for msg in stream:
+                results.append(msg['mam_result']['id'])
+
+        t = threading.Thread(target=consume)
+        t.start()
+
+        self.send_query('1')
+        self.recv_page('1', ['a', 'b'])
+        self.send_query('2', after='b')
+        self.recv_page('2', ['c'])
+
+        t.join(timeout=3)
+        self.assertFalse(t.is_alive(), "Archive iteration did not end.")
+        self.assertEqual(results, ['a', 'b', 'c'])
+
+    def testStreamArchivePages(self):
+        """Test receiving an archive through a callback per page."""
+        pages = []
+        done = threading.Event()
+
+        def page_callback(iq):
+            pages.append([msg['mam_result']['id']
+                          for msg in iq['mam']['results']])
+
+        self.xmpp['xep_0313'].stream_archive(
+                page_size=2,
+                page_callback=page_callback,
+                done_callback=lambda iq: done.set())
+
+        self.send_query('1')
+        self.recv_page('1', ['a', 'b'])
+        self.send_query('2', after='b')
+        self.recv_page('2', ['c'])
+
+        done.wait(2)
+        self.assertEqual(pages, [['a', 'b'], ['c']])
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamMAM)
@@ -1244,6 +1244,54 @@ class TestStreamSensorData(SleekTest):
         # Ensure we don't get anything after cancellation
         self.send(None)
 
+    def testRequestManyNodes(self):
+        """Test reading out 10k devices without a thread per device."""
+        self.stream_start(mode='component',
+                          plugins=['xep_0030',
+                                   'xep_0323'])
+
+        class SimulatedDevice(object):
+            def __init__(self, nodeId):
+                self.nodeId = nodeId
+
+            def has_field(self, field):
+                return True
+
+            def request_fields(self, fields, flags, session, callback):
+                threads.append(threading.active_count())
+                callback(session, result="done", nodeId=self.nodeId,
+                         timestamp_block=None)
+
+        threads = []
+        count = 10000
+        for i in range(count):
+            nodeId = "Device%s" % i
+            self.xmpp['xep_0323'].register_node(nodeId=nodeId,
+                    device=SimulatedDevice(nodeId), commTimeout=30)
+
+        before = threading.active_count()
+        self.recv("""
+            <iq type='get'
+                from='master@clayster.com/amr'
+                to='device@clayster.com'
+                id='1'>
+                <req xmlns='urn:xmpp:iot:sensordata' seqnr='1' momentary='true'/>
+            </iq>
+        """)
+
+        sent = []
+        while len(sent) <= count:
+            data = self.xmpp.socket.next_sent(timeout=10)
+            self.assertTrue(data is not None,
+                    "Readout stalled after %s stanzas" % len(sent))
+            sent.append(data)
+
+        self.assertEqual(len(threads), count)
+        self.assertTrue(max(threads) <= before + 2,
+                "Too many threads: %s > %s" % (max(threads), before + 2))
+        self.assertTrue(b'done' in sent[-1] or 'done' in sent[-1])
+        self.assertEqual(self.xmpp['xep_0323'].sessions, {})
+        self.assertEqual(len(self.xmpp['xep_0323'].timers), 0)
 
 
 suite = unittest.TestLoader().loadTestsFromTestCase(TestStreamSensorData)
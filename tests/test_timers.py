@@ -0,0 +1,87 @@
+import time
+import threading
+
+import unittest
+from sleekxmpp.test import SleekTest
+from sleekxmpp.util import TimerService, WorkerPool
+
+
+class TestTimers(SleekTest):
+
+    def setUp(self):
+        self.timers = TimerService()
+
+    def tearDown(self):
+        self.timers.stop()
+
+    def testOrder(self):
+        """Test that timers fire in deadline order."""
+        fired = []
+        done = threading.Event()
+        self.timers.schedule(0.2, done.set)
+        self.timers.schedule(0.1, fired.append, args=('b',))
+        self.timers.schedule(0.05, fired.append, args=('a',))
+        done.wait(2)
+        self.assertEqual(fired, ['a', 'b'])
+        self.assertEqual(len(self.timers), 0)
+
+    def testCancel(self):
+        """Test that a cancelled timer does not fire."""
+        fired = []
+        timer = self.timers.schedule(0.05, fired.append, args=('a',))
+        timer.cancel()
+        self.assertFalse(timer.is_alive())
+        time.sleep(0.1)
+        self.assertEqual(fired, [])
+
+    def testReset(self):
+        """Test that resetting a timer postpones it."""
+        fired = []
+        timer = self.timers.schedule(0.2, lambda: fired.append(time.time()))
+        start = time.time()
+        time.sleep(0.1)
+        timer.reset()
+        time.sleep(0.15)
+        self.assertEqual(fired, [])
+        timer.reset(0.01)
+        time.sleep(0.1)
+        self.assertEqual(len(fired), 1)
+        self.assertTrue(fired[0] - start >= 0.25)
+
+    def testWorkerPoolBounded(self):
+        """Test that a worker pool never starts more threads than allowed."""
+        pool = WorkerPool(max_workers=2)
+        results = []
+        lock = threading.Lock()
+
+        def task(i):
+            time.sleep(0.01)
+            with lock:
+                results.append(i)
+
+        for i in range(20):
+            pool.submit(task, i)
+        self.assertTrue(pool.size <= 2)
+
+        end = time.time() + 2
+        while len(results) < 20 and time.time() < end:
+            time.sleep(0.01)
+        pool.shutdown()
+        self.assertEqual(sorted(results), list(range(20)))
+
+    def testWorkerPoolShutdown(self):
+        """Test that a stopped worker pool drops tasks until restarted."""
+        pool = WorkerPool(max_workers=1)
+        done = threading.Event()
+        pool.shutdown()
+        self.assertFalse(pool.submit(done.set))
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(pool.size, 0)
+
+        pool.start()
+        self.assertTrue(pool.submit(done.set))
+        self.assertTrue(done.wait(2))
+        pool.shutdown()
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestTimers)
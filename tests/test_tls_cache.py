@@ -0,0 +1,69 @@
+import ssl
+import time
+
+import unittest
+from sleekxmpp.test import SleekTest
+from sleekxmpp.xmlstream import tls
+
+
+class FakeSession(object):
+
+    def __init__(self, timeout=300, age=0):
+        self.time = time.time() - age
+        self.timeout = timeout
+
+
+class TestTLSCache(SleekTest):
+
+    """
+    Test sharing SSL contexts and TLS sessions between streams.
+    """
+
+    def setUp(self):
+        self.cache = tls.TLSCache(max_sessions=2)
+
+    @unittest.skipUnless(tls.HAVE_CONTEXT, 'SSLContext is not supported')
+    def testContextReuse(self):
+        """Test that contexts are shared for identical settings."""
+        first = self.cache.context(version=ssl.PROTOCOL_SSLv23)
+        second = self.cache.context(version=ssl.PROTOCOL_SSLv23)
+        other = self.cache.context(version=ssl.PROTOCOL_SSLv23,
+                                   ciphers='HIGH')
+        self.assertTrue(first is second)
+        self.assertFalse(first is other)
+        self.assertEqual(first.verify_mode, ssl.CERT_NONE)
+
+    def testSessions(self):
+        """Test saving and finding TLS sessions by server."""
+        context = object()
+        session = FakeSession()
+        self.cache.save_session(context, ('example.com', 5222), session)
+        self.assertTrue(self.cache.get_session(
+            context, ('example.com', 5222)) is session)
+        self.assertEqual(self.cache.get_session(
+            context, ('example.org', 5222)), None)
+        self.assertEqual(self.cache.get_session(
+            object(), ('example.com', 5222)), None)
+
+    def testExpiredSession(self):
+        """Test that expired sessions are not offered for resumption."""
+        context = object()
+        self.cache.save_session(context, ('example.com', 5222),
+                                FakeSession(timeout=10, age=60))
+        self.assertEqual(self.cache.get_session(
+            context, ('example.com', 5222)), None)
+
+    def testSessionLimit(self):
+        """Test that the least recently used session is dropped."""
+        context = object()
+        a, b, c = FakeSession(), FakeSession(), FakeSession()
+        self.cache.save_session(context, ('a', 1), a)
+        self.cache.save_session(context, ('b', 1), b)
+        self.cache.get_session(context, ('a', 1))
+        self.cache.save_session(context, ('c', 1), c)
+        self.assertTrue(self.cache.get_session(context, ('a', 1)) is a)
+        self.assertEqual(self.cache.get_session(context, ('b', 1)), None)
+        self.assertTrue(self.cache.get_session(context, ('c', 1)) is c)
+
+
+suite = unittest.TestLoader().loadTestsFromTestCase(TestTLSCache)
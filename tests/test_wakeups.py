@@ -0,0 +1,170 @@
+import threading
+import time
+
+import unittest
+import sleekxmpp
+from sleekxmpp.test import SleekTest, TestServer
+from sleekxmpp.thirdparty.statemachine import StateMachine
+from sleekxmpp.util import WakeupEvent
+from sleekxmpp.xmlstream.scheduler import Scheduler
+
+
+class CountingCondition(object):
+
+    """Wrap a condition's wait method to count how often it returns."""
+
+    def __init__(self, condition):
+        self.count = 0
+        self.wait = condition.wait
+        condition.wait = self
+
+    def __call__(self, *args, **kwargs):
+        try:
+            return self.wait(*args, **kwargs)
+        finally:
+            self.count += 1
+
+
+class TestIdleWakeups(SleekTest):
+
+    """
+    Test that idle streams do not wake up their threads.
+    """
+
+    def setUp(self):
+        self.server = TestServer('localhost')
+        self.server.start()
+        self.xmpp = sleekxmpp.ClientXMPP('user@localhost/idle', 'x')
+        self.xmpp.auto_reconnect = False
+
+    def tearDown(self):
+        self.xmpp.disconnect(wait=False)
+        self.xmpp.stop.set()
+        self.server.stop()
+
+    def testIdleStream(self):
+        """Test that an idle connection causes no wakeups."""
+        ready = threading.Event()
+        self.xmpp.add_event_handler('session_start', lambda e: ready.set())
+        self.server.connect(self.xmpp)
+        self.xmpp.process(block=False)
+        self.assertTrue(ready.wait(10), 'Session did not start.')
+        time.sleep(0.2)
+
+        scheduler = CountingCondition(self.xmpp.scheduler.schedule_changed)
+        send = CountingCondition(self.xmpp._XMLStream__send_wakeup)
+        time.sleep(1.5)
+        self.assertEqual((scheduler.count, send.count), (0, 0),
+                'Idle stream woke up %s times.' % (scheduler.count +
+                                                    send.count))
+
+
+class TestScheduler(SleekTest):
+
+    """
+    Test that the scheduler sleeps until there is work to do.
+    """
+
+    def setUp(self):
+        self.scheduler = Scheduler()
+        self.scheduler.process(threaded=True)
+
+    def tearDown(self):
+        self.scheduler.stop.set()
+        self.scheduler.thread.join(5)
+
+    def testNewTask(self):
+        """Test that adding a task wakes the scheduler immediately."""
+        fired = threading.Event()
+        time.sleep(0.1)
+        start = time.time()
+        self.scheduler.add('soon', 0.05, fired.set)
+        self.assertTrue(fired.wait(5))
+        self.assertTrue(time.time() - start < 0.5,
+                'Task ran %.2f seconds late.' % (time.time() - start))
+
+    def testStop(self):
+        """Test that setting the stop event ends the scheduler at once."""
+        self.scheduler.add('later', 300, lambda: None)
+        time.sleep(0.1)
+        start = time.time()
+        self.scheduler.stop.set()
+        self.scheduler.thread.join(5)
+        self.assertFalse(self.scheduler.thread.is_alive())
+        self.assertTrue(time.time() - start < 0.5)
+
+    def testDuplicateName(self):
+        """Test that task names must be unique."""
+        self.scheduler.add('task', 300, lambda: None)
+        self.assertRaises(ValueError, self.scheduler.add,
+                          'task', 300, lambda: None)
+
+
+class TestStateMachineWait(SleekTest):
+
+    """
+    Test that state machine waits are woken by transitions.
+    """
+
+    def setUp(self):
+        self.machine = StateMachine(('off', 'starting', 'on'))
+
+    def testWaitForTransition(self):
+        """Test that a transition waits for one already running."""
+        entered = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def slow():
+            entered.set()
+            release.wait(5)
+            return True
+
+        def first():
+            results.append(self.machine.transition('off', 'starting',
+                                                   func=slow))
+
+        thread = threading.Thread(target=first)
+        thread.start()
+        self.assertTrue(entered.wait(5))
+
+        # Not ready yet, and not waiting.
+        self.assertFalse(self.machine.transition('starting', 'on'))
+
+        threading.Timer(0.1, release.set).start()
+        self.assertTrue(self.machine.transition('starting', 'on', wait=5))
+        thread.join(5)
+        self.assertEqual(results, [True])
+        self.assertTrue(self.machine['on'])
+
+    def testEnsure(self):
+        """Test that ensure returns as soon as the state is entered."""
+        threading.Timer(0.1, self.machine.transition,
+                        args=('off', 'on')).start()
+        start = time.time()
+        self.assertTrue(self.machine.ensure('on', wait=5))
+        self.assertTrue(time.time() - start < 1)
+
+    def testNestedTransition(self):
+        """Test that a transition function may use its own machine."""
+        def inner():
+            return self.machine.ensure('off')
+
+        self.assertTrue(self.machine.transition('off', 'on', func=inner))
+        self.assertTrue(self.machine['on'])
+
+    def testWakeupEvent(self):
+        """Test that a WakeupEvent notifies linked conditions."""
+        event = WakeupEvent()
+        condition = threading.Condition()
+        event.link(condition)
+        threading.Timer(0.1, event.set).start()
+        with condition:
+            condition.wait(5)
+        self.assertTrue(event.is_set())
+
+
+suite = unittest.TestSuite([
+    unittest.TestLoader().loadTestsFromTestCase(TestIdleWakeups),
+    unittest.TestLoader().loadTestsFromTestCase(TestScheduler),
+    unittest.TestLoader().loadTestsFromTestCase(TestStateMachineWait)])